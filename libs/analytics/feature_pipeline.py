@@ -1,13 +1,65 @@
 # libs/analytics/feature_pipeline.py
 
-# Placeholder for feature pipeline logic
-# This could involve data transformation, feature engineering, etc.
+# Feature engineering for the valuation model.
+# Features are computed column-wise with NumPy over a whole batch; the single-row
+# helper is a thin wrapper over the same code path.
+
+from typing import Iterable, Union
+
+import numpy as np
+import pandas as pd
+
+# Raw inputs extracted from Spotify artist payloads
+RAW_FEATURE_COLUMNS = ["streams_last_month", "country_listeners"]
+
+# Column order the valuation model expects
+FEATURE_COLUMNS = [
+    "streams_last_month",
+    "country_listeners",
+    "log_streams_last_month",
+    "streams_per_country",
+]
+
+def spotify_payloads_to_raw_frame(payloads: Union[Iterable[dict], pd.DataFrame]) -> pd.DataFrame:
+    """
+    Extracts the raw inputs from Spotify artist payloads into a columnar frame.
+    Missing payloads (None) and missing fields yield zeros.
+    """
+    if isinstance(payloads, pd.DataFrame):
+        if set(RAW_FEATURE_COLUMNS).issubset(payloads.columns):
+            return payloads[RAW_FEATURE_COLUMNS]
+        payloads = payloads.to_dict("records")
+    payloads = [p or {} for p in payloads]
+    return pd.DataFrame({
+        "streams_last_month": np.fromiter(((p.get("followers") or {}).get("total") or 0 for p in payloads), dtype=np.float64, count=len(payloads)),
+        "country_listeners": np.fromiter((len(p.get("available_markets") or ()) for p in payloads), dtype=np.float64, count=len(payloads)),
+    })
+
+def compute_features(raw: Union[Iterable[dict], pd.DataFrame]) -> np.ndarray:
+    """
+    Computes all model features for a batch of raw inputs (RAW_FEATURE_COLUMNS) and
+    returns a dense C-contiguous float32 matrix of shape (n_rows, len(FEATURE_COLUMNS)).
+    """
+    frame = raw if isinstance(raw, pd.DataFrame) else pd.DataFrame.from_records(list(raw), columns=RAW_FEATURE_COLUMNS)
+    streams = frame["streams_last_month"].fillna(0).to_numpy(dtype=np.float64)
+    countries = frame["country_listeners"].fillna(0).to_numpy(dtype=np.float64)
+
+    features = np.empty((len(frame), len(FEATURE_COLUMNS)), dtype=np.float32)
+    features[:, 0] = streams
+    features[:, 1] = countries
+    features[:, 2] = np.log1p(np.clip(streams, 0, None))
+    features[:, 3] = streams / np.maximum(countries, 1.0)
+    return features
+
+def build_feature_matrix(payloads: Union[Iterable[dict], pd.DataFrame]) -> np.ndarray:
+    """Raw Spotify artist payloads in, model-ready float32 feature matrix out."""
+    return compute_features(spotify_payloads_to_raw_frame(payloads))
+
+def features_to_frame(features: np.ndarray) -> pd.DataFrame:
+    """Wraps a feature matrix with the model's column names, without copying it."""
+    return pd.DataFrame(features, columns=FEATURE_COLUMNS, copy=False)
 
 def process_data_for_features(raw_data: dict) -> dict:
-    print(f"Processing data for features (placeholder): {raw_data}")
-    # Example processing
-    processed_features = {
-        "feature_1": raw_data.get("input_1", 0) * 2,
-        "feature_2": raw_data.get("input_2", "") + "_processed"
-    }
-    return processed_features 
\ No newline at end of file
+    """Single-row convenience wrapper over compute_features."""
+    row = compute_features([raw_data])[0]
+    return {name: float(value) for name, value in zip(FEATURE_COLUMNS, row)}
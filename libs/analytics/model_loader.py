@@ -1,20 +1,148 @@
 # libs/analytics/model_loader.py
+import os
+import resource
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional
 
-# Placeholder for ML model loading logic
-# This might load models from S3, a model registry, or local files.
+import joblib
+import structlog
+from prometheus_client import Counter, Gauge, Histogram
 
-class Model:
-    def __init__(self, name: str):
+logger = structlog.get_logger(__name__)
+
+# --- Model Registry Metrics ---
+MODEL_LOAD_DURATION_SECONDS = Histogram(
+    "analytics_model_load_duration_seconds",
+    "Time taken to load a model artifact from disk.",
+    ["model_name"]
+)
+
+MODEL_LOADS_TOTAL = Counter(
+    "analytics_model_loads_total",
+    "Total model load attempts.",
+    ["model_name", "outcome"] # outcome: 'success', 'not_found', 'error'
+)
+
+MODEL_INFO = Gauge(
+    "analytics_model_info",
+    "Currently served model version (value is always 1).",
+    ["model_name", "version"]
+)
+
+MODEL_RESIDENT_MEMORY_BYTES = Gauge(
+    "analytics_model_resident_memory_bytes",
+    "Resident memory of the process measured right after the model was (re)loaded.",
+    ["model_name"]
+)
+
+def _resident_memory_bytes() -> int:
+    """Current RSS of this process. Falls back to peak RSS where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 # ru_maxrss is KiB on Linux
+
+def load_model(model_path: Path, mmap_mode: Optional[str] = "r") -> Any:
+    """
+    Loads a joblib artifact. With mmap_mode="r", NumPy arrays stored uncompressed are
+    memory-mapped read-only, so every process loading the same file shares those pages
+    through the OS page cache instead of holding a private copy.
+    """
+    return joblib.load(model_path, mmap_mode=mmap_mode)
+
+class ModelRegistry:
+    """
+    Lazily loads a model artifact on first use and hot-swaps it when a new version lands.
+
+    The version is read from an optional "<artifact>.version" sidecar file, falling back
+    to the artifact's mtime and size. At most every check_interval_seconds, get() re-reads
+    the version and, if it changed, loads the new artifact and swaps it in with a single
+    reference assignment, so in-flight callers keep the model they already hold. No
+    background thread is used, which keeps the registry safe across Celery prefork.
+    """
+
+    def __init__(self, name: str, model_path: Path, mmap_mode: Optional[str] = "r", check_interval_seconds: float = 30.0):
         self.name = name
-        print(f"Model '{self.name}' initialized (placeholder).")
-
-    def predict(self, input_data: dict) -> dict:
-        print(f"Model '{self.name}' predicting with data (placeholder): {input_data}")
-        # Example prediction
-        return {"prediction": "some_value", "confidence": 0.9}
-
-def load_model(model_name: str) -> Model:
-    print(f"Loading model '{model_name}' (placeholder).")
-    # In a real scenario, this would involve deserializing a model file
-    # or fetching from a registry.
-    return Model(model_name) 
\ No newline at end of file
+        self.model_path = Path(model_path)
+        self.mmap_mode = mmap_mode
+        self.check_interval_seconds = check_interval_seconds
+        self._loaded: tuple[Any, Optional[str]] = (None, None) # (model, version), swapped atomically
+        self._last_check = float("-inf")
+        self._lock = threading.Lock()
+        self._reload_listeners: list[Callable[[Optional[str], Optional[str]], None]] = []
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._loaded[1]
+
+    def add_reload_listener(self, listener: Callable[[Optional[str], Optional[str]], None]) -> None:
+        """Registers listener(old_version, new_version), called after every successful swap."""
+        self._reload_listeners.append(listener)
+
+    def get(self) -> Any:
+        """Returns the current model, or None if it could not be loaded."""
+        return self.get_with_version()[0]
+
+    def get_with_version(self) -> tuple[Any, Optional[str]]:
+        """Returns (model, version) as one consistent pair."""
+        if time.monotonic() - self._last_check >= self.check_interval_seconds:
+            self._maybe_reload()
+        return self._loaded
+
+    def reload(self) -> bool:
+        """Forces a version check now. Returns True if a new model was swapped in."""
+        self._last_check = float("-inf")
+        return self._maybe_reload()
+
+    def _read_version(self) -> Optional[str]:
+        version_file = self.model_path.with_name(self.model_path.name + ".version")
+        try:
+            if version_file.is_file():
+                return version_file.read_text().strip()
+            stat = self.model_path.stat()
+            return f"mtime-{stat.st_mtime_ns}-{stat.st_size}"
+        except FileNotFoundError:
+            return None
+
+    def _maybe_reload(self) -> bool:
+        with self._lock:
+            if time.monotonic() - self._last_check < self.check_interval_seconds:
+                return False # Another thread just checked
+            self._last_check = time.monotonic()
+
+            new_version = self._read_version()
+            old_model, old_version = self._loaded
+            if new_version is None:
+                if old_model is None:
+                    logger.error("Model artifact not found", model_name=self.name, model_path=str(self.model_path))
+                    MODEL_LOADS_TOTAL.labels(model_name=self.name, outcome="not_found").inc()
+                return False
+            if old_model is not None and new_version == old_version:
+                return False
+
+            start_time = time.monotonic()
+            try:
+                new_model = load_model(self.model_path, mmap_mode=self.mmap_mode)
+            except Exception as e:
+                logger.error("Failed to load model artifact", model_name=self.name, model_path=str(self.model_path), version=new_version, error=str(e))
+                MODEL_LOADS_TOTAL.labels(model_name=self.name, outcome="error").inc()
+                return False # Keep serving the previous model, if any
+            MODEL_LOAD_DURATION_SECONDS.labels(model_name=self.name).observe(time.monotonic() - start_time)
+            MODEL_LOADS_TOTAL.labels(model_name=self.name, outcome="success").inc()
+
+            self._loaded = (new_model, new_version)
+            if old_version is not None and old_version != new_version:
+                MODEL_INFO.remove(self.name, old_version)
+            MODEL_INFO.labels(model_name=self.name, version=new_version).set(1)
+            MODEL_RESIDENT_MEMORY_BYTES.labels(model_name=self.name).set(_resident_memory_bytes())
+            logger.info("Model loaded", model_name=self.name, model_path=str(self.model_path), version=new_version, previous_version=old_version)
+
+        for listener in self._reload_listeners:
+            try:
+                listener(old_version, new_version)
+            except Exception as e:
+                logger.error("Model reload listener failed", model_name=self.name, error=str(e))
+        return True
@@ -0,0 +1,99 @@
+# libs/py_common/avro_codec.py
+import io
+import json
+import struct
+import threading
+from typing import Optional
+
+from confluent_kafka.schema_registry import Schema, SchemaRegistryClient, topic_subject_name_strategy
+from confluent_kafka.serialization import SerializationContext, SerializationError
+from fastavro import parse_schema, schemaless_reader, schemaless_writer
+
+# Confluent wire format: magic byte 0, 4-byte big-endian schema ID, Avro binary body
+_MAGIC_BYTE = 0
+_HEADER = struct.Struct(">bI")
+
+
+class FastAvroSerializer:
+    """
+    Avro serializer for one schema, wire-compatible with confluent-kafka's AvroSerializer.
+
+    The schema is parsed once and the framing header is built once per subject, so a
+    call is one fastavro schemaless_writer pass over the record. Schema IDs are
+    registered under <topic>-value (auto-register) the first time a topic is seen, or
+    ahead of time with resolve().
+    """
+
+    def __init__(self, schema_registry_client: SchemaRegistryClient, schema_str: str):
+        self._registry = schema_registry_client
+        schema_str = schema_str.strip() # As AvroSerializer registers it, so both resolve the same ID
+        self._schema = Schema(schema_str, "AVRO")
+        self.parsed_schema = parse_schema(json.loads(schema_str))
+        self._headers: dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, subject: str) -> int:
+        """Registers the schema under subject (idempotent) and returns its ID."""
+        header = self._headers.get(subject)
+        if header is None:
+            with self._lock:
+                header = self._headers.get(subject)
+                if header is None:
+                    schema_id = self._registry.register_schema(subject, self._schema)
+                    header = self._headers[subject] = _HEADER.pack(_MAGIC_BYTE, schema_id)
+        return _HEADER.unpack(header)[1]
+
+    def __call__(self, obj: dict, ctx: Optional[SerializationContext] = None) -> Optional[bytes]:
+        if obj is None:
+            return None
+        subject = topic_subject_name_strategy(ctx, None)
+        header = self._headers.get(subject)
+        if header is None:
+            self.resolve(subject)
+            header = self._headers[subject]
+        buf = io.BytesIO()
+        buf.write(header)
+        schemaless_writer(buf, self.parsed_schema, obj)
+        return buf.getvalue()
+
+
+class FastAvroDeserializer:
+    """
+    Avro deserializer for Confluent-framed messages, wire-compatible with
+    confluent-kafka's AvroDeserializer.
+
+    Writer schemas are fetched by ID once and kept parsed. With a reader schema,
+    records written with a different schema are resolved to it; otherwise records are
+    returned as written.
+    """
+
+    def __init__(self, schema_registry_client: SchemaRegistryClient, schema_str: Optional[str] = None):
+        self._registry = schema_registry_client
+        self._reader_schema = parse_schema(json.loads(schema_str)) if schema_str else None
+        # schema ID -> (parsed writer schema, reader schema to resolve to or None)
+        self._schemas: dict[int, tuple] = {}
+
+    def _schemas_for(self, schema_id: int) -> tuple:
+        schemas = self._schemas.get(schema_id)
+        if schemas is None:
+            writer_schema = parse_schema(json.loads(self._registry.get_schema(schema_id).schema_str))
+            # Written with the reader schema itself: skip fastavro's schema resolution
+            reader_schema = None if self._reader_schema == writer_schema else self._reader_schema
+            schemas = self._schemas[schema_id] = (writer_schema, reader_schema)
+        return schemas
+
+    def __call__(self, data: bytes, ctx: Optional[SerializationContext] = None) -> Optional[dict]:
+        if data is None:
+            return None
+        if len(data) <= _HEADER.size:
+            raise SerializationError(
+                f"Expecting data framing of length 6 bytes or more but total data size is {len(data)} bytes. "
+                "This message was not produced with a Confluent Schema Registry serializer"
+            )
+        magic, schema_id = _HEADER.unpack_from(data)
+        if magic != _MAGIC_BYTE:
+            raise SerializationError(f"Unexpected magic byte {magic}. This message was not produced with a Confluent Schema Registry serializer")
+        writer_schema, reader_schema = self._schemas_for(schema_id)
+        payload = io.BytesIO(data)
+        payload.seek(_HEADER.size)
+        return schemaless_reader(payload, writer_schema, reader_schema)
@@ -0,0 +1,123 @@
+# libs/py_common/cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# Entry states returned by TTLCache.get
+CACHE_FRESH = "fresh"
+CACHE_STALE = "stale"
+
+class TTLCache:
+    """
+    Small thread-safe in-process LRU cache with a TTL and a size bound.
+
+    An entry is "fresh" for ttl_seconds after it was set, then "stale" for a further
+    stale_seconds (so callers can serve it while revalidating), then it is dropped.
+    When the cache holds maxsize entries the least recently used one is evicted.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: float = 60.0, stale_seconds: float = 0.0, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> tuple[Any, Optional[str]]:
+        """Returns (value, CACHE_FRESH | CACHE_STALE), or (None, None) on a miss."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None, None
+            value, stored_at = entry
+            age = self._clock() - stored_at
+            if age > self.ttl_seconds + self.stale_seconds:
+                del self._data[key]
+                return None, None
+            self._data.move_to_end(key)
+            return value, (CACHE_FRESH if age <= self.ttl_seconds else CACHE_STALE)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, self._clock())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: while a call for a key is in flight,
+    other callers for that key block and receive the same result (or exception)
+    instead of issuing a duplicate call.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def in_flight(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._calls
+
+    def do_in_background(self, key: Hashable, fn: Callable[[], Any]) -> bool:
+        """Runs fn in a daemon thread unless a call for key is already in flight. Returns True if started."""
+        if self.in_flight(key):
+            return False
+
+        def _run():
+            try:
+                self.do(key, fn)
+            except Exception as e:
+                logger.warning("Background single-flight call failed", key=str(key), error=str(e))
+
+        thread = threading.Thread(target=_run, daemon=True, name=f"SingleFlightRefresh-{key}")
+        thread.start()
+        return True
@@ -0,0 +1,122 @@
+# libs/py_common/db.py
+import os
+import threading
+import time
+from typing import Optional
+
+import structlog
+from prometheus_client import Gauge, Histogram
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from sqlmodel import create_engine
+
+logger = structlog.get_logger(__name__)
+
+# --- Connection Pool Metrics ---
+DB_POOL_SIZE = Gauge(
+    "db_pool_size",
+    "Configured number of persistent connections in the pool.",
+    ["engine"]
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Connections currently checked out of the pool.",
+    ["engine"]
+)
+
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow_connections",
+    "Connections currently open beyond pool_size (negative while the pool is not yet full).",
+    ["engine"]
+)
+
+DB_POOL_CHECKOUT_WAIT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting to check a connection out of the pool.",
+    ["engine"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+)
+
+def sync_database_url(url: str) -> str:
+    """Turns an async SQLAlchemy URL (postgresql+asyncpg://) into its synchronous form."""
+    return url.replace("+asyncpg", "") if "+asyncpg" in url else url
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    _metrics_name = "default" # Set per engine by create_pooled_engine
+
+    def recreate(self):
+        pool = super().recreate()
+        pool._metrics_name = self._metrics_name
+        return pool
+
+    def _do_get(self):
+        start_time = time.monotonic()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT_SECONDS.labels(engine=self._metrics_name).observe(time.monotonic() - start_time)
+
+def _env(name: str, setting: str, default: str) -> str:
+    # Engine-specific override first (e.g. PAYOUTS_LEDGER_DB_POOL_SIZE), then the global DB_POOL_SIZE
+    return os.getenv(f"{name.upper()}_{setting}", os.getenv(setting, default))
+
+# Engines created through create_pooled_engine, disposed in forked children
+_engines: dict[str, Engine] = {}
+_engines_lock = threading.Lock()
+
+def _dispose_engines_after_fork() -> None:
+    # close=False: drop the parent's pooled connections without closing their sockets,
+    # which the parent still owns, so each child opens its own connections lazily.
+    for engine in list(_engines.values()):
+        engine.dispose(close=False)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_dispose_engines_after_fork)
+
+def create_pooled_engine(
+    url: str,
+    name: str,
+    pool_size: Optional[int] = None,
+    max_overflow: Optional[int] = None,
+    pool_timeout: Optional[float] = None,
+    pool_recycle: Optional[int] = None,
+    pool_pre_ping: Optional[bool] = None,
+    echo: bool = False,
+) -> Engine:
+    """
+    Creates a synchronous engine with an instrumented QueuePool and registers it for
+    pool metrics and post-fork recycling. Unset settings come from <NAME>_DB_POOL_* or
+    DB_POOL_* environment variables. Size workers so that
+    processes x (pool_size + max_overflow) stays below Postgres max_connections.
+    """
+    pool_size = pool_size if pool_size is not None else int(_env(name, "DB_POOL_SIZE", "5"))
+    max_overflow = max_overflow if max_overflow is not None else int(_env(name, "DB_POOL_MAX_OVERFLOW", "5"))
+    pool_timeout = pool_timeout if pool_timeout is not None else float(_env(name, "DB_POOL_TIMEOUT_SECONDS", "30"))
+    pool_recycle = pool_recycle if pool_recycle is not None else int(_env(name, "DB_POOL_RECYCLE_SECONDS", "1800"))
+    if pool_pre_ping is None:
+        pool_pre_ping = _env(name, "DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+    engine = create_engine(
+        url,
+        echo=echo,
+        poolclass=InstrumentedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+    )
+    engine.pool._metrics_name = name
+
+    # Read the live pool at scrape time; engine.pool is replaced on dispose()
+    DB_POOL_SIZE.labels(engine=name).set_function(lambda: engine.pool.size())
+    DB_POOL_CHECKED_OUT.labels(engine=name).set_function(lambda: engine.pool.checkedout())
+    DB_POOL_OVERFLOW.labels(engine=name).set_function(lambda: engine.pool.overflow())
+
+    with _engines_lock:
+        _engines[name] = engine
+    logger.info("Database engine created", engine=name, pool_size=pool_size, max_overflow=max_overflow, pool_pre_ping=pool_pre_ping, pool_recycle=pool_recycle)
+    return engine
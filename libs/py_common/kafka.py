@@ -1,17 +1,117 @@
 # libs/py_common/kafka.py
+import atexit
+import json
 import os
 import socket
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional, Union
+
 import structlog
-from confluent_kafka import Producer, Consumer, KafkaError, KafkaException
-from confluent_kafka.schema_registry import SchemaRegistryClient
+from confluent_kafka import Producer, Consumer, KafkaError, KafkaException, Message, TopicPartition
+from prometheus_client import Counter, Gauge, Histogram
+from confluent_kafka.schema_registry import Schema, topic_subject_name_strategy
 from confluent_kafka.schema_registry.avro import AvroSerializer, AvroDeserializer
-from confluent_kafka.serialization import StringSerializer, StringDeserializer
+from confluent_kafka.serialization import MessageField, SerializationContext, StringSerializer, StringDeserializer
+
+from libs.py_common.avro_codec import FastAvroDeserializer, FastAvroSerializer
+from libs.py_common.schema_registry import CachingSchemaRegistryClient, FileSchemaRegistryClient, preload_schemas
+
+try:
+    from celery.signals import worker_process_shutdown
+except ImportError: # Services without Celery (offers-api, event_consumer)
+    worker_process_shutdown = None
 
 logger = structlog.get_logger(__name__)
 
+# --- Consumer Runner Metrics ---
+# Consumer lag is exported from the librdkafka statistics (kafka_client_partition_consumer_lag_messages)
+KAFKA_CONSUMER_PROCESSING_SECONDS = Histogram(
+    "kafka_consumer_processing_seconds",
+    "Handler time per message, or per batch for batch handlers.",
+    ["group_id", "topic"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+)
+
+KAFKA_CONSUMER_IN_FLIGHT = Gauge(
+    "kafka_consumer_in_flight_messages",
+    "Messages handed to worker lanes and not yet processed.",
+    ["group_id"]
+)
+
+KAFKA_CONSUMER_PAUSED_PARTITIONS = Gauge(
+    "kafka_consumer_paused_partitions",
+    "Partitions currently paused because their worker backlog is full.",
+    ["group_id"]
+)
+
+KAFKA_CONSUMER_HANDLER_ERRORS_TOTAL = Counter(
+    "kafka_consumer_handler_errors_total",
+    "Messages (or batches) whose handler raised.",
+    ["group_id", "topic"]
+)
+
+# --- librdkafka Statistics Metrics ---
+# Exported from the statistics JSON every client emits each statistics.interval.ms.
+# "client" is the consumer group id for consumers and the producer's client name.
+KAFKA_CLIENT_PARTITION_LAG = Gauge(
+    "kafka_client_partition_consumer_lag_messages",
+    "Consumer lag per assigned partition, as reported by librdkafka.",
+    ["client", "topic", "partition"]
+)
+
+KAFKA_CLIENT_TOPIC_LAG = Gauge(
+    "kafka_client_topic_consumer_lag_messages",
+    "Consumer lag summed over the assigned partitions of a topic.",
+    ["client", "topic"]
+)
+
+KAFKA_CLIENT_FETCH_QUEUE_MESSAGES = Gauge(
+    "kafka_client_fetch_queue_messages",
+    "Pre-fetched messages waiting in the local fetch queue per partition.",
+    ["client", "topic", "partition"]
+)
+
+KAFKA_CLIENT_QUEUE_MESSAGES = Gauge(
+    "kafka_client_queue_messages",
+    "Messages in the client's producer queue, and events waiting in its reply (callback) queue.",
+    ["client", "queue"]
+)
+
+KAFKA_CLIENT_BROKER_RTT_SECONDS = Gauge(
+    "kafka_client_broker_rtt_seconds",
+    "Broker request round-trip time over the last statistics window (dominated by Fetch requests for consumers).",
+    ["client", "broker", "stat"]
+)
+
+KAFKA_CLIENT_PRODUCER_BATCH_BYTES = Gauge(
+    "kafka_client_producer_batch_bytes",
+    "Average produced batch size in bytes per topic over the last statistics window.",
+    ["client", "topic"]
+)
+
+KAFKA_CLIENT_PRODUCER_BATCH_MESSAGES = Gauge(
+    "kafka_client_producer_batch_messages",
+    "Average messages per produced batch per topic over the last statistics window.",
+    ["client", "topic"]
+)
+
 # --- Environment Variables for Kafka Configuration ---
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
 SCHEMA_REGISTRY_URL = os.getenv("SCHEMA_REGISTRY_URL", "http://localhost:8081")
+# Schema IDs resolved against the registry are mirrored here, so restarts resolve them offline.
+# The file records the registry URL and is discarded when pointed at another registry.
+# Empty keeps the mirror in memory. SCHEMA_REGISTRY_URL=file://<path> uses a local stand-in registry.
+SCHEMA_REGISTRY_CACHE_PATH = os.getenv("SCHEMA_REGISTRY_CACHE_PATH", "/tmp/schema_registry_cache.json")
+# Resolve every schema/*.avsc when the registry client is created
+SCHEMA_REGISTRY_PRELOAD = os.getenv("SCHEMA_REGISTRY_PRELOAD", "true").lower() in ("1", "true", "yes")
+# Precompiled fastavro serdes (libs.py_common.avro_codec); false falls back to confluent-kafka's
+KAFKA_AVRO_FAST_PATH = os.getenv("KAFKA_AVRO_FAST_PATH", "true").lower() in ("1", "true", "yes")
+# librdkafka statistics emission interval; 0 disables the statistics gauges
+KAFKA_STATISTICS_INTERVAL_MS = int(os.getenv("KAFKA_STATISTICS_INTERVAL_MS", "15000"))
 
 # Common Kafka client configuration
 # For mTLS, you'd set: ssl.ca.location, ssl.certificate.location, ssl.key.location, security.protocol=SSL
@@ -36,6 +136,70 @@ if kafka_config.get("security.protocol", "PLAINTEXT").upper() in ["SASL_SSL", "S
         logger.warning("Kafka SSL CA location not set and KAFKA_SKIP_SSL_VERIFICATION_FOR_DEV is not true. SSL might fail.")
         # For actual mTLS, cert and key locations would also be checked.
 
+# --- librdkafka Statistics ---
+class KafkaStatisticsExporter:
+    """
+    stats_cb for one client: turns the librdkafka statistics JSON into the kafka_client_*
+    gauges. Called from poll()/consume()/flush() on the thread serving the client.
+    Label sets that disappear from the statistics (e.g. partitions revoked in a
+    rebalance) are removed so stale lag is not reported.
+    """
+
+    def __init__(self, client_name: str):
+        self.client_name = client_name
+        self._labels: dict[Gauge, set[tuple]] = defaultdict(set)
+
+    def __call__(self, stats_json: str) -> None:
+        try:
+            self.export(json.loads(stats_json))
+        except Exception as e:
+            logger.warning("Failed to export Kafka client statistics", client=self.client_name, error=str(e))
+
+    def export(self, stats: dict) -> None:
+        seen: dict[Gauge, dict[tuple, float]] = defaultdict(dict)
+        client = self.client_name
+        seen[KAFKA_CLIENT_QUEUE_MESSAGES][(client, "producer")] = stats.get("msg_cnt", 0)
+        seen[KAFKA_CLIENT_QUEUE_MESSAGES][(client, "reply")] = stats.get("replyq", 0)
+
+        for broker in stats.get("brokers", {}).values():
+            rtt = broker.get("rtt") or {}
+            if broker.get("nodeid", -1) < 0 or not rtt.get("cnt"):
+                continue # Bootstrap placeholders, or no requests in this window
+            for stat in ("avg", "p99"):
+                seen[KAFKA_CLIENT_BROKER_RTT_SECONDS][(client, broker["name"], stat)] = rtt[stat] / 1_000_000 # microseconds
+
+        for topic_name, topic in stats.get("topics", {}).items():
+            topic_lag = None
+            for partition_id, partition in topic.get("partitions", {}).items():
+                lag = partition.get("consumer_lag", -1)
+                if int(partition_id) < 0 or lag < 0:
+                    continue # Internal UA partition, or not consumed by this client
+                seen[KAFKA_CLIENT_PARTITION_LAG][(client, topic_name, partition_id)] = lag
+                seen[KAFKA_CLIENT_FETCH_QUEUE_MESSAGES][(client, topic_name, partition_id)] = partition.get("fetchq_cnt", 0)
+                topic_lag = (topic_lag or 0) + lag
+            if topic_lag is not None:
+                seen[KAFKA_CLIENT_TOPIC_LAG][(client, topic_name)] = topic_lag
+
+            batch_bytes = topic.get("batchsize") or {}
+            batch_messages = topic.get("batchcnt") or {}
+            if batch_bytes.get("cnt"):
+                seen[KAFKA_CLIENT_PRODUCER_BATCH_BYTES][(client, topic_name)] = batch_bytes["avg"]
+            if batch_messages.get("cnt"):
+                seen[KAFKA_CLIENT_PRODUCER_BATCH_MESSAGES][(client, topic_name)] = batch_messages["avg"]
+
+        for gauge in set(self._labels) | set(seen):
+            current = seen.get(gauge, {})
+            for labels, value in current.items():
+                gauge.labels(*labels).set(value)
+            for labels in self._labels[gauge] - set(current):
+                gauge.remove(*labels)
+            self._labels[gauge] = set(current)
+
+def _statistics_config(client_name: str) -> dict:
+    if KAFKA_STATISTICS_INTERVAL_MS <= 0:
+        return {}
+    return {"statistics.interval.ms": KAFKA_STATISTICS_INTERVAL_MS, "stats_cb": KafkaStatisticsExporter(client_name)}
+
 # --- Schema Registry Client ---
 _schema_registry_client = None
 def get_schema_registry_client():
@@ -44,33 +208,157 @@ def get_schema_registry_client():
         if not SCHEMA_REGISTRY_URL:
             logger.error("SCHEMA_REGISTRY_URL is not set. Cannot create Avro Producer/Consumer.")
             raise ValueError("SCHEMA_REGISTRY_URL is required for Avro operations.")
-        sr_config = {'url': SCHEMA_REGISTRY_URL}
-        _schema_registry_client = SchemaRegistryClient(sr_config)
+        if SCHEMA_REGISTRY_URL.startswith("file://"):
+            # Local stand-in: IDs are assigned in-process and persisted to the file
+            _schema_registry_client = FileSchemaRegistryClient(SCHEMA_REGISTRY_URL[len("file://"):])
+        else:
+            sr_config = {'url': SCHEMA_REGISTRY_URL}
+            _schema_registry_client = CachingSchemaRegistryClient(sr_config, cache=FileSchemaRegistryClient(SCHEMA_REGISTRY_CACHE_PATH or None, registry_url=SCHEMA_REGISTRY_URL))
+        if SCHEMA_REGISTRY_PRELOAD:
+            preload_schemas(_schema_registry_client, register=isinstance(_schema_registry_client, FileSchemaRegistryClient))
     return _schema_registry_client
 
+def _avro_serializer(sr_client, schema_str: str):
+    if KAFKA_AVRO_FAST_PATH:
+        return FastAvroSerializer(sr_client, schema_str)
+    return AvroSerializer(sr_client, schema_str, conf={
+        'auto.register.schemas': True, # Consider False for production for more control
+        'subject.name.strategy': topic_subject_name_strategy, # <topic>-value; skips the registry's association lookup
+    })
+
+def _avro_deserializer(sr_client, schema_str: Optional[str] = None):
+    if KAFKA_AVRO_FAST_PATH:
+        return FastAvroDeserializer(sr_client, schema_str)
+    return AvroDeserializer(schema_registry_client=sr_client, schema_str=schema_str, conf={'subject.name.strategy': topic_subject_name_strategy})
+
+# --- Producer Profiles ---
+# Both profiles are idempotent (acks=all, no duplicates or reordering on retry).
+# low-latency sends almost immediately; high-throughput lingers to build large compressed batches.
+PRODUCER_PROFILES = {
+    "low-latency": {
+        "enable.idempotence": True,
+        "acks": "all",
+        "linger.ms": 5,
+        "batch.size": 64 * 1024,
+        "compression.type": "lz4",
+    },
+    "high-throughput": {
+        "enable.idempotence": True,
+        "acks": "all",
+        "linger.ms": 50,
+        "batch.size": 1024 * 1024,
+        "batch.num.messages": 10000,
+        "compression.type": "zstd",
+    },
+}
+KAFKA_PRODUCER_PROFILE = os.getenv("KAFKA_PRODUCER_PROFILE", "low-latency")
+KAFKA_PRODUCER_POLL_INTERVAL_SECONDS = float(os.getenv("KAFKA_PRODUCER_POLL_INTERVAL_SECONDS", "0.1"))
+KAFKA_PRODUCER_FLUSH_TIMEOUT_SECONDS = float(os.getenv("KAFKA_PRODUCER_FLUSH_TIMEOUT_SECONDS", "10"))
+# After a failed register_topic() the topic's error is re-raised without contacting the registry for this long
+KAFKA_SCHEMA_REGISTRATION_RETRY_SECONDS = float(os.getenv("KAFKA_SCHEMA_REGISTRATION_RETRY_SECONDS", "30"))
+
+def _producer_profile_config(profile: Optional[str] = None) -> dict:
+    profile = profile or KAFKA_PRODUCER_PROFILE
+    if profile not in PRODUCER_PROFILES:
+        raise ValueError(f"Unknown Kafka producer profile '{profile}'. Expected one of {sorted(PRODUCER_PROFILES)}.")
+    return dict(PRODUCER_PROFILES[profile])
+
+class ProducerPollThread(threading.Thread):
+    """Serves a producer's delivery and statistics callbacks even while nothing is being produced."""
+
+    def __init__(self, producer: Producer, interval_seconds: float = KAFKA_PRODUCER_POLL_INTERVAL_SECONDS):
+        super().__init__(name="KafkaProducerPollThread", daemon=True)
+        self.producer = producer
+        self.interval_seconds = interval_seconds
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.producer.poll(self.interval_seconds)
+            except Exception as e:
+                logger.error("Kafka producer poll failed", error=str(e), exc_info=True)
+                self._stop_event.wait(1.0)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join(timeout=self.interval_seconds + 1.0)
+
+# Producers created by this module, flushed on shutdown
+_producers: list[tuple[Producer, Optional[ProducerPollThread]]] = []
+_producers_lock = threading.Lock()
+
+def _track_producer(producer: Producer, background_poll: bool) -> Producer:
+    poll_thread = None
+    if background_poll:
+        poll_thread = ProducerPollThread(producer)
+        poll_thread.start()
+    with _producers_lock:
+        _producers.append((producer, poll_thread))
+    return producer
+
+def flush_producers(timeout: Optional[float] = None) -> int:
+    """
+    Stops the background poll threads and flushes every producer created by this module,
+    waiting up to timeout seconds each. Returns the number of messages still undelivered.
+    Runs at interpreter exit and when a Celery worker process shuts down.
+    """
+    timeout = KAFKA_PRODUCER_FLUSH_TIMEOUT_SECONDS if timeout is None else timeout
+    with _producers_lock:
+        producers = list(_producers)
+        _producers.clear()
+    undelivered = 0
+    for producer, poll_thread in producers:
+        if poll_thread is not None:
+            poll_thread.stop()
+        try:
+            remaining = producer.flush(timeout)
+        except Exception as e:
+            logger.error("Kafka producer flush failed", error=str(e), exc_info=True)
+            continue
+        if remaining:
+            logger.error("Kafka producer flush timed out with messages undelivered", undelivered=remaining, timeout=timeout)
+        undelivered += remaining
+    if producers:
+        logger.info("Kafka producers flushed", producers=len(producers), undelivered=undelivered)
+    return undelivered
+
+atexit.register(flush_producers)
+if worker_process_shutdown is not None:
+    # Prefork pool children leave via os._exit, which skips atexit handlers
+    worker_process_shutdown.connect(lambda **kwargs: flush_producers(), weak=False)
+
 # --- Producer Helper ---
-def create_producer(config_overrides: dict = None) -> Producer:
+def create_producer(config_overrides: Optional[dict] = None, client_name: str = "producer", profile: Optional[str] = None, background_poll: bool = True) -> Producer:
     producer_config = kafka_config.copy()
+    producer_config.update(_producer_profile_config(profile))
+    producer_config.update(_statistics_config(client_name))
     if config_overrides:
         producer_config.update(config_overrides)
     
     logger.info("Creating Kafka Producer", config=producer_config)
-    return Producer(producer_config)
+    return _track_producer(Producer(producer_config), background_poll)
 
-def create_avro_producer(value_schema_str: str, key_schema_str: str = None, config_overrides: dict = None) -> Producer:
+def create_avro_producer(
+    value_schema_str: str,
+    key_schema_str: Optional[str] = None,
+    config_overrides: Optional[dict] = None,
+    client_name: str = "avro-producer",
+    profile: Optional[str] = None,
+    background_poll: bool = True,
+) -> Producer:
     sr_client = get_schema_registry_client()
     
-    avro_serializer_config = {
-        'auto.register.schemas': True # Consider False for production for more control
-    }
-    value_avro_serializer = AvroSerializer(sr_client, value_schema_str, conf=avro_serializer_config)
+    value_avro_serializer = _avro_serializer(sr_client, value_schema_str)
     
     key_serializer = StringSerializer('utf_8')
     if key_schema_str: # If key is also Avro
-        key_avro_serializer = AvroSerializer(sr_client, key_schema_str, conf=avro_serializer_config)
+        key_avro_serializer = _avro_serializer(sr_client, key_schema_str)
         key_serializer = key_avro_serializer
         
     producer_config = kafka_config.copy()
+    producer_config.update(_producer_profile_config(profile))
+    producer_config.update(_statistics_config(client_name))
     producer_config.update({
         'key.serializer': key_serializer,
         'value.serializer': value_avro_serializer
@@ -80,11 +368,131 @@ def create_avro_producer(value_schema_str: str, key_schema_str: str = None, conf
 
     logger.info("Creating Avro Kafka Producer", config=producer_config)
     # Note: confluent_kafka.avro.AvroProducer is deprecated. Use Producer with AvroSerializer.
-    return Producer(producer_config)
+    return _track_producer(Producer(producer_config), background_poll)
+
+# --- Shared Producer Registry ---
+class ProducerRegistry:
+    """
+    One librdkafka Producer per process and profile, shared by every topic the process
+    produces to with that profile, so a pod holds one set of broker connections and one
+    send buffer per profile it uses.
+
+    register_topic() reads a topic's value schema once, builds its Avro serializer and
+    resolves the schema ID against the registry up front; produce() then only encodes
+    and enqueues. produce/poll/flush mirror confluent_kafka.Producer, so code written
+    against a per-topic Producer keeps working: dict values of registered topics are
+    Avro-encoded and str keys UTF-8 encoded.
+
+    Registration talks to the schema registry without holding the registry's lock, and
+    a failure is remembered for KAFKA_SCHEMA_REGISTRATION_RETRY_SECONDS, so callers get
+    the error straight away instead of each waiting on an unreachable registry. It still
+    blocks; async code registers topics at startup or through a thread.
+    """
+
+    def __init__(self, profile: Optional[str] = None, client_name: str = "producer"):
+        self.profile = profile
+        self.client_name = client_name
+        self._producer: Optional[Producer] = None
+        self._serializers: dict[str, Union[FastAvroSerializer, AvroSerializer]] = {}
+        self._schema_ids: dict[str, int] = {}
+        self._failures: dict[str, tuple[float, Exception]] = {} # topic -> (monotonic time, error)
+        self._lock = threading.Lock()
+
+    @property
+    def producer(self) -> Producer:
+        if self._producer is None:
+            with self._lock:
+                if self._producer is None:
+                    self._producer = create_producer(client_name=self.client_name, profile=self.profile)
+        return self._producer
+
+    def register_topic(self, topic: str, schema_path: Optional[Union[str, Path]] = None, schema_str: Optional[str] = None) -> "ProducerRegistry":
+        """Registers a topic's Avro value schema (idempotent). Returns the registry for chaining."""
+        if topic in self._serializers:
+            return self
+        failure = self._failures.get(topic)
+        if failure is not None and time.monotonic() - failure[0] < KAFKA_SCHEMA_REGISTRATION_RETRY_SECONDS:
+            raise failure[1]
+        try:
+            if schema_str is None:
+                schema_str = Path(schema_path).read_text()
+            schema_str = schema_str.strip() # The serializers register the stripped declaration
+            sr_client = get_schema_registry_client()
+            # Same subject and Schema the serializer would register on its first call; the
+            # ID is cached, so serializing never waits on the registry afterwards.
+            schema_id = sr_client.register_schema(f"{topic}-value", Schema(schema_str, "AVRO"))
+            serializer = _avro_serializer(sr_client, schema_str)
+            if isinstance(serializer, FastAvroSerializer):
+                serializer.resolve(f"{topic}-value")
+        except Exception as e:
+            self._failures[topic] = (time.monotonic(), e)
+            raise
+        with self._lock:
+            # Concurrent registrations of a topic resolve the same ID; the first one is kept
+            if topic in self._serializers:
+                return self
+            self._serializers[topic] = serializer
+            self._schema_ids[topic] = schema_id
+            self._failures.pop(topic, None)
+        logger.info("Kafka topic registered with shared producer", topic=topic, schema_id=schema_id)
+        return self
+
+    def schema_id(self, topic: str) -> Optional[int]:
+        return self._schema_ids.get(topic)
+
+    def produce(self, topic: str, value=None, key=None, **kwargs) -> None:
+        serializer = self._serializers.get(topic)
+        if serializer is not None and value is not None and not isinstance(value, bytes):
+            value = serializer(value, SerializationContext(topic, MessageField.VALUE))
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        self.producer.produce(topic, value=value, key=key, **kwargs)
+
+    def poll(self, timeout: float = 0) -> int:
+        return self.producer.poll(timeout)
+
+    def flush(self, timeout: float = KAFKA_PRODUCER_FLUSH_TIMEOUT_SECONDS) -> int:
+        return self.producer.flush(timeout)
+
+_producer_registries: dict[str, ProducerRegistry] = {}
+_producer_registry_lock = threading.Lock()
+
+def get_producer_registry(profile: Optional[str] = None) -> ProducerRegistry:
+    """
+    Returns the process-wide ProducerRegistry for profile (default KAFKA_PRODUCER_PROFILE).
+    Each profile gets its own producer, so callers asking for different profiles never
+    share one configured for the other.
+    """
+    profile = profile or KAFKA_PRODUCER_PROFILE
+    registry = _producer_registries.get(profile)
+    if registry is None:
+        _producer_profile_config(profile) # Unknown profiles fail here, not on first produce
+        with _producer_registry_lock:
+            registry = _producer_registries.get(profile)
+            if registry is None:
+                registry = ProducerRegistry(profile=profile, client_name=f"{socket.gethostname()}-{profile}-producer")
+                _producer_registries[profile] = registry
+    return registry
+
+def _reset_producer_registry_after_fork() -> None:
+    # librdkafka handles do not survive fork(); children build their own producers lazily
+    # and must not flush the parent's
+    _producer_registries.clear()
+    _producers.clear()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_producer_registry_after_fork)
 
 # --- Consumer Helper ---
-def create_consumer(group_id: str, topics: list[str], config_overrides: dict = None, auto_offset_reset='earliest') -> Consumer:
+def create_consumer(
+    group_id: str,
+    topics: list[str],
+    config_overrides: Optional[dict] = None,
+    auto_offset_reset='earliest',
+    callbacks: Optional["ConsumerCallbacks"] = None,
+) -> Consumer:
     consumer_config = kafka_config.copy()
+    consumer_config.update(_statistics_config(group_id))
     consumer_config.update({
         'group.id': group_id,
         'auto.offset.reset': auto_offset_reset,
@@ -92,33 +500,37 @@ def create_consumer(group_id: str, topics: list[str], config_overrides: dict = N
     })
     if config_overrides:
         consumer_config.update(config_overrides)
+    if callbacks is not None:
+        consumer_config['on_commit'] = callbacks.on_commit
     
     logger.info("Creating Kafka Consumer", config=consumer_config, topics=topics)
     consumer = Consumer(consumer_config)
-    consumer.subscribe(topics)
+    _subscribe(consumer, topics, callbacks)
     return consumer
 
 def create_avro_consumer(
     group_id: str, 
     topics: list[str], 
-    value_schema_str: str = None, # Made optional
-    key_schema_str: str = None, 
-    config_overrides: dict = None, 
-    auto_offset_reset='earliest'
+    value_schema_str: Optional[str] = None, # Made optional
+    key_schema_str: Optional[str] = None, 
+    config_overrides: Optional[dict] = None, 
+    auto_offset_reset='earliest',
+    callbacks: Optional["ConsumerCallbacks"] = None,
 ) -> Consumer:
     sr_client = get_schema_registry_client()
-    
+
     # If value_schema_str is None, AvroDeserializer will attempt to resolve schema using embedded schema ID
     # from the consumed message, fetching it from Schema Registry.
-    value_avro_deserializer = AvroDeserializer(schema_registry_client=sr_client, schema_str=value_schema_str if value_schema_str else None)
+    value_avro_deserializer = _avro_deserializer(sr_client, value_schema_str if value_schema_str else None)
     
     key_deserializer = StringDeserializer('utf_8') # Default key deserializer
     if key_schema_str:
         # If a key schema is provided, use Avro for the key as well
-        key_avro_deserializer = AvroDeserializer(schema_registry_client=sr_client, schema_str=key_schema_str)
+        key_avro_deserializer = _avro_deserializer(sr_client, key_schema_str)
         key_deserializer = key_avro_deserializer
 
     consumer_config = kafka_config.copy()
+    consumer_config.update(_statistics_config(group_id))
     consumer_config.update({
         'group.id': group_id,
         'auto.offset.reset': auto_offset_reset,
@@ -128,12 +540,361 @@ def create_avro_consumer(
     })
     if config_overrides:
         consumer_config.update(config_overrides)
+    if callbacks is not None:
+        consumer_config['on_commit'] = callbacks.on_commit
 
     logger.info("Creating Avro Kafka Consumer", group_id=group_id, topics=topics, has_value_schema_str=bool(value_schema_str))
     consumer = Consumer(consumer_config)
-    consumer.subscribe(topics)
+    _subscribe(consumer, topics, callbacks)
     return consumer
 
+def _subscribe(consumer: Consumer, topics: list[str], callbacks: Optional["ConsumerCallbacks"]) -> None:
+    if callbacks is None:
+        consumer.subscribe(topics)
+    else:
+        consumer.subscribe(topics, on_assign=callbacks.on_assign, on_revoke=callbacks.on_revoke, on_lost=callbacks.on_lost)
+
+# --- Consumer Runner ---
+# error_callback(stage, error, msg): stage is "poll" (broker error, error is a KafkaError),
+# "handler" (handler raised) or "loop" (anything else); msg is None when not tied to a message.
+ErrorCallback = Callable[[str, object, Optional[Message]], None]
+
+class ConsumerCallbacks:
+    """
+    Rebalance and offset commit callbacks for a consumer driven by a ConsumerRunner.
+
+    Pass the same instance to create_consumer/create_avro_consumer, which subscribe with
+    it and set it as on_commit, and to the ConsumerRunner, which attaches itself. The
+    consumer only calls them from poll()/consume()/commit(), i.e. once the runner runs.
+    on_commit, if given, is also called with every commit result.
+    """
+
+    def __init__(self, on_commit: Optional[Callable[[Optional[KafkaError], list[TopicPartition]], None]] = None):
+        self.runner: Optional["ConsumerRunner"] = None
+        self._on_commit = on_commit
+
+    def on_assign(self, consumer: Consumer, partitions: list[TopicPartition]) -> None:
+        if self.runner is not None:
+            self.runner._on_assign(partitions)
+
+    def on_revoke(self, consumer: Consumer, partitions: list[TopicPartition]) -> None:
+        if self.runner is not None:
+            self.runner._on_revoke(partitions, commit=True)
+
+    def on_lost(self, consumer: Consumer, partitions: list[TopicPartition]) -> None:
+        if self.runner is not None:
+            self.runner._on_revoke(partitions, commit=False) # Already owned by someone else: nothing to commit
+
+    def on_commit(self, err: Optional[KafkaError], partitions: list[TopicPartition]) -> None:
+        if self.runner is not None:
+            self.runner._on_commit(err, partitions)
+        if self._on_commit is not None:
+            self._on_commit(err, partitions)
+
+class ConsumerRunner:
+    """
+    The poll -> handle -> commit loop shared by the service consumers.
+
+    Messages are polled in batches of up to batch_size (batch_size=1 uses poll()).
+    A per-message handler runs on one of max_workers worker lanes; a partition always
+    maps to the same lane, so each partition is handled in offset order while
+    different partitions proceed in parallel. max_workers=0 handles messages inline
+    on the polling thread. A batch_handler instead receives each polled batch on the
+    polling thread; if it raises, the batch's partitions are rewound so it is redelivered.
+
+    Offsets are committed asynchronously once handled. With callbacks (see
+    ConsumerCallbacks) an offset counts as committed only once the commit callback
+    confirms it, so a failed commit is retried by the next loop; without them a commit
+    is assumed to succeed. When a partition has max_pending_per_partition messages
+    waiting in its lane it is paused until the backlog drains to half of that. On stop
+    the lanes are drained, the final offsets committed synchronously and the consumer
+    closed.
+
+    With callbacks, revoked partitions are drained from their lanes and their offsets
+    committed synchronously before the rebalance completes, and their state (handled
+    offsets, pause) is dropped so a reassigned partition starts afresh. Without them,
+    work in flight for a revoked partition may be redelivered to its new owner.
+
+    Broker errors and handler exceptions are logged, passed to error_callback and
+    followed by an error_backoff_seconds sleep. A message whose handler raised is
+    still committed past, as the per-service loops did. Delivery is at-least-once.
+    """
+
+    def __init__(
+        self,
+        consumer: Consumer,
+        group_id: str,
+        handler: Optional[Callable[[Message], None]] = None,
+        batch_handler: Optional[Callable[[list[Message]], None]] = None,
+        batch_size: int = 1,
+        poll_timeout: float = 1.0,
+        max_workers: int = 0,
+        max_pending_per_partition: int = 1000,
+        error_callback: Optional[ErrorCallback] = None,
+        error_backoff_seconds: float = 5.0,
+        stop_event: Optional[threading.Event] = None,
+        name: str = "kafka-consumer",
+        callbacks: Optional[ConsumerCallbacks] = None,
+    ):
+        if (handler is None) == (batch_handler is None):
+            raise ValueError("ConsumerRunner needs exactly one of handler or batch_handler.")
+        if batch_handler is not None and max_workers:
+            raise ValueError("Batch handlers run on the polling thread; max_workers must be 0.")
+        self.consumer = consumer
+        self.group_id = group_id
+        self.handler = handler
+        self.batch_handler = batch_handler
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        self.max_pending_per_partition = max_pending_per_partition
+        self.error_callback = error_callback
+        self.error_backoff_seconds = error_backoff_seconds
+        self.stop_event = stop_event or threading.Event()
+        self.name = name
+
+        self._lanes = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{name}-lane{i}") for i in range(max_workers)]
+        self._lock = threading.Lock()
+        self._drained = threading.Condition(self._lock) # Notified when a partition's lane backlog reaches zero
+        self._pending: dict[tuple[str, int], int] = defaultdict(int) # Messages queued or running per partition
+        self._done: dict[tuple[str, int], int] = {} # Next offset to commit per partition
+        self._committed: dict[tuple[str, int], int] = {} # Confirmed by the broker
+        self._committing: dict[tuple[str, int], int] = {} # Sent, result not yet known
+        self._paused: set[tuple[str, int]] = set()
+        self._revoked: set[tuple[str, int]] = set() # Late completions for these are not committed
+        if callbacks is not None:
+            callbacks.runner = self
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def run(self) -> None:
+        """Runs until stop_event is set, then drains, commits and closes the consumer."""
+        logger.info("Kafka consumer runner starting", runner=self.name, group_id=self.group_id,
+                    batch_size=self.batch_size, workers=len(self._lanes))
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    messages = self._poll()
+                    if messages:
+                        self._dispatch(messages)
+                    self._commit_done(asynchronous=True)
+                    self._resume_drained()
+                except Exception as e:
+                    logger.error("Exception in Kafka consumer loop", runner=self.name, error=str(e), exc_info=True)
+                    self._report_error("loop", e, None)
+                    time.sleep(self.error_backoff_seconds)
+        finally:
+            self._shutdown()
+
+    # --- Polling and dispatch ---
+    def _poll(self) -> list[Message]:
+        if self.batch_size <= 1:
+            msg = self.consumer.poll(timeout=self.poll_timeout)
+            return [msg] if msg is not None else []
+        return self.consumer.consume(num_messages=self.batch_size, timeout=self.poll_timeout)
+
+    def _dispatch(self, messages: list[Message]) -> None:
+        valid = []
+        broker_error = False
+        for msg in messages:
+            err = msg.error()
+            if err:
+                if err.code() == KafkaError._PARTITION_EOF:
+                    logger.debug("Reached end of partition", topic=msg.topic(), partition=msg.partition(), offset=msg.offset())
+                else:
+                    logger.error("Kafka consumer error", runner=self.name, error=err, topic=msg.topic())
+                    self._report_error("poll", err, msg)
+                    broker_error = True
+                continue
+            valid.append(msg)
+
+        if valid:
+            if self.batch_handler is not None:
+                self._handle_batch(valid)
+            elif self._lanes:
+                for msg in valid:
+                    self._submit(msg)
+            else:
+                for msg in valid:
+                    self._handle(msg)
+        if broker_error:
+            time.sleep(self.error_backoff_seconds) # Back off once per batch on broker errors
+
+    def _handle(self, msg: Message) -> None:
+        key = (msg.topic(), msg.partition())
+        start_time = time.monotonic()
+        failed = False
+        try:
+            self.handler(msg)
+        except Exception as e:
+            failed = True
+            logger.error("Kafka message handler failed", runner=self.name, topic=key[0], partition=key[1],
+                         offset=msg.offset(), error=str(e), exc_info=True)
+            KAFKA_CONSUMER_HANDLER_ERRORS_TOTAL.labels(group_id=self.group_id, topic=key[0]).inc()
+            self._report_error("handler", e, msg)
+        finally:
+            KAFKA_CONSUMER_PROCESSING_SECONDS.labels(group_id=self.group_id, topic=key[0]).observe(time.monotonic() - start_time)
+            self._mark_done(key, msg.offset())
+        if failed:
+            time.sleep(self.error_backoff_seconds)
+
+    def _handle_batch(self, messages: list[Message]) -> None:
+        first_offsets: dict[tuple[str, int], int] = {}
+        last_offsets: dict[tuple[str, int], int] = {}
+        for msg in messages:
+            key = (msg.topic(), msg.partition())
+            first_offsets.setdefault(key, msg.offset())
+            last_offsets[key] = max(last_offsets.get(key, -1), msg.offset())
+
+        start_time = time.monotonic()
+        try:
+            self.batch_handler(messages)
+        except Exception:
+            # Rewind so the whole batch is consumed again rather than committed past
+            for (topic, partition), offset in first_offsets.items():
+                self.consumer.seek(TopicPartition(topic, partition, offset))
+            for topic in {topic for topic, _ in first_offsets}:
+                KAFKA_CONSUMER_HANDLER_ERRORS_TOTAL.labels(group_id=self.group_id, topic=topic).inc()
+            raise
+        finally:
+            duration = time.monotonic() - start_time
+            for topic in {topic for topic, _ in first_offsets}:
+                KAFKA_CONSUMER_PROCESSING_SECONDS.labels(group_id=self.group_id, topic=topic).observe(duration)
+        for key, offset in last_offsets.items():
+            self._mark_done(key, offset)
+
+    # --- Worker lanes and backpressure ---
+    def _submit(self, msg: Message) -> None:
+        key = (msg.topic(), msg.partition())
+        with self._lock:
+            self._pending[key] += 1
+            backlog = self._pending[key]
+        KAFKA_CONSUMER_IN_FLIGHT.labels(group_id=self.group_id).inc()
+        self._lanes[hash(key) % len(self._lanes)].submit(self._run_in_lane, msg)
+        if backlog >= self.max_pending_per_partition and key not in self._paused:
+            self.consumer.pause([TopicPartition(*key)])
+            self._paused.add(key)
+            KAFKA_CONSUMER_PAUSED_PARTITIONS.labels(group_id=self.group_id).set(len(self._paused))
+            logger.info("Paused partition with full backlog", runner=self.name, topic=key[0], partition=key[1], backlog=backlog)
+
+    def _run_in_lane(self, msg: Message) -> None:
+        try:
+            self._handle(msg)
+        finally:
+            key = (msg.topic(), msg.partition())
+            with self._lock:
+                self._pending[key] -= 1
+                if self._pending[key] <= 0:
+                    self._drained.notify_all()
+            KAFKA_CONSUMER_IN_FLIGHT.labels(group_id=self.group_id).dec()
+
+    def _resume_drained(self) -> None:
+        if not self._paused:
+            return
+        resume_at = self.max_pending_per_partition // 2
+        with self._lock:
+            drained = [key for key in self._paused if self._pending[key] <= resume_at]
+        if not drained:
+            return
+        try:
+            self.consumer.resume([TopicPartition(*key) for key in drained])
+        except KafkaException as e:
+            # Partitions revoked while paused come back unpaused on reassignment
+            logger.warning("Failed to resume partitions", runner=self.name, error=str(e))
+        self._paused.difference_update(drained)
+        KAFKA_CONSUMER_PAUSED_PARTITIONS.labels(group_id=self.group_id).set(len(self._paused))
+
+    # --- Rebalances ---
+    def _on_assign(self, partitions: list[TopicPartition]) -> None:
+        # Called from poll()/consume() on the polling thread
+        keys = {(tp.topic, tp.partition) for tp in partitions}
+        with self._lock:
+            self._revoked -= keys
+            self._forget(keys) # Newly assigned partitions start unpaused, from the committed offset
+        KAFKA_CONSUMER_PAUSED_PARTITIONS.labels(group_id=self.group_id).set(len(self._paused))
+        logger.info("Kafka partitions assigned", runner=self.name, partitions=sorted(keys))
+
+    def _on_revoke(self, partitions: list[TopicPartition], commit: bool) -> None:
+        # Called from poll()/consume()/close() on the polling thread, before the partitions move
+        keys = {(tp.topic, tp.partition) for tp in partitions}
+        if commit:
+            with self._drained:
+                self._drained.wait_for(lambda: all(self._pending[key] <= 0 for key in keys))
+            try:
+                self._commit_done(asynchronous=False, keys=keys)
+            except KafkaException as e:
+                logger.error("Offset commit for revoked partitions failed", runner=self.name, error=str(e))
+        with self._lock:
+            self._revoked |= keys
+            self._forget(keys)
+        KAFKA_CONSUMER_PAUSED_PARTITIONS.labels(group_id=self.group_id).set(len(self._paused))
+        logger.info("Kafka partitions revoked" if commit else "Kafka partitions lost", runner=self.name, partitions=sorted(keys))
+
+    def _forget(self, keys: set[tuple[str, int]]) -> None:
+        # Caller holds _lock
+        for key in keys:
+            self._done.pop(key, None)
+            self._committed.pop(key, None)
+            self._committing.pop(key, None)
+            self._paused.discard(key)
+
+    # --- Offsets and errors ---
+    def _mark_done(self, key: tuple[str, int], offset: int) -> None:
+        with self._lock:
+            if key in self._revoked:
+                return # Lost while in flight; the new owner redelivers it
+            # The committed offset is the next one to read, hence +1
+            self._done[key] = max(self._done.get(key, -1), offset + 1)
+
+    def _commit_done(self, asynchronous: bool, keys: Optional[set[tuple[str, int]]] = None) -> None:
+        with self._lock:
+            offsets = [TopicPartition(topic, partition, offset) for (topic, partition), offset in self._done.items()
+                       if (keys is None or (topic, partition) in keys)
+                       and offset != self._committed.get((topic, partition))
+                       and (not asynchronous or offset != self._committing.get((topic, partition)))]
+            for tp in offsets:
+                self._committing[(tp.topic, tp.partition)] = tp.offset
+        if not offsets:
+            return
+        if asynchronous:
+            try:
+                self.consumer.commit(offsets=offsets, asynchronous=True) # Confirmed by _on_commit
+            except Exception:
+                self._on_commit(KafkaError(KafkaError._FAIL), offsets) # Not sent: retry next loop
+                raise
+            return
+        self._on_commit(None, self.consumer.commit(offsets=offsets, asynchronous=False))
+
+    def _on_commit(self, err: Optional[KafkaError], partitions: list[TopicPartition]) -> None:
+        # Commit results are served from poll()/consume()/commit() on the polling thread
+        with self._lock:
+            for tp in partitions:
+                key = (tp.topic, tp.partition)
+                if self._committing.get(key) == tp.offset:
+                    del self._committing[key] # Retried by the next _commit_done unless it succeeded
+                if err is None and tp.error is None and key not in self._revoked:
+                    self._committed[key] = tp.offset
+        if err is not None:
+            logger.warning("Kafka offset commit failed, retrying", runner=self.name, error=str(err))
+
+    def _report_error(self, stage: str, error, msg: Optional[Message]) -> None:
+        if self.error_callback is None:
+            return
+        try:
+            self.error_callback(stage, error, msg)
+        except Exception as e:
+            logger.warning("Kafka consumer error callback failed", runner=self.name, error=str(e))
+
+    def _shutdown(self) -> None:
+        for lane in self._lanes:
+            lane.shutdown(wait=True)
+        try:
+            self._commit_done(asynchronous=False)
+        except KafkaException as e:
+            logger.error("Final offset commit failed", runner=self.name, error=str(e))
+        self.consumer.close()
+        logger.info("Kafka consumer runner stopped", runner=self.name, group_id=self.group_id)
+
 # --- Delivery Report Callback (Example for Producer) ---
 def delivery_report(err, msg):
     """ Called once for each message produced to indicate delivery result.
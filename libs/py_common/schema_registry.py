@@ -0,0 +1,257 @@
+# libs/py_common/schema_registry.py
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Optional, Union
+
+import structlog
+from confluent_kafka.schema_registry import RegisteredSchema, Schema, SchemaRegistryClient
+from confluent_kafka.schema_registry.error import SchemaRegistryError
+from prometheus_client import Counter
+
+logger = structlog.get_logger(__name__)
+
+# Repository-level schema/ directory holding every event's .avsc
+SCHEMA_DIR = Path(__file__).resolve().parent.parent.parent / "schema"
+
+SCHEMA_REGISTRY_LOOKUPS_TOTAL = Counter(
+    "schema_registry_lookups_total",
+    "Schema registry lookups by where they were answered (local cache or remote registry)",
+    ["source"]
+)
+
+
+def subject_for_schema_file(path: Union[str, Path]) -> str:
+    """Value subject for a schema file: schema/offer_payout_completed.avsc -> offer.payout.completed-value."""
+    return f"{Path(path).stem.replace('_', '.')}-value"
+
+
+class FileSchemaRegistryClient(SchemaRegistryClient):
+    """
+    In-process schema registry, optionally persisted to a JSON file.
+
+    On its own it is a local stand-in for the Confluent registry (tests, benchmarks,
+    SCHEMA_REGISTRY_URL=file://...), assigning IDs as schemas are registered. Behind
+    CachingSchemaRegistryClient it mirrors the IDs the remote registry assigned, so a
+    restarted process resolves its schemas without a network round-trip. The mirror's file
+    records registry_url, the registry those IDs came from; a file written for another
+    registry (or none) is discarded on load, as its IDs mean nothing to this one.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, registry_url: Optional[str] = None):
+        super().__init__({'url': 'mock://local'}) # Never contacted; every lookup is overridden
+        self.path = Path(path) if path else None
+        self.registry_url = registry_url
+        self._lock = threading.RLock()
+        self._schemas: dict[int, Schema] = {}
+        self._versions: dict[str, list[RegisteredSchema]] = {}
+        if self.path and self.path.exists():
+            self._load()
+
+    # --- Local store ---
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable schema cache file", path=str(self.path), error=str(e))
+            return
+        if data.get("registry_url") != self.registry_url:
+            # Rewritten for this registry on the next record()
+            logger.info("Discarding schema cache file written for another registry", path=str(self.path),
+                        cached_registry_url=data.get("registry_url"), registry_url=self.registry_url)
+            return
+        for schema_id, schema_str in data.get("schemas", {}).items():
+            self._schemas[int(schema_id)] = Schema(schema_str, "AVRO")
+        for subject, versions in data.get("subjects", {}).items():
+            for entry in versions:
+                schema = self._schemas.get(entry["id"])
+                if schema is not None:
+                    self._versions.setdefault(subject, []).append(
+                        RegisteredSchema(schema_id=entry["id"], guid=None, schema=schema, subject=subject, version=entry["version"])
+                    )
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        data = {
+            "registry_url": self.registry_url,
+            "schemas": {str(schema_id): schema.schema_str for schema_id, schema in self._schemas.items()},
+            "subjects": {
+                subject: [{"id": rs.schema_id, "version": rs.version} for rs in versions]
+                for subject, versions in self._versions.items()
+            },
+        }
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(data, indent=2, sort_keys=True))
+            os.replace(tmp_path, self.path) # Atomic, so concurrent processes never read a torn file
+        except OSError as e:
+            logger.warning("Failed to persist schema cache file", path=str(self.path), error=str(e))
+
+    def find(self, subject_name: str, schema: Schema) -> Optional[RegisteredSchema]:
+        with self._lock:
+            for rs in self._versions.get(subject_name, []):
+                if rs.schema.schema_str == schema.schema_str:
+                    return rs
+        return None
+
+    def record(self, registered_schema: RegisteredSchema) -> None:
+        """Stores a schema under the ID (and subject/version, when known) another registry assigned."""
+        with self._lock:
+            self._schemas[registered_schema.schema_id] = registered_schema.schema
+            subject = registered_schema.subject
+            if subject and not self.find(subject, registered_schema.schema):
+                self._versions.setdefault(subject, []).append(registered_schema)
+            self._save()
+
+    # --- SchemaRegistryClient API used by the Avro serdes ---
+    def register_schema(self, subject_name: str, schema: Schema, normalize_schemas: bool = False) -> int:
+        return self.register_schema_full_response(subject_name, schema, normalize_schemas).schema_id
+
+    def register_schema_full_response(self, subject_name: str, schema: Schema, normalize_schemas: bool = False) -> RegisteredSchema:
+        with self._lock:
+            registered_schema = self.find(subject_name, schema)
+            if registered_schema is not None:
+                return registered_schema
+            schema_id = next((sid for sid, s in self._schemas.items() if s.schema_str == schema.schema_str), None)
+            if schema_id is None:
+                schema_id = max(self._schemas, default=0) + 1
+            versions = self._versions.get(subject_name, [])
+            registered_schema = RegisteredSchema(
+                schema_id=schema_id, guid=None, schema=schema, subject=subject_name,
+                version=max((rs.version for rs in versions), default=0) + 1,
+            )
+            self.record(registered_schema)
+            return registered_schema
+
+    def lookup_schema(self, subject_name: str, schema: Schema, normalize_schemas: bool = False, fmt: Optional[str] = None, deleted: bool = False) -> RegisteredSchema:
+        registered_schema = self.find(subject_name, schema)
+        if registered_schema is None:
+            raise SchemaRegistryError(404, 40403, "Schema not found")
+        return registered_schema
+
+    def get_schema(self, schema_id: int, subject_name: Optional[str] = None, fmt: Optional[str] = None, reference_format: Optional[str] = None) -> Schema:
+        schema = self._schemas.get(schema_id)
+        if schema is None:
+            raise SchemaRegistryError(404, 40403, "Schema not found")
+        return schema
+
+    def get_latest_version(self, subject_name: str, fmt: Optional[str] = None) -> RegisteredSchema:
+        versions = self._versions.get(subject_name)
+        if not versions:
+            raise SchemaRegistryError(404, 40401, "Subject not found")
+        return max(versions, key=lambda rs: rs.version)
+
+    def get_version(self, subject_name: str, version: Union[int, str] = "latest", deleted: bool = False, fmt: Optional[str] = None) -> RegisteredSchema:
+        if version == "latest":
+            return self.get_latest_version(subject_name, fmt)
+        for rs in self._versions.get(subject_name, []):
+            if rs.version == version:
+                return rs
+        raise SchemaRegistryError(404, 40402, "Version not found")
+
+    def get_versions(self, subject_name: str, *args, **kwargs) -> list[int]:
+        return [rs.version for rs in self._versions.get(subject_name, [])]
+
+    def get_subjects(self, *args, **kwargs) -> list[str]:
+        return sorted(self._versions)
+
+    def get_associations_by_resource_name(self, *args, **kwargs) -> list:
+        return [] # No topic associations; serdes fall back to <topic>-value subjects
+
+
+class CachingSchemaRegistryClient(SchemaRegistryClient):
+    """
+    Confluent registry client that answers from a FileSchemaRegistryClient first.
+
+    Schema IDs never change once assigned, so registrations and ID lookups already in the
+    local cache skip the network entirely; misses go to the registry and are recorded.
+    Latest-version lookups prefer the registry and fall back to the cache when it is
+    unreachable. A persistent cache must be keyed by the same registry URL.
+    """
+
+    def __init__(self, conf: dict, cache: FileSchemaRegistryClient):
+        if cache.path and cache.registry_url != conf['url']:
+            raise ValueError(f"Schema cache {cache.path} mirrors registry {cache.registry_url!r}, not {conf['url']!r}")
+        super().__init__(conf)
+        self.cache = cache
+
+    def register_schema(self, subject_name: str, schema: Schema, normalize_schemas: bool = False) -> int:
+        return self.register_schema_full_response(subject_name, schema, normalize_schemas).schema_id
+
+    def register_schema_full_response(self, subject_name: str, schema: Schema, normalize_schemas: bool = False) -> RegisteredSchema:
+        registered_schema = self.cache.find(subject_name, schema)
+        if registered_schema is not None:
+            SCHEMA_REGISTRY_LOOKUPS_TOTAL.labels(source="cache").inc()
+            return registered_schema
+        SCHEMA_REGISTRY_LOOKUPS_TOTAL.labels(source="remote").inc()
+        registered_schema = super().register_schema_full_response(subject_name, schema, normalize_schemas=normalize_schemas)
+        self.cache.record(RegisteredSchema(
+            schema_id=registered_schema.schema_id, guid=None, schema=schema,
+            subject=subject_name, version=registered_schema.version,
+        ))
+        return registered_schema
+
+    def lookup_schema(self, subject_name: str, schema: Schema, normalize_schemas: bool = False, fmt: Optional[str] = None, deleted: bool = False) -> RegisteredSchema:
+        registered_schema = self.cache.find(subject_name, schema)
+        if registered_schema is not None:
+            SCHEMA_REGISTRY_LOOKUPS_TOTAL.labels(source="cache").inc()
+            return registered_schema
+        SCHEMA_REGISTRY_LOOKUPS_TOTAL.labels(source="remote").inc()
+        registered_schema = super().lookup_schema(subject_name, schema, normalize_schemas=normalize_schemas, fmt=fmt, deleted=deleted)
+        self.cache.record(RegisteredSchema(
+            schema_id=registered_schema.schema_id, guid=None, schema=schema,
+            subject=subject_name, version=registered_schema.version,
+        ))
+        return registered_schema
+
+    def get_schema(self, schema_id: int, subject_name: Optional[str] = None, fmt: Optional[str] = None, reference_format: Optional[str] = None) -> Schema:
+        try:
+            schema = self.cache.get_schema(schema_id)
+            SCHEMA_REGISTRY_LOOKUPS_TOTAL.labels(source="cache").inc()
+            return schema
+        except SchemaRegistryError:
+            pass
+        SCHEMA_REGISTRY_LOOKUPS_TOTAL.labels(source="remote").inc()
+        schema = super().get_schema(schema_id, subject_name, fmt, reference_format)
+        self.cache.record(RegisteredSchema(schema_id=schema_id, guid=None, schema=schema, subject=None, version=None))
+        return schema
+
+    def get_latest_version(self, subject_name: str, fmt: Optional[str] = None) -> RegisteredSchema:
+        try:
+            return super().get_latest_version(subject_name, fmt)
+        except Exception as e:
+            try:
+                registered_schema = self.cache.get_latest_version(subject_name, fmt)
+            except SchemaRegistryError:
+                raise e
+            logger.warning("Schema registry unavailable, using cached latest version", subject=subject_name, error=str(e))
+            return registered_schema
+
+
+def preload_schemas(client: SchemaRegistryClient, schema_dir: Union[str, Path] = SCHEMA_DIR, register: bool = False) -> dict[str, int]:
+    """
+    Resolves the ID of every schema_dir/*.avsc under its value subject so the serdes find
+    them in the client cache. Lookups are read-only unless register is set (stand-in
+    registries); failures are logged and left for the serdes to retry on first use.
+    """
+    schema_ids = {}
+    for path in sorted(Path(schema_dir).glob("*.avsc")):
+        subject = subject_for_schema_file(path)
+        schema = Schema(path.read_text().strip(), "AVRO") # Stripped, as the Avro serializers register it
+        try:
+            if register:
+                schema_ids[subject] = client.register_schema(subject, schema)
+            else:
+                schema_ids[subject] = client.lookup_schema(subject, schema).schema_id
+        except SchemaRegistryError as e:
+            logger.warning("Could not preload schema", subject=subject, path=str(path), error=str(e))
+        except Exception as e:
+            # Registry unreachable: don't stall startup on retries for every file; cached
+            # schemas still resolve locally and the rest on first use
+            logger.warning("Schema registry unreachable, skipping schema preload", subject=subject, error=str(e))
+            break
+    logger.info("Schemas preloaded", count=len(schema_ids))
+    return schema_ids
@@ -0,0 +1,77 @@
+# services/docgen/assets.py
+# Static inputs of the PDF templates: stylesheets (assets/css/<name>.css) and the files
+# they or the templates reference (fonts, images). Documents are rendered with
+# base_url=ASSET_DIR, so a relative url() or src resolves to a file under assets/, which
+# AssetCache.fetch serves from memory after the first read. Anything else goes to
+# WeasyPrint's default fetcher.
+import mimetypes
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+from urllib.parse import unquote, urlsplit
+
+import structlog
+from weasyprint import default_url_fetcher
+
+logger = structlog.get_logger(__name__)
+
+ASSET_DIR = Path(__file__).resolve().parent / "assets"
+STYLESHEET_DIR = ASSET_DIR / "css"
+ASSET_BASE_URL = ASSET_DIR.as_uri() + "/"
+
+# Stylesheets applied to each document type
+TERMSHEET_STYLESHEETS = ("termsheet",)
+RECEIPT_STYLESHEETS = ("receipt",)
+
+def stylesheet_path(name: str) -> Path:
+    return STYLESHEET_DIR / f"{name}.css"
+
+class AssetCache:
+    """
+    In-memory copies of the files under the asset directory, keyed by file URL.
+
+    fetch() takes the caller's Counter as its first argument (bind it with
+    functools.partial) and counts each lookup in it as "hit", "miss" (read from disk)
+    or "bypass" (not an asset; passed to WeasyPrint's default fetcher).
+    """
+
+    def __init__(self, root: Path = ASSET_DIR):
+        self.root = root.resolve()
+        self._entries: dict[str, dict] = {}
+
+    def _asset_path(self, url: str) -> Optional[Path]:
+        parts = urlsplit(url)
+        if parts.scheme != "file":
+            return None
+        path = Path(unquote(parts.path)).resolve()
+        if not path.is_relative_to(self.root) or not path.is_file():
+            return None
+        return path
+
+    def _load(self, url: str, path: Path) -> dict:
+        entry = {
+            "string": path.read_bytes(),
+            "mime_type": mimetypes.guess_type(path.name)[0] or "application/octet-stream",
+            "redirected_url": url,
+        }
+        self._entries[url] = entry
+        return entry
+
+    def preload(self) -> int:
+        """Reads every asset into memory; returns the number of files loaded."""
+        for path in self.root.rglob("*"):
+            if path.is_file():
+                self._load(path.as_uri(), path)
+        return len(self._entries)
+
+    def fetch(self, lookups: Counter, url: str, timeout: int = 10, ssl_context=None) -> dict:
+        entry = self._entries.get(url)
+        if entry is not None:
+            lookups["hit"] += 1
+            return dict(entry) # WeasyPrint may consume the dict
+        path = self._asset_path(url)
+        if path is None:
+            lookups["bypass"] += 1
+            return default_url_fetcher(url, timeout=timeout, ssl_context=ssl_context)
+        lookups["miss"] += 1
+        return dict(self._load(url, path))
@@ -14,6 +14,13 @@ CELERY_TASK_DURATION_SECONDS = Histogram(
     ["task_name"]
 )
 
+DOCGEN_BATCH_STAGE_DURATION_SECONDS = Histogram(
+    "docgen_batch_stage_duration_seconds",
+    "Wall time of each stage of a batch term sheet task.",
+    ["stage"], # load, render, upload (after the last render), update
+    buckets=(0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+)
+
 # --- PDF Generation Metrics ---
 PDF_GENERATION_TOTAL = Counter(
     "docgen_pdf_generation_total",
@@ -27,6 +34,35 @@ PDF_GENERATION_DURATION_SECONDS = Histogram(
     [] # No specific labels here, or add one if e.g. different templates existed
 )
 
+# --- Render Pool Metrics ---
+PDF_RENDER_QUEUE_WAIT_SECONDS = Histogram(
+    "docgen_pdf_render_queue_wait_seconds",
+    "Time a document waited for a free render worker.",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+PDF_RENDER_POOL_IN_FLIGHT = Gauge(
+    "docgen_pdf_render_pool_in_flight",
+    "Documents queued on or being rendered by the render pool."
+)
+
+PDF_RENDER_POOL_RESTARTS_TOTAL = Counter(
+    "docgen_pdf_render_pool_restarts_total",
+    "Times the render pool was rebuilt after a worker process died."
+)
+
+# --- Asset Cache Metrics ---
+DOCGEN_ASSET_CACHE_LOOKUPS_TOTAL = Counter(
+    "docgen_asset_cache_lookups_total",
+    "URL lookups made while rendering PDFs, by asset cache result.",
+    ["result"] # hit: served from memory, miss: read from assets/, bypass: not a docgen asset
+)
+
+DOCGEN_ASSET_CACHE_HIT_RATIO = Gauge(
+    "docgen_asset_cache_hit_ratio",
+    "Share of asset lookups served from memory since the worker started."
+)
+
 # --- S3 Upload Metrics ---
 S3_UPLOADS_TOTAL = Counter(
     "docgen_s3_uploads_total",
@@ -40,6 +76,11 @@ S3_UPLOAD_DURATION_SECONDS = Histogram(
     []
 )
 
+S3_UPLOADS_IN_FLIGHT = Gauge(
+    "docgen_s3_uploads_in_flight",
+    "Uploads queued on or running in the background S3 uploader."
+)
+
 # --- General Application Metrics ---
 APP_ERRORS_TOTAL = Counter(
     "docgen_app_errors_total",
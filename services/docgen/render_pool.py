@@ -0,0 +1,336 @@
+# services/docgen/render_pool.py
+# Long-lived WeasyPrint render workers. A cold WeasyPrint render pays for loading Pango,
+# fontconfig and the system fonts before any layout happens; the pool's worker processes
+# pay that once at start-up (a warm-up render) and then take documents off the executor's
+# queue. Each worker is replaced after DOCGEN_RENDER_MAX_RENDERS_PER_WORKER documents,
+# which caps the memory WeasyPrint/Pango caches accumulate. Workers also parse the shared
+# stylesheets once into CSS objects and keep the template assets in memory (assets.py).
+#
+# The pool lives in the process that runs the Celery tasks, so the docgen worker runs
+# Celery's threads pool: task threads orchestrate I/O while rendering happens here. When
+# processes cannot be started (e.g. inside a daemonic prefork child) or the pool is
+# disabled with DOCGEN_RENDER_POOL_SIZE=0, documents are rendered in the calling process,
+# which still keeps its own warm font configuration between renders.
+#
+# PDFs are written straight into a buffer through HashingWriter, so the SHA-256 is ready
+# when rendering finishes and no local file is written. In-process, the buffer is a
+# SpooledTemporaryFile that only spills to an anonymous temporary file past
+# DOCGEN_PDF_SPOOL_MAX_BYTES; from a pool worker the PDF crosses the process boundary
+# once, as bytes, together with its hash.
+import functools
+import hashlib
+import io
+import itertools
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Any, BinaryIO, Iterable, Iterator, NamedTuple, Optional
+
+import structlog
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
+
+from .assets import ASSET_BASE_URL, STYLESHEET_DIR, AssetCache, stylesheet_path
+from .metrics import (
+    APP_ERRORS_TOTAL,
+    DOCGEN_ASSET_CACHE_HIT_RATIO,
+    DOCGEN_ASSET_CACHE_LOOKUPS_TOTAL,
+    PDF_RENDER_POOL_IN_FLIGHT,
+    PDF_RENDER_POOL_RESTARTS_TOTAL,
+    PDF_RENDER_QUEUE_WAIT_SECONDS,
+)
+
+logger = structlog.get_logger(__name__)
+
+DOCGEN_RENDER_POOL_SIZE = int(os.getenv("DOCGEN_RENDER_POOL_SIZE", str(os.cpu_count() or 1))) # 0 renders in-process
+DOCGEN_RENDER_MAX_RENDERS_PER_WORKER = int(os.getenv("DOCGEN_RENDER_MAX_RENDERS_PER_WORKER", "200"))
+DOCGEN_RENDER_TIMEOUT_SECONDS = float(os.getenv("DOCGEN_RENDER_TIMEOUT_SECONDS", "120"))
+# In-process renders stay in memory up to this size, then spill to an anonymous temporary file
+DOCGEN_PDF_SPOOL_MAX_BYTES = int(os.getenv("DOCGEN_PDF_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# Exercises text shaping and the default fonts so the first real document renders warm
+_WARMUP_HTML = "<html><body><h1>Warm-up</h1><p>Term sheet <b>bold</b> <i>italic</i> 0123456789 €</p></body></html>"
+
+# Per-process render state (in each pool worker, or in the calling process when rendering in-process)
+_font_config: Optional[FontConfiguration] = None
+_asset_cache: Optional[AssetCache] = None
+_stylesheets: dict[str, CSS] = {}
+
+class RenderedPdf(NamedTuple):
+    """A rendered document: its content (a file object at position 0, closed by the consumer), SHA-256 and size."""
+    body: BinaryIO
+    sha256: str
+    size: int
+
+class HashingWriter:
+    """Write-only file object that hashes and counts the bytes it passes on to target."""
+
+    def __init__(self, target: BinaryIO):
+        self.target = target
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self._sha256.update(data)
+        self.size += len(data)
+        return self.target.write(data)
+
+    def flush(self) -> None:
+        self.target.flush()
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+def _get_font_config() -> FontConfiguration:
+    global _font_config
+    if _font_config is None:
+        _font_config = FontConfiguration()
+    return _font_config
+
+def _get_asset_cache() -> AssetCache:
+    global _asset_cache
+    if _asset_cache is None:
+        _asset_cache = AssetCache()
+    return _asset_cache
+
+def _get_stylesheet(name: str) -> CSS:
+    stylesheet = _stylesheets.get(name)
+    if stylesheet is None:
+        stylesheet = _stylesheets[name] = CSS(
+            string=stylesheet_path(name).read_text(),
+            base_url=ASSET_BASE_URL,
+            url_fetcher=functools.partial(_get_asset_cache().fetch, Counter()),
+            font_config=_get_font_config(), # Registers the stylesheet's @font-face rules
+        )
+    return stylesheet
+
+def init_render_worker() -> None:
+    """Pool worker initializer: loads assets and stylesheets, then Pango, fontconfig and the fonts with a warm-up render."""
+    start_time = time.monotonic()
+    _get_asset_cache().preload()
+    names = tuple(path.stem for path in sorted(STYLESHEET_DIR.glob("*.css")))
+    render_pdf(_WARMUP_HTML, names, io.BytesIO())
+    logger.info("Render worker ready", pid=os.getpid(), stylesheets=names, warmup_seconds=round(time.monotonic() - start_time, 3))
+
+def render_pdf(html_content: str, stylesheets: tuple[str, ...], target: BinaryIO) -> tuple[str, int, Counter]:
+    """Renders HTML to PDF into target in the current process; returns the PDF's SHA-256 and size and the asset cache lookups."""
+    lookups = Counter()
+    writer = HashingWriter(target)
+    HTML(
+        string=html_content,
+        base_url=ASSET_BASE_URL,
+        url_fetcher=functools.partial(_get_asset_cache().fetch, lookups),
+    ).write_pdf(writer, stylesheets=[_get_stylesheet(name) for name in stylesheets], font_config=_get_font_config())
+    return writer.sha256, writer.size, lookups
+
+def _render_job(html_content: str, stylesheets: tuple[str, ...], submitted_at: float) -> tuple[bytes, str, int, Counter, float]:
+    # Runs in a pool worker; time.time() so the queue wait is comparable across processes
+    queue_wait = time.time() - submitted_at
+    buffer = io.BytesIO()
+    sha256, size, lookups = render_pdf(html_content, stylesheets, buffer)
+    return buffer.getvalue(), sha256, size, lookups, queue_wait
+
+_asset_lookup_totals = Counter()
+
+def _record_asset_lookups(lookups: Counter) -> None:
+    # Pool workers cannot export metrics themselves, so their counts are recorded here
+    for result, count in lookups.items():
+        DOCGEN_ASSET_CACHE_LOOKUPS_TOTAL.labels(result=result).inc(count)
+    _asset_lookup_totals.update(lookups)
+    cacheable = _asset_lookup_totals["hit"] + _asset_lookup_totals["miss"]
+    if cacheable:
+        DOCGEN_ASSET_CACHE_HIT_RATIO.set(_asset_lookup_totals["hit"] / cacheable)
+
+class RenderPool:
+    """
+    A process pool of warm render workers. Documents are queued to the executor and
+    rendered by whichever worker is free; a worker is recycled after
+    max_renders_per_worker documents. If a worker dies (e.g. OOM-killed) the pool is
+    rebuilt and the documents in flight fail.
+    """
+
+    def __init__(self, processes: int = DOCGEN_RENDER_POOL_SIZE, max_renders_per_worker: int = DOCGEN_RENDER_MAX_RENDERS_PER_WORKER):
+        self.processes = processes
+        self.max_renders_per_worker = max_renders_per_worker
+        self._lock = threading.Lock()
+        self._executor = self._create_executor()
+        self.generation = 0 # Bumped on every restart
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn: max_tasks_per_child does not work with fork, and workers must not inherit Celery's state
+        return ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=get_context("spawn"),
+            initializer=init_render_worker,
+            max_tasks_per_child=self.max_renders_per_worker,
+        )
+
+    def submit(self, html_content: str, stylesheets: tuple[str, ...] = ()) -> Future:
+        """Queues a document; the future resolves to (pdf_bytes, sha256, size, asset lookups, seconds spent queued)."""
+        with self._lock:
+            executor, generation = self._executor, self.generation
+        try:
+            return executor.submit(_render_job, html_content, stylesheets, time.time())
+        except BrokenProcessPool:
+            # A worker died since the last result was collected: submit to a fresh pool
+            self.restart(generation)
+            return self.submit(html_content, stylesheets)
+
+    def warm_up(self, timeout: float = DOCGEN_RENDER_TIMEOUT_SECONDS) -> None:
+        """Starts every worker now (workers are otherwise started on demand) and waits for their warm-up."""
+        with self._lock:
+            executor = self._executor
+        for future in [executor.submit(os.getpid) for _ in range(self.processes)]:
+            future.result(timeout=timeout)
+
+    def render(self, html_content: str, stylesheets: tuple[str, ...] = (), timeout: float = DOCGEN_RENDER_TIMEOUT_SECONDS) -> RenderedPdf:
+        PDF_RENDER_POOL_IN_FLIGHT.inc()
+        generation = self.generation
+        try:
+            return self.result(self.submit(html_content, stylesheets), generation, timeout)
+        finally:
+            PDF_RENDER_POOL_IN_FLIGHT.dec()
+
+    def result(self, future: Future, generation: int, timeout: Optional[float] = None) -> RenderedPdf:
+        """The rendered PDF of a submitted document; restarts the pool if the document's worker died."""
+        try:
+            pdf_bytes, sha256, size, lookups, queue_wait = future.result(timeout=timeout)
+        except BrokenProcessPool:
+            self.restart(generation)
+            raise
+        PDF_RENDER_QUEUE_WAIT_SECONDS.observe(queue_wait)
+        _record_asset_lookups(lookups)
+        return RenderedPdf(io.BytesIO(pdf_bytes), sha256, size) # BytesIO shares the bytes rather than copying them
+
+    def restart(self, generation: int) -> None:
+        """Replaces the executor, unless it was already replaced since generation."""
+        with self._lock:
+            if generation != self.generation:
+                return
+            broken, self._executor = self._executor, self._create_executor()
+            self.generation += 1
+        logger.error("Render worker died; render pool restarted", processes=self.processes)
+        APP_ERRORS_TOTAL.labels(error_type="render_pool_broken", component="render_pool").inc()
+        PDF_RENDER_POOL_RESTARTS_TOTAL.inc()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+_render_pool: Optional[RenderPool] = None
+_render_pool_disabled = DOCGEN_RENDER_POOL_SIZE <= 0
+_render_pool_lock = threading.Lock()
+
+def get_render_pool() -> Optional[RenderPool]:
+    """The process-wide render pool, or None when documents are rendered in-process."""
+    global _render_pool
+    if _render_pool is None and not _render_pool_disabled:
+        with _render_pool_lock:
+            if _render_pool is None and not _render_pool_disabled:
+                _render_pool = RenderPool()
+                logger.info("Render pool created", processes=_render_pool.processes, max_renders_per_worker=_render_pool.max_renders_per_worker)
+    return _render_pool
+
+def _disable_render_pool(error: AssertionError) -> None:
+    # "daemonic processes are not allowed to have children": running under a prefork pool
+    global _render_pool_disabled
+    logger.warning("Render pool cannot start worker processes here; rendering in-process", error=str(error))
+    APP_ERRORS_TOTAL.labels(error_type="render_pool_unavailable", component="render_pool").inc()
+    _render_pool_disabled = True
+    shutdown_render_pool(wait=False)
+
+def _render_in_process(html_content: str, stylesheets: tuple[str, ...]) -> RenderedPdf:
+    spool = tempfile.SpooledTemporaryFile(max_size=DOCGEN_PDF_SPOOL_MAX_BYTES)  # noqa: SIM115 - closed here on failure, else owned by RenderedPdf.body
+    try:
+        sha256, size, lookups = render_pdf(html_content, stylesheets, spool)
+    except Exception:
+        spool.close()
+        raise
+    _record_asset_lookups(lookups)
+    spool.seek(0)
+    return RenderedPdf(spool, sha256, size)
+
+def render_document(html_content: str, stylesheets: tuple[str, ...] = ()) -> RenderedPdf:
+    """Renders HTML with the named stylesheets (assets/css/<name>.css) to PDF, on the render pool or in-process without one."""
+    pool = get_render_pool()
+    if pool is not None:
+        try:
+            return pool.render(html_content, stylesheets)
+        except AssertionError as e:
+            _disable_render_pool(e)
+    return _render_in_process(html_content, stylesheets)
+
+def render_documents(
+    documents: Iterable[tuple[Any, str, tuple[str, ...]]],
+    max_in_flight: Optional[int] = None,
+    timeout: float = DOCGEN_RENDER_TIMEOUT_SECONDS,
+) -> Iterator[tuple[Any, Optional[RenderedPdf], Optional[Exception]]]:
+    """
+    Renders (key, html, stylesheets) documents across the render pool, yielding
+    (key, RenderedPdf, None) or (key, None, error) in completion order. At most
+    max_in_flight documents (default: twice the pool size) are queued at once, so
+    rendered PDFs do not pile up faster than the caller consumes them. A document not
+    rendered within timeout of being submitted, as with render(), is yielded as
+    (key, None, TimeoutError) and its future cancelled.
+    """
+    documents = iter(documents)
+    pool = get_render_pool()
+    max_in_flight = max_in_flight or (pool.processes * 2 if pool else 1)
+    submitted_to = pool
+    pending: dict[Future, tuple[Any, int, float]] = {} # future -> (key, pool generation, deadline)
+    in_process: list = []
+
+    def fill():
+        nonlocal pool
+        while pool is not None and len(pending) < max_in_flight:
+            document = next(documents, None)
+            if document is None:
+                return
+            key, html_content, stylesheets = document
+            generation = pool.generation
+            try:
+                pending[pool.submit(html_content, stylesheets)] = (key, generation, time.monotonic() + timeout)
+            except AssertionError as e:
+                _disable_render_pool(e)
+                pool = None
+                in_process.append(document)
+
+    fill()
+    while pending:
+        next_deadline = min(deadline for _, _, deadline in pending.values())
+        done, _ = wait_futures(pending, timeout=max(next_deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+        for future in done:
+            key, generation, _ = pending.pop(future)
+            try:
+                yield key, submitted_to.result(future, generation), None
+            except Exception as e:
+                yield key, None, e
+        now = time.monotonic()
+        for future in [f for f, (_, _, deadline) in pending.items() if deadline <= now]:
+            key, _, _ = pending.pop(future)
+            future.cancel() # Only stops it if not yet running; a render in progress finishes on its worker
+            logger.error("Render timed out in batch", key=str(key), timeout_seconds=timeout)
+            APP_ERRORS_TOTAL.labels(error_type="render_timeout", component="render_pool").inc()
+            yield key, None, TimeoutError(f"Render did not finish within {timeout}s")
+        fill()
+
+    # No pool, or it could not start workers
+    for key, html_content, stylesheets in itertools.chain(in_process, documents):
+        try:
+            yield key, _render_in_process(html_content, stylesheets), None
+        except Exception as e:
+            yield key, None, e
+
+def shutdown_render_pool(wait: bool = True) -> None:
+    global _render_pool
+    with _render_pool_lock:
+        pool, _render_pool = _render_pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait)
+        logger.info("Render pool shut down")
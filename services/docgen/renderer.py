@@ -1,13 +1,12 @@
-import os
 import uuid
 from datetime import datetime
 import hashlib
 from pathlib import Path
 import time # For duration measurement
+from concurrent.futures import Future
+from typing import BinaryIO
 
 from jinja2 import Environment, FileSystemLoader
-from weasyprint import HTML
-import boto3
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError, ClientError
 import structlog
 
@@ -26,19 +25,20 @@ from .metrics import (
     S3_UPLOAD_DURATION_SECONDS,
     APP_ERRORS_TOTAL
 )
+from .assets import RECEIPT_STYLESHEETS, TERMSHEET_STYLESHEETS
+from .render_pool import RenderedPdf, render_document
+from .uploader import S3_BUCKET_NAME, get_s3_uploader
 
 logger = structlog.get_logger(__name__)
 
 # Initialize Jinja2 environment
 TEMPLATE_DIR = Path(__file__).parent / "templates"
-jinja_env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=True)
+# Templates are compiled on first use and cached; auto_reload=False skips the per-render mtime check
+jinja_env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=True, auto_reload=False)
 
-# S3 Configuration
-S3_BUCKET_NAME = os.getenv("TERM_SHEETS_S3_BUCKET")
+# S3 Configuration (bucket, client and upload threads: uploader.py)
 S3_RECEIPTS_PREFIX = "receipts" # New prefix for receipts
 S3_TERMSHEETS_PREFIX = "termsheets" # Existing prefix for termsheets
-S3_REGION = os.getenv("AWS_REGION", "eu-north-1")
-s3_client = boto3.client("s3", region_name=S3_REGION) if S3_BUCKET_NAME else None
 if not S3_BUCKET_NAME:
     logger.warning("TERM_SHEETS_S3_BUCKET environment variable not set. S3 upload will be disabled.")
 
@@ -53,75 +53,87 @@ def render_html(offer: Offer) -> str:
     html_content = template.render(offer=offer, generation_date=generation_date_str)
     return html_content
 
-def generate_pdf_from_html(html_content: str, offer_id: uuid.UUID) -> tuple[str | None, bytes | None]:
-    """Generates a PDF from HTML content and returns its path and content."""
-    # Using /tmp for PDF generation, ensure worker has write access
-    # Filename could be more robust, e.g., include a timestamp or unique ID portion
-    pdf_filename = f"termsheet_offer_{str(offer_id)}.pdf"
-    # In a containerized environment, /tmp is usually fine.
-    # For serverless/lambda, ensure /tmp is writable and has enough space.
-    local_pdf_path = f"/tmp/{pdf_filename}"
-    
-    logger.info("Generating PDF", offer_id=str(offer_id), path=local_pdf_path)
+def generate_pdf_from_html(html_content: str, offer_id: uuid.UUID, stylesheets: tuple[str, ...] = ()) -> RenderedPdf | None:
+    """
+    Generates a PDF from HTML content, styled with the named stylesheets. The PDF is held
+    in a buffer (no local file) and hashed as it is written; the caller uploads it from
+    RenderedPdf.body and closes it.
+    """
+    logger.info("Generating PDF", offer_id=str(offer_id))
     
     start_time = time.monotonic()
     outcome = "failure_render"
-    pdf_bytes = None
     try:
-        pdf_bytes = HTML(string=html_content).write_pdf()
-        with open(local_pdf_path, "wb") as f:
-            f.write(pdf_bytes)
-        logger.info("PDF generated successfully", local_path=local_pdf_path)
+        # Rendered by a warm render pool worker (fonts already loaded)
+        pdf = render_document(html_content, stylesheets)
+        logger.info("PDF generated successfully", offer_id=str(offer_id), size_bytes=pdf.size, pdf_hash=pdf.sha256)
         outcome = "success"
-        return local_pdf_path, pdf_bytes
+        return pdf
     except Exception as e:
-        logger.error("Failed to generate or write PDF", error=str(e), offer_id=str(offer_id), exc_info=True)
+        logger.error("Failed to generate PDF", error=str(e), offer_id=str(offer_id), exc_info=True)
         APP_ERRORS_TOTAL.labels(error_type="pdf_generation", component="generate_pdf_from_html").inc()
-        outcome = "failure_write" # More specific error if possible
-        return None, None
+        return None
     finally:
         PDF_GENERATION_DURATION_SECONDS.observe(time.monotonic() - start_time)
         PDF_GENERATION_TOTAL.labels(outcome=outcome).inc()
 
-def upload_to_s3(pdf_bytes: bytes, offer_id: uuid.UUID) -> str | None:
-    """Uploads the PDF to S3 and returns a presigned URL."""
-    if not s3_client or not S3_BUCKET_NAME:
+def _submit_upload(pdf_body: bytes | BinaryIO, s3_key: str, object_id, component: str) -> Future:
+    """
+    Queues the PDF on the background S3 uploader. The returned future resolves to a
+    presigned URL, or to None if the upload failed (logged and counted here).
+    """
+    result = Future()
+    uploader = get_s3_uploader()
+    if uploader is None:
         logger.error("S3 client or bucket name not configured. Cannot upload.")
         S3_UPLOADS_TOTAL.labels(outcome="failure_config").inc()
-        return None
+        result.set_result(None)
+        return result
 
-    s3_key = f"termsheets/{str(offer_id)}/termsheet_{datetime.utcnow().strftime("%Y%m%d%H%M%S")}.pdf"
-    logger.info("Uploading PDF to S3", bucket=S3_BUCKET_NAME, key=s3_key, offer_id=str(offer_id))
-    
+    logger.info("Uploading PDF to S3", bucket=uploader.bucket, key=s3_key, object_id=str(object_id))
     start_time = time.monotonic()
-    outcome = "failure_unknown"
-    try:
-        s3_client.put_object(Bucket=S3_BUCKET_NAME, Key=s3_key, Body=pdf_bytes, ContentType='application/pdf')
-        
-        # Generate a presigned URL (valid for 24 hours)
-        presigned_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': S3_BUCKET_NAME, 'Key': s3_key},
-            ExpiresIn=24 * 3600  # 24 hours
-        )
-        logger.info("PDF uploaded to S3 successfully", s3_key=s3_key)
-        outcome = "success"
-        return presigned_url
-    except (NoCredentialsError, PartialCredentialsError) as e:
-        logger.error("S3 credentials not found or incomplete.", error=str(e), offer_id=str(offer_id))
-        APP_ERRORS_TOTAL.labels(error_type="s3_credentials", component="upload_to_s3").inc()
-        outcome = "failure_credentials"
-    except ClientError as e:
-        logger.error("S3 ClientError during upload.", error=str(e.response.get('Error',{}).get('Code')), offer_id=str(offer_id))
-        APP_ERRORS_TOTAL.labels(error_type="s3_client_error", component="upload_to_s3").inc()
-        outcome = "failure_client_error"
-    except Exception as e:
-        logger.error("Unexpected error during S3 upload.", error=str(e), offer_id=str(offer_id), exc_info=True)
-        APP_ERRORS_TOTAL.labels(error_type="s3_unknown_error", component="upload_to_s3").inc()
-    finally:
-        S3_UPLOAD_DURATION_SECONDS.observe(time.monotonic() - start_time)
-        S3_UPLOADS_TOTAL.labels(outcome=outcome).inc()
-    return None
+
+    def on_uploaded(upload: Future):
+        # Runs on an upload thread
+        presigned_url = None
+        outcome = "failure_unknown"
+        try:
+            upload.result()
+            # Signed locally (valid for 24 hours); no request to S3
+            presigned_url = uploader.presigned_url(s3_key)
+            logger.info("PDF uploaded to S3 successfully", s3_key=s3_key)
+            outcome = "success"
+        except (NoCredentialsError, PartialCredentialsError) as e:
+            logger.error("S3 credentials not found or incomplete.", error=str(e), object_id=str(object_id))
+            APP_ERRORS_TOTAL.labels(error_type="s3_credentials", component=component).inc()
+            outcome = "failure_credentials"
+        except ClientError as e:
+            logger.error("S3 ClientError during upload.", error=str(e.response.get('Error',{}).get('Code')), object_id=str(object_id))
+            APP_ERRORS_TOTAL.labels(error_type="s3_client_error", component=component).inc()
+            outcome = "failure_client_error"
+        except Exception as e:
+            logger.error("Unexpected error during S3 upload.", error=str(e), object_id=str(object_id), exc_info=True)
+            APP_ERRORS_TOTAL.labels(error_type="s3_unknown_error", component=component).inc()
+        finally:
+            S3_UPLOAD_DURATION_SECONDS.observe(time.monotonic() - start_time)
+            S3_UPLOADS_TOTAL.labels(outcome=outcome).inc()
+            result.set_result(presigned_url)
+
+    uploader.submit(pdf_body, s3_key).add_done_callback(on_uploaded)
+    return result
+
+def upload_to_s3_async(pdf_body: bytes | BinaryIO, offer_id: uuid.UUID) -> Future:
+    """
+    Queues the term sheet PDF (bytes, or a file object read from its current position
+    and kept open until the future is done) for upload. The future resolves to a
+    presigned URL, or None if the upload failed.
+    """
+    s3_key = f"{S3_TERMSHEETS_PREFIX}/{str(offer_id)}/termsheet_{datetime.utcnow().strftime("%Y%m%d%H%M%S")}.pdf"
+    return _submit_upload(pdf_body, s3_key, offer_id, "upload_to_s3")
+
+def upload_to_s3(pdf_body: bytes | BinaryIO, offer_id: uuid.UUID) -> str | None:
+    """Uploads the PDF (bytes, or a file object read from its current position) to S3 and returns a presigned URL."""
+    return upload_to_s3_async(pdf_body, offer_id).result()
 
 def calculate_sha256(pdf_bytes: bytes) -> str:
     """Calculates the SHA256 hash of the PDF content."""
@@ -141,19 +153,17 @@ def render_termsheet_pdf(offer: Offer) -> tuple[str | None, str | None]:
         # 1. Render HTML from Jinja2 template
         html_content = render_html(offer)
         
-        # 2. Generate PDF from HTML
-        # generate_pdf_from_html now returns (local_path, pdf_bytes)
-        _local_pdf_path, pdf_bytes = generate_pdf_from_html(html_content, offer.id)
-        if not pdf_bytes:
+        # 2. Generate PDF from HTML (hashed while it was written)
+        pdf = generate_pdf_from_html(html_content, offer.id, TERMSHEET_STYLESHEETS)
+        if pdf is None:
             logger.error("PDF generation failed, no bytes produced.", offer_id=str(offer.id))
             # Metric for this case already handled in generate_pdf_from_html
             return None, None
+        pdf_hash = pdf.sha256
 
-        # 3. Calculate SHA256 hash of the PDF content
-        pdf_hash = calculate_sha256(pdf_bytes)
-
-        # 4. Upload PDF to S3 and get presigned URL
-        s3_presigned_url = upload_to_s3(pdf_bytes, offer.id)
+        # 3. Upload PDF to S3 straight from the buffer and get presigned URL
+        with pdf.body:
+            s3_presigned_url = upload_to_s3(pdf.body, offer.id)
         # If upload fails, we might still want to return the hash, or handle differently
         if not s3_presigned_url:
             logger.warning("S3 upload failed, PDF not stored in S3 but hash calculated.", offer_id=str(offer.id))
@@ -187,45 +197,12 @@ def _render_html_for_receipt(event_data: dict) -> str:
     html_content = template.render(context)
     return html_content
 
-# Re-using existing generate_pdf_from_html, calculate_sha256
+# Re-using existing generate_pdf_from_html
 # Modified upload_to_s3 to accept a prefix
-def upload_to_s3_v2(pdf_bytes: bytes, object_id: str, s3_prefix: str, filename_prefix: str) -> str | None:
+def upload_to_s3_v2(pdf_body: bytes | BinaryIO, object_id: str, s3_prefix: str, filename_prefix: str) -> str | None:
     """Uploads the PDF to S3 under a specific prefix and returns a presigned URL."""
-    if not s3_client or not S3_BUCKET_NAME:
-        logger.error("S3 client or bucket name not configured. Cannot upload.")
-        S3_UPLOADS_TOTAL.labels(outcome="failure_config").inc() # Consider adding prefix to metric label
-        return None
-
     s3_key = f"{s3_prefix}/{str(object_id)}/{filename_prefix}_{datetime.utcnow().strftime("%Y%m%d%H%M%S")}.pdf"
-    logger.info("Uploading PDF to S3", bucket=S3_BUCKET_NAME, key=s3_key, object_id=str(object_id))
-    
-    start_time = time.monotonic()
-    outcome = "failure_unknown"
-    try:
-        s3_client.put_object(Bucket=S3_BUCKET_NAME, Key=s3_key, Body=pdf_bytes, ContentType='application/pdf')
-        presigned_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': S3_BUCKET_NAME, 'Key': s3_key},
-            ExpiresIn=24 * 3600  # 24 hours
-        )
-        logger.info("PDF uploaded to S3 successfully", s3_key=s3_key)
-        outcome = "success"
-        return presigned_url
-    except (NoCredentialsError, PartialCredentialsError) as e:
-        logger.error("S3 credentials not found or incomplete.", error=str(e), object_id=str(object_id))
-        APP_ERRORS_TOTAL.labels(error_type="s3_credentials", component="upload_to_s3_v2").inc()
-        outcome = "failure_credentials"
-    except ClientError as e:
-        logger.error("S3 ClientError during upload.", error=str(e.response.get('Error',{}).get('Code')), object_id=str(object_id))
-        APP_ERRORS_TOTAL.labels(error_type="s3_client_error", component="upload_to_s3_v2").inc()
-        outcome = "failure_client_error"
-    except Exception as e:
-        logger.error("Unexpected error during S3 upload.", error=str(e), object_id=str(object_id), exc_info=True)
-        APP_ERRORS_TOTAL.labels(error_type="s3_unknown_error", component="upload_to_s3_v2").inc()
-    finally:
-        S3_UPLOAD_DURATION_SECONDS.observe(time.monotonic() - start_time)
-        S3_UPLOADS_TOTAL.labels(outcome=outcome).inc() # Consider adding prefix
-    return None
+    return _submit_upload(pdf_body, s3_key, object_id, "upload_to_s3_v2").result()
 
 # --- New function for rendering and uploading receipt PDF ---
 def render_receipt_pdf_and_upload(event_data: dict) -> tuple[str | None, str | None]:
@@ -253,13 +230,14 @@ def render_receipt_pdf_and_upload(event_data: dict) -> tuple[str | None, str | N
     try:
         html_content = _render_html_for_receipt(event_data)
         
-        _local_pdf_path, pdf_bytes = generate_pdf_from_html(html_content, offer_id_uuid) # Pass UUID
-        if not pdf_bytes:
+        pdf = generate_pdf_from_html(html_content, offer_id_uuid, RECEIPT_STYLESHEETS) # Pass UUID
+        if pdf is None:
             logger.error("Receipt PDF generation failed, no bytes produced.", offer_id=offer_id_str)
             return None, None
 
-        pdf_hash = calculate_sha256(pdf_bytes)
-        s3_presigned_url = upload_to_s3_v2(pdf_bytes, offer_id_str, S3_RECEIPTS_PREFIX, "receipt")
+        pdf_hash = pdf.sha256
+        with pdf.body:
+            s3_presigned_url = upload_to_s3_v2(pdf.body, offer_id_str, S3_RECEIPTS_PREFIX, "receipt")
 
         logger.info("Receipt PDF processed", offer_id=offer_id_str, s3_url=s3_presigned_url, pdf_hash=pdf_hash)
         return s3_presigned_url, pdf_hash
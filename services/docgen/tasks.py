@@ -1,19 +1,25 @@
+import functools
 import os
 import uuid
 from datetime import datetime
 import time # For duration measurement
 import structlog
 import threading # For Kafka consumer thread
+from concurrent.futures import as_completed
 from pathlib import Path
 
-from sqlmodel import Session, create_engine, select # Synchronous for Celery task
-from sqlalchemy.orm import selectinload # To eagerly load relationships
+from celery.signals import worker_ready, worker_shutdown
+from sqlmodel import Session, select # Synchronous for Celery task
+from sqlalchemy.orm import joinedload, selectinload # To eagerly load relationships
 
 # Assuming libs is in PYTHONPATH
 from libs.py_common.celery_config import create_celery_app
+from libs.py_common.db import create_pooled_engine, sync_database_url
 from libs.py_common.kafka import (
+    ConsumerCallbacks,
+    ConsumerRunner,
     create_avro_consumer,
-    create_avro_producer as common_create_avro_producer, # Renamed to avoid conflict if local function is named create_avro_producer
+    get_producer_registry,
     delivery_report as kafka_delivery_report, # Renamed for clarity
     KafkaException
 )
@@ -25,14 +31,19 @@ PROJECT_ROOT_DOCGEN_TASK = Path(__file__).resolve().parent.parent.parent
 sys.path.append(str(PROJECT_ROOT_DOCGEN_TASK))
 
 from services.offers.models import Offer, Creator # Make sure Creator is imported if offer.creator is accessed
+from services.offers.transitions import transition_offer, transition_offers_with_values
 from services.offers.db import DATABASE_URL as OFFERS_DB_URL # Get sync DB URL for offers
-from .renderer import render_termsheet_pdf, render_receipt_pdf_and_upload # Import new function
+from .assets import TERMSHEET_STYLESHEETS
+from .renderer import render_termsheet_pdf, render_receipt_pdf_and_upload, render_html, upload_to_s3_async # Import new function
+from .render_pool import get_render_pool, render_documents, shutdown_render_pool
+from .uploader import shutdown_s3_uploader
 
 # Import metrics
 from .metrics import (
     CELERY_TASKS_PROCESSED_TOTAL,
     CELERY_TASK_DURATION_SECONDS,
     APP_ERRORS_TOTAL,
+    DOCGEN_BATCH_STAGE_DURATION_SECONDS,
     KAFKA_MESSAGES_CONSUMED_TOTAL, # Added for consumer metrics
     KAFKA_MESSAGES_PRODUCED_TOTAL, # Added for new producer
     start_metrics_server
@@ -52,6 +63,7 @@ celery_app.autodiscover_tasks(packages=["services.docgen"], related_name="tasks"
 # --- Kafka Consumer for offer.payout.completed ---
 OFFER_PAYOUT_COMPLETED_SCHEMA_PATH = Path(__file__).resolve().parent.parent.parent / "schema" / "offer_payout_completed.avsc"
 _offer_payout_completed_consumer = None
+_offer_payout_completed_consumer_callbacks = ConsumerCallbacks() # Rebalances and commit results, handled by its ConsumerRunner
 _offer_payout_completed_schema_str = None
 _docgen_kafka_consumer_thread_stop_event = threading.Event()
 
@@ -68,7 +80,8 @@ def get_offer_payout_completed_consumer():
             _offer_payout_completed_consumer = create_avro_consumer(
                 group_id=KAFKA_CONSUMER_GROUP_ID_PAYOUT_COMPLETED,
                 topics=[KAFKA_PAYOUT_COMPLETED_TOPIC],
-                value_schema_str=_offer_payout_completed_schema_str
+                value_schema_str=_offer_payout_completed_schema_str,
+                callbacks=_offer_payout_completed_consumer_callbacks,
             )
             logger.info("Kafka consumer for offer.payout.completed initialized.", 
                         topic=KAFKA_PAYOUT_COMPLETED_TOPIC, group_id=KAFKA_CONSUMER_GROUP_ID_PAYOUT_COMPLETED)
@@ -81,27 +94,17 @@ def get_offer_payout_completed_consumer():
 # --- Kafka Producer Setup for offer.receipt.generated ---
 OFFER_RECEIPT_GENERATED_TOPIC = "offer.receipt.generated"
 OFFER_RECEIPT_GENERATED_SCHEMA_PATH = Path(__file__).resolve().parent.parent.parent / "schema" / "offer_receipt_generated.avsc"
-_offer_receipt_generated_producer = None
-_offer_receipt_generated_schema_str = None
 
 def get_offer_receipt_generated_producer():
-    global _offer_receipt_generated_producer, _offer_receipt_generated_schema_str
-    if _offer_receipt_generated_producer is None:
-        try:
-            if not Path(OFFER_RECEIPT_GENERATED_SCHEMA_PATH).is_file():
-                logger.error("Schema file not found for offer.receipt.generated", path=str(OFFER_RECEIPT_GENERATED_SCHEMA_PATH))
-                raise FileNotFoundError(f"Schema file not found: {OFFER_RECEIPT_GENERATED_SCHEMA_PATH}")
-            with open(OFFER_RECEIPT_GENERATED_SCHEMA_PATH, 'r') as f:
-                _offer_receipt_generated_schema_str = f.read()
-            _offer_receipt_generated_producer = common_create_avro_producer(
-                value_schema_str=_offer_receipt_generated_schema_str
-            )
-            logger.info("Kafka producer for offer.receipt.generated initialized.", topic=OFFER_RECEIPT_GENERATED_TOPIC)
-        except Exception as e:
-            logger.error("Failed to initialize Kafka producer for offer.receipt.generated", error=str(e), exc_info=True)
-            APP_ERRORS_TOTAL.labels(component="kafka_producer_init", error_type="offer_receipt_generated").inc()
-            _offer_receipt_generated_producer = None
-    return _offer_receipt_generated_producer
+    """The process-wide shared producer with the offer.receipt.generated schema registered, or None if unavailable."""
+    try:
+        return get_producer_registry().register_topic(OFFER_RECEIPT_GENERATED_TOPIC, OFFER_RECEIPT_GENERATED_SCHEMA_PATH)
+    except FileNotFoundError:
+        logger.error("Schema file not found for offer.receipt.generated", path=str(OFFER_RECEIPT_GENERATED_SCHEMA_PATH))
+    except Exception as e:
+        logger.error("Failed to initialize Kafka producer for offer.receipt.generated", error=str(e), exc_info=True)
+    APP_ERRORS_TOTAL.labels(component="kafka_producer_init", error_type="offer_receipt_generated").inc()
+    return None
 
 @celery_app.task(name="services.docgen.tasks.generate_receipt_pdf") 
 def generate_receipt_pdf(offer_id: str, event_data: dict):
@@ -128,7 +131,7 @@ def generate_receipt_pdf(offer_id: str, event_data: dict):
             
             # Produce offer.receipt.generated event
             producer = get_offer_receipt_generated_producer()
-            if producer and _offer_receipt_generated_schema_str:
+            if producer:
                 receipt_event_payload = {
                     "event_id": str(uuid.uuid4()),
                     "offer_id": offer_id,
@@ -173,6 +176,28 @@ def generate_receipt_pdf(offer_id: str, event_data: dict):
         CELERY_TASK_DURATION_SECONDS.labels(task_name=task_name).observe(task_duration)
         CELERY_TASKS_PROCESSED_TOTAL.labels(task_name=task_name, status=status_metric_label).inc()
 
+def _on_payout_completed_consumer_error(stage, error, msg):
+    if stage == "poll":
+        APP_ERRORS_TOTAL.labels(component="kafka_consumer_poll", error_type=str(error.code())).inc()
+    else:
+        APP_ERRORS_TOTAL.labels(component="kafka_consumer_loop", error_type="docgen_payout_completed_exception").inc()
+
+def _handle_payout_completed_event(msg):
+    event_data = msg.value()
+    KAFKA_MESSAGES_CONSUMED_TOTAL.labels(topic=msg.topic(), group_id=KAFKA_CONSUMER_GROUP_ID_PAYOUT_COMPLETED, status="success").inc()
+    logger.info("Received offer.payout.completed event", topic=msg.topic(), data_keys=list(event_data.keys()) if event_data else [])
+
+    if event_data and event_data.get("status") == "SUCCESS" and "offer_id" in event_data:
+        offer_id_str = event_data.get('offer_id')
+        logger.info("Dispatching generate_receipt_pdf task for successful payout", offer_id=offer_id_str)
+        # Pass relevant parts of event_data if needed by generate_receipt_pdf
+        generate_receipt_pdf.delay(offer_id=offer_id_str, event_data=event_data)
+    elif event_data and event_data.get("status") == "FAILURE":
+        logger.info("Payout failed for offer, no receipt will be generated.", offer_id=event_data.get('offer_id'), reason=event_data.get('failure_reason'))
+    else:
+        logger.warning("Consumed payout.completed message missing data, offer_id, or status SUCCESS", raw_value=msg.value())
+        KAFKA_MESSAGES_CONSUMED_TOTAL.labels(topic=msg.topic(), group_id=KAFKA_CONSUMER_GROUP_ID_PAYOUT_COMPLETED, status="parse_or_filter_error").inc()
+
 def consume_payout_completed_events():
     logger.info("Starting Kafka consumer loop for payout completed events...")
     consumer = get_offer_payout_completed_consumer()
@@ -180,42 +205,16 @@ def consume_payout_completed_events():
         logger.error("Payout completed event consumer not available. Exiting consume loop.")
         return
 
-    while not _docgen_kafka_consumer_thread_stop_event.is_set():
-        try:
-            msg = consumer.poll(timeout=1.0)
-            if msg is None: continue
-            if msg.error():
-                if msg.error().code() == KafkaError._PARTITION_EOF:
-                    logger.debug(f'{msg.topic()} [{msg.partition()}] reached end at offset {msg.offset()}')
-                else:
-                    logger.error("Kafka consumer error for payout.completed", error=msg.error(), topic=msg.topic())
-                    APP_ERRORS_TOTAL.labels(component="kafka_consumer_poll", error_type=str(msg.error().code())).inc()
-                    time.sleep(5)
-                continue
-
-            event_data = msg.value()
-            KAFKA_MESSAGES_CONSUMED_TOTAL.labels(topic=msg.topic(), group_id=KAFKA_CONSUMER_GROUP_ID_PAYOUT_COMPLETED, status="success").inc()
-            logger.info("Received offer.payout.completed event", topic=msg.topic(), data_keys=list(event_data.keys()) if event_data else [])
-
-            if event_data and event_data.get("status") == "SUCCESS" and "offer_id" in event_data:
-                offer_id_str = event_data.get('offer_id')
-                logger.info("Dispatching generate_receipt_pdf task for successful payout", offer_id=offer_id_str)
-                # Pass relevant parts of event_data if needed by generate_receipt_pdf
-                generate_receipt_pdf.delay(offer_id=offer_id_str, event_data=event_data)
-            elif event_data and event_data.get("status") == "FAILURE":
-                logger.info("Payout failed for offer, no receipt will be generated.", offer_id=event_data.get('offer_id'), reason=event_data.get('failure_reason'))
-            else:
-                logger.warning("Consumed payout.completed message missing data, offer_id, or status SUCCESS", raw_value=msg.value())
-                KAFKA_MESSAGES_CONSUMED_TOTAL.labels(topic=msg.topic(), group_id=KAFKA_CONSUMER_GROUP_ID_PAYOUT_COMPLETED, status="parse_or_filter_error").inc()
-            
-            consumer.commit(message=msg)
-        except Exception as e:
-            logger.error("Exception in Kafka consumer loop for payout.completed", error=str(e), exc_info=True)
-            APP_ERRORS_TOTAL.labels(component="kafka_consumer_loop", error_type="docgen_payout_completed_exception").inc()
-            time.sleep(5)
-    
+    ConsumerRunner(
+        consumer,
+        KAFKA_CONSUMER_GROUP_ID_PAYOUT_COMPLETED,
+        handler=_handle_payout_completed_event,
+        error_callback=_on_payout_completed_consumer_error,
+        stop_event=_docgen_kafka_consumer_thread_stop_event,
+        name="docgen-payout-completed",
+        callbacks=_offer_payout_completed_consumer_callbacks,
+    ).run()
     logger.info("Kafka consumer loop for payout completed events stopping.")
-    if consumer: consumer.close()
 
 def start_docgen_kafka_listener_thread():
     if not get_offer_payout_completed_consumer():
@@ -238,9 +237,29 @@ if os.getenv("CELERY_WORKER_NAME"): # Check if running as a Celery worker
     except OSError as e:
         logger.error("Docgen Prometheus metrics server failed to start.", error=str(e))
 
+@worker_ready.connect
+def start_render_pool(**kwargs):
+    # Start and warm the render workers before the first task, not during it
+    pool = get_render_pool()
+    if pool is not None:
+        try:
+            pool.warm_up()
+        except Exception as e:
+            logger.error("Render pool warm-up failed; workers start on demand", error=str(e), exc_info=True)
+            APP_ERRORS_TOTAL.labels(error_type="render_pool_warmup", component="render_pool").inc()
+
+@worker_shutdown.connect
+def stop_render_pool(**kwargs):
+    shutdown_render_pool()
+
+@worker_shutdown.connect
+def stop_s3_uploader(**kwargs):
+    # Lets queued uploads finish
+    shutdown_s3_uploader()
+
 # Database Engine for offers (synchronous for Celery task)
-sync_offers_db_url = OFFERS_DB_URL.replace("+asyncpg", "") if "+asyncpg" in OFFERS_DB_URL else OFFERS_DB_URL
-engine = create_engine(sync_offers_db_url, echo=False) # Set echo=True for debugging SQL
+# Pool settings come from DOCGEN_OFFERS_DB_POOL_* / DB_POOL_* env vars
+engine = create_pooled_engine(sync_database_url(OFFERS_DB_URL), "docgen_offers")
 
 @celery_app.task(name="services.docgen.tasks.generate_termsheet", bind=True)
 def generate_termsheet(self, offer_id_str: str):
@@ -284,17 +303,15 @@ def generate_termsheet(self, offer_id_str: str):
                 # Optionally update offer status to DOCGEN_FAILED here if needed
                 return {"status": "error", "message": "PDF rendering or S3 upload failed"}
 
-            # 3. Update offer row with pdf_url and pdf_hash
-            offer.pdf_url = s3_url
-            offer.pdf_hash = pdf_hash_val
-            offer.status = "TERMSHEET_GENERATED" # Example new status
-            offer.updated_at = datetime.utcnow()
-            session.add(offer)
+            # 3. Update offer row with pdf_url and pdf_hash, only if it is still OFFER_READY
+            if not transition_offer(session, offer.id, "TERMSHEET_GENERATED", expected_status="OFFER_READY", pdf_url=s3_url, pdf_hash=pdf_hash_val):
+                logger.warning("Offer left OFFER_READY during termsheet generation. Update skipped.", offer_id=str(offer_id))
+                status_metric_label = "skipped_status_conflict"
+                return {"status": "skipped", "message": "Offer status changed during termsheet generation"}
             session.commit()
-            session.refresh(offer)
 
             logger.info("Termsheet generated and offer updated successfully.", 
-                        offer_id=str(offer_id), pdf_url=s3_url, pdf_hash=pdf_hash_val, new_status=offer.status)
+                        offer_id=str(offer_id), pdf_url=s3_url, pdf_hash=pdf_hash_val, new_status="TERMSHEET_GENERATED")
             status_metric_label = "success"
             return {"status": "success", "offer_id": str(offer_id), "pdf_url": s3_url, "pdf_hash": pdf_hash_val}
 
@@ -308,6 +325,119 @@ def generate_termsheet(self, offer_id_str: str):
         CELERY_TASK_DURATION_SECONDS.labels(task_name=task_name).observe(task_duration)
         CELERY_TASKS_PROCESSED_TOTAL.labels(task_name=task_name, status=status_metric_label).inc()
 
+# --- Batch term sheet generation (e.g. month-end re-issuance) ---
+# Rendered PDFs waiting for an upload thread; bounds the batch's memory when S3 is slower than rendering
+DOCGEN_BATCH_MAX_PENDING_UPLOADS = int(os.getenv("DOCGEN_BATCH_MAX_PENDING_UPLOADS", "64"))
+# Statuses a term sheet is issued from; re-issuing an already generated one keeps TERMSHEET_GENERATED
+TERMSHEET_BATCH_STATUSES = ("OFFER_READY", "TERMSHEET_GENERATED")
+
+def _upload_finished(pdf_body, pending_uploads: threading.BoundedSemaphore, _upload) -> None:
+    pdf_body.close() # Frees the buffer as soon as its upload is done
+    pending_uploads.release()
+
+def _observe_stage(timings: dict, stage: str, stage_start: float) -> float:
+    now = time.monotonic()
+    timings[stage] = round(now - stage_start, 3)
+    DOCGEN_BATCH_STAGE_DURATION_SECONDS.labels(stage=stage).observe(now - stage_start)
+    return now
+
+@celery_app.task(name="services.docgen.tasks.generate_termsheets_batch", bind=True)
+def generate_termsheets_batch(self, offer_ids: list[str]):
+    """
+    Generates the term sheets of many offers in one task:
+
+    load   - one SELECT of the offers joined with their creators
+    render - every PDF rendered (and hashed as it is written) across the render pool;
+             each is queued on the background S3 uploader as soon as it is done, so
+             uploads overlap rendering
+    upload - the time uploads ran on after the last PDF was rendered
+    update - pdf_url, pdf_hash and status of all uploaded offers in one UPDATE, guarded
+             per offer by the status it was loaded with
+
+    Offers not found or not in TERMSHEET_BATCH_STATUSES are skipped; a failed render or
+    upload fails only that offer. Per-stage timings are logged, exported and returned.
+    """
+    task_start_time = time.monotonic()
+    task_name = self.name
+    logger.info("Received task to generate termsheet batch", offers=len(offer_ids), task_name=task_name)
+    status_metric_label = "failure"
+    timings = {}
+    failed = {}
+
+    try:
+        stage_start = time.monotonic()
+        requested_ids = [uuid.UUID(offer_id) for offer_id in offer_ids]
+        with Session(engine) as session:
+            offers = session.exec(
+                select(Offer).options(joinedload(Offer.creator)).where(Offer.id.in_(requested_ids))
+            ).unique().all()
+        offers_by_id = {offer.id: offer for offer in offers}
+        not_found = [str(offer_id) for offer_id in requested_ids if offer_id not in offers_by_id]
+        eligible = [offer for offer in offers if offer.status in TERMSHEET_BATCH_STATUSES]
+        skipped_status = [str(offer.id) for offer in offers if offer.status not in TERMSHEET_BATCH_STATUSES]
+        stage_start = _observe_stage(timings, "load", stage_start)
+
+        rows = []
+        pending_uploads = threading.BoundedSemaphore(DOCGEN_BATCH_MAX_PENDING_UPLOADS)
+        uploads = {}
+        documents = ((offer.id, render_html(offer), TERMSHEET_STYLESHEETS) for offer in eligible)
+        for offer_id, pdf, error in render_documents(documents):
+            if error is not None:
+                logger.error("Termsheet render failed in batch", offer_id=str(offer_id), error=str(error))
+                failed[str(offer_id)] = "render"
+                continue
+            pending_uploads.acquire()
+            future = upload_to_s3_async(pdf.body, offer_id)
+            future.add_done_callback(functools.partial(_upload_finished, pdf.body, pending_uploads))
+            uploads[future] = (offer_id, pdf.sha256)
+        stage_start = _observe_stage(timings, "render", stage_start)
+
+        for future in as_completed(uploads):
+            offer_id, pdf_hash_val = uploads[future]
+            s3_url = future.result() # None when the upload failed (already logged)
+            if not s3_url:
+                failed[str(offer_id)] = "upload"
+                continue
+            rows.append({
+                "id": offer_id,
+                "expected_status": offers_by_id[offer_id].status,
+                "pdf_url": s3_url,
+                "pdf_hash": pdf_hash_val,
+            })
+        stage_start = _observe_stage(timings, "upload", stage_start)
+
+        with Session(engine) as session:
+            updated_ids = transition_offers_with_values(session, rows, "TERMSHEET_GENERATED")
+            session.commit()
+        updated = set(updated_ids)
+        skipped_status += [str(row["id"]) for row in rows if row["id"] not in updated] # Status changed meanwhile
+        _observe_stage(timings, "update", stage_start)
+
+        if failed:
+            APP_ERRORS_TOTAL.labels(error_type="pdf_render_upload_failed", component="generate_termsheets_batch_task").inc(len(failed))
+        status_metric_label = "success" if not failed else "partial_failure"
+        logger.info("Termsheet batch finished", requested=len(requested_ids), generated=len(updated_ids), failed=len(failed),
+                    not_found=len(not_found), skipped_status=len(skipped_status), timings=timings)
+        return {
+            "status": "success" if not failed else "partial_failure",
+            "requested": len(requested_ids),
+            "generated": len(updated_ids),
+            "failed": failed,
+            "not_found": not_found,
+            "skipped_status": skipped_status,
+            "timings": timings,
+        }
+
+    except Exception as e:
+        logger.error("Unhandled exception in generate_termsheets_batch task", error=str(e), offers=len(offer_ids), exc_info=True)
+        APP_ERRORS_TOTAL.labels(error_type="unhandled_exception", component="generate_termsheets_batch_task").inc()
+        status_metric_label = "failure_unhandled_exception"
+        raise
+    finally:
+        task_duration = time.monotonic() - task_start_time
+        CELERY_TASK_DURATION_SECONDS.labels(task_name=task_name).observe(task_duration)
+        CELERY_TASKS_PROCESSED_TOTAL.labels(task_name=task_name, status=status_metric_label).inc()
+
 # How this task is triggered:
 # - If Offer service directly calls this: from services.docgen.tasks import generate_termsheet; generate_termsheet.delay(str(offer.id))
 # - If using an event bus (e.g., Kafka consumer in docgen service):
@@ -0,0 +1,128 @@
+# services/docgen/uploader.py
+# Uploads generated documents to S3 in the background. One boto3 client, its connection
+# pool sized for DOCGEN_S3_UPLOAD_CONCURRENCY and with standard retries, is shared by an
+# s3transfer TransferManager whose threads run the uploads; callers get a Future, so a
+# task thread can render the next document while the last one is uploading. Bodies over
+# DOCGEN_S3_MULTIPART_THRESHOLD_BYTES go up as multipart uploads, their parts sharing the
+# same threads and connections. Presigned URLs are signed locally with the client's
+# credentials; no request is made.
+#
+# S3_ENDPOINT_URL points the client at an S3-compatible stand-in (moto server, MinIO).
+import io
+import os
+import threading
+from concurrent.futures import Future
+from typing import BinaryIO, Optional
+
+import boto3
+import structlog
+from botocore.config import Config
+from s3transfer.manager import TransferConfig, TransferManager
+from s3transfer.subscribers import BaseSubscriber
+
+from .metrics import S3_UPLOADS_IN_FLIGHT
+
+logger = structlog.get_logger(__name__)
+
+S3_BUCKET_NAME = os.getenv("TERM_SHEETS_S3_BUCKET")
+S3_REGION = os.getenv("AWS_REGION", "eu-north-1")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None # None: AWS
+DOCGEN_S3_UPLOAD_CONCURRENCY = int(os.getenv("DOCGEN_S3_UPLOAD_CONCURRENCY", "16")) # Concurrent requests (uploads and parts)
+DOCGEN_S3_MAX_POOL_CONNECTIONS = int(os.getenv("DOCGEN_S3_MAX_POOL_CONNECTIONS", str(DOCGEN_S3_UPLOAD_CONCURRENCY)))
+DOCGEN_S3_MAX_ATTEMPTS = int(os.getenv("DOCGEN_S3_MAX_ATTEMPTS", "5"))
+DOCGEN_S3_MULTIPART_THRESHOLD_BYTES = int(os.getenv("DOCGEN_S3_MULTIPART_THRESHOLD_BYTES", str(8 * 1024 * 1024)))
+DOCGEN_S3_MULTIPART_CHUNKSIZE_BYTES = int(os.getenv("DOCGEN_S3_MULTIPART_CHUNKSIZE_BYTES", str(8 * 1024 * 1024))) # S3 minimum: 5 MiB
+DOCGEN_S3_PRESIGNED_URL_EXPIRY_SECONDS = int(os.getenv("DOCGEN_S3_PRESIGNED_URL_EXPIRY_SECONDS", str(24 * 3600)))
+
+def create_s3_client(max_pool_connections: int = DOCGEN_S3_MAX_POOL_CONNECTIONS):
+    return boto3.client(
+        "s3",
+        region_name=S3_REGION,
+        endpoint_url=S3_ENDPOINT_URL,
+        config=Config(
+            max_pool_connections=max_pool_connections,
+            retries={"total_max_attempts": DOCGEN_S3_MAX_ATTEMPTS, "mode": "standard"}, # First try included
+        ),
+    )
+
+class _ResolveFuture(BaseSubscriber):
+    # Bridges a transfer to a concurrent.futures.Future (as_completed, add_done_callback)
+    def __init__(self, result: Future):
+        self._result = result
+
+    def on_done(self, future, **kwargs):
+        try:
+            future.result()
+        except BaseException as e:
+            self._result.set_exception(e)
+        else:
+            self._result.set_result(None)
+
+class S3Uploader:
+    """
+    Background uploads to one bucket. submit() queues a body and returns a Future that
+    resolves once the object is stored, or raises what the upload raised. At most
+    concurrency requests are in flight across all uploads and multipart parts.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        client=None,
+        concurrency: int = DOCGEN_S3_UPLOAD_CONCURRENCY,
+        multipart_threshold: int = DOCGEN_S3_MULTIPART_THRESHOLD_BYTES,
+        multipart_chunksize: int = DOCGEN_S3_MULTIPART_CHUNKSIZE_BYTES,
+    ):
+        self.bucket = bucket
+        self.client = client or create_s3_client(max(DOCGEN_S3_MAX_POOL_CONNECTIONS, concurrency))
+        self._transfer = TransferManager(self.client, TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_request_concurrency=concurrency,
+        ))
+
+    def submit(self, body: bytes | BinaryIO, key: str, content_type: str = "application/pdf") -> Future:
+        """Queues an upload of bytes or a seekable file object (read from its current position, kept open by the caller until the future is done)."""
+        if isinstance(body, (bytes, bytearray)):
+            body = io.BytesIO(body)
+        result = Future()
+        S3_UPLOADS_IN_FLIGHT.inc()
+        result.add_done_callback(lambda _: S3_UPLOADS_IN_FLIGHT.dec())
+        try:
+            self._transfer.upload(body, self.bucket, key, extra_args={"ContentType": content_type}, subscribers=[_ResolveFuture(result)])
+        except Exception as e:
+            result.set_exception(e)
+        return result
+
+    def upload(self, body: bytes | BinaryIO, key: str, content_type: str = "application/pdf") -> None:
+        self.submit(body, key, content_type).result()
+
+    def presigned_url(self, key: str, expires_in: int = DOCGEN_S3_PRESIGNED_URL_EXPIRY_SECONDS) -> str:
+        """A GET URL for key, signed locally."""
+        return self.client.generate_presigned_url("get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=expires_in)
+
+    def shutdown(self, cancel: bool = False) -> None:
+        """Waits for queued uploads to finish (or cancels them) and stops the upload threads."""
+        self._transfer.shutdown(cancel=cancel)
+
+_s3_uploader: Optional[S3Uploader] = None
+_s3_uploader_lock = threading.Lock()
+
+def get_s3_uploader() -> Optional[S3Uploader]:
+    """The process-wide uploader for TERM_SHEETS_S3_BUCKET, or None when no bucket is configured."""
+    global _s3_uploader
+    if _s3_uploader is None and S3_BUCKET_NAME:
+        with _s3_uploader_lock:
+            if _s3_uploader is None:
+                _s3_uploader = S3Uploader(S3_BUCKET_NAME)
+                logger.info("S3 uploader created", bucket=S3_BUCKET_NAME, concurrency=DOCGEN_S3_UPLOAD_CONCURRENCY,
+                            multipart_threshold_bytes=DOCGEN_S3_MULTIPART_THRESHOLD_BYTES)
+    return _s3_uploader
+
+def shutdown_s3_uploader() -> None:
+    global _s3_uploader
+    with _s3_uploader_lock:
+        uploader, _s3_uploader = _s3_uploader, None
+    if uploader is not None:
+        uploader.shutdown()
+        logger.info("S3 uploader shut down")
@@ -1,13 +1,14 @@
 # services/event_consumer/consumer.py
 import os
 import signal
+import threading
 import time
 import structlog
 from pathlib import Path
 import json # Added for potential JSON decoding if not using Avro
 
 # Assuming libs is in PYTHONPATH
-from libs.py_common.kafka import create_avro_consumer, create_consumer, KafkaError, KafkaException # Added create_consumer and KafkaException
+from libs.py_common.kafka import ConsumerCallbacks, ConsumerRunner, create_avro_consumer, create_consumer
 
 # Import metrics
 from .metrics import (
@@ -28,12 +29,15 @@ PAYOUT_SUCCEEDED_TOPIC = "payout.succeeded"
 # PAYOUT_SUCCEEDED_SCHEMA_PATH = Path(__file__).parent.parent.parent / "schema" / "payout_succeeded.avsc"
 # _payout_succeeded_schema_str = None
 
-running = True
+# Messages are handled on EVENT_CONSUMER_MAX_WORKERS lanes, in order within each partition
+EVENT_CONSUMER_BATCH_SIZE = int(os.getenv("EVENT_CONSUMER_BATCH_SIZE", "100"))
+EVENT_CONSUMER_MAX_WORKERS = int(os.getenv("EVENT_CONSUMER_MAX_WORKERS", "4"))
+
+_stop_event = threading.Event()
 
 def shutdown_handler(signum, frame):
-    global running
     logger.info("Shutdown signal received, stopping consumer...")
-    running = False
+    _stop_event.set()
 
 def load_payout_succeeded_schema():
     # global _payout_succeeded_schema_str
@@ -47,6 +51,44 @@ def load_payout_succeeded_schema():
     #     logger.error("Failed to load payout_succeeded.avsc", error=str(e))
     pass # Not using Avro for this consumer as per simpler initial requirement
 
+def _on_consumer_error(stage, error, msg):
+    if stage == "poll":
+        APP_ERRORS_TOTAL.labels(error_type="kafka_consume_error", component="consumer_loop").inc()
+        KAFKA_MESSAGES_CONSUMED_TOTAL.labels(topic=msg.topic(), consumer_group=CONSUMER_GROUP_ID, status="error_kafka").inc()
+    elif stage == "loop":
+        APP_ERRORS_TOTAL.labels(error_type="unhandled_exception", component="consumer_loop").inc()
+
+def handle_payout_succeeded(msg):
+    topic = msg.topic()
+    start_time = time.monotonic()
+    metric_status = "success"
+    try:
+        # Process the message (value() might be bytes or already deserialized object by AvroConsumer)
+        event_data = msg.value() # If AvroConsumer, this is a dict. If Consumer, bytes.
+        if isinstance(event_data, bytes): # Basic consumer might give bytes
+            event_data = json.loads(event_data.decode('utf-8'))
+
+        logger.info("Received payout.succeeded event", 
+                    offer_id=event_data.get("offer_id"), 
+                    payout_method=event_data.get("payout_method"), 
+                    reference_id=event_data.get("reference_id"),
+                    amount_cents=event_data.get("amount_cents")
+        )
+        # Add any specific processing logic here if needed beyond logging
+
+    except json.JSONDecodeError as e:
+        logger.error("Failed to decode JSON message from Kafka", error=str(e), topic=topic)
+        APP_ERRORS_TOTAL.labels(error_type="json_decode_error", component="message_processing").inc()
+        metric_status = "error_deserialize"
+    except Exception as e:
+        logger.error("Error processing message from Kafka", error=str(e), topic=topic, exc_info=True)
+        APP_ERRORS_TOTAL.labels(error_type="processing_error", component="message_processing").inc()
+        metric_status = "error_processing"
+    finally:
+        processing_duration = time.monotonic() - start_time
+        KAFKA_MESSAGE_PROCESSING_DURATION_SECONDS.labels(topic=topic, consumer_group=CONSUMER_GROUP_ID).observe(processing_duration)
+        KAFKA_MESSAGES_CONSUMED_TOTAL.labels(topic=topic, consumer_group=CONSUMER_GROUP_ID, status=metric_status).inc()
+
 def main():
     logger.info("Starting event consumer for payout.succeeded topic.")
     
@@ -67,11 +109,13 @@ def main():
     # )
     # Using non-Avro consumer as schema isn't specified to be Avro for this example yet
     consumer = None
+    callbacks = ConsumerCallbacks() # Rebalances and commit results, handled by the ConsumerRunner
     try:
         consumer = create_avro_consumer( # Assuming payout.succeeded *is* Avro and schema exists
             group_id=CONSUMER_GROUP_ID,
             topics=[PAYOUT_SUCCEEDED_TOPIC],
-            value_schema_str=Path(Path(__file__).parent.parent.parent / "schema" / "payout_succeeded.avsc").read_text() 
+            value_schema_str=Path(Path(__file__).parent.parent.parent / "schema" / "payout_succeeded.avsc").read_text(),
+            callbacks=callbacks,
             # This line above is problematic if schema/payout_succeeded.avsc doesn't exist.
             # Fallback to simple consumer if schema is an issue:
             # consumer = create_consumer(CONSUMER_GROUP_ID, [PAYOUT_SUCCEEDED_TOPIC])
@@ -79,75 +123,28 @@ def main():
     except FileNotFoundError:
         logger.error(f"Schema file for {PAYOUT_SUCCEEDED_TOPIC} not found. Falling back to non-Avro consumer.")
         APP_ERRORS_TOTAL.labels(error_type="kafka_consumer_init", component="main_consumer_setup").inc()
-        consumer = create_consumer(CONSUMER_GROUP_ID, [PAYOUT_SUCCEEDED_TOPIC]) # Fallback
+        consumer = create_consumer(CONSUMER_GROUP_ID, [PAYOUT_SUCCEEDED_TOPIC], callbacks=callbacks) # Fallback
     except Exception as e:
         logger.error(f"Failed to create Avro consumer: {e}. Falling back to non-Avro consumer.")
         APP_ERRORS_TOTAL.labels(error_type="kafka_consumer_init", component="main_consumer_setup").inc()
-        consumer = create_consumer(CONSUMER_GROUP_ID, [PAYOUT_SUCCEEDED_TOPIC]) # Fallback
+        consumer = create_consumer(CONSUMER_GROUP_ID, [PAYOUT_SUCCEEDED_TOPIC], callbacks=callbacks) # Fallback
 
     signal.signal(signal.SIGINT, shutdown_handler)
     signal.signal(signal.SIGTERM, shutdown_handler)
 
     logger.info("Event consumer started. Waiting for messages...", topics=PAYOUT_SUCCEEDED_TOPIC)
-    try:
-        while running:
-            msg = consumer.poll(timeout=1.0) # Poll for messages
-            if msg is None:
-                continue
-            
-            topic = msg.topic()
-            start_time = time.monotonic()
-            metric_status = "success"
-
-            if msg.error():
-                if msg.error().code() == KafkaError._PARTITION_EOF:
-                    # End of partition event
-                    logger.debug(f"Reached end of partition for {topic} [{msg.partition()}]")
-                elif msg.error():
-                    logger.error(f"Kafka consume error for {topic}", error=msg.error())
-                    APP_ERRORS_TOTAL.labels(error_type="kafka_consume_error", component="consumer_loop").inc()
-                    metric_status = "error_kafka"
-                KAFKA_MESSAGES_CONSUMED_TOTAL.labels(topic=topic, consumer_group=CONSUMER_GROUP_ID, status=metric_status).inc()
-                continue # Continue to next message or poll interval
-
-            try:
-                # Process the message (value() might be bytes or already deserialized object by AvroConsumer)
-                event_data = msg.value() # If AvroConsumer, this is a dict. If Consumer, bytes.
-                if isinstance(event_data, bytes): # Basic consumer might give bytes
-                    event_data = json.loads(event_data.decode('utf-8'))
-                
-                logger.info("Received payout.succeeded event", 
-                            offer_id=event_data.get("offer_id"), 
-                            payout_method=event_data.get("payout_method"), 
-                            reference_id=event_data.get("reference_id"),
-                            amount_cents=event_data.get("amount_cents")
-                )
-                # Add any specific processing logic here if needed beyond logging
-
-            except json.JSONDecodeError as e:
-                logger.error("Failed to decode JSON message from Kafka", error=str(e), topic=topic)
-                APP_ERRORS_TOTAL.labels(error_type="json_decode_error", component="message_processing").inc()
-                metric_status = "error_deserialize"
-            except Exception as e:
-                logger.error("Error processing message from Kafka", error=str(e), topic=topic, exc_info=True)
-                APP_ERRORS_TOTAL.labels(error_type="processing_error", component="message_processing").inc()
-                metric_status = "error_processing"
-            finally:
-                consumer.commit(message=msg) # Commit offset for the processed message
-                processing_duration = time.monotonic() - start_time
-                KAFKA_MESSAGE_PROCESSING_DURATION_SECONDS.labels(topic=topic, consumer_group=CONSUMER_GROUP_ID).observe(processing_duration)
-                KAFKA_MESSAGES_CONSUMED_TOTAL.labels(topic=topic, consumer_group=CONSUMER_GROUP_ID, status=metric_status).inc()
-
-    except KafkaException as ke:
-        logger.critical("Critical KafkaException in consumer loop", error=str(ke), exc_info=True)
-        APP_ERRORS_TOTAL.labels(error_type="kafka_critical_exception", component="consumer_loop").inc()
-    except Exception as e:
-        logger.critical("Unhandled exception in consumer loop", error=str(e), exc_info=True)
-        APP_ERRORS_TOTAL.labels(error_type="unhandled_exception", component="consumer_loop").inc()
-    finally:
-        if consumer:
-            logger.info("Closing Kafka consumer.")
-            consumer.close()
+    ConsumerRunner(
+        consumer,
+        CONSUMER_GROUP_ID,
+        handler=handle_payout_succeeded,
+        batch_size=EVENT_CONSUMER_BATCH_SIZE,
+        max_workers=EVENT_CONSUMER_MAX_WORKERS,
+        error_callback=_on_consumer_error,
+        stop_event=_stop_event,
+        name="event-consumer-payout-succeeded",
+        callbacks=callbacks,
+    ).run()
+    logger.info("Event consumer stopped.")
 
 if __name__ == "__main__":
     # Load .env file if it exists (for local development)
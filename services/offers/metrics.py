@@ -60,7 +60,70 @@ OFFER_STATUS_UPDATES_TOTAL = Counter(
     ["old_status", "new_status"]
 )
 
+KAFKA_MESSAGES_CONSUMED_TOTAL = Counter(
+    "offers_kafka_messages_consumed_total",
+    "Total Kafka messages consumed by the Offers API (deal updates relayed to SSE clients).",
+    ["topic", "group_id", "status"] # status: success
+)
+
 # Note: For starlette-prometheus, many HTTP metrics are auto-instrumented.
 # These custom HTTP_ metrics can be used if you need more specific labeling or control,
 # or if you are instrumenting parts not covered by the middleware.
-# starlette-prometheus typically exposes /metrics endpoint automatically. 
\ No newline at end of file
+# starlette-prometheus typically exposes /metrics endpoint automatically. 
+# --- Transactional Outbox Metrics ---
+OUTBOX_EVENTS_RELAYED_TOTAL = Counter(
+    "outbox_events_relayed_total",
+    "Outbox events handed to Kafka by the relay, by delivery outcome.",
+    ["topic", "status"] # status: delivered, failed
+)
+
+OUTBOX_RELAY_BATCH_SIZE = Histogram(
+    "outbox_relay_batch_size",
+    "Outbox events claimed per relay batch.",
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+)
+
+OUTBOX_OLDEST_EVENT_AGE_SECONDS = Gauge(
+    "outbox_oldest_event_age_seconds",
+    "Age of the oldest event in the last claimed relay batch (0 when the outbox is empty)."
+)
+
+# --- SSE Fan-out Metrics ---
+SSE_FANOUT_MESSAGES_TOTAL = Counter(
+    "sse_fanout_messages_total",
+    "Deal update events passed through the SSE fan-out backend.",
+    ["backend", "direction"] # direction: published (sent by this replica), received (delivered to its clients)
+)
+
+# --- SSE Broadcast Metrics ---
+SSE_SUBSCRIBERS = Gauge(
+    "sse_subscribers",
+    "SSE clients connected to this process."
+)
+
+SSE_EVENTS_BROADCAST_TOTAL = Counter(
+    "sse_events_broadcast_total",
+    "Events broadcast to this process's SSE clients (each encoded once)."
+)
+
+SSE_QUEUED_FRAMES = Gauge(
+    "sse_queued_frames",
+    "Frames buffered for all SSE clients, sampled on each heartbeat tick."
+)
+
+SSE_CLIENT_QUEUE_DEPTH_MAX = Gauge(
+    "sse_client_queue_depth_max",
+    "Deepest SSE client buffer, sampled on each heartbeat tick."
+)
+
+SSE_FRAMES_DROPPED_TOTAL = Counter(
+    "sse_frames_dropped_total",
+    "Frames dropped from full SSE client buffers.",
+    ["policy"] # drop-oldest: oldest frame overwritten; disconnect: buffer discarded with the client
+)
+
+SSE_CLIENTS_DISCONNECTED_TOTAL = Counter(
+    "sse_clients_disconnected_total",
+    "SSE clients disconnected by the server.",
+    ["reason"] # slow: buffer full under the disconnect policy
+)
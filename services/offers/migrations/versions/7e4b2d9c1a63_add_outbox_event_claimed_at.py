@@ -0,0 +1,24 @@
+"""add_outbox_event_claimed_at
+
+Revision ID: 7e4b2d9c1a63
+Revises: 3c7e0a1f9b42
+Create Date: 2025-06-09 09:41:12.530417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e4b2d9c1a63'
+down_revision = '3c7e0a1f9b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('outbox_event', sa.Column('claimed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('outbox_event', 'claimed_at')
@@ -63,4 +63,19 @@ class OfferRead(OfferBase):
     updated_at: datetime
 
 class OfferReadWithCreator(OfferRead):
-    creator: CreatorRead 
\ No newline at end of file
+    creator: CreatorRead 
+
+# Transactional outbox: events written in the same transaction as the state change they
+# describe, and published to Kafka by services.offers.outbox.OutboxRelay
+class OutboxEvent(SQLModel, table=True):
+    __tablename__ = "outbox_event"
+
+    # Increasing, so one relay publishes events in roughly the order they were inserted.
+    # IDs are assigned at insert, not commit: a later commit can carry a lower ID.
+    id: Optional[int] = Field(default=None, sa_column=sa.Column(sa.BigInteger, primary_key=True, autoincrement=True))
+    topic: str = Field(nullable=False)
+    key: Optional[str] = Field(default=None, nullable=True)
+    payload: dict = Field(sa_column=sa.Column(sa.JSON, nullable=False))
+    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    # Set when a relay claims the event; the claim lapses after OUTBOX_RELAY_LEASE_SECONDS
+    claimed_at: Optional[datetime] = Field(default=None, nullable=True)
@@ -0,0 +1,247 @@
+# services/offers/outbox.py
+# Transactional outbox for offer events. Request handlers add an OutboxEvent in the same
+# transaction as the change it describes, so the event exists iff the change committed;
+# OutboxRelay publishes committed events to Kafka in batches and deletes them once the
+# broker acknowledged them. Delivery is at-least-once; the producer is idempotent, so
+# broker-side retries never duplicate or reorder within a relay batch.
+import asyncio
+import functools
+import os
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional, Union
+
+import sqlalchemy as sa
+import structlog
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from libs.py_common.kafka import get_producer_registry
+from .metrics import APP_ERRORS_TOTAL, OUTBOX_EVENTS_RELAYED_TOTAL, OUTBOX_OLDEST_EVENT_AGE_SECONDS, OUTBOX_RELAY_BATCH_SIZE
+from .models import OutboxEvent
+
+logger = structlog.get_logger(__name__)
+
+outbox_table = OutboxEvent.__table__
+
+OUTBOX_RELAY_BATCH_SIZE_LIMIT = int(os.getenv("OUTBOX_RELAY_BATCH_SIZE", "1000"))
+# Idle sleep between polls when the last batch did not fill up
+OUTBOX_RELAY_POLL_INTERVAL_SECONDS = float(os.getenv("OUTBOX_RELAY_POLL_INTERVAL_SECONDS", "0.5"))
+# How long a batch waits for its own delivery reports
+OUTBOX_RELAY_FLUSH_TIMEOUT_SECONDS = float(os.getenv("OUTBOX_RELAY_FLUSH_TIMEOUT_SECONDS", "30"))
+# Claimed events whose delivery was never reported are claimable again after this; keep it above the flush timeout
+OUTBOX_RELAY_LEASE_SECONDS = float(os.getenv("OUTBOX_RELAY_LEASE_SECONDS", "120"))
+
+def enqueue_outbox_event(session: AsyncSession, topic: str, payload: dict, key: Optional[str] = None) -> OutboxEvent:
+    """Adds an event to the outbox in the session's transaction. The caller commits."""
+    event = OutboxEvent(topic=topic, key=key, payload=payload)
+    session.add(event)
+    return event
+
+class _Countdown:
+    # Released once count_down() has been called count times
+    def __init__(self, count: int):
+        self._count = count
+        self._cond = threading.Condition()
+
+    def count_down(self) -> None:
+        with self._cond:
+            self._count -= 1
+            if self._count <= 0:
+                self._cond.notify_all()
+
+    def wait(self, timeout: float) -> int:
+        """Waits up to timeout for the count to reach zero; returns what is left."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._count <= 0, timeout)
+            return max(self._count, 0)
+
+class OutboxRelay:
+    """
+    Drains the outbox table to Kafka.
+
+    Each batch claims up to batch_size of the oldest unclaimed events in a short
+    transaction (UPDATE ... SET claimed_at ... RETURNING over a FOR UPDATE SKIP LOCKED
+    select), so several relays (one per API replica) never publish the same rows and no
+    transaction stays open while Kafka is slow. The events are produced through the
+    shared idempotent producer and the relay waits up to flush_timeout for this batch's
+    own delivery reports, not for everything queued on the producer. A second short
+    transaction deletes the acknowledged events and releases the failed ones for the
+    next batch. Reports arriving after the wait are settled by the next batch; events
+    never reported are claimable again once their lease_seconds claim lapses.
+    topics maps each outbox topic to its Avro value schema file.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        topics: dict[str, Union[str, Path]],
+        batch_size: int = OUTBOX_RELAY_BATCH_SIZE_LIMIT,
+        poll_interval: float = OUTBOX_RELAY_POLL_INTERVAL_SECONDS,
+        flush_timeout: float = OUTBOX_RELAY_FLUSH_TIMEOUT_SECONDS,
+        lease_seconds: float = OUTBOX_RELAY_LEASE_SECONDS,
+    ):
+        self._session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        self.topics = topics
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.flush_timeout = flush_timeout
+        self.lease_seconds = lease_seconds
+        self._producer = None
+        self._stop = asyncio.Event()
+        # Filled by delivery callbacks on the producer's poll thread, drained by _settle()
+        self._reports_lock = threading.Lock()
+        self._acknowledged: list[int] = []
+        self._failed: list[int] = []
+
+    @property
+    def producer(self):
+        if self._producer is None:
+            registry = get_producer_registry()
+            for topic, schema_path in self.topics.items():
+                registry.register_topic(topic, schema_path)
+            self._producer = registry
+        return self._producer
+
+    def _claim_statement(self, now: datetime):
+        claimable = (
+            sa.select(outbox_table.c.id)
+            .where(sa.or_(
+                outbox_table.c.claimed_at.is_(None),
+                outbox_table.c.claimed_at < now - timedelta(seconds=self.lease_seconds),
+            ))
+            .order_by(outbox_table.c.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        return (
+            sa.update(outbox_table)
+            .where(outbox_table.c.id.in_(claimable))
+            .values(claimed_at=now)
+            .returning(outbox_table.c.id, outbox_table.c.topic, outbox_table.c.key, outbox_table.c.payload, outbox_table.c.created_at)
+        )
+
+    def _on_delivery(self, event_id: int, topic: str, countdown: _Countdown, err, msg) -> None:
+        # Runs on the producer's poll thread, possibly after _publish() stopped waiting
+        with self._reports_lock:
+            (self._failed if err is not None else self._acknowledged).append(event_id)
+        if err is None:
+            OUTBOX_EVENTS_RELAYED_TOTAL.labels(topic=topic, status="delivered").inc()
+        else:
+            OUTBOX_EVENTS_RELAYED_TOTAL.labels(topic=topic, status="failed").inc()
+            logger.warning("Outbox event delivery failed", event_id=event_id, topic=topic, error=str(err))
+        countdown.count_down()
+
+    def _publish(self, rows) -> None:
+        """Produces the rows and waits up to flush_timeout for their delivery reports."""
+        producer = self.producer
+        countdown = _Countdown(len(rows))
+        for n, row in enumerate(rows):
+            try:
+                producer.produce(row.topic, value=row.payload, key=row.key,
+                                 on_delivery=functools.partial(self._on_delivery, row.id, row.topic, countdown))
+            except BufferError:
+                # Local queue full: release the rest for the next batch
+                logger.warning("Kafka producer queue full, deferring rest of outbox batch", event_id=row.id)
+                with self._reports_lock:
+                    self._failed.extend(r.id for r in rows[n:])
+                for _ in rows[n:]:
+                    countdown.count_down()
+                break
+        pending = countdown.wait(self.flush_timeout)
+        if pending:
+            logger.warning("Outbox batch not fully acknowledged before flush timeout", undelivered=pending)
+
+    async def _claim(self) -> list:
+        async with self._session_factory() as session, session.begin():
+            rows = (await session.execute(self._claim_statement(datetime.utcnow()))).all()
+        return sorted(rows, key=lambda row: row.id) # RETURNING does not keep the select's order
+
+    async def _settle(self) -> int:
+        """Deletes the acknowledged events and releases the failed ones; returns the number deleted."""
+        with self._reports_lock:
+            acknowledged, self._acknowledged = self._acknowledged, []
+            failed, self._failed = self._failed, []
+        if not acknowledged and not failed:
+            return 0
+        async with self._session_factory() as session, session.begin():
+            if acknowledged:
+                await session.execute(
+                    sa.delete(outbox_table).where(outbox_table.c.id == sa.any_(
+                        sa.bindparam("ids", acknowledged, type_=postgresql.ARRAY(sa.BigInteger))
+                    ))
+                )
+            if failed:
+                await session.execute(
+                    sa.update(outbox_table).where(outbox_table.c.id == sa.any_(
+                        sa.bindparam("ids", failed, type_=postgresql.ARRAY(sa.BigInteger))
+                    )).values(claimed_at=None)
+                )
+        return len(acknowledged)
+
+    async def relay_batch(self) -> int:
+        """Publishes one batch; returns the number of events delivered (and deleted)."""
+        rows = await self._claim()
+        OUTBOX_RELAY_BATCH_SIZE.observe(len(rows))
+        if rows:
+            OUTBOX_OLDEST_EVENT_AGE_SECONDS.set((datetime.utcnow() - rows[0].created_at).total_seconds())
+            # Producing and waiting block on librdkafka; keep them off the event loop
+            await asyncio.to_thread(self._publish, rows)
+        else:
+            OUTBOX_OLDEST_EVENT_AGE_SECONDS.set(0)
+        delivered = await self._settle()
+        if rows:
+            logger.debug("Outbox batch relayed", claimed=len(rows), delivered=delivered)
+        return delivered
+
+    async def run(self) -> None:
+        logger.info("Outbox relay started", topics=list(self.topics), batch_size=self.batch_size)
+        self._stop.clear()
+        while not self._stop.is_set():
+            try:
+                delivered = await self.relay_batch()
+            except Exception as e:
+                logger.error("Outbox relay batch failed", error=str(e), exc_info=True)
+                APP_ERRORS_TOTAL.labels(service_name="offers-api", error_type="outbox_relay_error", component="outbox_relay").inc()
+                delivered = 0
+            if delivered < self.batch_size:
+                # Drained, or Kafka is failing: wait before polling again, waking early on stop
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        try:
+            await self._settle() # Reports that arrived after the last batch stopped waiting
+        except Exception as e:
+            logger.warning("Failed to settle outbox delivery reports on stop", error=str(e))
+        logger.info("Outbox relay stopped")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+_outbox_relay: Optional[OutboxRelay] = None
+_outbox_relay_task: Optional[asyncio.Task] = None
+
+async def start_outbox_relay(engine: AsyncEngine, topics: dict[str, Union[str, Path]]) -> None:
+    global _outbox_relay, _outbox_relay_task
+    if _outbox_relay_task and not _outbox_relay_task.done():
+        logger.info("Outbox relay already running.")
+        return
+    _outbox_relay = OutboxRelay(engine, topics)
+    _outbox_relay_task = asyncio.create_task(_outbox_relay.run(), name="outbox-relay")
+
+async def stop_outbox_relay(timeout: float = 10.0) -> None:
+    """Stops the relay after its in-flight batch; undrained events are published on the next start."""
+    global _outbox_relay, _outbox_relay_task
+    if _outbox_relay is None:
+        return
+    _outbox_relay.stop()
+    try:
+        await asyncio.wait_for(_outbox_relay_task, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning("Outbox relay did not stop in time.")
+        _outbox_relay_task.cancel()
+    _outbox_relay = None
+    _outbox_relay_task = None
@@ -3,23 +3,32 @@ import uuid
 import asyncio # For SSE sleep
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request # Added Request for SSE
 from fastapi.responses import StreamingResponse # For SSE
+from starlette.concurrency import run_in_threadpool
 import structlog
 from sqlmodel import select
+from sqlalchemy.orm import selectinload
 from sqlmodel.ext.asyncio.session import AsyncSession # Assuming async session from db.py
 import json # For loading schema file
 from pathlib import Path
 from datetime import datetime # For timestamp in new event
 import threading # For Kafka consumer thread
-import time # For sleep in Kafka consumer loop
-
-from .db import get_session # Assuming get_session provides AsyncSession
-from .models import Offer, OfferCreate, OfferRead, Creator, CreatorCreate, CreatorRead, OfferStatus # Import OfferStatus
+import functools
+import os
+
+from .db import async_engine, get_session # Assuming get_session provides AsyncSession
+from .outbox import enqueue_outbox_event, start_outbox_relay, stop_outbox_relay
+from .sse import SseBroadcaster
+from .sse_fanout import create_sse_fanout
+from .models import Offer, OfferCreate, OfferRead, Creator, CreatorCreate, CreatorRead
 # Import metrics for custom counters if needed (starlette-prometheus handles HTTP ones)
 from .metrics import OFFERS_CREATED_TOTAL, OFFER_STATUS_UPDATES_TOTAL, APP_ERRORS_TOTAL, KAFKA_MESSAGES_CONSUMED_TOTAL # Added KAFKA_MESSAGES_CONSUMED_TOTAL
 
 # Kafka imports
 from libs.py_common.kafka import (
-    create_avro_producer, 
+    ConsumerCallbacks,
+    ConsumerRunner,
+    flush_producers,
+    get_producer_registry,
     create_avro_consumer, # Added
     delivery_report as kafka_delivery_report, # Renamed for clarity
     KafkaException
@@ -35,48 +44,32 @@ router = APIRouter(
 # --- Kafka Producer Setup for offer.created ---
 OFFER_CREATED_TOPIC = "offer.created"
 OFFER_CREATED_SCHEMA_PATH = Path(__file__).resolve().parent.parent.parent / "schema" / "offer_created.avsc"
-_offer_created_producer = None
-_offer_created_schema_str = None
 
 def get_offer_created_producer():
-    global _offer_created_producer, _offer_created_schema_str
-    if _offer_created_producer is None:
-        try:
-            with open(OFFER_CREATED_SCHEMA_PATH, 'r') as f:
-                _offer_created_schema_str = f.read()
-            _offer_created_producer = create_avro_producer(value_schema_str=_offer_created_schema_str)
-            logger.info("Offer.created Kafka producer initialized.", topic=OFFER_CREATED_TOPIC)
-        except FileNotFoundError:
-            logger.error("offer_created.avsc not found.", path=str(OFFER_CREATED_SCHEMA_PATH))
-            _offer_created_producer = None 
-        except Exception as e:
-            logger.error("Failed to initialize Kafka producer for offer.created", error=str(e), exc_info=True)
-            APP_ERRORS_TOTAL.labels(service_name="offers-api", error_type="kafka_producer_init", component="get_offer_created_producer").inc()
-            _offer_created_producer = None
-    return _offer_created_producer
+    """The process-wide shared producer with the offer.created schema registered, or None if unavailable."""
+    try:
+        return get_producer_registry().register_topic(OFFER_CREATED_TOPIC, OFFER_CREATED_SCHEMA_PATH)
+    except FileNotFoundError:
+        logger.error("offer_created.avsc not found.", path=str(OFFER_CREATED_SCHEMA_PATH))
+    except Exception as e:
+        logger.error("Failed to initialize Kafka producer for offer.created", error=str(e), exc_info=True)
+        APP_ERRORS_TOTAL.labels(service_name="offers-api", error_type="kafka_producer_init", component="get_offer_created_producer").inc()
+    return None
 
 # --- Kafka Producer Setup for offer.payout.requested ---
 OFFER_PAYOUT_REQUESTED_TOPIC = "offer.payout.requested"
 OFFER_PAYOUT_REQUESTED_SCHEMA_PATH = Path(__file__).resolve().parent.parent.parent / "schema" / "offer_payout_requested.avsc"
-_offer_payout_requested_producer = None
-_offer_payout_requested_schema_str = None
 
 def get_offer_payout_requested_producer():
-    global _offer_payout_requested_producer, _offer_payout_requested_schema_str
-    if _offer_payout_requested_producer is None:
-        try:
-            with open(OFFER_PAYOUT_REQUESTED_SCHEMA_PATH, 'r') as f:
-                _offer_payout_requested_schema_str = f.read()
-            _offer_payout_requested_producer = create_avro_producer(value_schema_str=_offer_payout_requested_schema_str)
-            logger.info("Offer.payout.requested Kafka producer initialized.", topic=OFFER_PAYOUT_REQUESTED_TOPIC)
-        except FileNotFoundError:
-            logger.error("offer_payout_requested.avsc not found.", path=str(OFFER_PAYOUT_REQUESTED_SCHEMA_PATH))
-            _offer_payout_requested_producer = None
-        except Exception as e:
-            logger.error("Failed to initialize Kafka producer for offer.payout.requested", error=str(e), exc_info=True)
-            APP_ERRORS_TOTAL.labels(service_name="offers-api", error_type="kafka_producer_init", component="get_offer_payout_requested_producer").inc()
-            _offer_payout_requested_producer = None
-    return _offer_payout_requested_producer
+    """The process-wide shared producer with the offer.payout.requested schema registered, or None if unavailable."""
+    try:
+        return get_producer_registry().register_topic(OFFER_PAYOUT_REQUESTED_TOPIC, OFFER_PAYOUT_REQUESTED_SCHEMA_PATH)
+    except FileNotFoundError:
+        logger.error("offer_payout_requested.avsc not found.", path=str(OFFER_PAYOUT_REQUESTED_SCHEMA_PATH))
+    except Exception as e:
+        logger.error("Failed to initialize Kafka producer for offer.payout.requested", error=str(e), exc_info=True)
+        APP_ERRORS_TOTAL.labels(service_name="offers-api", error_type="kafka_producer_init", component="get_offer_payout_requested_producer").inc()
+    return None
 
 # --- Kafka Consumer Setup for Offer Updates (for SSE) ---
 OFFER_UPDATES_CONSUMER_GROUP_ID = "offers-api-sse-fanout"
@@ -87,6 +80,7 @@ OFFER_VALUATED_SCHEMA_PATH = Path(__file__).resolve().parent.parent.parent / "sc
 OFFER_PAYOUT_COMPLETED_SCHEMA_PATH = Path(__file__).resolve().parent.parent.parent / "schema" / "offer_payout_completed.avsc"
 
 _offer_updates_consumer = None
+_offer_updates_consumer_callbacks = ConsumerCallbacks() # Rebalances and commit results, handled by its ConsumerRunner
 _offer_valuated_schema_str = None
 _offer_payout_completed_schema_str = None
 _offers_api_kafka_consumer_stop_event = threading.Event()
@@ -109,6 +103,8 @@ _offers_api_kafka_consumer_stop_event = threading.Event()
 # We will need to load ALL schemas this consumer might encounter.
 
 _offer_updates_event_loop = None # To run async broadcast_deal_update from sync consumer thread
+# How long the consumer thread waits for an event to be handed to the fan-out backend
+SSE_FANOUT_PUBLISH_TIMEOUT_SECONDS = float(os.getenv("SSE_FANOUT_PUBLISH_TIMEOUT_SECONDS", "5"))
 
 def get_offer_updates_consumer():
     global _offer_updates_consumer # Removed schema string globals as they are not needed here anymore
@@ -118,7 +114,8 @@ def get_offer_updates_consumer():
             _offer_updates_consumer = create_avro_consumer(
                 group_id=OFFER_UPDATES_CONSUMER_GROUP_ID,
                 topics=[OFFER_VALUATED_TOPIC, OFFER_PAYOUT_COMPLETED_TOPIC],
-                value_schema_str=None # Explicitly pass None or omit
+                value_schema_str=None, # Explicitly pass None or omit
+                callbacks=_offer_updates_consumer_callbacks,
             )
             logger.info("Kafka consumer for offer updates (SSE) initialized to use Schema Registry for deserialization.")
         except Exception as e:
@@ -127,6 +124,30 @@ def get_offer_updates_consumer():
             _offer_updates_consumer = None
     return _offer_updates_consumer
 
+def _on_sse_consumer_error(stage, error, msg):
+    if stage == "poll":
+        APP_ERRORS_TOTAL.labels(service_name="offers-api", component="kafka_sse_consumer_poll", error_type=str(error.code())).inc()
+    else:
+        APP_ERRORS_TOTAL.labels(service_name="offers-api", component="kafka_sse_consumer_loop", error_type="exception").inc()
+
+def _handle_offer_update_for_sse(loop: asyncio.AbstractEventLoop, msg):
+    event_data = msg.value()
+    topic = msg.topic()
+    KAFKA_MESSAGES_CONSUMED_TOTAL.labels(topic=topic, group_id=OFFER_UPDATES_CONSUMER_GROUP_ID, status="success").inc()
+    logger.info("SSE Consumer: Received event", topic=topic, data_keys=list(event_data.keys()) if event_data else [])
+
+    sse_event_type = "UNKNOWN_EVENT"
+    if topic == OFFER_VALUATED_TOPIC:
+        sse_event_type = "OFFER_VALUATED"
+    elif topic == OFFER_PAYOUT_COMPLETED_TOPIC:
+        sse_event_type = "OFFER_PAYOUT_COMPLETED"
+
+    # Run the async broadcast function in the main event loop. Waiting for it keeps the
+    # partition's events (one offer's events) in order through the fan-out backend.
+    asyncio.run_coroutine_threadsafe(
+        broadcast_deal_update({"type": sse_event_type, "payload": event_data}), loop
+    ).result(timeout=SSE_FANOUT_PUBLISH_TIMEOUT_SECONDS)
+
 def consume_offer_updates_for_sse(loop: asyncio.AbstractEventLoop):
     logger.info("Starting Kafka consumer loop for SSE offer updates...")
     consumer = get_offer_updates_consumer()
@@ -134,38 +155,16 @@ def consume_offer_updates_for_sse(loop: asyncio.AbstractEventLoop):
         logger.error("Offer updates SSE consumer not available. Exiting loop.")
         return
 
-    while not _offers_api_kafka_consumer_stop_event.is_set():
-        try:
-            msg = consumer.poll(timeout=1.0)
-            if msg is None: continue
-            if msg.error():
-                if msg.error().code() == KafkaError._PARTITION_EOF: continue
-                logger.error("Kafka SSE consumer error", error=msg.error(), topic=msg.topic())
-                APP_ERRORS_TOTAL.labels(service_name="offers-api", component="kafka_sse_consumer_poll", error_type=str(msg.error().code())).inc()
-                time.sleep(5)
-                continue
-            
-            event_data = msg.value()
-            topic = msg.topic()
-            KAFKA_MESSAGES_CONSUMED_TOTAL.labels(topic=topic, group_id=OFFER_UPDATES_CONSUMER_GROUP_ID, status="success").inc()
-            logger.info("SSE Consumer: Received event", topic=topic, data_keys=list(event_data.keys()) if event_data else [])
-
-            sse_event_type = "UNKNOWN_EVENT"
-            if topic == OFFER_VALUATED_TOPIC:
-                sse_event_type = "OFFER_VALUATED"
-            elif topic == OFFER_PAYOUT_COMPLETED_TOPIC:
-                sse_event_type = "OFFER_PAYOUT_COMPLETED"
-            
-            # Run the async broadcast function in the main event loop
-            asyncio.run_coroutine_threadsafe(broadcast_deal_update({"type": sse_event_type, "payload": event_data}), loop)
-            consumer.commit(message=msg)
-        except Exception as e:
-            logger.error("Exception in Kafka SSE consumer loop", error=str(e), exc_info=True)
-            APP_ERRORS_TOTAL.labels(service_name="offers-api", component="kafka_sse_consumer_loop", error_type="exception").inc()
-            time.sleep(5)
-    
+    ConsumerRunner(
+        consumer,
+        OFFER_UPDATES_CONSUMER_GROUP_ID,
+        handler=functools.partial(_handle_offer_update_for_sse, loop),
+        error_callback=_on_sse_consumer_error,
+        stop_event=_offers_api_kafka_consumer_stop_event,
+        name="offers-sse-updates",
+        callbacks=_offer_updates_consumer_callbacks,
+    ).run()
     logger.info("Kafka consumer loop for SSE offer updates stopping.")
-    if consumer: consumer.close()
 
 _sse_consumer_thread = None
 
@@ -197,35 +196,17 @@ async def stop_sse_kafka_listener():
     logger.info("SSE Kafka listener thread stopped.")
 
 # --- SSE Endpoint for Deal Updates ---
-# In-memory store for active SSE client queues (simple approach for single instance)
-# For multi-instance setup, a shared message broker like Redis pub/sub would be needed.
-active_sse_clients: list[asyncio.Queue] = []
-
-async def deal_event_generator(request: Request):
-    queue = asyncio.Queue()
-    active_sse_clients.append(queue)
-    try:
-        while True:
-            # Wait for an event to be put into this client's queue
-            # Or send periodic heartbeats to keep connection alive
-            try:
-                event_data_json = await asyncio.wait_for(queue.get(), timeout=15) # Wait for 15s
-                yield f"data: {event_data_json}\n\n" # SSE format: data: <json_string>\n\n
-                queue.task_done() # Mark as processed
-            except asyncio.TimeoutError:
-                # Send a heartbeat comment to keep the connection alive
-                yield ":heartbeat\n\n"
-            
-            # Check if client disconnected
-            if await request.is_disconnected():
-                logger.info("SSE client disconnected (detected by request.is_disconnected())")
-                break
-    except asyncio.CancelledError:
-        logger.info("SSE connection cancelled/closed by client.")
-    finally:
-        if queue in active_sse_clients:
-            active_sse_clients.remove(queue)
-        logger.info(f"SSE client queue removed. Active clients: {len(active_sse_clients)}")
+# This replica's SSE clients. Updates reach them through the fan-out backend
+# (SSE_FANOUT_BACKEND), which with Redis also delivers the updates published by every
+# other replica.
+deal_event_broadcaster = SseBroadcaster()
+_sse_fanout = None
+
+def get_sse_fanout():
+    global _sse_fanout
+    if _sse_fanout is None:
+        _sse_fanout = create_sse_fanout(deliver_deal_update)
+    return _sse_fanout
 
 @router.get("/events/deals", response_class=StreamingResponse)
 async def stream_deal_events(request: Request):
@@ -237,30 +218,41 @@ async def stream_deal_events(request: Request):
         "Connection": "keep-alive",
         "X-Accel-Buffering": "no", # For Nginx if it's in front
     }
-    return StreamingResponse(deal_event_generator(request), headers=headers)
+    return StreamingResponse(deal_event_broadcaster.stream(), headers=headers)
 
 # Function to be called by Kafka consumer or other parts of the app to send updates to SSE clients
 async def broadcast_deal_update(deal_update_data: dict):
-    """Broadcasts a deal update to all connected SSE clients."""
-    if not active_sse_clients:
-        logger.debug("No active SSE clients to broadcast update to.")
-        return
+    """Broadcasts a deal update to the SSE clients of every replica."""
+    # default=str: Avro-decoded UUIDs and timestamps
+    await get_sse_fanout().publish(json.dumps(deal_update_data, default=str))
 
-    event_data_json = json.dumps(deal_update_data) # Ensure it's a JSON string
-    logger.info(f"Broadcasting deal update to {len(active_sse_clients)} SSE client(s)", data_keys=list(deal_update_data.keys()))
-    for queue in active_sse_clients:
-        try:
-            await queue.put(event_data_json)
-        except Exception as e:
-            logger.error("Failed to put message in an SSE client queue", error=str(e), exc_info=True)
+async def deliver_deal_update(event_data_json: str):
+    """Delivers a fanned-out deal update to this replica's SSE clients."""
+    deal_event_broadcaster.broadcast(event_data_json)
 
 # Example CRUD functions (can be moved to a crud.py file)
+def _offer_created_event(db_offer: Offer) -> dict:
+    return {
+        "event_id": str(uuid.uuid4()),
+        "offer_id": str(db_offer.id),
+        "creator_id": str(db_offer.creator_id),
+        "title": db_offer.title,
+        "description": db_offer.description,
+        "amount_cents": db_offer.amount_cents,
+        "currency_code": db_offer.currency_code,
+        "status": db_offer.status,
+        "created_at_timestamp": int(db_offer.created_at.timestamp() * 1_000_000)
+    }
+
 async def create_db_offer(session: AsyncSession, offer_data: OfferCreate) -> Offer:
     # Here you might want to fetch or create the Creator if creator_id refers to an existing one
     # or if creator details are part of OfferCreate and need to be handled.
     # For simplicity, assume creator_id is valid and exists.
     db_offer = Offer.model_validate(offer_data)
     session.add(db_offer)
+    # id and created_at are set client-side, so the offer.created event is written to the
+    # outbox in the same transaction: it is published iff the offer is committed
+    enqueue_outbox_event(session, OFFER_CREATED_TOPIC, _offer_created_event(db_offer), key=str(db_offer.id))
     await session.commit()
     await session.refresh(db_offer)
     # Load creator relationship for the event if needed and not auto-loaded by refresh
@@ -276,47 +268,14 @@ async def create_db_offer(session: AsyncSession, offer_data: OfferCreate) -> Off
 async def handle_create_offer(
     offer_data: OfferCreate, 
     session: AsyncSession = Depends(get_session),
-    background_tasks: BackgroundTasks = BackgroundTasks()
 ):
     logger.info("Received request to create offer", title=offer_data.title, creator_id=offer_data.creator_id)
     try:
         db_offer = await create_db_offer(session=session, offer_data=offer_data)
         OFFERS_CREATED_TOTAL.labels(platform_name=db_offer.creator.platform_name if db_offer.creator else "unknown").inc()
         
-        # Produce Kafka event for offer.created
-        producer = get_offer_created_producer()
-        if producer and _offer_created_schema_str: # Ensure producer and schema are loaded
-            event_payload = {
-                "event_id": str(uuid.uuid4()),
-                "offer_id": str(db_offer.id),
-                "creator_id": str(db_offer.creator_id),
-                "title": db_offer.title,
-                "description": db_offer.description,
-                "amount_cents": db_offer.amount_cents,
-                "currency_code": db_offer.currency_code,
-                "status": db_offer.status.value, # Use enum value
-                "created_at_timestamp": int(db_offer.created_at.timestamp() * 1_000_000)
-            }
-            try:
-                # Use background_tasks for non-blocking Kafka produce
-                background_tasks.add_task(
-                    producer.produce,
-                    topic=OFFER_CREATED_TOPIC,
-                    key=str(db_offer.id), # Use offer_id as key
-                    value=event_payload,
-                    on_delivery=delivery_report
-                )
-                # producer.poll(0) # Not strictly needed for background task, flush if critical & sync
-                logger.info("offer.created event enqueued to Kafka background task", offer_id=str(db_offer.id))
-            except KafkaException as e:
-                logger.error("Kafka producer error for offer.created", error=str(e), offer_id=str(db_offer.id))
-                APP_ERRORS_TOTAL.labels(service_name="offers-api", error_type="kafka_produce_error", component="handle_create_offer").inc()
-                # Decide if failure to produce should fail the API call or just log
-            except Exception as e: # Catch other unexpected errors during Kafka produce
-                logger.error("Unexpected error during Kafka produce for offer.created", error=str(e), offer_id=str(db_offer.id), exc_info=True)
-                APP_ERRORS_TOTAL.labels(service_name="offers-api", error_type="kafka_produce_unexpected", component="handle_create_offer").inc()
-
-        # After successfully creating/updating offer in DB and sending Kafka event
+        # offer.created was committed to the outbox with the offer; the relay publishes it
+
         # Broadcast to SSE clients (example with OfferRead model)
         offer_read_data = OfferRead.model_validate(db_offer).model_dump_json()
         await broadcast_deal_update({"type": "OFFER_CREATED", "payload": json.loads(offer_read_data)})
@@ -338,21 +297,22 @@ async def handle_request_payout(
         APP_ERRORS_TOTAL.labels(service_name="offers-api", error_type="offer_not_found", component="handle_request_payout").inc()
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Offer not found")
 
-    if offer.status != OfferStatus.OFFER_READY:
-        logger.warning("Payout requested for offer not in OFFER_READY state", offer_id=str(offer_id), current_status=offer.status.value)
+    if offer.status != "OFFER_READY":
+        logger.warning("Payout requested for offer not in OFFER_READY state", offer_id=str(offer_id), current_status=offer.status)
         APP_ERRORS_TOTAL.labels(service_name="offers-api", error_type="invalid_status_for_payout", component="handle_request_payout").inc()
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Offer status is {offer.status.value}, must be OFFER_READY to request payout.")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Offer status is {offer.status}, must be OFFER_READY to request payout.")
 
     # Update offer status (optional, depends on your state machine)
-    # offer.status = OfferStatus.PAYOUT_REQUESTED # Assuming this status exists
+    # offer.status = "PAYOUT_REQUESTED" # Assuming this status exists
     # offer.updated_at = datetime.utcnow()
     # session.add(offer)
     # await session.commit()
     # await session.refresh(offer)
-    # OFFER_STATUS_UPDATES_TOTAL.labels(new_status=OfferStatus.PAYOUT_REQUESTED.value).inc()
+    # OFFER_STATUS_UPDATES_TOTAL.labels(new_status="PAYOUT_REQUESTED").inc()
 
-    producer = get_offer_payout_requested_producer()
-    if producer and _offer_payout_requested_schema_str:
+    # Registered at startup; if that failed, retrying may wait on the schema registry, so keep it off the event loop
+    producer = await run_in_threadpool(get_offer_payout_requested_producer)
+    if producer:
         # TODO: Determine how to get recipient_details. For now, placeholder.
         # This might come from the Offer model, Creator model, or a separate system.
         recipient_details_placeholder = f"recipient_details_for_creator_{offer.creator_id}"
@@ -371,7 +331,7 @@ async def handle_request_payout(
                 topic=OFFER_PAYOUT_REQUESTED_TOPIC,
                 key=str(offer.id),
                 value=event_payload,
-                on_delivery=delivery_report
+                on_delivery=kafka_delivery_report
             )
             logger.info("offer.payout.requested event enqueued to Kafka background task", offer_id=str(offer.id))
         except KafkaException as e:
@@ -421,17 +381,24 @@ async def handle_create_creator(creator_data: CreatorCreate, session: AsyncSessi
 # Modify FastAPI startup/shutdown to manage Kafka consumer for SSE
 @router.on_event("startup")
 async def on_offers_api_startup():
-    # Initialize producers if not already done (idempotent call)
-    get_offer_created_producer()
-    get_offer_payout_requested_producer()
+    # Register the produced topics' schemas up front (idempotent call); this talks to the schema registry
+    await run_in_threadpool(get_offer_payout_requested_producer)
+    # Publish outbox events (offer.created) committed by this or any previous process
+    await start_outbox_relay(async_engine, {OFFER_CREATED_TOPIC: OFFER_CREATED_SCHEMA_PATH})
+    # Subscribe to the SSE fan-out before consuming, so this replica's own events reach its clients
+    await get_sse_fanout().start()
     # Start the Kafka consumer for SSE updates
     await start_sse_kafka_listener()
-    logger.info("Offers API startup: Kafka producers and SSE consumer listener initialized/started.")
+    logger.info("Offers API startup: Kafka producers, outbox relay, SSE fan-out and consumer listener initialized/started.")
 
 @router.on_event("shutdown")
 async def on_offers_api_shutdown():
     # Stop the Kafka consumer for SSE updates
     await stop_sse_kafka_listener()
-    # Note: Producers are typically not explicitly closed unless specific resource cleanup is needed.
-    # The underlying librdkafka handles connection management.
-    logger.info("Offers API shutdown: SSE consumer listener stopped.") 
\ No newline at end of file
+    await get_sse_fanout().stop()
+    await deal_event_broadcaster.close()
+    # Finish the in-flight outbox batch; the rest is published after the next start
+    await stop_outbox_relay()
+    # Deliver queued offer events before the process exits
+    flush_producers()
+    logger.info("Offers API shutdown: SSE consumer listener, SSE fan-out and outbox relay stopped, Kafka producers flushed.") 
\ No newline at end of file
@@ -0,0 +1,191 @@
+# services/offers/sse.py
+# Server-Sent Events broadcasting for the offers API. Each event is encoded once into an
+# SSE frame and the same bytes object is appended to every client's bounded buffer;
+# idle clients get heartbeats from one shared timer instead of a timeout per connection.
+# A client's stream writes everything buffered since its last write in one chunk.
+import asyncio
+import os
+from collections import deque
+from typing import AsyncIterator, Optional
+
+import structlog
+
+from .metrics import (
+    SSE_CLIENT_QUEUE_DEPTH_MAX,
+    SSE_CLIENTS_DISCONNECTED_TOTAL,
+    SSE_EVENTS_BROADCAST_TOTAL,
+    SSE_FRAMES_DROPPED_TOTAL,
+    SSE_QUEUED_FRAMES,
+    SSE_SUBSCRIBERS,
+)
+
+logger = structlog.get_logger(__name__)
+
+SSE_CLIENT_BUFFER_SIZE = int(os.getenv("SSE_CLIENT_BUFFER_SIZE", "256")) # Frames buffered per client
+# What to do when a client's buffer is full: drop-oldest (skip events) or disconnect (the client reconnects)
+SSE_SLOW_CLIENT_POLICY = os.getenv("SSE_SLOW_CLIENT_POLICY", "drop-oldest").lower()
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+DROP_OLDEST = "drop-oldest"
+DISCONNECT = "disconnect"
+HEARTBEAT_FRAME = b":heartbeat\n\n"
+
+def encode_sse_frame(data: str) -> bytes:
+    """Frames a (JSON) string as one SSE message; multi-line data gets one data: field per line."""
+    return b"".join(b"data: " + line.encode() + b"\n" for line in data.split("\n")) + b"\n"
+
+class SseSubscriber:
+    """One client connection: a bounded buffer of encoded frames and the stream's wake-up future."""
+
+    __slots__ = ("_buffer", "_waiter", "closed")
+
+    def __init__(self, buffer_size: int):
+        self._buffer: deque = deque(maxlen=buffer_size)
+        self._waiter: Optional[asyncio.Future] = None
+        self.closed = False
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def full(self) -> bool:
+        return len(self._buffer) == self._buffer.maxlen
+
+    def push(self, frame: bytes) -> None:
+        """Appends a frame; on a full buffer the deque drops the oldest one."""
+        self._buffer.append(frame)
+        self._wake()
+
+    def close(self) -> int:
+        """Ends the client's stream; returns the number of frames discarded."""
+        discarded = len(self._buffer)
+        self._buffer.clear()
+        self.closed = True
+        self._wake()
+        return discarded
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def next_chunk(self) -> Optional[bytes]:
+        """Waits for frames and returns all of them as one chunk, or None once closed."""
+        while not self._buffer:
+            if self.closed:
+                return None
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        chunk = b"".join(self._buffer)
+        self._buffer.clear()
+        return chunk
+
+class SseBroadcaster:
+    """
+    Broadcasts events to every subscribed SSE client of this process.
+
+    broadcast() is synchronous and never waits on a client: a client whose buffer is
+    full either loses its oldest frame (drop-oldest) or is disconnected (disconnect).
+    Must be used from the event loop thread.
+    """
+
+    def __init__(
+        self,
+        buffer_size: int = SSE_CLIENT_BUFFER_SIZE,
+        slow_client_policy: str = SSE_SLOW_CLIENT_POLICY,
+        heartbeat_seconds: float = SSE_HEARTBEAT_SECONDS,
+    ):
+        if slow_client_policy not in (DROP_OLDEST, DISCONNECT):
+            raise ValueError(f"Unknown SSE slow client policy {slow_client_policy!r}; expected {DROP_OLDEST!r} or {DISCONNECT!r}")
+        self.buffer_size = buffer_size
+        self.slow_client_policy = slow_client_policy
+        self.heartbeat_seconds = heartbeat_seconds
+        self._subscribers: set[SseSubscriber] = set()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> SseSubscriber:
+        subscriber = SseSubscriber(self.buffer_size)
+        self._subscribers.add(subscriber)
+        SSE_SUBSCRIBERS.set(len(self._subscribers))
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat(), name="sse-heartbeat")
+        return subscriber
+
+    def unsubscribe(self, subscriber: SseSubscriber) -> None:
+        self._subscribers.discard(subscriber)
+        SSE_SUBSCRIBERS.set(len(self._subscribers))
+
+    def broadcast(self, data: str) -> int:
+        """Encodes data once and queues it for every client; returns the number of clients."""
+        SSE_EVENTS_BROADCAST_TOTAL.inc()
+        if not self._subscribers:
+            return 0
+        frame = encode_sse_frame(data)
+        dropped = 0
+        slow = []
+        for subscriber in self._subscribers:
+            if subscriber.full:
+                if self.slow_client_policy == DISCONNECT:
+                    slow.append(subscriber)
+                    continue
+                dropped += 1
+            subscriber.push(frame)
+        for subscriber in slow:
+            dropped += subscriber.close()
+            self.unsubscribe(subscriber)
+        if dropped:
+            SSE_FRAMES_DROPPED_TOTAL.labels(policy=self.slow_client_policy).inc(dropped)
+        if slow:
+            SSE_CLIENTS_DISCONNECTED_TOTAL.labels(reason="slow").inc(len(slow))
+            logger.warning("Disconnected slow SSE clients", count=len(slow), buffer_size=self.buffer_size)
+        return len(self._subscribers) + len(slow)
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """
+        The response body for one client, subscribed when the response starts. Disconnects
+        need no polling here: StreamingResponse cancels the body when the client goes away,
+        or the next write (at the latest the next heartbeat) fails, and either way the
+        subscriber is removed.
+        """
+        subscriber = self.subscribe()
+        try:
+            while True:
+                chunk = await subscriber.next_chunk()
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def _heartbeat(self) -> None:
+        # One timer for all clients; clients with frames pending are about to be written to anyway
+        while self._subscribers:
+            await asyncio.sleep(self.heartbeat_seconds)
+            queued = deepest = 0
+            for subscriber in self._subscribers:
+                depth = len(subscriber)
+                if depth:
+                    queued += depth
+                    deepest = max(deepest, depth)
+                else:
+                    subscriber.push(HEARTBEAT_FRAME)
+            SSE_QUEUED_FRAMES.set(queued)
+            SSE_CLIENT_QUEUE_DEPTH_MAX.set(deepest)
+
+    async def close(self) -> None:
+        """Ends every client's stream and stops the heartbeat timer."""
+        for subscriber in list(self._subscribers):
+            subscriber.close()
+            self.unsubscribe(subscriber)
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
@@ -0,0 +1,180 @@
+# services/offers/sse_fanout.py
+# Fan-out of deal updates to the SSE clients of every offers-api replica. Each event is
+# published once - by the replica whose SSE Kafka consumer owns the partition (the consumer
+# group is shared, so the cluster consumes every event once), or by the replica that
+# handled the request - and delivered to the local clients of every replica subscribed:
+#   inprocess     - delivered to this replica's clients only (single-instance deployments)
+#   redis-pubsub  - PUBLISH/SUBSCRIBE on one channel; fire-and-forget, so a replica that
+#                   is disconnected from Redis misses what was published meanwhile
+#   redis-streams - XADD to one capped stream that every replica XREADs from its last seen
+#                   entry, so a replica that reconnects catches up on what it missed
+# Redis delivers a channel's messages (a stream's entries) in publish order, and
+# publishers await each publish before the next, so the events of one offer - one Kafka
+# partition, one consumer - reach every client in order.
+import abc
+import asyncio
+import os
+from typing import Awaitable, Callable, Optional
+
+import redis.asyncio as aioredis
+import structlog
+
+from .metrics import APP_ERRORS_TOTAL, SSE_FANOUT_MESSAGES_TOTAL
+
+logger = structlog.get_logger(__name__)
+
+SSE_FANOUT_BACKEND = os.getenv("SSE_FANOUT_BACKEND", "inprocess").lower()
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+SSE_FANOUT_CHANNEL = os.getenv("SSE_FANOUT_CHANNEL", "offers:sse:deals") # Pub/sub channel or stream key
+SSE_FANOUT_STREAM_MAXLEN = int(os.getenv("SSE_FANOUT_STREAM_MAXLEN", "10000")) # Approximate cap; bounds the catch-up after a reconnect
+SSE_FANOUT_RECONNECT_SECONDS = float(os.getenv("SSE_FANOUT_RECONNECT_SECONDS", "1"))
+
+# Delivers one JSON-encoded event to this replica's SSE clients
+Deliver = Callable[[str], Awaitable[None]]
+
+class InProcessFanout:
+    """Delivers published events straight to this replica's clients."""
+
+    name = "inprocess"
+
+    def __init__(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, data: str) -> None:
+        SSE_FANOUT_MESSAGES_TOTAL.labels(backend=self.name, direction="published").inc()
+        SSE_FANOUT_MESSAGES_TOTAL.labels(backend=self.name, direction="received").inc()
+        await self._deliver(data)
+
+class _RedisFanout(abc.ABC):
+    """
+    Shared plumbing of the Redis backends: publish() sends to Redis only, and a
+    background task started by start() receives from Redis and delivers locally,
+    including this replica's own events. The task reconnects after Redis errors.
+    """
+
+    name = "redis"
+
+    def __init__(self, deliver: Deliver, client: Optional[aioredis.Redis] = None, channel: str = SSE_FANOUT_CHANNEL):
+        self._deliver = deliver
+        self._client = client
+        self.channel = channel
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def client(self) -> aioredis.Redis:
+        if self._client is None:
+            self._client = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
+        return self._client
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name=f"sse-fanout-{self.name}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @abc.abstractmethod
+    async def publish(self, data: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def _receive(self) -> None:
+        """Receives from Redis until the connection fails."""
+
+    async def _received(self, data: str) -> None:
+        SSE_FANOUT_MESSAGES_TOTAL.labels(backend=self.name, direction="received").inc()
+        try:
+            await self._deliver(data)
+        except Exception as e:
+            # A delivery problem must not tear down the subscription
+            logger.error("Failed to deliver fanned-out SSE event", backend=self.name, error=str(e), exc_info=True)
+            APP_ERRORS_TOTAL.labels(service_name="offers-api", error_type="sse_deliver_error", component="sse_fanout").inc()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._receive()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("SSE fan-out subscription lost, reconnecting", backend=self.name, error=str(e))
+                APP_ERRORS_TOTAL.labels(service_name="offers-api", error_type=type(e).__name__, component="sse_fanout").inc()
+                await asyncio.sleep(SSE_FANOUT_RECONNECT_SECONDS)
+
+class RedisPubSubFanout(_RedisFanout):
+    name = "redis-pubsub"
+
+    async def publish(self, data: str) -> None:
+        await self.client.publish(self.channel, data)
+        SSE_FANOUT_MESSAGES_TOTAL.labels(backend=self.name, direction="published").inc()
+
+    async def _receive(self) -> None:
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(self.channel)
+            logger.info("Subscribed to SSE fan-out channel", channel=self.channel)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    await self._received(message["data"])
+        finally:
+            await pubsub.aclose()
+
+class RedisStreamFanout(_RedisFanout):
+    name = "redis-streams"
+
+    def __init__(
+        self,
+        deliver: Deliver,
+        client: Optional[aioredis.Redis] = None,
+        channel: str = SSE_FANOUT_CHANNEL,
+        maxlen: int = SSE_FANOUT_STREAM_MAXLEN,
+        block_ms: int = 5000,
+        read_count: int = 100,
+    ):
+        super().__init__(deliver, client, channel)
+        self.maxlen = maxlen
+        self.block_ms = block_ms
+        self.read_count = read_count
+        self._last_id: Optional[str] = None
+
+    async def publish(self, data: str) -> None:
+        await self.client.xadd(self.channel, {"data": data}, maxlen=self.maxlen, approximate=True)
+        SSE_FANOUT_MESSAGES_TOTAL.labels(backend=self.name, direction="published").inc()
+
+    async def _receive(self) -> None:
+        if self._last_id is None:
+            # Start from the current tail (not "$"), so that if the first read fails the
+            # reconnect still resumes from here and sees everything published since
+            tail = await self.client.xrevrange(self.channel, count=1)
+            self._last_id = tail[0][0] if tail else "0-0"
+            logger.info("Reading SSE fan-out stream", stream=self.channel, from_id=self._last_id)
+        while True:
+            response = await self.client.xread({self.channel: self._last_id}, count=self.read_count, block=self.block_ms)
+            for _stream, entries in response or ():
+                for entry_id, fields in entries:
+                    self._last_id = entry_id
+                    await self._received(fields["data"])
+
+SSE_FANOUT_BACKENDS = {backend.name: backend for backend in (InProcessFanout, RedisPubSubFanout, RedisStreamFanout)}
+
+def create_sse_fanout(deliver: Deliver, backend: str = SSE_FANOUT_BACKEND):
+    """Builds the fan-out backend named by backend (SSE_FANOUT_BACKEND by default)."""
+    try:
+        backend_cls = SSE_FANOUT_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown SSE fan-out backend {backend!r}; expected one of {sorted(SSE_FANOUT_BACKENDS)}") from None
+    logger.info("SSE fan-out backend selected", backend=backend)
+    return backend_cls(deliver)
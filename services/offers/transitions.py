@@ -0,0 +1,125 @@
+# services/offers/transitions.py
+# Offer state transitions as single UPDATE ... RETURNING statements, shared by the workers.
+# Each transition carries the status the caller expects the offer to be in; rows whose
+# status changed in the meantime are left untouched and missing from the returned ids.
+import uuid
+from datetime import datetime
+from typing import Iterable, Optional, Union
+
+import sqlalchemy as sa
+import structlog
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import Session
+
+from .models import Offer
+
+logger = structlog.get_logger(__name__)
+
+offer_table = Offer.__table__
+
+ExpectedStatus = Optional[Union[str, Iterable[str]]]
+
+def _expected_status_clause(expected_status: ExpectedStatus):
+    if expected_status is None:
+        return sa.true()
+    if isinstance(expected_status, str):
+        return offer_table.c.status == expected_status
+    return offer_table.c.status == sa.any_(
+        sa.bindparam("expected_statuses", list(expected_status), type_=postgresql.ARRAY(offer_table.c.status.type))
+    )
+
+def _transition_statement(offer_ids: list[uuid.UUID], new_status: str, expected_status: ExpectedStatus, values: dict):
+    return (
+        sa.update(offer_table)
+        .where(
+            offer_table.c.id == sa.any_(sa.bindparam("ids", offer_ids, type_=postgresql.ARRAY(offer_table.c.id.type))),
+            _expected_status_clause(expected_status),
+        )
+        .values(status=new_status, updated_at=datetime.utcnow(), **values)
+        .returning(offer_table.c.id)
+    )
+
+def _log_skipped(offer_ids: list, updated_ids: list, new_status: str, expected_status: ExpectedStatus) -> None:
+    if len(updated_ids) != len(offer_ids):
+        logger.warning("Offer transition skipped rows whose status changed", new_status=new_status,
+                       expected_status=expected_status, requested=len(offer_ids), updated=len(updated_ids))
+
+def transition_offers(
+    session: Session,
+    offer_ids: Iterable[uuid.UUID],
+    new_status: str,
+    expected_status: ExpectedStatus = None,
+    **values,
+) -> list[uuid.UUID]:
+    """
+    UPDATE offer SET status = :new_status, updated_at = now, **values
+    WHERE id = ANY(:ids) AND status = :expected_status RETURNING id
+
+    One round-trip for any number of offers. Returns the ids actually transitioned;
+    the caller commits.
+    """
+    offer_ids = list(offer_ids)
+    if not offer_ids:
+        return []
+    updated_ids = list(session.execute(_transition_statement(offer_ids, new_status, expected_status, values)).scalars().all())
+    _log_skipped(offer_ids, updated_ids, new_status, expected_status)
+    return updated_ids
+
+def transition_offer(session: Session, offer_id: uuid.UUID, new_status: str, expected_status: ExpectedStatus = None, **values) -> bool:
+    """Single-offer form of transition_offers. Returns False if the offer was not in expected_status."""
+    return bool(transition_offers(session, [offer_id], new_status, expected_status, **values))
+
+async def transition_offers_async(
+    session: AsyncSession,
+    offer_ids: Iterable[uuid.UUID],
+    new_status: str,
+    expected_status: ExpectedStatus = None,
+    **values,
+) -> list[uuid.UUID]:
+    """transition_offers on an AsyncSession (asyncpg). The caller commits."""
+    offer_ids = list(offer_ids)
+    if not offer_ids:
+        return []
+    result = await session.execute(_transition_statement(offer_ids, new_status, expected_status, values))
+    updated_ids = list(result.scalars().all())
+    _log_skipped(offer_ids, updated_ids, new_status, expected_status)
+    return updated_ids
+
+async def transition_offer_async(session: AsyncSession, offer_id: uuid.UUID, new_status: str, expected_status: ExpectedStatus = None, **values) -> bool:
+    """Single-offer form of transition_offers_async. Returns False if the offer was not in expected_status."""
+    return bool(await transition_offers_async(session, [offer_id], new_status, expected_status, **values))
+
+def transition_offers_with_values(
+    session: Session,
+    rows: list[dict],
+    new_status: str,
+) -> list[uuid.UUID]:
+    """
+    Bulk transition where every offer gets its own column values (e.g. valuation prices):
+
+    UPDATE offer SET status = :new_status, updated_at = now, col = v.col, ...
+    FROM (VALUES (...), ...) AS v (id, expected_status, col, ...)
+    WHERE offer.id = v.id AND offer.status = v.expected_status RETURNING offer.id
+
+    Each row is a dict with "id", "expected_status" and the same set of column keys.
+    """
+    if not rows:
+        return []
+    value_names = [name for name in rows[0] if name not in ("id", "expected_status")]
+    columns = [sa.column("id", offer_table.c.id.type), sa.column("expected_status", offer_table.c.status.type)]
+    columns += [sa.column(name, offer_table.c[name].type) for name in value_names]
+    new_values = sa.values(*columns, name="v").data(
+        [(row["id"], row["expected_status"], *(row[name] for name in value_names)) for row in rows]
+    )
+    stmt = (
+        sa.update(offer_table)
+        .where(offer_table.c.id == new_values.c.id, offer_table.c.status == new_values.c.expected_status)
+        .values(status=new_status, updated_at=datetime.utcnow(), **{name: new_values.c[name] for name in value_names})
+        .returning(offer_table.c.id)
+    )
+    updated_ids = list(session.execute(stmt).scalars().all())
+    if len(updated_ids) != len(rows):
+        logger.warning("Offer transition skipped rows whose status changed", new_status=new_status,
+                       requested=len(rows), updated=len(updated_ids))
+    return updated_ids
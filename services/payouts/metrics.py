@@ -62,6 +62,32 @@ LEDGER_ENTRIES_CREATED_TOTAL = Counter(
     ["transaction_type", "payout_method"]
 )
 
+# --- Kafka Metrics ---
+KAFKA_MESSAGES_CONSUMED_TOTAL = Counter(
+    "payouts_kafka_messages_consumed_total",
+    "Total Kafka messages consumed by the Payouts worker.",
+    ["topic", "group_id", "status"] # status: success, parse_error
+)
+
+KAFKA_MESSAGES_PRODUCED_TOTAL = Counter(
+    "payouts_kafka_messages_produced_total",
+    "Total Kafka messages produced by the Payouts worker.",
+    ["topic", "status"]
+)
+
+KAFKA_CONSUMER_BATCH_SIZE = Histogram(
+    "payouts_kafka_consumer_batch_size_messages",
+    "Number of messages returned per batched consume() call.",
+    ["topic"],
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+
+KAFKA_OFFSET_COMMITS_TOTAL = Counter(
+    "payouts_kafka_offset_commits_total",
+    "Asynchronous offset commits by outcome.",
+    ["group_id", "outcome"] # outcome: success, error
+)
+
 # --- General Application Metrics ---
 APP_ERRORS_TOTAL = Counter(
     "payouts_app_errors_total",
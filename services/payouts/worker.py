@@ -6,15 +6,19 @@ import time # For duration measurement
 import threading # For running consumer in a separate thread
 
 import stripe # type: ignore
+from celery import group
 import pybreaker # type: ignore
 import structlog
-from sqlmodel import Session, create_engine, select
+from sqlmodel import Session, select
 
 # Assuming libs is in PYTHONPATH
 from libs.py_common.celery_config import create_celery_app
+from libs.py_common.db import create_pooled_engine, sync_database_url
 from libs.py_common.kafka import (
+    ConsumerCallbacks,
+    ConsumerRunner,
     create_avro_consumer, 
-    create_avro_producer as common_create_avro_producer, # Renamed to avoid conflict
+    get_producer_registry,
     delivery_report as kafka_delivery_report, # Rename to avoid conflict if local delivery_report is defined
     KafkaException
 )
@@ -26,6 +30,7 @@ PROJECT_ROOT_PAYOUTS_WORKER = Path(__file__).resolve().parent.parent.parent
 sys.path.append(str(PROJECT_ROOT_PAYOUTS_WORKER))
 
 from services.offers.models import Offer # To fetch offer details
+from services.offers.transitions import transition_offer
 from services.offers.db import DATABASE_URL as OFFERS_DB_URL # Read-only access to offers DB
 from .models import LedgerEntry, LedgerEntryCreate # Payouts service's own ledger model
 
@@ -41,6 +46,8 @@ from .metrics import (
     APP_ERRORS_TOTAL,
     KAFKA_MESSAGES_CONSUMED_TOTAL, # New metric for consumer
     KAFKA_MESSAGES_PRODUCED_TOTAL, # New metric for producer
+    KAFKA_CONSUMER_BATCH_SIZE,
+    KAFKA_OFFSET_COMMITS_TOTAL,
     start_worker_metrics_server
 )
 
@@ -56,6 +63,10 @@ KAFKA_PAYOUT_SUCCEEDED_TOPIC = "payout.succeeded"
 KAFKA_PAYOUT_REQUESTED_TOPIC = "offer.payout.requested"
 KAFKA_CONSUMER_GROUP_ID_PAYOUT_REQUESTED = "payouts-worker-payout-requested-consumer"
 KAFKA_PAYOUT_COMPLETED_TOPIC = "offer.payout.completed" # New Topic
+# Batched consumption of payout requests: up to BATCH_SIZE messages per consume() call,
+# waiting at most LINGER_SECONDS for a batch to fill. A batch size of 1 selects the per-message loop.
+PAYOUT_CONSUMER_BATCH_SIZE = int(os.getenv("PAYOUT_CONSUMER_BATCH_SIZE", "500"))
+PAYOUT_CONSUMER_LINGER_SECONDS = float(os.getenv("PAYOUT_CONSUMER_LINGER_SECONDS", "0.5"))
 
 # Initialize Stripe API
 if STRIPE_API_KEY:
@@ -69,10 +80,10 @@ celery_app.autodiscover_tasks(packages=["services.payouts"], related_name="worke
 
 # Database Engines
 # For reading Offer data (assuming it's synchronous for Celery tasks)
-sync_offers_db_url = OFFERS_DB_URL.replace("+asyncpg", "") if "+asyncpg" in OFFERS_DB_URL else OFFERS_DB_URL
-offers_engine = create_engine(sync_offers_db_url, echo=False)
+# Pool settings come from PAYOUTS_OFFERS_DB_POOL_* / PAYOUTS_LEDGER_DB_POOL_* / DB_POOL_* env vars
+offers_engine = create_pooled_engine(sync_database_url(OFFERS_DB_URL), "payouts_offers")
 # For writing to Payouts Ledger (also synchronous)
-payouts_engine = create_engine(PAYOUTS_DB_URL, echo=False)
+payouts_engine = create_pooled_engine(PAYOUTS_DB_URL, "payouts_ledger")
 
 # Circuit Breaker for Stripe
 stripe_breaker = pybreaker.CircuitBreaker(fail_max=3, reset_timeout=180) # Opens after 3 failures in 3 minutes
@@ -86,6 +97,17 @@ _offer_payout_requested_consumer = None
 _offer_payout_requested_schema_str = None
 _kafka_consumer_thread_stop_event = threading.Event()
 
+def _on_payout_offsets_committed(err, partitions):
+    """Result callback for asynchronous offset commits, served from consume()/poll()."""
+    if err is not None:
+        logger.error("Async offset commit failed", error=str(err), partitions=[(p.topic, p.partition, p.offset) for p in partitions])
+        KAFKA_OFFSET_COMMITS_TOTAL.labels(group_id=KAFKA_CONSUMER_GROUP_ID_PAYOUT_REQUESTED, outcome="error").inc()
+        return
+    KAFKA_OFFSET_COMMITS_TOTAL.labels(group_id=KAFKA_CONSUMER_GROUP_ID_PAYOUT_REQUESTED, outcome="success").inc()
+
+# Rebalances and commit results, handled by the consumer's ConsumerRunner
+_offer_payout_requested_consumer_callbacks = ConsumerCallbacks(on_commit=_on_payout_offsets_committed)
+
 def get_offer_payout_requested_consumer():
     global _offer_payout_requested_consumer, _offer_payout_requested_schema_str
     if _offer_payout_requested_consumer is None:
@@ -99,7 +121,8 @@ def get_offer_payout_requested_consumer():
             _offer_payout_requested_consumer = create_avro_consumer(
                 group_id=KAFKA_CONSUMER_GROUP_ID_PAYOUT_REQUESTED,
                 topics=[KAFKA_PAYOUT_REQUESTED_TOPIC],
-                value_schema_str=_offer_payout_requested_schema_str
+                value_schema_str=_offer_payout_requested_schema_str,
+                callbacks=_offer_payout_requested_consumer_callbacks,
             )
             logger.info("Kafka consumer for offer.payout.requested initialized.", 
                         topic=KAFKA_PAYOUT_REQUESTED_TOPIC, group_id=KAFKA_CONSUMER_GROUP_ID_PAYOUT_REQUESTED)
@@ -109,6 +132,49 @@ def get_offer_payout_requested_consumer():
             _offer_payout_requested_consumer = None # Ensure it's None on error
     return _offer_payout_requested_consumer
 
+def _on_payout_consumer_error(stage, error, msg):
+    if stage == "poll":
+        APP_ERRORS_TOTAL.labels(component="kafka_consumer_poll", error_type=str(error.code())).inc()
+    else:
+        APP_ERRORS_TOTAL.labels(component="kafka_consumer_loop", error_type="exception").inc()
+
+def _handle_payout_request(msg):
+    event_data = msg.value() # AvroDeserializer already converted it to a dict
+    KAFKA_MESSAGES_CONSUMED_TOTAL.labels(topic=msg.topic(), group_id=KAFKA_CONSUMER_GROUP_ID_PAYOUT_REQUESTED, status="success").inc()
+    logger.info("Received offer.payout.requested event", topic=msg.topic(), partition=msg.partition(), offset=msg.offset(), key=msg.key(), data_keys=list(event_data.keys()) if event_data else [])
+
+    if event_data and 'offer_id' in event_data:
+        offer_id_str = event_data.get('offer_id')
+        # Potentially pass other details from event_data to execute_payout if useful
+        # e.g., recipient_details, amount_cents, currency_code
+        logger.info("Dispatching execute_payout task for offer", offer_id=offer_id_str)
+        execute_payout.delay(offer_id_str=offer_id_str)
+    else:
+        logger.warning("Consumed message missing offer_id or data", raw_message_value=msg.value())
+        KAFKA_MESSAGES_CONSUMED_TOTAL.labels(topic=msg.topic(), group_id=KAFKA_CONSUMER_GROUP_ID_PAYOUT_REQUESTED, status="parse_error").inc()
+
+def _dispatch_payout_request_batch(messages) -> int:
+    """
+    Dispatches one execute_payout per valid message as a single Celery group.
+    Returns the number of tasks dispatched. If dispatching raises, the ConsumerRunner
+    rewinds the batch so the messages are consumed again rather than lost.
+    """
+    KAFKA_CONSUMER_BATCH_SIZE.labels(topic=KAFKA_PAYOUT_REQUESTED_TOPIC).observe(len(messages))
+    offer_ids = []
+    for msg in messages:
+        event_data = msg.value() # AvroDeserializer already converted it to a dict
+        if event_data and 'offer_id' in event_data:
+            KAFKA_MESSAGES_CONSUMED_TOTAL.labels(topic=msg.topic(), group_id=KAFKA_CONSUMER_GROUP_ID_PAYOUT_REQUESTED, status="success").inc()
+            offer_ids.append(event_data.get('offer_id'))
+        else:
+            logger.warning("Consumed message missing offer_id or data", raw_message_value=event_data)
+            KAFKA_MESSAGES_CONSUMED_TOTAL.labels(topic=msg.topic(), group_id=KAFKA_CONSUMER_GROUP_ID_PAYOUT_REQUESTED, status="parse_error").inc()
+
+    if offer_ids:
+        group(execute_payout.s(offer_id_str=offer_id_str) for offer_id_str in offer_ids).apply_async()
+        logger.info("Dispatched execute_payout group", task_count=len(offer_ids))
+    return len(offer_ids)
+
 def consume_payout_requests():
     logger.info("Starting Kafka consumer loop for payout requests...")
     consumer = get_offer_payout_requested_consumer()
@@ -116,49 +182,38 @@ def consume_payout_requests():
         logger.error("Payout request consumer not available. Exiting consume loop.")
         return
 
-    while not _kafka_consumer_thread_stop_event.is_set():
-        try:
-            msg = consumer.poll(timeout=1.0) # Poll for messages
-
-            if msg is None:
-                continue
-            if msg.error():
-                if msg.error().code() == KafkaError._PARTITION_EOF:
-                    # End of partition event
-                    logger.debug('%%s [%%d] reached end at offset %%d\n' %
-                                 (msg.topic(), msg.partition(), msg.offset()))
-                elif msg.error():
-                    logger.error("Kafka consumer error", error=msg.error(), topic=msg.topic())
-                    APP_ERRORS_TOTAL.labels(component="kafka_consumer_poll", error_type=str(msg.error().code())).inc()
-                    # Consider a small sleep on persistent errors to avoid tight loop hammering Kafka
-                    time.sleep(5)
-                continue
-
-            # Message successfully consumed
-            event_data = msg.value() # AvroDeserializer already converted it to a dict
-            KAFKA_MESSAGES_CONSUMED_TOTAL.labels(topic=msg.topic(), group_id=KAFKA_CONSUMER_GROUP_ID_PAYOUT_REQUESTED, status="success").inc()
-            logger.info("Received offer.payout.requested event", topic=msg.topic(), partition=msg.partition(), offset=msg.offset(), key=msg.key(), data_keys=list(event_data.keys()) if event_data else [])
-
-            if event_data and 'offer_id' in event_data:
-                offer_id_str = event_data.get('offer_id')
-                # Potentially pass other details from event_data to execute_payout if useful
-                # e.g., recipient_details, amount_cents, currency_code
-                logger.info("Dispatching execute_payout task for offer", offer_id=offer_id_str)
-                execute_payout.delay(offer_id_str=offer_id_str)
-            else:
-                logger.warning("Consumed message missing offer_id or data", raw_message_value=msg.value())
-                KAFKA_MESSAGES_CONSUMED_TOTAL.labels(topic=msg.topic(), group_id=KAFKA_CONSUMER_GROUP_ID_PAYOUT_REQUESTED, status="parse_error").inc()
-
-            consumer.commit(message=msg) # Commit offset for the processed message
+    ConsumerRunner(
+        consumer,
+        KAFKA_CONSUMER_GROUP_ID_PAYOUT_REQUESTED,
+        handler=_handle_payout_request,
+        error_callback=_on_payout_consumer_error,
+        stop_event=_kafka_consumer_thread_stop_event,
+        name="payouts-payout-requested",
+        callbacks=_offer_payout_requested_consumer_callbacks,
+    ).run()
+    logger.info("Kafka consumer loop for payout requests stopping.")
 
-        except Exception as e:
-            logger.error("Exception in Kafka consumer loop for payout requests", error=str(e), exc_info=True)
-            APP_ERRORS_TOTAL.labels(component="kafka_consumer_loop", error_type="exception").inc()
-            time.sleep(5) # Sleep briefly before retrying poll, to avoid tight loop on unexpected errors
+def consume_payout_requests_batched():
+    """Batched variant of consume_payout_requests: one consume(), one task group and one async commit per batch."""
+    logger.info("Starting batched Kafka consumer loop for payout requests...",
+                batch_size=PAYOUT_CONSUMER_BATCH_SIZE, linger_seconds=PAYOUT_CONSUMER_LINGER_SECONDS)
+    consumer = get_offer_payout_requested_consumer()
+    if not consumer:
+        logger.error("Payout request consumer not available. Exiting consume loop.")
+        return
 
-    logger.info("Kafka consumer loop for payout requests stopping.")
-    if consumer:
-        consumer.close()
+    ConsumerRunner(
+        consumer,
+        KAFKA_CONSUMER_GROUP_ID_PAYOUT_REQUESTED,
+        batch_handler=_dispatch_payout_request_batch,
+        batch_size=PAYOUT_CONSUMER_BATCH_SIZE,
+        poll_timeout=PAYOUT_CONSUMER_LINGER_SECONDS,
+        error_callback=_on_payout_consumer_error,
+        stop_event=_kafka_consumer_thread_stop_event,
+        name="payouts-payout-requested-batched",
+        callbacks=_offer_payout_requested_consumer_callbacks,
+    ).run()
+    logger.info("Batched Kafka consumer loop for payout requests stopping.")
 
 def start_kafka_listener_thread():
     """Starts the Kafka consumer loop in a daemon thread."""
@@ -168,7 +223,8 @@ def start_kafka_listener_thread():
 
     logger.info("Starting Kafka listener thread for payout requests.")
     _kafka_consumer_thread_stop_event.clear()
-    consumer_thread = threading.Thread(target=consume_payout_requests, daemon=True)
+    consume_loop = consume_payout_requests_batched if PAYOUT_CONSUMER_BATCH_SIZE > 1 else consume_payout_requests
+    consumer_thread = threading.Thread(target=consume_loop, daemon=True)
     consumer_thread.name = "PayoutsKafkaConsumerThread"
     consumer_thread.start()
     return consumer_thread
@@ -180,29 +236,17 @@ def stop_kafka_listener_thread():
 
 # --- Kafka Producer for offer.payout.completed ---
 OFFER_PAYOUT_COMPLETED_SCHEMA_PATH = Path(__file__).resolve().parent.parent.parent / "schema" / "offer_payout_completed.avsc"
-_offer_payout_completed_producer = None
-_offer_payout_completed_schema_str = None
 
 def get_offer_payout_completed_producer():
-    global _offer_payout_completed_producer, _offer_payout_completed_schema_str
-    if _offer_payout_completed_producer is None:
-        try:
-            if not Path(OFFER_PAYOUT_COMPLETED_SCHEMA_PATH).is_file():
-                logger.error("Schema file not found for offer.payout.completed", path=str(OFFER_PAYOUT_COMPLETED_SCHEMA_PATH))
-                raise FileNotFoundError(f"Schema file not found: {OFFER_PAYOUT_COMPLETED_SCHEMA_PATH}")
-            with open(OFFER_PAYOUT_COMPLETED_SCHEMA_PATH, 'r') as f:
-                _offer_payout_completed_schema_str = f.read()
-            
-            _offer_payout_completed_producer = common_create_avro_producer( # Use renamed import
-                value_schema_str=_offer_payout_completed_schema_str
-            )
-            logger.info("Kafka producer for offer.payout.completed initialized.", 
-                        topic=KAFKA_PAYOUT_COMPLETED_TOPIC)
-        except Exception as e:
-            logger.error("Failed to initialize Kafka producer for offer.payout.completed", error=str(e), exc_info=True)
-            APP_ERRORS_TOTAL.labels(component="kafka_producer_init", error_type="offer_payout_completed").inc()
-            _offer_payout_completed_producer = None 
-    return _offer_payout_completed_producer
+    """The process-wide shared producer with the offer.payout.completed schema registered, or None if unavailable."""
+    try:
+        return get_producer_registry().register_topic(KAFKA_PAYOUT_COMPLETED_TOPIC, OFFER_PAYOUT_COMPLETED_SCHEMA_PATH)
+    except FileNotFoundError:
+        logger.error("Schema file not found for offer.payout.completed", path=str(OFFER_PAYOUT_COMPLETED_SCHEMA_PATH))
+    except Exception as e:
+        logger.error("Failed to initialize Kafka producer for offer.payout.completed", error=str(e), exc_info=True)
+    APP_ERRORS_TOTAL.labels(component="kafka_producer_init", error_type="offer_payout_completed").inc()
+    return None
 
 # --- Helper Functions with Metrics ---
 def _create_ledger_entry(session: Session, offer_id: uuid.UUID, amount_cents: int, currency: str, debit: str, credit: str, ref_id: str, desc: str, type: str="payout", payout_method: str="unknown"):
@@ -394,19 +438,14 @@ def execute_payout(self, offer_id_str: str):
                                      payout_reference_id_for_event, desc, type=f"{payout_method_for_event}_payout", payout_method=payout_method_for_event)
                 
                 with Session(offers_engine) as offers_session_update:
-                    offer_to_update = offers_session_update.get(Offer, offer_id)
-                    if offer_to_update:
-                        offer_to_update.status = "PAID_OUT" 
-                        offer_to_update.updated_at = datetime.utcnow()
-                        # Store last payout method and ref if your Offer model supports it
-                        # offer_to_update.last_payout_method = payout_method_for_event
-                        # offer_to_update.last_payout_reference = payout_reference_id_for_event
-                        offers_session_update.add(offer_to_update)
+                    # Single UPDATE ... RETURNING, guarded by the status read before the payout
+                    # Store last payout method and ref here too if your Offer model supports it
+                    if transition_offer(offers_session_update, offer_id, "PAID_OUT", expected_status=original_offer_status):
                         offers_session_update.commit()
                         logger.info("Offer status updated to PAID_OUT", offer_id=offer_id)
                     else:
-                        logger.error("Offer not found for status update after payout.", offer_id=offer_id)
-                        failure_reason_for_event = "Offer not found during final status update after successful payout."
+                        logger.error("Offer not found or status changed before status update after payout.", offer_id=offer_id, expected_status=original_offer_status)
+                        failure_reason_for_event = "Offer not found or status changed during final status update after successful payout."
                         payout_status_for_event = "FAILURE" # This is a critical data integrity issue
                         APP_ERRORS_TOTAL.labels(component="execute_payout", error_type="offer_disappeared_post_payout").inc()
 
@@ -432,7 +471,7 @@ def execute_payout(self, offer_id_str: str):
         # Produce Kafka event for offer.payout.completed REGARDLESS OF OUTCOME (unless offer was not found initially)
         if original_offer_status != "UNKNOWN": # Means offer was found initially
             producer = get_offer_payout_completed_producer()
-            if producer and _offer_payout_completed_schema_str:
+            if producer:
                 event_payload_completed = {
                     "event_id": str(uuid.uuid4()),
                     "offer_id": offer_id_str,
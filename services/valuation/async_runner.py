@@ -0,0 +1,319 @@
+"""
+Asyncio valuation runner, an alternative entry point to the prefork run_valuation task.
+
+Spotify is called over a pooled httpx.AsyncClient, the offers DB is reached through
+services.offers.db.async_engine (asyncpg) and Redis through redis.asyncio, so one process
+keeps up to VALUATION_ASYNC_CONCURRENCY valuations in flight while they wait on I/O.
+Model inference and the shared prediction cache run in a worker thread.
+
+Run it as a Celery worker that serves run_valuation_async_batch:
+    celery -A services.valuation.async_runner.celery_app worker -l INFO -Q valuation --pool solo
+or directly for a list of offers:
+    python -m services.valuation.async_runner <offer_id> [<offer_id> ...]
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from typing import Optional
+
+import httpx
+import redis
+import redis.asyncio as aioredis
+import structlog
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, sessionmaker
+from sqlmodel import select
+
+from libs.analytics.feature_pipeline import build_feature_matrix, features_to_frame
+from services.offers.db import async_engine
+from services.offers.models import Offer
+from services.offers.transitions import transition_offer_async
+
+from .metrics import (
+    CELERY_TASKS_PROCESSED_TOTAL,
+    CELERY_TASK_DURATION_SECONDS,
+    SPOTIFY_API_CALLS_TOTAL,
+    SPOTIFY_API_LATENCY_SECONDS,
+    CACHE_HITS_TOTAL,
+    CACHE_MISSES_TOTAL,
+    MODEL_PREDICTIONS_TOTAL,
+    VALUATION_ASYNC_IN_FLIGHT,
+    APP_ERRORS_TOTAL,
+)
+from .rules_engine import signals_from_spotify
+from .worker import (
+    celery_app,
+    model_registry,
+    rules_engine,
+    predict_with_cache,
+    spotify_artist_local_cache,
+    get_offer_valuated_producer,
+    _build_offer_valuated_payload,
+    _produce_offer_valuated_event,
+    _spotify_artist_cache_key,
+    SPOTIFY_ARTIST_CACHE_NAME,
+    SPOTIFY_REDIS_CACHE_TTL,
+    SPOTIPY_CLIENT_ID,
+    SPOTIPY_CLIENT_SECRET,
+    REDIS_HOST,
+    REDIS_PORT,
+)
+
+logger = structlog.get_logger(__name__)
+
+SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
+SPOTIFY_API_BASE_URL = "https://api.spotify.com/v1"
+SPOTIFY_MAX_ATTEMPTS = 3
+SPOTIFY_TOKEN_REFRESH_MARGIN_SECONDS = 60
+
+VALUATION_ASYNC_CONCURRENCY = int(os.getenv("VALUATION_ASYNC_CONCURRENCY", "200"))
+SPOTIFY_HTTP_MAX_CONNECTIONS = int(os.getenv("SPOTIFY_HTTP_MAX_CONNECTIONS", "100"))
+SPOTIFY_HTTP_TIMEOUT_SECONDS = float(os.getenv("SPOTIFY_HTTP_TIMEOUT_SECONDS", "10"))
+
+class AsyncSpotifyClient:
+    """Minimal client-credentials Spotify client over a shared httpx.AsyncClient."""
+
+    def __init__(self, client_id: str, client_secret: str, http_client: httpx.AsyncClient):
+        self._client_id = client_id
+        self._client_secret = client_secret
+        self._http = http_client
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
+
+    async def _access_token(self) -> str:
+        async with self._token_lock: # One token request even with hundreds of callers waiting
+            if self._token is None or time.monotonic() >= self._token_expires_at - SPOTIFY_TOKEN_REFRESH_MARGIN_SECONDS:
+                response = await self._http.post(
+                    SPOTIFY_TOKEN_URL,
+                    data={"grant_type": "client_credentials"},
+                    auth=(self._client_id, self._client_secret),
+                )
+                response.raise_for_status()
+                body = response.json()
+                self._token = body["access_token"]
+                self._token_expires_at = time.monotonic() + float(body.get("expires_in", 3600))
+            return self._token
+
+    async def artist(self, artist_id: str) -> dict:
+        endpoint_name = "artist_details"
+        for attempt in range(1, SPOTIFY_MAX_ATTEMPTS + 1):
+            token = await self._access_token()
+            start_time = time.monotonic()
+            try:
+                response = await self._http.get(f"{SPOTIFY_API_BASE_URL}/artists/{artist_id}", headers={"Authorization": f"Bearer {token}"})
+            except httpx.TransportError as e:
+                SPOTIFY_API_LATENCY_SECONDS.labels(endpoint=endpoint_name).observe(time.monotonic() - start_time)
+                SPOTIFY_API_CALLS_TOTAL.labels(endpoint=endpoint_name, status_code="error_transport").inc()
+                if attempt == SPOTIFY_MAX_ATTEMPTS:
+                    raise
+                logger.warning("Spotify transport error, retrying", artist_id=artist_id, attempt=attempt, error=str(e))
+                await asyncio.sleep(2 ** attempt)
+                continue
+            SPOTIFY_API_LATENCY_SECONDS.labels(endpoint=endpoint_name).observe(time.monotonic() - start_time)
+            SPOTIFY_API_CALLS_TOTAL.labels(endpoint=endpoint_name, status_code=str(response.status_code)).inc()
+
+            if response.status_code == 401: # Token revoked or expired early
+                self._token = None
+            elif response.status_code == 429 or response.status_code >= 500:
+                if attempt < SPOTIFY_MAX_ATTEMPTS:
+                    await asyncio.sleep(float(response.headers.get("Retry-After", 2 ** attempt)))
+            else:
+                break
+        response.raise_for_status()
+        return response.json()
+
+class AsyncValuationRunner:
+    """Values offers concurrently on one event loop, with at most `concurrency` in flight."""
+
+    def __init__(self, concurrency: int = VALUATION_ASYNC_CONCURRENCY):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._http = httpx.AsyncClient(
+            timeout=SPOTIFY_HTTP_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=SPOTIFY_HTTP_MAX_CONNECTIONS, max_keepalive_connections=SPOTIFY_HTTP_MAX_CONNECTIONS),
+        )
+        self._spotify = AsyncSpotifyClient(SPOTIPY_CLIENT_ID, SPOTIPY_CLIENT_SECRET, self._http) if SPOTIPY_CLIENT_ID and SPOTIPY_CLIENT_SECRET else None
+        self._redis = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
+        self._session_factory = sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+        self._artist_fetches: dict[str, asyncio.Future] = {} # Coalesces concurrent lookups of one artist
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+        await self._redis.aclose()
+
+    async def get_spotify_artist_data(self, artist_id: str) -> Optional[dict]:
+        """Same tiers as the sync worker: process-local cache, then Redis, then Spotify."""
+        artist_data, _ = spotify_artist_local_cache.get(artist_id)
+        if artist_data is not None:
+            CACHE_HITS_TOTAL.labels(cache_name=SPOTIFY_ARTIST_CACHE_NAME, tier="local").inc()
+            return artist_data
+        CACHE_MISSES_TOTAL.labels(cache_name=SPOTIFY_ARTIST_CACHE_NAME, tier="local").inc()
+
+        in_flight = self._artist_fetches.get(artist_id)
+        if in_flight is not None:
+            return await asyncio.shield(in_flight)
+        fetch = asyncio.ensure_future(self._load_spotify_artist(artist_id))
+        self._artist_fetches[artist_id] = fetch
+        fetch.add_done_callback(lambda _: self._artist_fetches.pop(artist_id, None))
+        return await asyncio.shield(fetch)
+
+    async def _load_spotify_artist(self, artist_id: str) -> Optional[dict]:
+        cache_key = _spotify_artist_cache_key(artist_id)
+        try:
+            cached_value = await self._redis.get(cache_key)
+        except redis.exceptions.ConnectionError as e:
+            logger.warning("Redis connection error on cache get", error=str(e), artist_id=artist_id)
+            APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="redis_connection", component="cache_get").inc()
+            cached_value = None
+        if cached_value is not None:
+            CACHE_HITS_TOTAL.labels(cache_name=SPOTIFY_ARTIST_CACHE_NAME, tier="redis").inc()
+            artist_data = json.loads(cached_value)
+            spotify_artist_local_cache.set(artist_id, artist_data)
+            return artist_data
+        CACHE_MISSES_TOTAL.labels(cache_name=SPOTIFY_ARTIST_CACHE_NAME, tier="redis").inc()
+
+        if self._spotify is None:
+            return None
+        try:
+            artist_data = await self._spotify.artist(artist_id)
+        except Exception as e:
+            logger.error("Failed to get Spotify data after retries", artist_id=artist_id, error=str(e))
+            APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="spotify_api", component="get_artist_data").inc()
+            return None
+        try:
+            await self._redis.setex(cache_key, SPOTIFY_REDIS_CACHE_TTL, json.dumps(artist_data))
+        except redis.exceptions.ConnectionError as e:
+            logger.warning("Redis connection error on cache set", error=str(e), artist_id=artist_id)
+            APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="redis_connection", component="cache_set").inc()
+        spotify_artist_local_cache.set(artist_id, artist_data)
+        return artist_data
+
+    async def _transition_offer(self, offer: Offer, new_status: str, **values) -> bool:
+        """Guarded on the status the offer was read with; False if another writer moved it on meanwhile."""
+        async with self._session_factory() as session:
+            transitioned = await transition_offer_async(session, offer.id, new_status, expected_status=offer.status, **values)
+            await session.commit()
+        return transitioned
+
+    async def valuate(self, offer_id_str: str) -> dict:
+        async with self._semaphore:
+            VALUATION_ASYNC_IN_FLIGHT.inc()
+            try:
+                return await self._valuate(uuid.UUID(offer_id_str))
+            finally:
+                VALUATION_ASYNC_IN_FLIGHT.dec()
+
+    async def _valuate(self, offer_id: uuid.UUID) -> dict:
+        # Short-lived sessions on either side of the Spotify wait, so in-flight valuations don't pin pool connections
+        async with self._session_factory() as session:
+            result = await session.execute(select(Offer).options(selectinload(Offer.creator)).where(Offer.id == offer_id))
+            offer = result.scalars().first()
+        if not offer:
+            logger.error("Offer not found for valuation", offer_id=str(offer_id))
+            APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="not_found", component="db_get_offer").inc()
+            return {"status": "error", "message": "Offer not found"}
+
+        spotify_data = None
+        if offer.creator and offer.creator.platform_name == "spotify":
+            spotify_data = await self.get_spotify_artist_data(offer.creator.platform_id)
+        else:
+            logger.warning("Spotify data cannot be fetched for offer.", offer_id=str(offer_id))
+        feature_df = features_to_frame(build_feature_matrix([spotify_data]))
+
+        model, model_version = model_registry.get_with_version()
+        if not model:
+            logger.error("Valuation model not loaded. Cannot predict.", offer_id=str(offer_id))
+            await self._transition_offer(offer, "VALUATION_FAILED_MODEL_MISSING")
+            APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="model_missing", component="predict").inc()
+            MODEL_PREDICTIONS_TOTAL.labels(outcome="error_model_missing").inc()
+            return {"status": "error", "message": "Valuation model not loaded"}
+        try:
+            # CPU-bound inference and the sync Redis tier of the prediction cache stay off the event loop
+            predictions = await asyncio.to_thread(predict_with_cache, model, model_version, feature_df)
+            MODEL_PREDICTIONS_TOTAL.labels(outcome="success").inc()
+        except Exception as e:
+            logger.error("Error during model prediction", error=str(e), offer_id=str(offer_id))
+            await self._transition_offer(offer, "VALUATION_FAILED_PREDICTION_ERROR")
+            APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="prediction_error", component="predict").inc()
+            MODEL_PREDICTIONS_TOTAL.labels(outcome="error_prediction").inc()
+            return {"status": "error", "message": f"Model prediction error: {e}"}
+        prediction = rules_engine.apply(predictions, signals_from_spotify([spotify_data]))[0]
+
+        valuation = {
+            "price_low_eur": int(prediction[0]),
+            "price_median_eur": int(prediction[1]),
+            "price_high_eur": int(prediction[2]),
+            "valuation_confidence": float(prediction[3]),
+        }
+        # Only if nobody moved the offer on meanwhile; otherwise no offer.valuated event either
+        if not await self._transition_offer(offer, "OFFER_READY", **valuation):
+            logger.warning("Offer status changed during valuation. Result discarded.", offer_id=str(offer_id), read_status=offer.status)
+            return {"status": "skipped", "message": "Offer status changed during valuation"}
+        valuation["status"] = "OFFER_READY"
+        logger.info("Offer updated with valuation", offer_id=str(offer_id), status=valuation["status"])
+
+        producer = get_offer_valuated_producer()
+        if producer:
+            _produce_offer_valuated_event(producer, _build_offer_valuated_payload(offer_id, offer.creator_id, valuation), component="kafka_produce_async")
+            producer.poll(0)
+        else:
+            logger.warning("Kafka producer not available. Skipping event production.", offer_id=str(offer_id))
+        return {"status": "success", "offer_id": str(offer_id), **valuation}
+
+    async def run(self, offer_id_strs: list[str]) -> dict:
+        """Values all offers concurrently and returns per-offer results keyed by offer id."""
+        offer_id_strs = list(dict.fromkeys(offer_id_strs))
+        outcomes = await asyncio.gather(*(self.valuate(s) for s in offer_id_strs), return_exceptions=True)
+        results = {}
+        for offer_id_str, outcome in zip(offer_id_strs, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.error("Unhandled error in async valuation", offer_id=offer_id_str, error=str(outcome))
+                APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="unknown", component="async_valuation").inc()
+                outcome = {"status": "error", "message": str(outcome)}
+            results[offer_id_str] = outcome
+        return results
+
+# One event loop and runner per process, created lazily so each prefork child gets its
+# own loop, HTTP pool and DB connections instead of sharing the parent's.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_runner: Optional[AsyncValuationRunner] = None
+_owner_pid: Optional[int] = None
+
+def get_async_runner() -> tuple[asyncio.AbstractEventLoop, AsyncValuationRunner]:
+    global _loop, _runner, _owner_pid
+    if _runner is None or _owner_pid != os.getpid():
+        _loop = asyncio.new_event_loop()
+        _runner = AsyncValuationRunner()
+        _owner_pid = os.getpid()
+    return _loop, _runner
+
+@celery_app.task(name="services.valuation.async_runner.run_valuation_async_batch", bind=True)
+def run_valuation_async_batch(self, offer_id_strs: list[str]):
+    task_start_time = time.monotonic()
+    task_name = self.name
+    status = "failure"
+    try:
+        loop, runner = get_async_runner()
+        results = loop.run_until_complete(runner.run(offer_id_strs))
+        valued_count = sum(1 for r in results.values() if r.get("status") == "success")
+        status = "success" if valued_count == len(results) else "partial_success"
+        logger.info("Async valuation batch complete", task_name=task_name, offer_count=len(results), valued_count=valued_count)
+        return {"status": status, "valued_count": valued_count, "results": results}
+    finally:
+        CELERY_TASK_DURATION_SECONDS.labels(task_name=task_name).observe(time.monotonic() - task_start_time)
+        CELERY_TASKS_PROCESSED_TOTAL.labels(task_name=task_name, status=status).inc()
+
+async def _main(offer_id_strs: list[str]) -> dict:
+    runner = AsyncValuationRunner()
+    try:
+        return await runner.run(offer_id_strs)
+    finally:
+        await runner.aclose()
+        await async_engine.dispose()
+
+if __name__ == "__main__":
+    for offer_id_str, result in asyncio.run(_main(sys.argv[1:])).items():
+        print(offer_id_str, result)
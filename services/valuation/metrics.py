@@ -31,13 +31,13 @@ SPOTIFY_API_LATENCY_SECONDS = Histogram(
 CACHE_HITS_TOTAL = Counter(
     "valuation_cache_hits_total",
     "Total cache hits for valuation worker.",
-    ["cache_name"] # e.g., 'spotify_artist_data'
+    ["cache_name", "tier"] # e.g., 'spotify_artist_data'; tier: 'local' (in-process LRU) or 'redis'
 )
 
 CACHE_MISSES_TOTAL = Counter(
     "valuation_cache_misses_total",
     "Total cache misses for valuation worker.",
-    ["cache_name"]
+    ["cache_name", "tier"]
 )
 
 # --- Model Prediction Metrics ---
@@ -47,11 +47,29 @@ MODEL_PREDICTIONS_TOTAL = Counter(
     ["outcome"] # e.g., 'success', 'error'
 )
 
+VALUATION_BATCH_SIZE_OFFERS = Histogram(
+    "valuation_batch_size_offers",
+    "Number of offers valued per run_valuation_batch task.",
+    [],
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+)
+
+FALLBACK_RULES_TRIGGERED_TOTAL = Counter(
+    "valuation_fallback_rules_triggered_total",
+    "Number of offers whose valuation was adjusted by a fallback rule.",
+    ["rule_name"] # e.g., 'STREAM_DECLINE', 'GEO_CONCENTRATION'
+)
+
+VALUATION_ASYNC_IN_FLIGHT = Gauge(
+    "valuation_async_in_flight",
+    "Number of valuations currently in flight in the async valuation runner."
+)
+
 # --- General Application Metrics ---
 APP_ERRORS_TOTAL = Counter(
     "valuation_app_errors_total",
     "Total number of application errors in valuation worker.",
-    ["error_type", "component"] # component e.g., 'spotify_fetch', 'db_update', 'model_predict'
+    ["service_name", "error_type", "component"] # component e.g., 'spotify_fetch', 'db_update', 'model_predict'
 )
 
 def start_metrics_server(port: int = 8001, addr: str = '0.0.0.0'):
@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+import structlog
+import yaml
+
+from libs.py_common.flags import is_enabled
+
+from .metrics import FALLBACK_RULES_TRIGGERED_TOTAL, APP_ERRORS_TOTAL
+
+logger = structlog.get_logger(__name__)
+
+# Column layout of a prediction matrix: one row per offer
+PRICE_LOW, PRICE_MEDIAN, PRICE_HIGH, CONFIDENCE = range(4)
+PRICE_COLUMNS = [PRICE_LOW, PRICE_MEDIAN, PRICE_HIGH]
+
+# Signals the rules read, one row per offer. Missing values never trigger a rule.
+SIGNAL_COLUMNS = ["streams_last_month", "stream_decline_rate", "total_listeners", "top_country_share"]
+
+@dataclass(frozen=True)
+class CompiledRule:
+    name: str
+    flag_name: Optional[str]
+    predicate: Callable[[pd.DataFrame], np.ndarray] # signals -> boolean mask
+    adjust: Callable[[np.ndarray, np.ndarray], None] # (predictions, mask) -> in-place update
+
+def _column(signals: pd.DataFrame, name: str) -> np.ndarray:
+    if name not in signals:
+        return np.full(len(signals), np.nan)
+    return pd.to_numeric(signals[name], errors="coerce").to_numpy(dtype=np.float64)
+
+def _compile_stream_decline(name: str, config: dict) -> CompiledRule:
+    threshold = float(config.get("threshold_percentage", 0.3))
+    min_streams = float(config.get("min_streams_for_eval", 0))
+    multiplier = float(config.get("valuation_multiplier", 1.0))
+
+    def predicate(signals: pd.DataFrame) -> np.ndarray:
+        return (_column(signals, "stream_decline_rate") > threshold) & (_column(signals, "streams_last_month") >= min_streams)
+
+    def adjust(predictions: np.ndarray, mask: np.ndarray) -> None:
+        predictions[np.ix_(mask, PRICE_COLUMNS)] *= multiplier
+
+    return CompiledRule(name, config.get("enabled_flag_name"), predicate, adjust)
+
+def _compile_geo_concentration(name: str, config: dict) -> CompiledRule:
+    max_share = float(config.get("max_single_country_percentage", 1.0))
+    min_listeners = float(config.get("min_total_listeners_for_eval", 0))
+    factor = float(config.get("confidence_reduction_factor", 1.0))
+
+    def predicate(signals: pd.DataFrame) -> np.ndarray:
+        return (_column(signals, "top_country_share") > max_share) & (_column(signals, "total_listeners") >= min_listeners)
+
+    def adjust(predictions: np.ndarray, mask: np.ndarray) -> None:
+        predictions[mask, CONFIDENCE] *= factor
+
+    return CompiledRule(name, config.get("enabled_flag_name"), predicate, adjust)
+
+RULE_COMPILERS: dict[str, Callable[[str, dict], CompiledRule]] = {
+    "STREAM_DECLINE": _compile_stream_decline,
+    "GEO_CONCENTRATION": _compile_geo_concentration,
+}
+
+def compile_rules(rules_config: dict) -> list[CompiledRule]:
+    compiled = []
+    for name, config in (rules_config or {}).items():
+        compiler = RULE_COMPILERS.get(name)
+        if compiler is None:
+            logger.warning("Unknown fallback rule in rules file, skipping", rule_name=name)
+            continue
+        compiled.append(compiler(name, config or {}))
+    return compiled
+
+class RulesEngine:
+    """
+    Applies the fallback rules from rules.yaml to a whole batch of predictions at once.
+
+    The file is compiled once into vectorized predicate/adjustment functions and
+    recompiled when its mtime changes (checked at most every check_interval_seconds).
+    Each rule's feature flag is resolved once per batch, and only when the rule
+    matches at least one offer.
+    """
+
+    def __init__(self, rules_path: Path, flag_resolver: Callable[[str], bool] = is_enabled, check_interval_seconds: float = 30.0):
+        self.rules_path = Path(rules_path)
+        self.flag_resolver = flag_resolver
+        self.check_interval_seconds = check_interval_seconds
+        self._rules: list[CompiledRule] = []
+        self._mtime_ns: Optional[int] = None
+        self._last_check = float("-inf")
+        self._lock = threading.Lock()
+
+    @property
+    def rules(self) -> list[CompiledRule]:
+        if time.monotonic() - self._last_check >= self.check_interval_seconds:
+            self._maybe_reload()
+        return self._rules
+
+    def _maybe_reload(self) -> None:
+        with self._lock:
+            self._last_check = time.monotonic()
+            try:
+                mtime_ns = os.stat(self.rules_path).st_mtime_ns
+            except FileNotFoundError:
+                if self._mtime_ns is None:
+                    logger.error("Fallback rules file not found!", rules_path=str(self.rules_path))
+                return
+            if mtime_ns == self._mtime_ns:
+                return
+            try:
+                with open(self.rules_path, 'r') as f:
+                    self._rules = compile_rules(yaml.safe_load(f))
+                self._mtime_ns = mtime_ns
+                logger.info("Fallback rules compiled", rules_path=str(self.rules_path), rules=[r.name for r in self._rules])
+            except Exception as e: # Keep the previous rules on a bad edit
+                logger.error("Failed to compile fallback rules", rules_path=str(self.rules_path), error=str(e))
+                APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="rules_compile_error", component="rules_engine").inc()
+
+    def apply(self, predictions, signals: pd.DataFrame) -> np.ndarray:
+        """
+        Returns a float64 copy of predictions (n_offers x [low, median, high, confidence])
+        with every enabled, matching rule applied. signals holds SIGNAL_COLUMNS per offer.
+        """
+        adjusted = np.array(predictions, dtype=np.float64)
+        for rule in self.rules:
+            mask = rule.predicate(signals)
+            matched = int(mask.sum())
+            if not matched:
+                continue
+            if rule.flag_name and not self.flag_resolver(rule.flag_name):
+                continue
+            rule.adjust(adjusted, mask)
+            FALLBACK_RULES_TRIGGERED_TOTAL.labels(rule_name=rule.name).inc(matched)
+            logger.info("Fallback rule applied", rule_name=rule.name, offer_count=matched)
+        return adjusted
+
+def signals_from_spotify(payloads: list) -> pd.DataFrame:
+    """Builds the rule signal frame from Spotify artist payloads (None for unavailable artists)."""
+    payloads = [p or {} for p in payloads]
+    return pd.DataFrame({
+        "streams_last_month": [(p.get("followers") or {}).get("total") for p in payloads],
+        "stream_decline_rate": [p.get("stream_decline_rate") for p in payloads],
+        "total_listeners": [p.get("total_listeners") for p in payloads],
+        "top_country_share": [p.get("top_country_share") for p in payloads],
+    }, columns=SIGNAL_COLUMNS, dtype="float64")
@@ -1,22 +1,26 @@
 import os
 import uuid
-import joblib
+import hashlib
+import numpy as np
 import pandas as pd
-import yaml
 import redis
 import json
-from datetime import timedelta
+import threading
+from datetime import datetime, timedelta
 import time
 
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
-from sqlmodel import Session, create_engine, select # Using synchronous session for Celery task
+from sqlmodel import Session, select # Using synchronous session for Celery task
+from sqlalchemy.orm import selectinload # To eagerly load creators for batch valuation
 from tenacity import retry, stop_after_attempt, wait_exponential
 import structlog
 
 # Assuming libs is in PYTHONPATH
 from libs.py_common.celery_config import create_celery_app
-from libs.py_common.kafka import create_avro_producer, delivery_report, KafkaException # Added KafkaException
+from libs.py_common.kafka import get_producer_registry, delivery_report, KafkaException # Added KafkaException
+from libs.py_common.cache import TTLCache, SingleFlight, CACHE_STALE
+from libs.py_common.db import create_pooled_engine, sync_database_url
 # Assuming services/offers/models.py contains the Offer model definition
 # This creates a dependency. Ideally, models could be in libs if shared, or use an API.
 # For now, direct import path relative to a common root for services.
@@ -25,9 +29,12 @@ from pathlib import Path
 # Add project root to sys.path to allow absolute-like imports for services
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 sys.path.append(str(PROJECT_ROOT))
-from services.offers.models import Offer # Now this should work
+from services.offers.models import Offer, Creator # Now this should work
+from services.offers.transitions import transition_offer, transition_offers_with_values
 from services.offers.db import DATABASE_URL as OFFERS_DB_URL # Get sync DB URL for offers
-from libs.analytics.feature_pipeline import process_data_for_features # Adjusted based on typical use
+from libs.analytics.feature_pipeline import process_data_for_features, build_feature_matrix, features_to_frame
+from libs.analytics.model_loader import ModelRegistry
+from .rules_engine import RulesEngine, signals_from_spotify
 # Kafka producer - placeholder. Use a proper Kafka client library like confluent-kafka-python
 # from confluent_kafka import Producer
 
@@ -40,6 +47,7 @@ from .metrics import (
     CACHE_HITS_TOTAL,
     CACHE_MISSES_TOTAL,
     MODEL_PREDICTIONS_TOTAL,
+    VALUATION_BATCH_SIZE_OFFERS,
     APP_ERRORS_TOTAL,
     start_metrics_server
 )
@@ -62,9 +70,8 @@ if os.getenv("CELERY_WORKER_NAME"): # Crude way to check if in Celery worker vs
         # If this happens, metrics won't be available from this worker instance.
 
 # Database Engine for offers (synchronous for Celery task)
-# Construct a synchronous URL if OFFERS_DB_URL is async
-sync_offers_db_url = OFFERS_DB_URL.replace("+asyncpg", "") if "+asyncpg" in OFFERS_DB_URL else OFFERS_DB_URL
-engine = create_engine(sync_offers_db_url, echo=False) # Set echo=True for debugging SQL
+# Pool settings come from VALUATION_OFFERS_DB_POOL_* / DB_POOL_* env vars
+engine = create_pooled_engine(sync_database_url(OFFERS_DB_URL), "valuation_offers")
 
 # Spotify API Client
 SPOTIPY_CLIENT_ID = os.getenv("SPOTIPY_CLIENT_ID")
@@ -81,73 +88,94 @@ REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
 
-# Load valuation model (bundled in service folder)
-MODEL_PATH = Path(__file__).parent / "model.pkl"
-try:
-    model = joblib.load(MODEL_PATH)
-    logger.info("Valuation model loaded successfully.", model_path=str(MODEL_PATH))
-except FileNotFoundError:
-    logger.error("Valuation model model.pkl not found in service folder!", model_path=str(MODEL_PATH))
-    model = None # Worker will fail tasks needing the model
+# Valuation model (bundled in service folder). Loaded lazily on first use, memory-mapped so
+# prefork children share its arrays, and hot-swapped when a new model.pkl version lands.
+MODEL_PATH = Path(os.getenv("VALUATION_MODEL_PATH", str(Path(__file__).parent / "model.pkl")))
+model_registry = ModelRegistry(
+    "valuation",
+    MODEL_PATH,
+    check_interval_seconds=float(os.getenv("VALUATION_MODEL_CHECK_INTERVAL_SECONDS", "30")),
+)
 
-# Load fallback rules
+# Fallback rules, compiled once and recompiled when rules.yaml changes
 RULES_PATH = Path(__file__).parent / "rules.yaml"
-try:
-    with open(RULES_PATH, 'r') as f:
-        rules_config = yaml.safe_load(f)
-    logger.info("Fallback rules loaded successfully.", rules_path=str(RULES_PATH))
-except FileNotFoundError:
-    logger.error("Fallback rules rules.yaml not found!", rules_path=str(RULES_PATH))
-    rules_config = {}
+rules_engine = RulesEngine(
+    RULES_PATH,
+    check_interval_seconds=float(os.getenv("VALUATION_RULES_CHECK_INTERVAL_SECONDS", "30")),
+)
 
 # Kafka Configuration
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
 OFFER_VALUATED_TOPIC = "offer.valuated"
 
+# Batch valuation configuration
+VALUATION_BATCH_SIZE = int(os.getenv("VALUATION_BATCH_SIZE", "500")) # Max offers per run_valuation_batch task
+VALUATION_BATCH_LINGER_SECONDS = float(os.getenv("VALUATION_BATCH_LINGER_SECONDS", "2.0")) # Max wait before a partial batch is dispatched
+
 # --- Kafka Producer for offer.valuated ---
 OFFER_VALUATED_SCHEMA_PATH = Path(__file__).resolve().parent.parent.parent / "schema" / "offer_valuated.avsc"
-_offer_valuated_producer = None
-_offer_valuated_schema_str = None
 
 def get_offer_valuated_producer():
-    global _offer_valuated_producer, _offer_valuated_schema_str
-    if _offer_valuated_producer is None:
-        try:
-            with open(OFFER_VALUATED_SCHEMA_PATH, 'r') as f:
-                _offer_valuated_schema_str = f.read()
-            # Pass delivery_report callback to create_avro_producer if it accepts it, or handle separately
-            _offer_valuated_producer = create_avro_producer(value_schema_str=_offer_valuated_schema_str)
-            logger.info("Offer.valuated Kafka producer initialized.", topic=OFFER_VALUATED_TOPIC)
-        except FileNotFoundError:
-            logger.error("offer_valuated.avsc not found. Kafka producer will not work.", path=str(OFFER_VALUATED_SCHEMA_PATH))
-            _offer_valuated_producer = None # Ensure it's None if schema fails to load
-        except Exception as e:
-            logger.error("Failed to initialize Kafka producer for offer.valuated", error=str(e), exc_info=True)
-            APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="kafka_producer_init", component="get_offer_valuated_producer").inc()
-            _offer_valuated_producer = None # Ensure it's None on other init errors
-    return _offer_valuated_producer
+    """The process-wide shared producer with the offer.valuated schema registered, or None if unavailable."""
+    try:
+        # Batch valuations emit bursts of events: linger and compress rather than send one by one
+        return get_producer_registry(profile="high-throughput").register_topic(OFFER_VALUATED_TOPIC, OFFER_VALUATED_SCHEMA_PATH)
+    except FileNotFoundError:
+        logger.error("offer_valuated.avsc not found. Kafka producer will not work.", path=str(OFFER_VALUATED_SCHEMA_PATH))
+    except Exception as e:
+        logger.error("Failed to initialize Kafka producer for offer.valuated", error=str(e), exc_info=True)
+        APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="kafka_producer_init", component="get_offer_valuated_producer").inc()
+    return None
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def get_spotify_artist_data(artist_id: str):
-    endpoint_name = "artist_details"
-    if not sp:
-        logger.warning("Spotify client not available.")
-        SPOTIFY_API_CALLS_TOTAL.labels(endpoint=endpoint_name, status_code="error_client_unavailable").inc()
-        return None
-    
-    cache_key = f"spotify:artist:{artist_id}"
+# --- Spotify artist cache ---
+# Lookups go through an in-process LRU (tier "local") in front of Redis (tier "redis").
+# Concurrent misses for the same artist are coalesced: threads in a process share one
+# in-flight fetch, and processes of the same worker coordinate through a short Redis lock.
+SPOTIFY_ARTIST_CACHE_NAME = "spotify_artist_data"
+SPOTIFY_REDIS_CACHE_TTL = timedelta(minutes=int(os.getenv("SPOTIFY_REDIS_CACHE_TTL_MINUTES", "15")))
+SPOTIFY_REDIS_REFRESH_AHEAD_SECONDS = int(os.getenv("SPOTIFY_REDIS_REFRESH_AHEAD_SECONDS", "120")) # Refresh Redis entries this close to expiry in the background
+SPOTIFY_LOCAL_CACHE_MAXSIZE = int(os.getenv("SPOTIFY_LOCAL_CACHE_MAXSIZE", "2048"))
+SPOTIFY_LOCAL_CACHE_TTL_SECONDS = float(os.getenv("SPOTIFY_LOCAL_CACHE_TTL_SECONDS", "60"))
+SPOTIFY_LOCAL_CACHE_STALE_SECONDS = float(os.getenv("SPOTIFY_LOCAL_CACHE_STALE_SECONDS", "300")) # Serve stale while revalidating for this long
+SPOTIFY_FETCH_LOCK_TTL_MS = int(os.getenv("SPOTIFY_FETCH_LOCK_TTL_MS", "10000"))
+SPOTIFY_FETCH_LOCK_WAIT_SECONDS = float(os.getenv("SPOTIFY_FETCH_LOCK_WAIT_SECONDS", "2.0"))
+
+spotify_artist_local_cache = TTLCache(
+    maxsize=SPOTIFY_LOCAL_CACHE_MAXSIZE,
+    ttl_seconds=SPOTIFY_LOCAL_CACHE_TTL_SECONDS,
+    stale_seconds=SPOTIFY_LOCAL_CACHE_STALE_SECONDS,
+)
+_spotify_artist_fetches = SingleFlight()
+
+def _spotify_artist_cache_key(artist_id: str) -> str:
+    return f"spotify:artist:{artist_id}"
+
+def _read_spotify_artist_from_redis(artist_id: str):
+    """Returns (artist_data, remaining_ttl_seconds) from Redis, or (None, None) on a miss or Redis error."""
+    cache_key = _spotify_artist_cache_key(artist_id)
     try:
-        cached_data = redis_client.get(cache_key)
-        if cached_data:
-            logger.info("Spotify artist data cache hit", artist_id=artist_id)
-            CACHE_HITS_TOTAL.labels(cache_name="spotify_artist_data").inc()
-            return json.loads(cached_data)
-        CACHE_MISSES_TOTAL.labels(cache_name="spotify_artist_data").inc()
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.get(cache_key)
+        pipe.ttl(cache_key)
+        cached_data, remaining_ttl = pipe.execute()
     except redis.exceptions.ConnectionError as e:
         logger.error("Redis connection error during cache get", error=str(e))
         APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="redis_connection", component="cache_get").inc()
-        # Fall through to API call if cache is down
-    
+        return None, None # Fall through to API call if cache is down
+    if not cached_data:
+        return None, None
+    return json.loads(cached_data), remaining_ttl
+
+def _write_spotify_artist_to_redis(artist_id: str, artist_data: dict) -> None:
+    try:
+        redis_client.setex(_spotify_artist_cache_key(artist_id), SPOTIFY_REDIS_CACHE_TTL, json.dumps(artist_data))
+    except redis.exceptions.ConnectionError as e:
+        logger.error("Redis connection error during cache set", error=str(e))
+        APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="redis_connection", component="cache_set").inc()
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+def _fetch_spotify_artist_from_api(artist_id: str):
+    endpoint_name = "artist_details"
     logger.info("Fetching Spotify artist data from API", artist_id=artist_id)
     start_time = time.monotonic()
     try:
@@ -155,12 +183,6 @@ def get_spotify_artist_data(artist_id: str):
         latency = time.monotonic() - start_time
         SPOTIFY_API_LATENCY_SECONDS.labels(endpoint=endpoint_name).observe(latency)
         SPOTIFY_API_CALLS_TOTAL.labels(endpoint=endpoint_name, status_code="200").inc()
-        if artist_data:
-            try:
-                redis_client.setex(cache_key, timedelta(minutes=15), json.dumps(artist_data))
-            except redis.exceptions.ConnectionError as e:
-                logger.error("Redis connection error during cache set", error=str(e))
-                APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="redis_connection", component="cache_set").inc()
         return artist_data
     except spotipy.exceptions.SpotifyException as e:
         latency = time.monotonic() - start_time
@@ -178,6 +200,313 @@ def get_spotify_artist_data(artist_id: str):
         APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="unknown", component="get_artist_data").inc()
         raise
 
+def _load_spotify_artist(artist_id: str):
+    """
+    Fetches an artist from Spotify and fills both cache tiers. A Redis lock makes other
+    processes wait for this fetch to land in Redis instead of calling Spotify themselves.
+    """
+    lock_key = f"{_spotify_artist_cache_key(artist_id)}:lock"
+    try:
+        lock_acquired = bool(redis_client.set(lock_key, "1", nx=True, px=SPOTIFY_FETCH_LOCK_TTL_MS))
+    except redis.exceptions.ConnectionError as e:
+        logger.error("Redis connection error during fetch lock", error=str(e))
+        APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="redis_connection", component="fetch_lock").inc()
+        lock_acquired = False
+        deadline = 0.0 # Redis is down, nobody else can fill it: fetch directly
+    else:
+        deadline = time.monotonic() + SPOTIFY_FETCH_LOCK_WAIT_SECONDS
+
+    if not lock_acquired:
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            artist_data, _ = _read_spotify_artist_from_redis(artist_id)
+            if artist_data is not None:
+                spotify_artist_local_cache.set(artist_id, artist_data)
+                return artist_data
+        if deadline:
+            logger.warning("Timed out waiting for concurrent Spotify fetch, fetching directly", artist_id=artist_id)
+
+    try:
+        artist_data = _fetch_spotify_artist_from_api(artist_id)
+        if artist_data:
+            _write_spotify_artist_to_redis(artist_id, artist_data)
+            spotify_artist_local_cache.set(artist_id, artist_data)
+        return artist_data
+    finally:
+        if lock_acquired:
+            try:
+                redis_client.delete(lock_key)
+            except redis.exceptions.ConnectionError:
+                pass # Lock expires on its own after SPOTIFY_FETCH_LOCK_TTL_MS
+
+def _redis_entry_expiring(remaining_ttl) -> bool:
+    return remaining_ttl is not None and 0 <= remaining_ttl < SPOTIFY_REDIS_REFRESH_AHEAD_SECONDS
+
+def _revalidate_spotify_artist(artist_id: str):
+    """
+    Refreshes a stale local entry: from Redis when it holds the artist, from Spotify only
+    on a Redis miss or when the Redis entry is about to expire.
+    """
+    artist_data, remaining_ttl = _read_spotify_artist_from_redis(artist_id)
+    if artist_data is not None and not _redis_entry_expiring(remaining_ttl):
+        spotify_artist_local_cache.set(artist_id, artist_data)
+        return artist_data
+    return _load_spotify_artist(artist_id)
+
+def get_spotify_artist_data(artist_id: str):
+    endpoint_name = "artist_details"
+    if not sp:
+        logger.warning("Spotify client not available.")
+        SPOTIFY_API_CALLS_TOTAL.labels(endpoint=endpoint_name, status_code="error_client_unavailable").inc()
+        return None
+
+    # Tier 1: in-process LRU
+    artist_data, state = spotify_artist_local_cache.get(artist_id)
+    if state is not None:
+        CACHE_HITS_TOTAL.labels(cache_name=SPOTIFY_ARTIST_CACHE_NAME, tier="local").inc()
+        if state == CACHE_STALE: # Serve stale, revalidate once in the background
+            _spotify_artist_fetches.do_in_background(artist_id, lambda: _revalidate_spotify_artist(artist_id))
+        return artist_data
+    CACHE_MISSES_TOTAL.labels(cache_name=SPOTIFY_ARTIST_CACHE_NAME, tier="local").inc()
+
+    # Tier 2: Redis
+    artist_data, remaining_ttl = _read_spotify_artist_from_redis(artist_id)
+    if artist_data is not None:
+        logger.info("Spotify artist data cache hit", artist_id=artist_id)
+        CACHE_HITS_TOTAL.labels(cache_name=SPOTIFY_ARTIST_CACHE_NAME, tier="redis").inc()
+        spotify_artist_local_cache.set(artist_id, artist_data)
+        if _redis_entry_expiring(remaining_ttl):
+            _spotify_artist_fetches.do_in_background(artist_id, lambda: _load_spotify_artist(artist_id))
+        return artist_data
+    CACHE_MISSES_TOTAL.labels(cache_name=SPOTIFY_ARTIST_CACHE_NAME, tier="redis").inc()
+
+    # Origin: one fetch per artist_id at a time
+    return _spotify_artist_fetches.do(artist_id, lambda: _load_spotify_artist(artist_id))
+
+
+# --- Bulk Spotify prefetch ---
+SPOTIFY_SEVERAL_ARTISTS_LIMIT = 50 # Max IDs accepted by GET /v1/artists
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+def _fetch_spotify_artists_chunk(artist_ids: list[str]) -> list[dict]:
+    endpoint_name = "several_artists"
+    start_time = time.monotonic()
+    try:
+        response = sp.artists(artist_ids)
+        SPOTIFY_API_CALLS_TOTAL.labels(endpoint=endpoint_name, status_code="200").inc()
+        return [artist for artist in (response or {}).get("artists", []) if artist] # Unknown IDs come back as null
+    except spotipy.exceptions.SpotifyException as e:
+        status_code = e.http_status if hasattr(e, 'http_status') else "error_spotify_exception"
+        SPOTIFY_API_CALLS_TOTAL.labels(endpoint=endpoint_name, status_code=str(status_code)).inc()
+        logger.error("Spotify API error during bulk artist fetch", error=str(e), artist_count=len(artist_ids))
+        APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="spotify_api", component="prefetch_artists").inc()
+        raise # Re-raise for tenacity retry
+    finally:
+        SPOTIFY_API_LATENCY_SECONDS.labels(endpoint=endpoint_name).observe(time.monotonic() - start_time)
+
+def prefetch_spotify_artists(artist_ids: list[str]) -> int:
+    """
+    Warms both artist cache tiers for the given IDs using the several-artists endpoint,
+    SPOTIFY_SEVERAL_ARTISTS_LIMIT IDs per call, and a single pipelined SETEX round-trip
+    per chunk. Artists already cached are skipped. Returns the number of artists fetched.
+    Failures are logged and swallowed: valuations fall back to per-artist lookups.
+    """
+    if not sp:
+        return 0
+    candidates = [a for a in dict.fromkeys(artist_ids) if a and spotify_artist_local_cache.get(a)[1] is None]
+    if not candidates:
+        return 0
+
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for artist_id in candidates:
+            pipe.exists(_spotify_artist_cache_key(artist_id))
+        missing = [a for a, cached in zip(candidates, pipe.execute()) if not cached]
+    except redis.exceptions.ConnectionError as e:
+        logger.error("Redis connection error during prefetch lookup", error=str(e))
+        APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="redis_connection", component="prefetch_lookup").inc()
+        missing = candidates
+
+    fetched = 0
+    for start in range(0, len(missing), SPOTIFY_SEVERAL_ARTISTS_LIMIT):
+        chunk = missing[start:start + SPOTIFY_SEVERAL_ARTISTS_LIMIT]
+        try:
+            artists = _fetch_spotify_artists_chunk(chunk)
+        except Exception as e:
+            logger.error("Bulk Spotify prefetch failed for chunk", error=str(e), artist_count=len(chunk))
+            continue
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for artist in artists:
+                pipe.setex(_spotify_artist_cache_key(artist["id"]), SPOTIFY_REDIS_CACHE_TTL, json.dumps(artist))
+            pipe.execute()
+        except redis.exceptions.ConnectionError as e:
+            logger.error("Redis connection error during prefetch cache set", error=str(e))
+            APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="redis_connection", component="prefetch_cache_set").inc()
+        for artist in artists:
+            spotify_artist_local_cache.set(artist["id"], artist)
+        fetched += len(artists)
+
+    logger.info("Spotify artist prefetch complete", requested=len(candidates), fetched=fetched)
+    return fetched
+
+def _spotify_platform_ids(offers) -> list[str]:
+    return [offer.creator.platform_id for offer in offers if offer.creator and offer.creator.platform_name == "spotify"]
+
+@celery_app.task(name="services.valuation.worker.prefetch_spotify_artists_for_offers", bind=True)
+def prefetch_spotify_artists_for_offers(self, offer_id_strs: list[str]):
+    """Backfill helper: warms the artist cache for the creators of the given offers ahead of valuation."""
+    task_start_time = time.monotonic()
+    task_name = self.name
+    status = "failure"
+    try:
+        offer_ids = [uuid.UUID(s) for s in offer_id_strs]
+        with Session(engine) as session:
+            platform_ids = session.exec(
+                select(Creator.platform_id)
+                .join(Offer, Offer.creator_id == Creator.id)
+                .where(Offer.id.in_(offer_ids), Creator.platform_name == "spotify")
+                .distinct()
+            ).all()
+        fetched = prefetch_spotify_artists(list(platform_ids))
+        status = "success"
+        return {"status": "success", "artist_count": len(platform_ids), "fetched": fetched}
+    finally:
+        CELERY_TASK_DURATION_SECONDS.labels(task_name=task_name).observe(time.monotonic() - task_start_time)
+        CELERY_TASKS_PROCESSED_TOTAL.labels(task_name=task_name, status=status).inc()
+
+
+# --- Prediction cache ---
+# Predictions are keyed by the model version plus a hash of the feature vector, so offers
+# whose creator yields an identical feature row skip inference. Like the artist cache it
+# has an in-process tier ("local") in front of Redis ("redis").
+PREDICTION_CACHE_NAME = "valuation_prediction"
+PREDICTION_REDIS_CACHE_TTL = timedelta(minutes=int(os.getenv("VALUATION_PREDICTION_CACHE_TTL_MINUTES", "60")))
+prediction_local_cache = TTLCache(
+    maxsize=int(os.getenv("VALUATION_PREDICTION_LOCAL_CACHE_MAXSIZE", "4096")),
+    ttl_seconds=float(os.getenv("VALUATION_PREDICTION_LOCAL_CACHE_TTL_SECONDS", "300")),
+)
+
+def _invalidate_prediction_cache(old_version, new_version) -> None:
+    # Redis keys embed the model version, so the old model's entries are never read again and expire on their own
+    prediction_local_cache.clear()
+    logger.info("Prediction cache invalidated after model reload", old_version=old_version, new_version=new_version)
+
+model_registry.add_reload_listener(_invalidate_prediction_cache)
+
+def _feature_fingerprints(feature_df: pd.DataFrame) -> list[str]:
+    """SHA-256 per feature row over the column names and the float32 row bytes."""
+    header = "\x1f".join(map(str, feature_df.columns)).encode()
+    rows = np.ascontiguousarray(feature_df.to_numpy(dtype=np.float32))
+    return [hashlib.sha256(header + row.tobytes()).hexdigest() for row in rows]
+
+def _prediction_cache_key(model_version: str, fingerprint: str) -> str:
+    return f"valuation:prediction:{model_version}:{fingerprint}"
+
+def predict_with_cache(model, model_version: str, feature_df: pd.DataFrame) -> np.ndarray:
+    """
+    Returns an (n_rows, 4) array of [low, median, high, confidence]. model.predict is only
+    called for rows missing from both cache tiers, and identical rows are predicted once.
+    """
+    fingerprints = _feature_fingerprints(feature_df)
+    predictions = np.empty((len(fingerprints), 4), dtype=np.float64)
+
+    pending: dict[str, list[int]] = {} # fingerprint -> row positions still to fill
+    for i, fingerprint in enumerate(fingerprints):
+        cached, _ = prediction_local_cache.get((model_version, fingerprint))
+        if cached is not None:
+            predictions[i] = cached
+        else:
+            pending.setdefault(fingerprint, []).append(i)
+    local_misses = sum(len(rows) for rows in pending.values())
+    CACHE_HITS_TOTAL.labels(cache_name=PREDICTION_CACHE_NAME, tier="local").inc(len(fingerprints) - local_misses)
+    CACHE_MISSES_TOTAL.labels(cache_name=PREDICTION_CACHE_NAME, tier="local").inc(local_misses)
+    if not pending:
+        return predictions
+
+    lookup = list(pending)
+    try:
+        cached_values = redis_client.mget([_prediction_cache_key(model_version, fp) for fp in lookup])
+    except redis.exceptions.ConnectionError as e:
+        logger.warning("Redis connection error on prediction cache lookup", error=str(e))
+        APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="redis_connection", component="prediction_cache_get").inc()
+        cached_values = [None] * len(lookup)
+    for fingerprint, cached_value in zip(lookup, cached_values):
+        if cached_value is None:
+            continue
+        cached = json.loads(cached_value)
+        prediction_local_cache.set((model_version, fingerprint), cached)
+        rows = pending.pop(fingerprint)
+        predictions[rows] = cached
+        CACHE_HITS_TOTAL.labels(cache_name=PREDICTION_CACHE_NAME, tier="redis").inc(len(rows))
+    CACHE_MISSES_TOTAL.labels(cache_name=PREDICTION_CACHE_NAME, tier="redis").inc(sum(len(rows) for rows in pending.values()))
+    if not pending:
+        return predictions
+
+    to_predict = list(pending)
+    model_output = model.predict(feature_df.iloc[[pending[fp][0] for fp in to_predict]])
+    if len(model_output) != len(to_predict):
+        raise ValueError(f"Model returned {len(model_output)} predictions for {len(to_predict)} feature rows")
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for fingerprint, prediction in zip(to_predict, model_output):
+            pipe.setex(_prediction_cache_key(model_version, fingerprint), PREDICTION_REDIS_CACHE_TTL, json.dumps([float(v) for v in prediction[:4]]))
+        pipe.execute()
+    except redis.exceptions.ConnectionError as e:
+        logger.warning("Redis connection error on prediction cache write", error=str(e))
+        APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="redis_connection", component="prediction_cache_set").inc()
+    for fingerprint, prediction in zip(to_predict, model_output):
+        values = [float(v) for v in prediction[:4]]
+        prediction_local_cache.set((model_version, fingerprint), values)
+        predictions[pending[fingerprint]] = values
+    return predictions
+
+def _get_spotify_data_for_offer(offer: Offer):
+    """Returns Spotify artist data for the offer's creator, or None if it cannot be fetched."""
+    if offer.creator and offer.creator.platform_name == "spotify" and sp:
+        logger.info("Fetching Spotify data for creator", creator_platform_id=offer.creator.platform_id)
+        return get_spotify_artist_data(offer.creator.platform_id)
+    logger.warning("Spotify data cannot be fetched for offer.", offer_id=str(offer.id))
+    return None
+
+def _raw_features_from_spotify(spotify_data) -> dict:
+    """Maps a Spotify artist payload to the raw inputs of the feature pipeline."""
+    return {
+        "streams_last_month": spotify_data.get('followers', {}).get('total', 0) if spotify_data else 0,
+        "country_listeners": len(spotify_data.get('available_markets', [])) if spotify_data else 0
+    }
+
+def _build_offer_valuated_payload(offer_id, creator_id, valuation: dict) -> dict:
+    """Builds the offer.valuated event payload from a persisted valuation."""
+    return {
+        "event_id": str(uuid.uuid4()), # Add a unique event_id
+        "offer_id": str(offer_id),
+        "creator_id": str(creator_id), # The Avro schema expects a string for creator_id
+        "price_low_eur": valuation["price_low_eur"],
+        "price_median_eur": valuation["price_median_eur"],
+        "price_high_eur": valuation["price_high_eur"],
+        "valuation_confidence": valuation["valuation_confidence"],
+        "status": valuation["status"],
+        "timestamp": int(datetime.utcnow().timestamp() * 1_000_000) # Microseconds
+    }
+
+def _produce_offer_valuated_event(producer, event_payload: dict, component: str) -> None:
+    """Enqueues an offer.valuated event. Delivery callbacks are served by the caller's poll()."""
+    try:
+        producer.produce(
+            topic=OFFER_VALUATED_TOPIC,
+            key=event_payload["offer_id"],
+            value=event_payload,
+            on_delivery=delivery_report
+        )
+        logger.info("offer.valuated event produced to Kafka", offer_id=event_payload["offer_id"], payload_keys=list(event_payload.keys()))
+    except KafkaException as e: # Catch specific Kafka errors
+        logger.error("Kafka producer error for offer.valuated", error=str(e), offer_id=event_payload["offer_id"])
+        APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="kafka_produce_error", component=component).inc()
+    except Exception as e: # Catch other unexpected errors during Kafka produce
+        logger.error("Unexpected error during Kafka produce for offer.valuated", error=str(e), offer_id=event_payload["offer_id"], exc_info=True)
+        APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="kafka_produce_unexpected", component=component).inc()
+
 @celery_app.task(name="services.valuation.worker.run_valuation", bind=True)
 def run_valuation(self, offer_id_str: str):
     task_start_time = time.monotonic()
@@ -197,24 +526,15 @@ def run_valuation(self, offer_id_str: str):
             
             logger.info("Offer retrieved", offer_id=str(offer_id), offer_title=offer.title, creator_id=offer.creator_id)
 
-            spotify_data = None
-            if offer.creator and offer.creator.platform_name == "spotify" and sp:
-                logger.info("Fetching Spotify data for creator", creator_platform_id=offer.creator.platform_id)
-                spotify_data = get_spotify_artist_data(offer.creator.platform_id)
-            else:
-                logger.warning("Spotify data cannot be fetched for offer.", offer_id=str(offer_id))
-
-            raw_features_data = {
-                "streams_last_month": spotify_data.get('followers', {}).get('total', 0) if spotify_data else 0,
-                "country_listeners": len(spotify_data.get('available_markets', [])) if spotify_data else 0
-            }
+            spotify_data = _get_spotify_data_for_offer(offer)
+            raw_features_data = _raw_features_from_spotify(spotify_data)
             feature_dict = process_data_for_features(raw_features_data)
             feature_df = pd.DataFrame([feature_dict])
 
+            model, model_version = model_registry.get_with_version()
             if not model:
                 logger.error("Valuation model not loaded. Cannot predict.")
-                offer.status = "VALUATION_FAILED_MODEL_MISSING"
-                session.add(offer)
+                transition_offer(session, offer.id, "VALUATION_FAILED_MODEL_MISSING", expected_status=offer.status)
                 session.commit()
                 APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="model_missing", component="predict").inc()
                 MODEL_PREDICTIONS_TOTAL.labels(outcome="error_model_missing").inc()
@@ -222,16 +542,11 @@ def run_valuation(self, offer_id_str: str):
                 return {"status": "error", "message": "Valuation model not loaded"}
             
             try:
-                prediction_results = model.predict(feature_df)
+                prediction_results = predict_with_cache(model, model_version, feature_df)
                 MODEL_PREDICTIONS_TOTAL.labels(outcome="success").inc()
-                computed_low_eur = int(prediction_results[0][0])
-                computed_median_eur = int(prediction_results[0][1])
-                computed_high_eur = int(prediction_results[0][2])
-                computed_confidence = float(prediction_results[0][3])
             except Exception as e:
                 logger.error("Error during model prediction", error=str(e), offer_id=str(offer_id))
-                offer.status = "VALUATION_FAILED_PREDICTION_ERROR"
-                session.add(offer)
+                transition_offer(session, offer.id, "VALUATION_FAILED_PREDICTION_ERROR", expected_status=offer.status)
                 session.commit()
                 APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="prediction_error", component="predict").inc()
                 MODEL_PREDICTIONS_TOTAL.labels(outcome="error_prediction").inc()
@@ -239,61 +554,31 @@ def run_valuation(self, offer_id_str: str):
                 return {"status": "error", "message": f"Model prediction error: {e}"}
 
             # 5. Apply fallback rules
-            # Example rule check from rules.yaml (needs actual flag checks)
-            # stream_decline_threshold = rules_config.get('STREAM_DECLINE', {}).get('threshold', 0.3)
-            # current_stream_decline = spotify_data.get('stream_decline_rate', 0) # Fictional field
-            # if current_stream_decline > stream_decline_threshold and is_feature_enabled("fallback_stream_decline", offer_id):
-            #    logger.info("Applying fallback rule for stream decline")
-            #    computed_median_eur = max(1000, computed_median_eur * 0.8) # e.g. cap at 10 EUR or reduce by 20%
-
-            # 6. Update offer row
-            offer.price_low_eur = computed_low_eur
-            offer.price_median_eur = computed_median_eur
-            offer.price_high_eur = computed_high_eur
-            offer.valuation_confidence = computed_confidence
-            offer.status = "OFFER_READY"
-            offer.updated_at = datetime.utcnow()
-            session.add(offer)
+            prediction_results = rules_engine.apply(prediction_results, signals_from_spotify([spotify_data]))
+            valuation = {
+                "price_low_eur": int(prediction_results[0][0]),
+                "price_median_eur": int(prediction_results[0][1]),
+                "price_high_eur": int(prediction_results[0][2]),
+                "valuation_confidence": float(prediction_results[0][3]),
+            }
+
+            # 6. Update offer row: one UPDATE ... RETURNING, only if nobody moved the offer on meanwhile
+            if not transition_offer(session, offer.id, "OFFER_READY", expected_status=offer.status, **valuation):
+                logger.warning("Offer status changed during valuation. Result discarded.", offer_id=str(offer.id), read_status=offer.status)
+                status = "skipped_status_conflict"
+                return {"status": "skipped", "message": "Offer status changed during valuation"}
             session.commit()
-            session.refresh(offer)
-            logger.info("Offer updated with valuation", offer_id=str(offer.id), status=offer.status)
+            valuation["status"] = "OFFER_READY"
+            logger.info("Offer updated with valuation", offer_id=str(offer.id), status=valuation["status"])
 
             # 7. Produce Kafka event
+            # Prefer ID from loaded creator if available, otherwise fall back to the FK column
+            creator_id_for_event = offer.creator.id if offer.creator and getattr(offer.creator, 'id', None) is not None else offer.creator_id
+            event_payload = _build_offer_valuated_payload(offer.id, creator_id_for_event, valuation)
             producer = get_offer_valuated_producer()
-            if producer and _offer_valuated_schema_str: # Check schema loaded too
-                # Ensure creator_id is UUID string for Avro schema
-                # Assuming offer.creator_id is always a valid UUID if offer.creator is not loaded or None
-                # The Avro schema expects a string for creator_id.
-                creator_id_for_event = str(offer.creator_id)
-                if offer.creator and hasattr(offer.creator, 'id') and offer.creator.id is not None:
-                     creator_id_for_event = str(offer.creator.id) # Prefer ID from loaded creator if available
-
-                event_payload = {
-                    "event_id": str(uuid.uuid4()), # Add a unique event_id
-                    "offer_id": str(offer.id),
-                    "creator_id": creator_id_for_event,
-                    "price_low_eur": offer.price_low_eur,
-                    "price_median_eur": offer.price_median_eur,
-                    "price_high_eur": offer.price_high_eur,
-                    "valuation_confidence": offer.valuation_confidence,
-                    "status": offer.status,
-                    "timestamp": int(datetime.utcnow().timestamp() * 1_000_000) # Microseconds
-                }
-                try:
-                    producer.produce(
-                        topic=OFFER_VALUATED_TOPIC, 
-                        key=str(offer.id), 
-                        value=event_payload, 
-                        on_delivery=delivery_report
-                    )
-                    producer.poll(0) # Trigger delivery report callbacks non-blockingly
-                    logger.info("offer.valuated event produced to Kafka", offer_id=str(offer.id), payload_keys=list(event_payload.keys()))
-                except KafkaException as e: # Catch specific Kafka errors
-                    logger.error("Kafka producer error for offer.valuated", error=str(e), offer_id=str(offer.id))
-                    APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="kafka_produce_error", component="run_valuation").inc()
-                except Exception as e: # Catch other unexpected errors during Kafka produce
-                    logger.error("Unexpected error during Kafka produce for offer.valuated", error=str(e), offer_id=str(offer.id), exc_info=True)
-                    APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="kafka_produce_unexpected", component="run_valuation").inc()
+            if producer:
+                _produce_offer_valuated_event(producer, event_payload, component="run_valuation")
+                producer.poll(0) # Trigger delivery report callbacks non-blockingly
             else:
                 logger.warning("Kafka producer for offer.valuated not available or schema not loaded.", offer_id=str(offer.id))
             status = "success"
@@ -310,6 +595,176 @@ def run_valuation(self, offer_id_str: str):
         CELERY_TASK_DURATION_SECONDS.labels(task_name=task_name).observe(task_duration)
         CELERY_TASKS_PROCESSED_TOTAL.labels(task_name=task_name, status=status).inc()
 
+def _bulk_set_offer_status(session: Session, offers: list, new_status: str) -> None:
+    """Marks every offer in the batch with the same status in a single UPDATE, skipping offers moved on meanwhile."""
+    transition_offers_with_values(session, [{"id": offer.id, "expected_status": offer.status} for offer in offers], new_status)
+    session.commit()
+
+@celery_app.task(name="services.valuation.worker.run_valuation_batch", bind=True)
+def run_valuation_batch(self, offer_id_strs: list[str]):
+    """
+    Values many offers in one pass: one IN query to load them, one feature matrix,
+    one model.predict call and one bulk UPDATE. An offer.valuated event is still
+    produced for every valued offer.
+    """
+    task_start_time = time.monotonic()
+    task_name = self.name
+    offer_ids = list(dict.fromkeys(uuid.UUID(s) for s in offer_id_strs)) # De-duplicate, keep order
+    logger.info("Starting batch valuation", offer_count=len(offer_ids), task_name=task_name)
+    VALUATION_BATCH_SIZE_OFFERS.observe(len(offer_ids))
+    status = "failure" # Default status for metrics
+    results: dict[str, dict] = {}
+
+    try:
+        with Session(engine) as session:
+            offers = session.exec(
+                select(Offer).options(selectinload(Offer.creator)).where(Offer.id.in_(offer_ids))
+            ).all()
+
+            found_ids = {offer.id for offer in offers}
+            for missing_id in (oid for oid in offer_ids if oid not in found_ids):
+                logger.error("Offer not found for valuation", offer_id=str(missing_id))
+                APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="not_found", component="db_get_offer").inc()
+                results[str(missing_id)] = {"status": "error", "message": "Offer not found"}
+
+            if not offers:
+                status = "failure_offer_not_found"
+                return {"status": "error", "message": "No offers found", "results": results}
+
+            # Warm the artist cache for the whole batch with bulk Spotify calls,
+            # then offers of the same creator share one lookup within the batch
+            prefetch_spotify_artists(_spotify_platform_ids(offers))
+            spotify_data_by_platform_id: dict[str, dict | None] = {}
+            spotify_payloads = []
+            for offer in offers:
+                platform_id = offer.creator.platform_id if offer.creator else None
+                if platform_id not in spotify_data_by_platform_id:
+                    spotify_data_by_platform_id[platform_id] = _get_spotify_data_for_offer(offer)
+                spotify_payloads.append(spotify_data_by_platform_id[platform_id])
+            feature_df = features_to_frame(build_feature_matrix(spotify_payloads))
+
+            model, model_version = model_registry.get_with_version()
+            if not model:
+                logger.error("Valuation model not loaded. Cannot predict.", offer_count=len(offers))
+                _bulk_set_offer_status(session, offers, "VALUATION_FAILED_MODEL_MISSING")
+                APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="model_missing", component="predict").inc(len(offers))
+                MODEL_PREDICTIONS_TOTAL.labels(outcome="error_model_missing").inc(len(offers))
+                status = "failure_model_missing"
+                return {"status": "error", "message": "Valuation model not loaded"}
+
+            try:
+                prediction_results = predict_with_cache(model, model_version, feature_df)
+            except Exception as e:
+                logger.error("Error during batch model prediction", error=str(e), offer_count=len(offers))
+                _bulk_set_offer_status(session, offers, "VALUATION_FAILED_PREDICTION_ERROR")
+                APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="prediction_error", component="predict").inc(len(offers))
+                MODEL_PREDICTIONS_TOTAL.labels(outcome="error_prediction").inc(len(offers))
+                status = "failure_prediction_error"
+                return {"status": "error", "message": f"Model prediction error: {e}"}
+            MODEL_PREDICTIONS_TOTAL.labels(outcome="success").inc(len(offers))
+            # Fallback rules run over the whole batch at once
+            prediction_results = rules_engine.apply(prediction_results, signals_from_spotify(spotify_payloads))
+
+            update_rows = []
+            creator_ids = {}
+            for offer, prediction in zip(offers, prediction_results):
+                update_rows.append({
+                    "id": offer.id,
+                    "expected_status": offer.status,
+                    "price_low_eur": int(prediction[0]),
+                    "price_median_eur": int(prediction[1]),
+                    "price_high_eur": int(prediction[2]),
+                    "valuation_confidence": float(prediction[3]),
+                })
+                creator_ids[offer.id] = offer.creator.id if offer.creator and offer.creator.id is not None else offer.creator_id
+
+            # One UPDATE ... FROM (VALUES ...) RETURNING for the whole batch; offers whose status
+            # changed since they were read are skipped
+            updated_ids = set(transition_offers_with_values(session, update_rows, "OFFER_READY"))
+            session.commit()
+            logger.info("Offers updated with batch valuation", offer_count=len(updated_ids))
+            for row in update_rows:
+                if row["id"] not in updated_ids:
+                    results[str(row["id"])] = {"status": "skipped", "message": "Offer status changed during valuation"}
+            update_rows = [{**row, "status": "OFFER_READY"} for row in update_rows if row["id"] in updated_ids]
+
+        producer = get_offer_valuated_producer()
+        if not producer:
+            logger.warning("Kafka producer for offer.valuated not available or schema not loaded.", offer_count=len(update_rows))
+        for row in update_rows:
+            event_payload = _build_offer_valuated_payload(row["id"], creator_ids[row["id"]], row)
+            if producer:
+                _produce_offer_valuated_event(producer, event_payload, component="run_valuation_batch")
+            results[str(row["id"])] = {"status": "success", "valuation": event_payload}
+        if producer:
+            producer.poll(0) # Serve delivery callbacks once for the whole batch
+
+        status = "success" if len(update_rows) == len(offer_ids) else "partial_success"
+        return {"status": status, "valued_count": len(update_rows), "results": results}
+
+    except Exception as e:
+        logger.error("Unhandled exception in run_valuation_batch task", error=str(e), offer_count=len(offer_ids), exc_info=True)
+        APP_ERRORS_TOTAL.labels(service_name="valuation", error_type="unhandled_exception", component="run_valuation_batch_task").inc()
+        status = "failure_unhandled_exception"
+        raise # Re-raise to let Celery handle retry logic or mark as failed
+    finally:
+        task_duration = time.monotonic() - task_start_time
+        CELERY_TASK_DURATION_SECONDS.labels(task_name=task_name).observe(task_duration)
+        CELERY_TASKS_PROCESSED_TOTAL.labels(task_name=task_name, status=status).inc()
+
+def dispatch_valuation_batches(offer_id_strs: list[str], batch_size: int = VALUATION_BATCH_SIZE) -> list:
+    """Splits offer ids into chunks of at most batch_size and enqueues one run_valuation_batch per chunk."""
+    async_results = []
+    for start in range(0, len(offer_id_strs), batch_size):
+        chunk = [str(offer_id) for offer_id in offer_id_strs[start:start + batch_size]]
+        async_results.append(run_valuation_batch.delay(chunk))
+    logger.info("Dispatched valuation batches", offer_count=len(offer_id_strs), batch_count=len(async_results))
+    return async_results
+
+class ValuationBatchDispatcher:
+    """
+    Auto-batching front door for run_valuation_batch.
+
+    Offer ids are buffered as they arrive and dispatched as one batch task when
+    the buffer reaches batch_size, or when the oldest buffered id has waited
+    linger_seconds, whichever comes first.
+    """
+
+    def __init__(self, batch_size: int = VALUATION_BATCH_SIZE, linger_seconds: float = VALUATION_BATCH_LINGER_SECONDS):
+        self.batch_size = batch_size
+        self.linger_seconds = linger_seconds
+        self._buffer: list[str] = []
+        self._lock = threading.Lock()
+        self._timer: threading.Timer | None = None
+
+    def submit(self, offer_id_str: str) -> None:
+        with self._lock:
+            self._buffer.append(str(offer_id_str))
+            if len(self._buffer) >= self.batch_size:
+                batch = self._drain_locked()
+            else:
+                batch = None
+                if self._timer is None:
+                    self._timer = threading.Timer(self.linger_seconds, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        if batch:
+            dispatch_valuation_batches(batch, self.batch_size)
+
+    def flush(self) -> None:
+        with self._lock:
+            batch = self._drain_locked()
+        if batch:
+            dispatch_valuation_batches(batch, self.batch_size)
+
+    def _drain_locked(self) -> list[str]:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._buffer = self._buffer, []
+        return batch
+
+
 # To run worker: celery -A services.valuation.worker.celery_app worker -l INFO
 # Remember to have Redis running.
 # For the Kafka part, a Kafka broker needs to be running.
@@ -0,0 +1,51 @@
+from collections import Counter
+from unittest.mock import patch
+
+from services.docgen.assets import ASSET_DIR, AssetCache, stylesheet_path
+
+
+def test_assets_are_read_once_then_served_from_memory(tmp_path):
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG")
+    cache = AssetCache(tmp_path)
+    lookups = Counter()
+    url = (tmp_path / "logo.png").as_uri()
+
+    first = cache.fetch(lookups, url)
+    (tmp_path / "logo.png").write_bytes(b"changed on disk")
+    second = cache.fetch(lookups, url)
+
+    assert first["string"] == second["string"] == b"\x89PNG"
+    assert second["mime_type"] == "image/png"
+    assert lookups == Counter(miss=1, hit=1)
+
+
+def test_preloaded_assets_are_hits(tmp_path):
+    (tmp_path / "fonts").mkdir()
+    (tmp_path / "fonts" / "brand.woff2").write_bytes(b"wOF2")
+    cache = AssetCache(tmp_path)
+    lookups = Counter()
+
+    assert cache.preload() == 1
+    cache.fetch(lookups, (tmp_path / "fonts" / "brand.woff2").as_uri())
+
+    assert lookups == Counter(hit=1)
+
+
+def test_urls_outside_the_asset_dir_go_to_the_default_fetcher(tmp_path):
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "secret.txt").write_text("not an asset")
+    cache = AssetCache(tmp_path / "assets")
+    lookups = Counter()
+
+    with patch("services.docgen.assets.default_url_fetcher", return_value={"string": b""}) as default_fetcher:
+        cache.fetch(lookups, (tmp_path / "assets" / ".." / "secret.txt").as_uri())
+        cache.fetch(lookups, "https://example.com/logo.png")
+
+    assert default_fetcher.call_count == 2
+    assert lookups == Counter(bypass=2)
+
+
+def test_template_stylesheets_exist():
+    for name in ("termsheet", "receipt"):
+        assert stylesheet_path(name).is_file()
+        assert stylesheet_path(name).is_relative_to(ASSET_DIR)
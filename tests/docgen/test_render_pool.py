@@ -0,0 +1,136 @@
+import hashlib
+import os
+from collections import Counter
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from services.docgen import render_pool
+from services.docgen.render_pool import HashingWriter, RenderPool, render_document
+
+
+@pytest.fixture
+def pool():
+    pool = RenderPool(processes=1, max_renders_per_worker=2)
+    yield pool
+    pool.shutdown()
+
+
+def _fake_render(html, stylesheets, target):
+    if html == "bad":
+        raise ValueError("layout failed")
+    writer = HashingWriter(target)
+    for chunk in (html.encode(), b"-pdf"):
+        writer.write(chunk)
+    return writer.sha256, writer.size, Counter(hit=1)
+
+
+def test_pool_renders_pdfs(pool):
+    pdf = pool.render("<h1 class='highlight'>Term sheet</h1>", ("termsheet",))
+    content = pdf.body.read()
+    assert content.startswith(b"%PDF")
+    assert pdf.sha256 == hashlib.sha256(content).hexdigest()
+    assert pdf.size == len(content)
+
+
+def test_hashing_writer_hashes_incrementally():
+    target = MagicMock()
+    writer = HashingWriter(target)
+    writer.write(b"%PDF-1.7\n")
+    writer.write(b"%%EOF")
+
+    assert writer.sha256 == hashlib.sha256(b"%PDF-1.7\n%%EOF").hexdigest()
+    assert writer.size == 14
+    assert target.write.call_count == 2
+
+
+def test_in_process_render_spools_without_a_local_file():
+    with patch.object(render_pool, "render_pdf", side_effect=_fake_render), \
+         patch.object(render_pool, "DOCGEN_PDF_SPOOL_MAX_BYTES", 4):
+        pdf = render_pool._render_in_process("<p>larger than the spool</p>", ())
+
+    with pdf.body:
+        assert pdf.body.read() == b"<p>larger than the spool</p>-pdf"
+        assert pdf.body._rolled # Spilled to an unlinked temporary file, not a named path
+    assert pdf.sha256 == hashlib.sha256(b"<p>larger than the spool</p>-pdf").hexdigest()
+
+
+def test_stylesheets_are_parsed_once_per_process():
+    assert render_pool._get_stylesheet("termsheet") is render_pool._get_stylesheet("termsheet")
+
+
+def test_worker_recycled_after_max_renders(pool):
+    pids = [pool._executor.submit(os.getpid).result(timeout=60) for _ in range(3)]
+
+    assert pids[0] == pids[1] # Same warm worker
+    assert pids[2] != pids[1] # Replaced after 2 jobs
+    assert os.getpid() not in pids
+
+
+def test_broken_pool_is_rebuilt():
+    with patch.object(RenderPool, "_create_executor") as create_executor:
+        broken, fresh = MagicMock(), MagicMock()
+        broken.submit.return_value.result.side_effect = BrokenProcessPool("worker died")
+        create_executor.side_effect = [broken, fresh]
+        pool = RenderPool(processes=2)
+
+        with pytest.raises(BrokenProcessPool):
+            pool.render("<p>x</p>")
+
+        assert pool._executor is fresh
+        broken.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+
+
+def test_render_document_falls_back_in_process_when_workers_cannot_start():
+    pool = MagicMock()
+    pool.render.side_effect = AssertionError("daemonic processes are not allowed to have children")
+    with patch.object(render_pool, "_render_pool", pool), \
+         patch.object(render_pool, "_render_pool_disabled", False), \
+         patch.object(render_pool, "render_pdf", side_effect=_fake_render) as render_pdf:
+        assert render_document("<p>x</p>").body.read() == b"<p>x</p>-pdf"
+        assert render_pool._render_pool_disabled
+        assert render_pool._render_pool is None
+
+    render_pdf.assert_called_once()
+    pool.shutdown.assert_called_once()
+
+
+def test_render_documents_yields_errors_per_document_in_process():
+    with patch.object(render_pool, "_render_pool", None), \
+         patch.object(render_pool, "_render_pool_disabled", True), \
+         patch.object(render_pool, "render_pdf", side_effect=_fake_render):
+        results = list(render_pool.render_documents([(1, "a", ()), (2, "bad", ()), (3, "c", ())]))
+
+    assert [(key, pdf and pdf.body.read()) for key, pdf, _ in results] == [(1, b"a-pdf"), (2, None), (3, b"c-pdf")]
+    assert isinstance(results[1][2], ValueError)
+
+
+def test_render_documents_across_pool_in_completion_order(pool):
+    with patch.object(render_pool, "_render_pool", pool):
+        results = list(render_pool.render_documents([(n, f"<p>{n}</p>", ("termsheet",)) for n in range(5)], max_in_flight=2))
+
+    assert sorted(key for key, _, _ in results) == list(range(5))
+    assert all(pdf.body.read().startswith(b"%PDF") and error is None for _, pdf, error in results)
+
+
+def test_render_documents_times_out_hung_renders():
+    hung = Future() # Never completes, like a render stuck on a slow remote URL
+    fake_pool = MagicMock(processes=1, generation=0)
+    fake_pool.submit.side_effect = lambda html, stylesheets: hung if html == "slow" else _completed(html)
+    fake_pool.result.side_effect = lambda future, generation, timeout=None: future.result()
+
+    with patch.object(render_pool, "_render_pool", fake_pool):
+        results = list(render_pool.render_documents([(1, "a", ()), (2, "slow", ()), (3, "c", ())], max_in_flight=3, timeout=0.05))
+
+    assert sorted((key, pdf) for key, pdf, _ in results[:2]) == [(1, "a-pdf"), (3, "c-pdf")]
+    assert results[2][:2] == (2, None)
+    assert isinstance(results[2][2], TimeoutError)
+    assert hung.cancelled()
+
+
+def _completed(html):
+    future = Future()
+    future.set_result(f"{html}-pdf")
+    return future
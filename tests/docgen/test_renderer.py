@@ -1,14 +1,21 @@
 import pytest
 import os
 import uuid
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 from pathlib import Path
 import hashlib
 from datetime import datetime
+import io
+from urllib.parse import urlsplit
+
+import boto3
+from moto import mock_aws
 
 # Adjust these imports based on your actual project structure
 # This assumes services.docgen.renderer and services.offers.models are discoverable
-from services.docgen.renderer import render_termsheet_pdf, render_html, generate_pdf_from_html, calculate_sha256, upload_to_s3
+from services.docgen.renderer import render_termsheet_pdf, render_html, generate_pdf_from_html, calculate_sha256, upload_to_s3, upload_to_s3_async
+from services.docgen.render_pool import RenderedPdf
+from services.docgen.uploader import S3Uploader
 from services.offers.models import Offer, Creator # As used in the template and renderer
 
 @pytest.fixture
@@ -56,30 +63,25 @@ def test_render_html(mock_offer_fixture):
     assert "12000.00 EUR" in html_content # Median price example
     assert "12345.00 USD" in html_content # Offer amount
 
-@patch("services.docgen.renderer.HTML") # Patch WeasyPrint's HTML class
-def test_generate_pdf_from_html(mock_weasyprint_html, mock_offer_fixture):
+@patch("services.docgen.renderer.render_document") # Patch the render pool
+def test_generate_pdf_from_html(mock_render_document, mock_offer_fixture):
     """Test PDF generation (mocking WeasyPrint actual PDF writing)."""
     mock_pdf_content_bytes = b"%PDF-1.4 mock_pdf_content"
-    mock_html_instance = MagicMock()
-    mock_html_instance.write_pdf.return_value = mock_pdf_content_bytes
-    mock_weasyprint_html.return_value = mock_html_instance
+    rendered = RenderedPdf(io.BytesIO(mock_pdf_content_bytes), hashlib.sha256(mock_pdf_content_bytes).hexdigest(), len(mock_pdf_content_bytes))
+    mock_render_document.return_value = rendered
 
     test_html = "<h1>Test PDF</h1>"
     offer_id_for_pdf = mock_offer_fixture.id
-    
-    # Ensure /tmp directory exists or use a temporary directory fixture from pytest for robustness
-    # For this test, assume /tmp is writable.
-    if not os.path.exists("/tmp"):
-        os.makedirs("/tmp") # Should ideally be handled by test environment setup
 
-    local_path, pdf_bytes = generate_pdf_from_html(test_html, offer_id_for_pdf)
+    pdf = generate_pdf_from_html(test_html, offer_id_for_pdf)
+
+    mock_render_document.assert_called_once_with(test_html, ())
+    assert pdf is rendered
+    assert not os.path.exists(f"/tmp/termsheet_offer_{str(offer_id_for_pdf)}.pdf") # Nothing written locally
 
-    mock_weasyprint_html.assert_called_once_with(string=test_html)
-    mock_html_instance.write_pdf.assert_called_once()
-    assert local_path == f"/tmp/termsheet_offer_{str(offer_id_for_pdf)}.pdf"
-    assert pdf_bytes == mock_pdf_content_bytes
-    assert os.path.exists(local_path) # Check if file was actually written by the mock setup
-    os.remove(local_path) # Clean up
+@patch("services.docgen.renderer.render_document", side_effect=RuntimeError("layout failed"))
+def test_generate_pdf_from_html_failure(mock_render_document, mock_offer_fixture):
+    assert generate_pdf_from_html("<h1>Test PDF</h1>", mock_offer_fixture.id) is None
 
 def test_calculate_sha256():
     """Test SHA256 hash calculation."""
@@ -89,85 +91,67 @@ def test_calculate_sha256():
     assert actual_hash == expected_hash
     assert len(actual_hash) == 64
 
-@patch("services.docgen.renderer.s3_client")
-def test_upload_to_s3_success(mock_boto_s3_client, mock_offer_fixture):
+@pytest.fixture
+def s3_uploader():
+    """An S3Uploader on a moto bucket, used by the renderer in place of the process-wide one."""
+    with mock_aws():
+        client = boto3.client("s3", region_name="eu-north-1")
+        client.create_bucket(Bucket="test-bucket", CreateBucketConfiguration={"LocationConstraint": "eu-north-1"})
+        uploader = S3Uploader("test-bucket", client=client)
+        with patch("services.docgen.renderer.get_s3_uploader", return_value=uploader):
+            yield uploader
+        uploader.shutdown()
+
+def test_upload_to_s3_success(s3_uploader, mock_offer_fixture):
     """Test S3 upload success case."""
-    # Ensure the global s3_client in renderer module is the mocked one
-    # Also, ensure S3_BUCKET_NAME is set for the test context
-    with patch.dict(os.environ, {"TERM_SHEETS_S3_BUCKET": "test-bucket"}):
-        # Re-patch the s3_client inside renderer if it's module-level and already initialized
-        # or ensure the fixture correctly patches the one used by the function.
-        # The global patch on renderer.s3_client should suffice if it's module level.
-        # If renderer.s3_client is None due to env var not set at import, this test needs adjustment.
-        # For this test, let's assume S3_BUCKET_NAME will be picked up by the patched s3_client context.
-        
-        # We need to ensure that the `s3_client` within `upload_to_s3` is our mock.
-        # If `services.docgen.renderer.s3_client` was initialized to None because
-        # `S3_BUCKET_NAME` was not set when the module was imported, the patch might not work as expected.
-        # A safer way is to also patch `boto3.client` call if `s3_client` is initialized dynamically, 
-        # or ensure the module level `s3_client` is our mock.
-        
-        # For this test, we assume the @patch("services.docgen.renderer.s3_client") works directly.
-        # If S3_BUCKET_NAME was initially None, the s3_client in renderer might be None.
-        # Let's mock the S3_BUCKET_NAME as well for the scope of this test.
-        with patch('services.docgen.renderer.S3_BUCKET_NAME', "test-bucket"):
-            # Ensure the s3_client in the renderer module is our mock for this test execution context
-            # This is a bit tricky due to module-level global `s3_client`
-            # The `patch` decorator should handle replacing `services.docgen.renderer.s3_client`
-            # If it was `None`, the function would return early. We test the upload path here.
-            services.docgen.renderer.s3_client = mock_boto_s3_client # Ensure it is our mock
-
-            mock_boto_s3_client.put_object.return_value = {}
-            expected_presigned_url = "https://test-bucket.s3.eu-north-1.amazonaws.com/some_key?AWSAccessKeyId=..."
-            mock_boto_s3_client.generate_presigned_url.return_value = expected_presigned_url
-
-            pdf_bytes = b"dummy pdf data for s3"
-            offer_id_for_s3 = mock_offer_fixture.id
-            
-            presigned_url = upload_to_s3(pdf_bytes, offer_id_for_s3)
-
-            mock_boto_s3_client.put_object.assert_called_once()
-            # We can add more specific assertions on put_object args (Bucket, Key, Body, ContentType)
-            mock_boto_s3_client.generate_presigned_url.assert_called_once_with(
-                'get_object',
-                Params=MatchDictContains({'Bucket': "test-bucket"}), # Helper for partial dict match
-                ExpiresIn=24 * 3600
-            )
-            assert presigned_url == expected_presigned_url
-
-# Helper for partial dictionary matching in mock calls
-class MatchDictContains:
-    def __init__(self, subset):
-        self.subset = subset
-    def __eq__(self, other):
-        return self.subset.items() <= other.items()
-    def __repr__(self):
-        return f"MatchDictContains({self.subset})"
+    pdf_body = io.BytesIO(b"dummy pdf data for s3")
+
+    presigned_url = upload_to_s3(pdf_body, mock_offer_fixture.id)
+
+    key = urlsplit(presigned_url).path.lstrip("/").removeprefix("test-bucket/")
+    assert key.startswith(f"termsheets/{mock_offer_fixture.id}/termsheet_")
+    stored = s3_uploader.client.get_object(Bucket="test-bucket", Key=key)
+    assert stored["Body"].read() == b"dummy pdf data for s3"
+    assert stored["ContentType"] == "application/pdf"
+    assert "X-Amz-Expires=86400" in presigned_url # 24 hours
+
+def test_upload_to_s3_async_does_not_block(s3_uploader, mock_offer_fixture):
+    futures = [upload_to_s3_async(b"%PDF-" + str(n).encode(), uuid.uuid4()) for n in range(10)]
+    assert all(future.result(timeout=30).startswith("https://") for future in futures)
+
+def test_upload_to_s3_failure_returns_none(mock_offer_fixture):
+    with mock_aws():
+        uploader = S3Uploader("missing-bucket", client=boto3.client("s3", region_name="eu-north-1"))
+        with patch("services.docgen.renderer.get_s3_uploader", return_value=uploader):
+            assert upload_to_s3(b"%PDF", mock_offer_fixture.id) is None
+        uploader.shutdown()
+
+@patch("services.docgen.renderer.get_s3_uploader", return_value=None)
+def test_upload_to_s3_without_bucket(mock_get_uploader, mock_offer_fixture):
+    assert upload_to_s3(b"%PDF", mock_offer_fixture.id) is None
 
 
 @patch("services.docgen.renderer.upload_to_s3")
-@patch("services.docgen.renderer.calculate_sha256")
 @patch("services.docgen.renderer.generate_pdf_from_html")
 @patch("services.docgen.renderer.render_html")
 def test_render_termsheet_pdf_success(
     mock_render_html,
     mock_generate_pdf,
-    mock_calculate_sha,
     mock_upload_s3,
     mock_offer_fixture
 ):
     """Test the main orchestrator function render_termsheet_pdf for success."""
     mock_render_html.return_value = "<html>mock html</html>"
-    mock_generate_pdf.return_value = (" /tmp/mock.pdf", b"mock pdf bytes")
-    mock_calculate_sha.return_value = "mocksha256hash"
+    pdf_body = io.BytesIO(b"mock pdf bytes")
+    mock_generate_pdf.return_value = RenderedPdf(pdf_body, "mocksha256hash", 14)
     mock_upload_s3.return_value = "https://mock_s3_url.com/mock.pdf"
 
     s3_url, pdf_hash = render_termsheet_pdf(mock_offer_fixture)
 
     mock_render_html.assert_called_once_with(mock_offer_fixture)
-    mock_generate_pdf.assert_called_once_with("<html>mock html</html>", mock_offer_fixture.id)
-    mock_calculate_sha.assert_called_once_with(b"mock pdf bytes")
-    mock_upload_s3.assert_called_once_with(b"mock pdf bytes", mock_offer_fixture.id)
+    mock_generate_pdf.assert_called_once_with("<html>mock html</html>", mock_offer_fixture.id, ("termsheet",))
+    mock_upload_s3.assert_called_once_with(pdf_body, mock_offer_fixture.id) # Streamed from the render buffer
+    assert pdf_body.closed
 
     assert s3_url == "https://mock_s3_url.com/mock.pdf"
     assert pdf_hash == "mocksha256hash"
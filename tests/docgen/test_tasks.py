@@ -130,8 +130,6 @@ def test_generate_receipt_pdf_task_success(
     mock_producer_instance.produce = MagicMock()
     mock_producer_instance.poll = MagicMock()
     mock_get_receipt_producer.return_value = mock_producer_instance
-    # Also mock the global schema string variable that the task checks
-    docgen_tasks._offer_receipt_generated_schema_str = "{\"type\": \"string\"}" # Dummy schema
 
     result = docgen_tasks.generate_receipt_pdf(offer_id=offer_id, event_data=event_data)
 
@@ -178,9 +176,7 @@ def test_generate_receipt_pdf_task_kafka_producer_unavailable(
 
     # Simulate producer not being available
     mock_get_receipt_producer.return_value = None
-    # Ensure the global schema string is also None, as the check is `if producer and _offer_receipt_generated_schema_str:`
-    with patch.object(docgen_tasks, '_offer_receipt_generated_schema_str', None):
-        result = docgen_tasks.generate_receipt_pdf(offer_id=offer_id, event_data=event_data)
+    result = docgen_tasks.generate_receipt_pdf(offer_id=offer_id, event_data=event_data)
 
     mock_render_and_upload.assert_called_once_with(event_data)
     # Task still returns success obiect, but logs a warning
@@ -353,4 +349,64 @@ def test_docgen_consumer_loop_stops_on_event(
     assert not consumer_loop_thread.is_alive()
     mock_consumer_instance.close.assert_called_once()
     mock_logger.info.assert_any_call("Kafka consumer loop for payout completed events stopping.")
-    docgen_tasks._docgen_kafka_consumer_thread_stop_event.clear() 
\ No newline at end of file
+    docgen_tasks._docgen_kafka_consumer_thread_stop_event.clear() 
+
+def test_generate_termsheets_batch_task_registered():
+    assert "services.docgen.tasks.generate_termsheets_batch" in docgen_celery_app.tasks
+
+
+@patch("services.docgen.tasks.transition_offers_with_values")
+@patch("services.docgen.tasks.upload_to_s3_async")
+@patch("services.docgen.tasks.render_documents")
+@patch("services.docgen.tasks.render_html")
+@patch("services.docgen.tasks.Session")
+def test_generate_termsheets_batch(mock_session_cls, mock_render_html, mock_render_documents, mock_upload, mock_transition):
+    from types import SimpleNamespace
+    import hashlib
+    import io
+    from concurrent.futures import Future
+    from services.docgen.render_pool import RenderedPdf
+
+    ready, reissue, render_fails, upload_fails, paid_out = (
+        SimpleNamespace(id=uuid.uuid4(), status=status)
+        for status in ("OFFER_READY", "TERMSHEET_GENERATED", "OFFER_READY", "OFFER_READY", "PAID_OUT")
+    )
+    missing_id = uuid.uuid4()
+    session = mock_session_cls.return_value.__enter__.return_value
+    session.exec.return_value.unique.return_value.all.return_value = [ready, reissue, render_fails, upload_fails, paid_out]
+    mock_render_html.side_effect = lambda offer: f"<html>{offer.id}</html>"
+
+    def render_documents(documents):
+        for offer_id, html, stylesheets in documents:
+            assert stylesheets == ("termsheet",)
+            if offer_id == render_fails.id:
+                yield offer_id, None, RuntimeError("layout failed")
+            else:
+                pdf_bytes = html.encode()
+                yield offer_id, RenderedPdf(io.BytesIO(pdf_bytes), hashlib.sha256(pdf_bytes).hexdigest(), len(pdf_bytes)), None
+    mock_render_documents.side_effect = render_documents
+    def upload(pdf_body, offer_id):
+        future = Future()
+        future.set_result(None if offer_id == upload_fails.id else f"https://s3/{offer_id}.pdf")
+        return future
+    mock_upload.side_effect = upload
+    mock_transition.side_effect = lambda session, rows, new_status: [row["id"] for row in rows]
+
+    offer_ids = [str(o.id) for o in (ready, reissue, render_fails, upload_fails, paid_out)] + [str(missing_id)]
+    result = docgen_tasks.generate_termsheets_batch(offer_ids)
+
+    session.exec.assert_called_once() # Offers and creators in one query
+    rows = sorted(mock_transition.call_args[0][1], key=lambda row: row["expected_status"])
+    assert mock_transition.call_args[0][2] == "TERMSHEET_GENERATED"
+    assert rows == [
+        {"id": ready.id, "expected_status": "OFFER_READY", "pdf_url": f"https://s3/{ready.id}.pdf",
+         "pdf_hash": hashlib.sha256(f"<html>{ready.id}</html>".encode()).hexdigest()},
+        {"id": reissue.id, "expected_status": "TERMSHEET_GENERATED", "pdf_url": f"https://s3/{reissue.id}.pdf",
+         "pdf_hash": hashlib.sha256(f"<html>{reissue.id}</html>".encode()).hexdigest()},
+    ]
+    assert result["status"] == "partial_failure"
+    assert result["generated"] == 2
+    assert result["failed"] == {str(render_fails.id): "render", str(upload_fails.id): "upload"}
+    assert result["not_found"] == [str(missing_id)]
+    assert result["skipped_status"] == [str(paid_out.id)]
+    assert set(result["timings"]) == {"load", "render", "upload", "update"}
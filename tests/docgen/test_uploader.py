@@ -0,0 +1,83 @@
+import io
+import tempfile
+from concurrent.futures import wait
+from unittest.mock import patch
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+from services.docgen import uploader as docgen_uploader
+from services.docgen.uploader import S3Uploader, create_s3_client
+
+BUCKET = "test-termsheets"
+MIB = 1024 * 1024
+
+
+@pytest.fixture
+def s3():
+    with mock_aws():
+        client = boto3.client("s3", region_name="eu-north-1")
+        client.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": "eu-north-1"})
+        yield client
+
+
+@pytest.fixture
+def uploader(s3):
+    uploader = S3Uploader(BUCKET, client=s3, concurrency=4, multipart_threshold=5 * MIB, multipart_chunksize=5 * MIB)
+    yield uploader
+    uploader.shutdown()
+
+
+def test_client_connection_pool_and_retries():
+    client = create_s3_client(max_pool_connections=48)
+    assert client.meta.config.max_pool_connections == 48
+    assert client.meta.config.retries == {"total_max_attempts": docgen_uploader.DOCGEN_S3_MAX_ATTEMPTS, "mode": "standard"}
+
+
+def test_concurrent_uploads(s3, uploader):
+    futures = [uploader.submit(f"%PDF-{n}".encode(), f"termsheets/{n}.pdf") for n in range(20)]
+    done, not_done = wait(futures, timeout=30)
+
+    assert not not_done and all(future.exception() is None for future in done)
+    for n in range(20):
+        stored = s3.get_object(Bucket=BUCKET, Key=f"termsheets/{n}.pdf")
+        assert stored["Body"].read() == f"%PDF-{n}".encode()
+        assert stored["ContentType"] == "application/pdf"
+
+
+def test_large_document_uses_multipart_upload(s3, uploader):
+    with tempfile.SpooledTemporaryFile(max_size=MIB) as body:
+        body.write(b"%PDF" + b"x" * (11 * MIB))
+        body.seek(0)
+        uploader.upload(body, "termsheets/large.pdf")
+
+    stored = s3.head_object(Bucket=BUCKET, Key="termsheets/large.pdf")
+    assert stored["ContentLength"] == 11 * MIB + 4
+    assert stored["ETag"].strip('"').endswith("-3") # Three 5 MiB parts
+
+
+def test_failed_upload_raises_from_future(s3):
+    uploader = S3Uploader("missing-bucket", client=s3)
+    try:
+        error = uploader.submit(io.BytesIO(b"%PDF"), "termsheets/x.pdf").exception(timeout=30)
+    finally:
+        uploader.shutdown()
+
+    assert isinstance(error, ClientError)
+    assert error.response["Error"]["Code"] == "NoSuchBucket"
+
+
+def test_presigned_url_is_signed_locally(uploader):
+    with patch.object(uploader.client._endpoint, "make_request") as make_request:
+        url = uploader.presigned_url("termsheets/1.pdf", expires_in=600)
+
+    make_request.assert_not_called()
+    assert f"{BUCKET}" in url and "termsheets/1.pdf" in url
+    assert "X-Amz-Expires=600" in url and "X-Amz-Signature=" in url
+
+
+def test_no_uploader_without_bucket():
+    with patch.object(docgen_uploader, "S3_BUCKET_NAME", None), patch.object(docgen_uploader, "_s3_uploader", None):
+        assert docgen_uploader.get_s3_uploader() is None
@@ -1,13 +1,14 @@
 # tests/event_consumer/test_consumer.py
 import pytest
 import json
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, ANY
 import uuid
 from datetime import datetime
 
 from confluent_kafka import Message # To create mock messages
 
 # Adjust to your project structure
+from services.event_consumer import consumer as consumer_module
 from services.event_consumer.consumer import main as consume_events, PAYOUT_SUCCEEDED_TOPIC, CONSUMER_GROUP_ID
 # We will mock create_avro_consumer from libs.py_common.kafka
 
@@ -26,20 +27,19 @@ def mock_kafka_consumer_for_event_consumer(monkeypatch):
     
     return mock_consumer_instance, mock_create_fn
 
-@patch("services.event_consumer.consumer.structlog.get_logger") # Mock logger to check output
+@patch("services.event_consumer.consumer.logger") # Mock logger to check output
 @patch("services.event_consumer.consumer.start_metrics_server") # Mock metrics server start
 @patch("services.event_consumer.consumer.Path.read_text") # Mock schema reading
 def test_event_consumer_logs_payout_succeeded(
     mock_read_text: MagicMock,
     mock_start_metrics: MagicMock,
-    mock_logger_get: MagicMock,
+    mock_logger_instance: MagicMock,
     mock_kafka_consumer_for_event_consumer: tuple[MagicMock, MagicMock],
     monkeypatch
 ):
     mock_consumer, mock_create_consumer_fn = mock_kafka_consumer_for_event_consumer
-    mock_logger_instance = MagicMock()
-    mock_logger_get.return_value = mock_logger_instance
-    
+    monkeypatch.setattr("services.event_consumer.consumer.signal.signal", MagicMock()) # Leave the test runner's handlers alone
+
     # Mock schema reading to succeed
     mock_read_text.return_value = '{"type": "record", "name": "PayoutSucceededEvent", "fields": []}' # Minimal valid Avro
 
@@ -63,28 +63,31 @@ def test_event_consumer_logs_payout_succeeded(
     mock_message.value.return_value = payout_event_data # Deserialized Avro message (dict)
     mock_message.key.return_value = str(offer_id).encode('utf-8')
 
-    # Configure the consumer's poll method to return our mock message, then None to stop loop
-    mock_consumer.poll.side_effect = [mock_message, None] # First poll gets message, second stops
-    
+    # First batch carries the message, the next one stops the runner
+    def consume(num_messages, timeout):
+        if mock_consumer.consume.call_count == 1:
+            return [mock_message]
+        consumer_module._stop_event.set()
+        return []
+    mock_consumer.consume.side_effect = consume
+
     # --- Act ---
-    # Temporarily patch `running` to False to make the consumer loop run once for the test
-    monkeypatch.setattr("services.event_consumer.consumer.running", lambda: mock_consumer.poll.call_count <= 1)
-    
-    consume_events() # Run the main consumer loop
+    try:
+        consume_events() # Run the main consumer loop
+    finally:
+        consumer_module._stop_event.clear()
 
     # --- Assert ---
     mock_start_metrics.assert_called_once()
     mock_create_consumer_fn.assert_called_once_with(
         group_id=CONSUMER_GROUP_ID,
         topics=[PAYOUT_SUCCEEDED_TOPIC],
-        value_schema_str=ANY # Schema string was read
+        value_schema_str=ANY, # Schema string was read
+        callbacks=ANY, # Shared with the ConsumerRunner
     )
-    mock_consumer.subscribe.assert_called_once_with([PAYOUT_SUCCEEDED_TOPIC])
-    assert mock_consumer.poll.call_count >= 1 # Called at least once, maybe twice to exit
-    
+    assert mock_consumer.consume.call_count >= 2
+
     # Check if the message was logged by structlog (inspect calls to the mocked logger)
-    # This is a bit dependent on how you structure your logs with structlog.
-    # Assuming logger.info was called with relevant data.
     found_log_call = False
     for call_args in mock_logger_instance.info.call_args_list:
         args, kwargs = call_args
@@ -94,7 +97,9 @@ def test_event_consumer_logs_payout_succeeded(
                 break
     assert found_log_call, "Expected log for received payout.succeeded event not found."
 
-    mock_consumer.commit.assert_called_once_with(message=mock_message)
+    # The offset after the message is committed once it has been handled
+    committed = {tp.partition: tp.offset for call in mock_consumer.commit.call_args_list for tp in call.kwargs["offsets"]}
+    assert committed == {0: 101}
     mock_consumer.close.assert_called_once()
 
 # Add more tests: error handling, deserialization failures, etc. 
\ No newline at end of file
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from libs.analytics.feature_pipeline import (
+    FEATURE_COLUMNS,
+    build_feature_matrix,
+    compute_features,
+    features_to_frame,
+    process_data_for_features,
+)
+
+
+def test_build_feature_matrix_is_dense_float32_in_model_order():
+    payloads = [
+        {"followers": {"total": 999}, "available_markets": ["SE", "NO", "DK"]},
+        None, # Artist that could not be fetched
+        {"followers": {}, "available_markets": []},
+    ]
+
+    features = build_feature_matrix(payloads)
+
+    assert features.dtype == np.float32
+    assert features.shape == (3, len(FEATURE_COLUMNS))
+    assert features.flags["C_CONTIGUOUS"]
+    np.testing.assert_allclose(features[0], [999, 3, np.log1p(999), 333], rtol=1e-6)
+    np.testing.assert_array_equal(features[1], np.zeros(len(FEATURE_COLUMNS)))
+    np.testing.assert_array_equal(features[2], np.zeros(len(FEATURE_COLUMNS)))
+
+
+def test_build_feature_matrix_accepts_dataframe_of_payloads():
+    frame = pd.DataFrame([{"followers": {"total": 10}, "available_markets": ["SE"]}])
+    np.testing.assert_array_equal(build_feature_matrix(frame), build_feature_matrix(frame.to_dict("records")))
+
+
+def test_single_row_wrapper_matches_batch(capsys):
+    raw = {"streams_last_month": 1000, "country_listeners": 4}
+
+    single = process_data_for_features(raw)
+    batch = compute_features([raw])[0]
+
+    assert list(single) == FEATURE_COLUMNS
+    assert [single[c] for c in FEATURE_COLUMNS] == pytest.approx(batch.tolist())
+    assert capsys.readouterr().out == "" # No per-call printing
+
+
+def test_features_to_frame_uses_model_columns():
+    frame = features_to_frame(compute_features([{"streams_last_month": 1, "country_listeners": 1}]))
+    assert list(frame.columns) == FEATURE_COLUMNS
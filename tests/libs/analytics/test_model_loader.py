@@ -0,0 +1,59 @@
+import joblib
+import numpy as np
+
+from libs.analytics.model_loader import ModelRegistry, MODEL_INFO
+
+
+def _write_model(path, weights, version=None):
+    joblib.dump({"weights": np.asarray(weights, dtype=np.float32)}, path)
+    if version is not None:
+        (path.parent / (path.name + ".version")).write_text(version)
+
+
+def test_registry_loads_lazily_with_mmap(tmp_path):
+    model_path = tmp_path / "model.pkl"
+    _write_model(model_path, np.arange(1000), version="v1")
+    registry = ModelRegistry("test_lazy", model_path, check_interval_seconds=3600)
+
+    assert registry.version is None # Nothing loaded until first use
+    model, version = registry.get_with_version()
+
+    assert version == "v1"
+    assert isinstance(model["weights"], np.memmap)
+    assert MODEL_INFO.labels(model_name="test_lazy", version="v1")._value.get() == 1
+
+
+def test_registry_swaps_in_new_version_and_notifies_listeners(tmp_path):
+    model_path = tmp_path / "model.pkl"
+    _write_model(model_path, [1.0], version="v1")
+    registry = ModelRegistry("test_swap", model_path, check_interval_seconds=0)
+    swaps = []
+    registry.add_reload_listener(lambda old, new: swaps.append((old, new)))
+
+    first = registry.get()
+    assert registry.get() is first # Same version: no reload
+
+    _write_model(model_path, [2.0], version="v2")
+    second = registry.get()
+
+    assert second is not first
+    assert float(second["weights"][0]) == 2.0
+    assert swaps == [(None, "v1"), ("v1", "v2")]
+
+
+def test_registry_keeps_serving_previous_model_when_load_fails(tmp_path):
+    model_path = tmp_path / "model.pkl"
+    _write_model(model_path, [1.0], version="v1")
+    registry = ModelRegistry("test_broken", model_path, check_interval_seconds=0)
+    good = registry.get()
+
+    model_path.write_bytes(b" ") # Corrupt artifact
+    (tmp_path / "model.pkl.version").write_text("v2")
+
+    assert registry.get() is good
+    assert registry.version == "v1"
+
+
+def test_registry_returns_none_for_missing_artifact(tmp_path):
+    registry = ModelRegistry("test_missing", tmp_path / "absent.pkl")
+    assert registry.get() is None
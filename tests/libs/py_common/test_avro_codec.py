@@ -0,0 +1,84 @@
+import json
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from confluent_kafka.schema_registry.avro import AvroDeserializer, AvroSerializer
+from confluent_kafka.serialization import MessageField, SerializationContext, SerializationError
+
+from libs.py_common.avro_codec import FastAvroDeserializer, FastAvroSerializer
+from libs.py_common.schema_registry import SCHEMA_DIR, FileSchemaRegistryClient, subject_for_schema_file
+
+SCHEMA_FILES = sorted(SCHEMA_DIR.glob("*.avsc"))
+
+
+def _value(avro_type):
+    if isinstance(avro_type, list):
+        return _value(avro_type[-1]) # Non-null branch of ["null", T]
+    if isinstance(avro_type, dict):
+        if avro_type.get("logicalType") == "uuid":
+            return uuid.UUID("5f0c6a4e-8a39-4c36-9df0-2a4bd7b7c001")
+        if avro_type.get("logicalType") == "timestamp-micros":
+            return datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+        if avro_type["type"] == "enum":
+            return avro_type["symbols"][0]
+        return _value(avro_type["type"])
+    return {"string": "EUR", "int": 125000, "long": 9_000_000_000, "double": 0.87}[avro_type]
+
+
+def _event(schema_path):
+    return {f["name"]: _value(f["type"]) for f in json.loads(schema_path.read_text())["fields"]}
+
+
+def _ctx(schema_path):
+    return SerializationContext(subject_for_schema_file(schema_path)[:-len("-value")], MessageField.VALUE)
+
+
+@pytest.mark.parametrize("schema_path", SCHEMA_FILES, ids=lambda p: p.stem)
+def test_wire_compatible_with_confluent_serdes(schema_path):
+    registry = FileSchemaRegistryClient()
+    schema_str = schema_path.read_text()
+    event, ctx = _event(schema_path), _ctx(schema_path)
+
+    fast_bytes = FastAvroSerializer(registry, schema_str)(event, ctx)
+    confluent_bytes = AvroSerializer(registry, schema_str)(event, ctx)
+
+    assert fast_bytes == confluent_bytes
+    assert FastAvroDeserializer(registry)(confluent_bytes, ctx) == event
+    assert AvroDeserializer(registry)(fast_bytes, ctx) == event
+    assert FastAvroDeserializer(registry, schema_str)(fast_bytes, ctx) == event
+
+
+def test_resolves_older_writer_schema_to_reader_schema():
+    registry = FileSchemaRegistryClient()
+    reader_str = (SCHEMA_DIR / "offer_receipt_generated.avsc").read_text()
+    writer = json.loads(reader_str)
+    writer["fields"] = [f for f in writer["fields"] if f["name"] != "receipt_hash_sha256"] # Before the field was added
+    event = _event(SCHEMA_DIR / "offer_receipt_generated.avsc")
+    del event["receipt_hash_sha256"]
+    ctx = SerializationContext("offer.receipt.generated", MessageField.VALUE)
+
+    data = FastAvroSerializer(registry, json.dumps(writer))(event, ctx)
+
+    assert FastAvroDeserializer(registry, reader_str)(data, ctx) == {**event, "receipt_hash_sha256": None}
+
+
+def test_schema_id_resolved_once_per_subject():
+    registry = FileSchemaRegistryClient()
+    serializer = FastAvroSerializer(registry, (SCHEMA_DIR / "payout_succeeded.avsc").read_text())
+    schema_id = serializer.resolve("payout.succeeded-value")
+    event = _event(SCHEMA_DIR / "payout_succeeded.avsc")
+
+    data = serializer(event, SerializationContext("payout.succeeded", MessageField.VALUE))
+
+    assert data[:5] == b"\x00" + schema_id.to_bytes(4, "big")
+    assert registry.get_versions("payout.succeeded-value") == [1]
+
+
+def test_rejects_unframed_payloads():
+    deserializer = FastAvroDeserializer(FileSchemaRegistryClient())
+    with pytest.raises(SerializationError):
+        deserializer(b"\x01\x00\x00\x00\x01abc")
+    with pytest.raises(SerializationError):
+        deserializer(b"\x00\x00")
+    assert deserializer(None) is None
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from libs.py_common.cache import TTLCache, SingleFlight, CACHE_FRESH, CACHE_STALE
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_fresh_stale_and_expired():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl_seconds=10, stale_seconds=5, clock=clock)
+    cache.set("a", 1)
+
+    assert cache.get("a") == (1, CACHE_FRESH)
+    clock.now = 12
+    assert cache.get("a") == (1, CACHE_STALE)
+    clock.now = 16
+    assert cache.get("a") == (None, None)
+    assert len(cache) == 0
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a") # "a" becomes most recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") == (None, None)
+    assert cache.get("a")[0] == 1
+    assert cache.get("c")[0] == 3
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def slow_fetch():
+        calls.append(1)
+        release.wait(timeout=2)
+        return "artist"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("id", slow_fetch))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    release.set()
+    for t in threads:
+        t.join(timeout=2)
+
+    assert calls == [1]
+    assert results == ["artist"] * 5
+    assert not flight.in_flight("id")
+
+
+def test_single_flight_propagates_errors_and_allows_retry():
+    flight = SingleFlight()
+
+    def failing():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        flight.do("id", failing)
+    assert flight.do("id", lambda: 42) == 42
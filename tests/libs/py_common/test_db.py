@@ -0,0 +1,54 @@
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+
+from libs.py_common.db import (
+    create_pooled_engine,
+    sync_database_url,
+    InstrumentedQueuePool,
+    _dispose_engines_after_fork,
+)
+
+
+def _sample(name, engine_name):
+    return REGISTRY.get_sample_value(name, {"engine": engine_name})
+
+
+def test_sync_database_url():
+    assert sync_database_url("postgresql+asyncpg://u:p@h/db") == "postgresql://u:p@h/db"
+    assert sync_database_url("postgresql://u:p@h/db") == "postgresql://u:p@h/db"
+
+
+def test_pool_settings_from_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "3")
+    monkeypatch.setenv("TEST_ENV_ENGINE_DB_POOL_MAX_OVERFLOW", "7")
+    engine = create_pooled_engine(f"sqlite:///{tmp_path}/env.db", "test_env_engine")
+
+    assert isinstance(engine.pool, InstrumentedQueuePool)
+    assert engine.pool.size() == 3
+    assert engine.pool._max_overflow == 7
+    assert engine.pool._pre_ping is True
+
+
+def test_pool_gauges_track_checkouts(tmp_path):
+    engine = create_pooled_engine(f"sqlite:///{tmp_path}/gauges.db", "test_gauge_engine", pool_size=2, max_overflow=1)
+    waits_before = _sample("db_pool_checkout_wait_seconds_count", "test_gauge_engine") or 0
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        assert _sample("db_pool_checked_out_connections", "test_gauge_engine") == 1
+    assert _sample("db_pool_checked_out_connections", "test_gauge_engine") == 0
+    assert _sample("db_pool_size", "test_gauge_engine") == 2
+    assert _sample("db_pool_checkout_wait_seconds_count", "test_gauge_engine") == waits_before + 1
+
+
+def test_engines_recycled_after_fork(tmp_path):
+    engine = create_pooled_engine(f"sqlite:///{tmp_path}/fork.db", "test_fork_engine")
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    parent_pool = engine.pool
+
+    _dispose_engines_after_fork()
+
+    assert engine.pool is not parent_pool
+    assert engine.pool._metrics_name == "test_fork_engine"
+    assert _sample("db_pool_checked_out_connections", "test_fork_engine") == 0
@@ -0,0 +1,50 @@
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from libs.py_common import kafka as kafka_lib
+
+
+@pytest.fixture(autouse=True)
+def no_tracked_producers():
+    kafka_lib.flush_producers(timeout=0)
+    yield
+    kafka_lib.flush_producers(timeout=0)
+
+
+@pytest.mark.parametrize("profile", sorted(kafka_lib.PRODUCER_PROFILES))
+def test_profiles_are_valid_librdkafka_config(profile):
+    producer = kafka_lib.create_producer(profile=profile, background_poll=False)
+    assert producer.flush(0) == 0
+
+
+def test_profile_applied_and_overridable():
+    with patch("libs.py_common.kafka.Producer") as mock_producer_cls:
+        kafka_lib.create_producer(profile="high-throughput", config_overrides={"linger.ms": 10}, background_poll=False)
+
+    config = mock_producer_cls.call_args[0][0]
+    assert config["enable.idempotence"] is True
+    assert config["compression.type"] == "zstd"
+    assert config["linger.ms"] == 10 # Overrides win over the profile
+
+
+def test_unknown_profile_rejected():
+    with pytest.raises(ValueError):
+        kafka_lib.create_producer(profile="fastest")
+
+
+def test_background_poll_and_flush_on_shutdown():
+    producer = MagicMock()
+    producer.flush.return_value = 2 # Two messages still undelivered at the deadline
+    with patch("libs.py_common.kafka.Producer", return_value=producer):
+        kafka_lib.create_producer()
+
+    deadline = time.monotonic() + 2
+    while not producer.poll.called and time.monotonic() < deadline:
+        time.sleep(0.01)
+    producer.poll.assert_called_with(kafka_lib.KAFKA_PRODUCER_POLL_INTERVAL_SECONDS)
+
+    assert kafka_lib.flush_producers(timeout=3) == 2
+    producer.flush.assert_called_once_with(3)
+    assert kafka_lib.flush_producers() == 0 # Producers are flushed once
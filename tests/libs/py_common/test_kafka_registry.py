@@ -0,0 +1,102 @@
+import struct
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+from confluent_kafka.schema_registry import Schema
+
+from libs.py_common.kafka import (
+    KAFKA_PRODUCER_PROFILE,
+    KAFKA_SCHEMA_REGISTRATION_RETRY_SECONDS,
+    ProducerRegistry,
+    get_producer_registry,
+)
+from libs.py_common.schema_registry import FileSchemaRegistryClient
+
+SCHEMA_DIR = Path(__file__).resolve().parents[3] / "schema"
+
+
+@pytest.fixture
+def sr_client():
+    client = FileSchemaRegistryClient()
+    client.register_schema("unrelated-value", Schema('"string"', "AVRO")) # Registered topics get ID 2 onwards
+    with patch("libs.py_common.kafka.get_schema_registry_client", return_value=client):
+        yield client
+
+
+@pytest.fixture
+def producer():
+    producer = MagicMock()
+    with patch("libs.py_common.kafka.create_producer", return_value=producer) as mock_create:
+        yield producer, mock_create
+
+
+def test_one_producer_shared_by_registered_topics(sr_client, producer):
+    mock_producer, mock_create = producer
+    registry = ProducerRegistry(profile="high-throughput", client_name="test-host-producer")
+    registry.register_topic("offer.created", SCHEMA_DIR / "offer_created.avsc")
+    registry.register_topic("offer.valuated", SCHEMA_DIR / "offer_valuated.avsc")
+
+    registry.produce("offer.created", value=b"raw", key="k1")
+    registry.produce("offer.valuated", value=b"raw", key="k2")
+    registry.poll(0)
+
+    mock_create.assert_called_once_with(client_name="test-host-producer", profile="high-throughput")
+    assert mock_producer.produce.call_count == 2
+    mock_producer.produce.assert_called_with("offer.valuated", value=b"raw", key=b"k2")
+
+
+def test_register_topic_resolves_schema_id_once(sr_client, producer):
+    registry = ProducerRegistry()
+    schema_path = SCHEMA_DIR / "offer_receipt_generated.avsc"
+
+    assert registry.register_topic("offer.receipt.generated", schema_path) is registry
+    registry.register_topic("offer.receipt.generated", schema_path) # Idempotent
+
+    assert sr_client.get_versions("offer.receipt.generated-value") == [1]
+    assert registry.schema_id("offer.receipt.generated") == 2
+    assert registry.schema_id("offer.unknown") is None
+
+
+def test_dict_values_are_avro_encoded_for_registered_topics(sr_client, producer):
+    mock_producer, _ = producer
+    registry = ProducerRegistry().register_topic(
+        "test.topic",
+        schema_str='{"type": "record", "name": "T", "fields": [{"name": "offer_id", "type": "string"}]}',
+    )
+
+    registry.produce("test.topic", value={"offer_id": "abc"}, key="abc")
+
+    _, kwargs = mock_producer.produce.call_args
+    assert kwargs["key"] == b"abc"
+    magic, schema_id = struct.unpack(">bI", kwargs["value"][:5]) # Confluent wire format header
+    assert (magic, schema_id) == (0, 2)
+    assert kwargs["value"][5:] == b"\x06abc"
+
+
+def test_failed_registration_is_not_retried_until_backoff_expires(sr_client, producer):
+    registry = ProducerRegistry()
+    schema_path = SCHEMA_DIR / "offer_receipt_generated.avsc"
+
+    with patch.object(sr_client, "register_schema", side_effect=ConnectionError("registry down")) as mock_register, \
+         patch("libs.py_common.kafka.time.monotonic", return_value=100.0):
+        for _ in range(3):
+            with pytest.raises(ConnectionError):
+                registry.register_topic("offer.receipt.generated", schema_path)
+    mock_register.assert_called_once()
+
+    with patch("libs.py_common.kafka.time.monotonic", return_value=100.0 + KAFKA_SCHEMA_REGISTRATION_RETRY_SECONDS):
+        assert registry.register_topic("offer.receipt.generated", schema_path) is registry
+    assert registry.schema_id("offer.receipt.generated") == 2
+
+
+def test_get_producer_registry_keeps_one_registry_per_profile():
+    with patch.dict("libs.py_common.kafka._producer_registries", clear=True):
+        default = get_producer_registry()
+        high_throughput = get_producer_registry(profile="high-throughput")
+
+        assert get_producer_registry(profile=KAFKA_PRODUCER_PROFILE) is default
+        assert get_producer_registry(profile="high-throughput") is high_throughput
+        assert high_throughput is not default and high_throughput.profile == "high-throughput"
+        with pytest.raises(ValueError):
+            get_producer_registry(profile="unknown")
@@ -0,0 +1,233 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from confluent_kafka import KafkaError, TopicPartition
+from prometheus_client import REGISTRY
+
+from libs.py_common.kafka import ConsumerCallbacks, ConsumerRunner
+
+
+def _message(partition, offset, topic="test.topic", value=None):
+    msg = MagicMock()
+    msg.error.return_value = None
+    msg.topic.return_value = topic
+    msg.partition.return_value = partition
+    msg.offset.return_value = offset
+    msg.value.return_value = value
+    return msg
+
+
+def _error_message(code):
+    msg = MagicMock()
+    msg.error.return_value.code.return_value = code
+    msg.topic.return_value = "test.topic"
+    return msg
+
+
+def _consumer(batches, runner_ref):
+    """A consumer whose consume() replays batches, then stops the runner."""
+    consumer = MagicMock()
+
+    def consume(num_messages, timeout):
+        if batches:
+            return batches.pop(0)
+        runner_ref[0].stop()
+        return []
+    consumer.consume.side_effect = consume
+    return consumer
+
+
+def _committed(consumer):
+    offsets = {}
+    for call in consumer.commit.call_args_list:
+        for tp in call.kwargs["offsets"]:
+            offsets[(tp.topic, tp.partition)] = tp.offset
+    return offsets
+
+
+def test_requires_exactly_one_handler():
+    with pytest.raises(ValueError):
+        ConsumerRunner(MagicMock(), "g")
+    with pytest.raises(ValueError):
+        ConsumerRunner(MagicMock(), "g", handler=print, batch_handler=print)
+
+
+def test_worker_lanes_keep_partition_order_and_commit_after_processing():
+    handled = {0: [], 1: []}
+
+    def handler(msg):
+        time.sleep(0.001 * (msg.offset() % 3)) # Uneven handler times must not reorder a partition
+        handled[msg.partition()].append(msg.offset())
+
+    batches = [
+        [_message(p, o) for o in range(0, 25) for p in (0, 1)],
+        [_message(p, o) for o in range(25, 50) for p in (0, 1)],
+    ]
+    runner_ref = [None]
+    consumer = _consumer(batches, runner_ref)
+    runner = ConsumerRunner(consumer, "test-lanes", handler=handler, batch_size=50, max_workers=4)
+    runner_ref[0] = runner
+
+    runner.run()
+
+    assert handled == {0: list(range(50)), 1: list(range(50))}
+    assert _committed(consumer) == {("test.topic", 0): 50, ("test.topic", 1): 50}
+    assert consumer.commit.call_args.kwargs["asynchronous"] is False # Final commit on shutdown
+    consumer.close.assert_called_once()
+    assert REGISTRY.get_sample_value("kafka_consumer_processing_seconds_count", {"group_id": "test-lanes", "topic": "test.topic"}) == 100
+
+
+def test_full_partition_backlog_pauses_until_drained():
+    release = threading.Event()
+    runner_ref = [None]
+    batches = [[_message(0, o) for o in range(4)]]
+    consumer = _consumer(batches, runner_ref)
+
+    def handler(msg):
+        release.wait(timeout=2)
+
+    runner = ConsumerRunner(consumer, "test-pause", handler=handler, batch_size=10, max_workers=1, max_pending_per_partition=4)
+    runner_ref[0] = runner
+    # Keep polling (empty batches) until the lane has drained, then stop
+    original_consume = consumer.consume.side_effect
+
+    def consume(num_messages, timeout):
+        if not batches and consumer.pause.called and not consumer.resume.called:
+            release.set()
+            return []
+        return original_consume(num_messages, timeout)
+    consumer.consume.side_effect = consume
+
+    runner.run()
+
+    paused = consumer.pause.call_args[0][0]
+    assert [(tp.topic, tp.partition) for tp in paused] == [("test.topic", 0)]
+    resumed = consumer.resume.call_args[0][0]
+    assert [(tp.topic, tp.partition) for tp in resumed] == [("test.topic", 0)]
+
+
+@patch("libs.py_common.kafka.time.sleep")
+def test_broker_and_handler_errors_are_reported_and_committed_past(mock_sleep):
+    errors = []
+
+    def handler(msg):
+        if msg.offset() == 1:
+            raise RuntimeError("bad payload")
+
+    runner_ref = [None]
+    batches = [[_message(0, 0), _error_message(KafkaError._PARTITION_EOF), _message(0, 1), _error_message(KafkaError._FAIL), _message(0, 2)]]
+    consumer = _consumer(batches, runner_ref)
+    runner = ConsumerRunner(consumer, "test-errors", handler=handler, batch_size=10,
+                            error_callback=lambda stage, error, msg: errors.append(stage))
+    runner_ref[0] = runner
+
+    runner.run()
+
+    assert errors == ["poll", "handler"] # Broker errors are reported before the batch is handled; EOF is not an error
+    assert _committed(consumer) == {("test.topic", 0): 3}
+    assert mock_sleep.call_count == 2 # Once after the handler error, once for the broker error
+
+
+def test_single_message_mode_uses_poll():
+    runner_ref = [None]
+    consumer = MagicMock()
+    messages = [_message(3, 7)]
+
+    def poll(timeout):
+        if messages:
+            return messages.pop(0)
+        runner_ref[0].stop()
+        return None
+    consumer.poll.side_effect = poll
+    handler = MagicMock()
+    runner = ConsumerRunner(consumer, "test-poll", handler=handler)
+    runner_ref[0] = runner
+
+    runner.run()
+
+    handler.assert_called_once()
+    consumer.consume.assert_not_called()
+    assert _committed(consumer) == {("test.topic", 3): 8}
+
+
+def _confirming_commit(callbacks, fail_first=0):
+    """commit() side effect that reports results through callbacks, failing the first fail_first async commits."""
+    failures = [fail_first]
+
+    def commit(offsets, asynchronous):
+        err = None
+        if asynchronous and failures[0]:
+            failures[0] -= 1
+            err = KafkaError(KafkaError.REQUEST_TIMED_OUT)
+        callbacks.on_commit(err, offsets)
+        return None if asynchronous else offsets
+    return commit
+
+
+def test_failed_async_commit_is_retried_while_partition_is_idle():
+    runner_ref = [None]
+    batches = [[_message(0, 4)], [], []] # The partition goes idle after one message
+    consumer = _consumer(batches, runner_ref)
+    callbacks = ConsumerCallbacks()
+    consumer.commit.side_effect = _confirming_commit(callbacks, fail_first=1)
+    runner = ConsumerRunner(consumer, "test-commit-retry", handler=MagicMock(), batch_size=10, callbacks=callbacks)
+    runner_ref[0] = runner
+
+    runner.run()
+
+    commits = [(call.kwargs["asynchronous"], [(tp.partition, tp.offset) for tp in call.kwargs["offsets"]]) for call in consumer.commit.call_args_list]
+    assert commits == [(True, [(0, 5)]), (True, [(0, 5)])] # Retried once confirmed failed; nothing left for shutdown
+
+
+def test_revoke_drains_commits_and_forgets_partition():
+    release = threading.Event()
+    handled = []
+    runner_ref = [None]
+    callbacks = ConsumerCallbacks()
+    batches = [[_message(0, o) for o in range(4)]]
+    consumer = _consumer(batches, runner_ref)
+    consumer.commit.side_effect = _confirming_commit(callbacks)
+
+    def handler(msg):
+        release.wait(timeout=2)
+        handled.append(msg.offset())
+
+    runner = ConsumerRunner(consumer, "test-revoke", handler=handler, batch_size=10, max_workers=1,
+                            max_pending_per_partition=4, callbacks=callbacks)
+    runner_ref[0] = runner
+    original_consume = consumer.consume.side_effect
+    rebalanced = []
+
+    def consume(num_messages, timeout):
+        if not batches and not rebalanced:
+            rebalanced.append(True)
+            assert consumer.pause.call_count == 1 # Backlog full: partition 0 paused
+            release.set()
+            callbacks.on_revoke(consumer, [TopicPartition("test.topic", 0)])
+            assert handled == [0, 1, 2, 3] # Drained before the revoke returned
+            assert consumer.commit.call_args.kwargs == {"offsets": [TopicPartition("test.topic", 0, 4)], "asynchronous": False}
+            callbacks.on_assign(consumer, [TopicPartition("test.topic", 0)])
+            return [_message(0, o) for o in range(4, 8)]
+        return original_consume(num_messages, timeout)
+    consumer.consume.side_effect = consume
+
+    runner.run()
+
+    assert consumer.pause.call_count == 2 # Paused again after reassignment
+    assert REGISTRY.get_sample_value("kafka_consumer_paused_partitions", {"group_id": "test-revoke"}) == 0
+    assert consumer.commit.call_args.kwargs["offsets"] == [TopicPartition("test.topic", 0, 8)]
+
+
+def test_late_completion_of_lost_partition_is_not_committed():
+    runner_ref = [None]
+    callbacks = ConsumerCallbacks()
+    consumer = _consumer([], runner_ref)
+    runner = ConsumerRunner(consumer, "test-lost", handler=MagicMock(), callbacks=callbacks)
+
+    callbacks.on_lost(consumer, [TopicPartition("test.topic", 1)])
+    runner._mark_done(("test.topic", 1), 9)
+    runner._commit_done(asynchronous=True)
+
+    consumer.commit.assert_not_called()
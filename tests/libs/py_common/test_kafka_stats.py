@@ -0,0 +1,68 @@
+import json
+
+from prometheus_client import REGISTRY
+
+from libs.py_common.kafka import KafkaStatisticsExporter, _statistics_config
+
+
+def _stats(partitions):
+    """Trimmed librdkafka statistics JSON for a client consuming and producing test.topic."""
+    return json.dumps({
+        "name": "rdkafka#consumer-1",
+        "type": "consumer",
+        "msg_cnt": 3,
+        "replyq": 1,
+        "brokers": {
+            "GroupCoordinator": {"name": "GroupCoordinator", "nodeid": -1, "rtt": {"cnt": 0}},
+            "broker1:9092/1": {"name": "broker1:9092/1", "nodeid": 1, "rtt": {"cnt": 4, "avg": 2500, "p99": 100000}},
+        },
+        "topics": {
+            "test.topic": {
+                "topic": "test.topic",
+                "batchsize": {"cnt": 2, "avg": 4096},
+                "batchcnt": {"cnt": 2, "avg": 16},
+                "partitions": {
+                    "-1": {"partition": -1, "consumer_lag": -1, "fetchq_cnt": 0},
+                    **{str(p): {"partition": p, "consumer_lag": lag, "fetchq_cnt": 5} for p, lag in partitions.items()},
+                },
+            }
+        },
+    })
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels)
+
+
+def test_statistics_exported_as_gauges():
+    exporter = KafkaStatisticsExporter("test-stats-group")
+    exporter(_stats({0: 10, 1: 32, 2: -1}))
+
+    assert _sample("kafka_client_partition_consumer_lag_messages", client="test-stats-group", topic="test.topic", partition="0") == 10
+    assert _sample("kafka_client_partition_consumer_lag_messages", client="test-stats-group", topic="test.topic", partition="2") is None
+    assert _sample("kafka_client_topic_consumer_lag_messages", client="test-stats-group", topic="test.topic") == 42
+    assert _sample("kafka_client_fetch_queue_messages", client="test-stats-group", topic="test.topic", partition="1") == 5
+    assert _sample("kafka_client_queue_messages", client="test-stats-group", queue="producer") == 3
+    assert _sample("kafka_client_broker_rtt_seconds", client="test-stats-group", broker="broker1:9092/1", stat="p99") == 0.1
+    assert _sample("kafka_client_broker_rtt_seconds", client="test-stats-group", broker="GroupCoordinator", stat="avg") is None
+    assert _sample("kafka_client_producer_batch_bytes", client="test-stats-group", topic="test.topic") == 4096
+    assert _sample("kafka_client_producer_batch_messages", client="test-stats-group", topic="test.topic") == 16
+
+
+def test_revoked_partitions_are_removed():
+    exporter = KafkaStatisticsExporter("test-stats-rebalance")
+    exporter(_stats({0: 10, 1: 32}))
+    exporter(_stats({1: 7})) # Partition 0 revoked
+
+    assert _sample("kafka_client_partition_consumer_lag_messages", client="test-stats-rebalance", topic="test.topic", partition="0") is None
+    assert _sample("kafka_client_topic_consumer_lag_messages", client="test-stats-rebalance", topic="test.topic") == 7
+
+
+def test_malformed_statistics_are_ignored():
+    KafkaStatisticsExporter("test-stats-bad")("not json") # Must not raise into librdkafka's callback
+
+
+def test_statistics_config_wires_stats_cb():
+    config = _statistics_config("test-stats-config")
+    assert config["statistics.interval.ms"] > 0
+    assert isinstance(config["stats_cb"], KafkaStatisticsExporter)
@@ -0,0 +1,98 @@
+import uuid
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pytest
+from confluent_kafka.schema_registry import RegisteredSchema, Schema, SchemaRegistryClient
+from confluent_kafka.schema_registry.avro import AvroDeserializer, AvroSerializer
+from confluent_kafka.serialization import MessageField, SerializationContext
+
+from libs.py_common.schema_registry import (
+    SCHEMA_DIR,
+    CachingSchemaRegistryClient,
+    FileSchemaRegistryClient,
+    preload_schemas,
+    subject_for_schema_file,
+)
+
+REGISTRY_URL = "http://registry:8081"
+OFFER_CREATED = Schema((SCHEMA_DIR / "offer_created.avsc").read_text().strip(), "AVRO")
+
+
+def test_subject_for_schema_file():
+    assert subject_for_schema_file(SCHEMA_DIR / "offer_payout_completed.avsc") == "offer.payout.completed-value"
+
+
+def test_file_registry_persists_ids_across_instances(tmp_path):
+    path = tmp_path / "registry.json"
+    registry = FileSchemaRegistryClient(path)
+    schema_ids = preload_schemas(registry, register=True)
+
+    assert len(schema_ids) == len(list(SCHEMA_DIR.glob("*.avsc")))
+    reloaded = FileSchemaRegistryClient(path)
+    assert reloaded.register_schema("offer.created-value", OFFER_CREATED) == schema_ids["offer.created-value"]
+    assert reloaded.get_schema(schema_ids["offer.created-value"]).schema_str == OFFER_CREATED.schema_str
+    assert reloaded.get_latest_version("offer.created-value").version == 1
+
+
+def test_file_registry_round_trips_through_avro_serdes():
+    registry = FileSchemaRegistryClient()
+    serializer = AvroSerializer(registry, OFFER_CREATED.schema_str)
+    deserializer = AvroDeserializer(registry)
+    ctx = SerializationContext("offer.created", MessageField.VALUE)
+    event = {
+        "offer_id": uuid.uuid4(), "creator_id": uuid.uuid4(), "title": "Tape machine", "description": None,
+        "amount_cents": 125000, "currency_code": "EUR", "status": "PENDING_VALUATION",
+        "created_at_timestamp": datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc),
+    }
+
+    assert deserializer(serializer(event, ctx), ctx) == event
+
+
+def test_caching_client_skips_registry_for_cached_schemas(tmp_path):
+    cache = FileSchemaRegistryClient(tmp_path / "cache.json", registry_url=REGISTRY_URL)
+    client = CachingSchemaRegistryClient({'url': REGISTRY_URL}, cache=cache)
+    remote = RegisteredSchema(schema_id=17, guid=None, schema=OFFER_CREATED, subject="offer.created-value", version=3)
+
+    with patch.object(SchemaRegistryClient, "register_schema_full_response", return_value=remote) as mock_register:
+        assert client.register_schema("offer.created-value", OFFER_CREATED) == 17
+        assert client.register_schema("offer.created-value", OFFER_CREATED) == 17
+    mock_register.assert_called_once()
+
+    # A restarted process resolves the schema and its ID from the disk cache alone
+    offline = CachingSchemaRegistryClient({'url': REGISTRY_URL}, cache=FileSchemaRegistryClient(tmp_path / "cache.json", registry_url=REGISTRY_URL))
+    with patch.object(SchemaRegistryClient, "register_schema_full_response", side_effect=ConnectionError) as mock_register, \
+         patch.object(SchemaRegistryClient, "get_schema", side_effect=ConnectionError):
+        assert offline.register_schema("offer.created-value", OFFER_CREATED) == 17
+        assert offline.get_schema(17).schema_str == OFFER_CREATED.schema_str
+    mock_register.assert_not_called()
+
+
+def test_cache_file_from_another_registry_is_discarded(tmp_path):
+    path = tmp_path / "cache.json"
+    FileSchemaRegistryClient(path, registry_url=REGISTRY_URL).record(
+        RegisteredSchema(schema_id=17, guid=None, schema=OFFER_CREATED, subject="offer.created-value", version=3)
+    )
+    other = RegisteredSchema(schema_id=4, guid=None, schema=OFFER_CREATED, subject="offer.created-value", version=1)
+
+    client = CachingSchemaRegistryClient({'url': "http://other-registry:8081"},
+                                         cache=FileSchemaRegistryClient(path, registry_url="http://other-registry:8081"))
+    with patch.object(SchemaRegistryClient, "register_schema_full_response", return_value=other) as mock_register:
+        assert client.register_schema("offer.created-value", OFFER_CREATED) == 4
+    mock_register.assert_called_once()
+    # The file now mirrors the other registry, so the first one's IDs are gone from it too
+    assert FileSchemaRegistryClient(path, registry_url=REGISTRY_URL).find("offer.created-value", OFFER_CREATED) is None
+
+    with pytest.raises(ValueError):
+        CachingSchemaRegistryClient({'url': REGISTRY_URL}, cache=FileSchemaRegistryClient(path))
+
+
+def test_caching_client_falls_back_to_cached_latest_version():
+    cache = FileSchemaRegistryClient()
+    cache.record(RegisteredSchema(schema_id=5, guid=None, schema=OFFER_CREATED, subject="offer.created-value", version=2))
+    client = CachingSchemaRegistryClient({'url': REGISTRY_URL}, cache=cache)
+
+    with patch.object(SchemaRegistryClient, "get_latest_version", side_effect=ConnectionError):
+        assert client.get_latest_version("offer.created-value").schema_id == 5
+        with pytest.raises(ConnectionError):
+            client.get_latest_version("offer.unknown-value")
@@ -0,0 +1,126 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from services.offers.outbox import OutboxRelay, enqueue_outbox_event
+from services.offers.models import OutboxEvent
+
+
+def _row(event_id, topic="offer.created"):
+    return SimpleNamespace(id=event_id, topic=topic, key=f"key-{event_id}", payload={"n": event_id},
+                           created_at=datetime.utcnow() - timedelta(seconds=5))
+
+
+def _session(execute_results):
+    session = MagicMock()
+    session.__aenter__.return_value = session
+    session.begin.return_value.__aenter__.return_value = None
+    session.execute = AsyncMock(side_effect=execute_results)
+    return session
+
+
+def _relay(rows, fail_ids=(), late_ids=()):
+    claim_session = _session([MagicMock(all=MagicMock(return_value=rows))])
+    settle_session = _session([MagicMock(), MagicMock()])
+
+    producer = MagicMock()
+    late = []
+
+    def produce(topic, value, key, on_delivery):
+        # The producer's poll thread reports most deliveries while the relay waits
+        event_id = int(key.split("-")[1])
+        if event_id in late_ids:
+            late.append(on_delivery)
+        else:
+            on_delivery("broker down" if event_id in fail_ids else None, MagicMock())
+    producer.produce.side_effect = produce
+
+    relay = OutboxRelay(MagicMock(), {"offer.created": "unused.avsc"}, batch_size=10, flush_timeout=0.01)
+    relay._session_factory = MagicMock(side_effect=[claim_session, settle_session])
+    relay._producer = producer
+    return relay, claim_session, settle_session, producer, late
+
+
+def _compiled(statement):
+    return statement.compile(dialect=postgresql.dialect())
+
+
+def test_enqueue_adds_event_without_committing():
+    session = MagicMock()
+    event = enqueue_outbox_event(session, "offer.created", {"offer_id": "o-1"}, key="o-1")
+
+    session.add.assert_called_once_with(event)
+    assert isinstance(event, OutboxEvent)
+    session.commit.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_relay_batch_publishes_and_deletes_only_acknowledged_events():
+    relay, claim_session, settle_session, producer, _ = _relay([_row(3), _row(1), _row(2)], fail_ids={2})
+
+    delivered = await relay.relay_batch()
+
+    assert delivered == 2
+    assert [c.kwargs["key"] for c in producer.produce.call_args_list] == ["key-1", "key-2", "key-3"]
+    producer.flush.assert_not_called() # Waits on this batch's reports, not the shared producer's queue
+
+    claim = str(_compiled(claim_session.execute.call_args_list[0].args[0]))
+    assert claim.startswith("UPDATE outbox_event SET claimed_at=")
+    assert "ORDER BY outbox_event.id" in claim
+    assert "FOR UPDATE SKIP LOCKED" in claim
+    assert claim.endswith("RETURNING outbox_event.id, outbox_event.topic, outbox_event.key, outbox_event.payload, outbox_event.created_at")
+
+    delete = _compiled(settle_session.execute.call_args_list[0].args[0])
+    assert str(delete) == "DELETE FROM outbox_event WHERE outbox_event.id = ANY (%(ids)s::BIGINT[])"
+    assert delete.params["ids"] == [1, 3]
+    release = _compiled(settle_session.execute.call_args_list[1].args[0])
+    assert str(release).startswith("UPDATE outbox_event SET claimed_at=")
+    assert release.params["ids"] == [2] # Event 2 is released for the next batch
+
+
+@pytest.mark.asyncio
+async def test_late_delivery_reports_are_settled_by_the_next_batch():
+    relay, _, settle_session, _, late = _relay([_row(1), _row(2)], late_ids={2})
+
+    assert await relay.relay_batch() == 1 # Stopped waiting for event 2 after flush_timeout
+    assert _compiled(settle_session.execute.call_args_list[0].args[0]).params["ids"] == [1]
+
+    late[0](None, MagicMock())
+    next_settle = _session([MagicMock()])
+    relay._session_factory = MagicMock(side_effect=[_session([MagicMock(all=MagicMock(return_value=[]))]), next_settle])
+
+    assert await relay.relay_batch() == 1
+    assert _compiled(next_settle.execute.call_args_list[0].args[0]).params["ids"] == [2]
+
+
+@pytest.mark.asyncio
+async def test_relay_batch_on_empty_outbox_skips_kafka():
+    relay, claim_session, settle_session, producer, _ = _relay([])
+
+    assert await relay.relay_batch() == 0
+    producer.produce.assert_not_called()
+    assert claim_session.execute.await_count == 1
+    settle_session.execute.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_run_drains_full_batches_back_to_back_and_stops():
+    relay = OutboxRelay(MagicMock(), {}, batch_size=10, poll_interval=60)
+    results = [10, 10, 3]
+
+    async def relay_batch():
+        if not results:
+            relay.stop()
+            return 0
+        return results.pop(0)
+    relay.relay_batch = relay_batch
+
+    task = asyncio.create_task(relay.run())
+    await asyncio.sleep(0.05)
+    assert results == [] # Full batches were not followed by a poll_interval wait
+    relay.stop()
+    await asyncio.wait_for(task, timeout=1)
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from services.offers.sse import HEARTBEAT_FRAME, SseBroadcaster, encode_sse_frame
+
+
+@pytest.mark.asyncio
+async def test_event_is_encoded_once_and_shared_by_all_clients():
+    broadcaster = SseBroadcaster(heartbeat_seconds=60)
+    subscribers = [broadcaster.subscribe() for _ in range(3)]
+
+    assert broadcaster.broadcast('{"type": "OFFER_CREATED"}') == 3
+
+    frames = [sub._buffer[0] for sub in subscribers]
+    assert frames[0] == b'data: {"type": "OFFER_CREATED"}\n\n'
+    assert all(frame is frames[0] for frame in frames)
+    await broadcaster.close()
+
+
+def test_multiline_data_gets_one_data_field_per_line():
+    assert encode_sse_frame("a\nb") == b"data: a\ndata: b\n\n"
+
+
+@pytest.mark.asyncio
+async def test_buffered_frames_are_written_as_one_chunk():
+    broadcaster = SseBroadcaster(heartbeat_seconds=60)
+    subscriber = broadcaster.subscribe()
+    broadcaster.broadcast("1")
+    broadcaster.broadcast("2")
+
+    assert await subscriber.next_chunk() == b"data: 1\n\ndata: 2\n\n"
+    await broadcaster.close()
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_keeps_the_newest_frames():
+    broadcaster = SseBroadcaster(buffer_size=2, slow_client_policy="drop-oldest", heartbeat_seconds=60)
+    subscriber = broadcaster.subscribe()
+    for n in range(4):
+        broadcaster.broadcast(str(n))
+
+    assert await subscriber.next_chunk() == b"data: 2\n\ndata: 3\n\n"
+    assert len(broadcaster) == 1
+    await broadcaster.close()
+
+
+@pytest.mark.asyncio
+async def test_disconnect_policy_ends_the_slow_clients_stream_only():
+    broadcaster = SseBroadcaster(buffer_size=2, slow_client_policy="disconnect", heartbeat_seconds=60)
+    slow = broadcaster.subscribe()
+    broadcaster.broadcast("0")
+    broadcaster.broadcast("1")
+    fast = broadcaster.subscribe()
+
+    broadcaster.broadcast("2")
+
+    assert await slow.next_chunk() is None
+    assert await fast.next_chunk() == b"data: 2\n\n"
+    assert len(broadcaster) == 1
+    await broadcaster.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_heartbeat_reaches_idle_clients():
+    broadcaster = SseBroadcaster(heartbeat_seconds=0.01)
+    stream = broadcaster.stream()
+
+    assert await asyncio.wait_for(stream.__anext__(), timeout=1) == HEARTBEAT_FRAME
+    await stream.aclose()
+    assert len(broadcaster) == 0 # Closing the response body unsubscribes
+    await broadcaster.close()
+
+
+@pytest.mark.asyncio
+async def test_close_ends_open_streams():
+    broadcaster = SseBroadcaster(heartbeat_seconds=60)
+    stream = broadcaster.stream()
+    pending = asyncio.ensure_future(stream.__anext__())
+    await asyncio.sleep(0)
+
+    await broadcaster.close()
+
+    with pytest.raises(StopAsyncIteration):
+        await asyncio.wait_for(pending, timeout=1)
+    assert len(broadcaster) == 0
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        SseBroadcaster(slow_client_policy="block")
@@ -0,0 +1,126 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+import redis
+
+from services.offers import sse_fanout
+from services.offers.sse_fanout import InProcessFanout, RedisPubSubFanout, RedisStreamFanout, create_sse_fanout
+
+
+def _collector():
+    delivered = []
+
+    async def deliver(data):
+        delivered.append(data)
+    return delivered, deliver
+
+
+async def _wait_for(predicate, timeout=1.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "timed out"
+        await asyncio.sleep(0.001)
+
+
+@pytest.mark.asyncio
+async def test_inprocess_delivers_published_events_locally():
+    delivered, deliver = _collector()
+    fanout = create_sse_fanout(deliver, backend="inprocess")
+    assert isinstance(fanout, InProcessFanout)
+
+    await fanout.start()
+    await fanout.publish('{"n": 1}')
+    await fanout.publish('{"n": 2}')
+
+    assert delivered == ['{"n": 1}', '{"n": 2}']
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError, match="redis-streams"):
+        create_sse_fanout(AsyncMock(), backend="kafka")
+
+
+@pytest.mark.asyncio
+async def test_pubsub_publishes_to_redis_and_delivers_channel_messages():
+    delivered, deliver = _collector()
+    client = MagicMock()
+    client.publish = AsyncMock()
+    pubsub = client.pubsub.return_value
+    pubsub.subscribe = AsyncMock()
+    pubsub.aclose = AsyncMock()
+
+    async def listen():
+        yield {"type": "message", "data": "a"}
+        yield {"type": "message", "data": "b"}
+        await asyncio.Event().wait() # Connection stays open
+    pubsub.listen = listen
+    fanout = RedisPubSubFanout(deliver, client=client, channel="deals")
+
+    await fanout.publish("a")
+    await fanout.start()
+    await _wait_for(lambda: len(delivered) == 2)
+    await fanout.stop()
+
+    client.publish.assert_awaited_once_with("deals", "a")
+    pubsub.subscribe.assert_awaited_once_with("deals")
+    pubsub.aclose.assert_awaited_once()
+    assert delivered == ["a", "b"] # Own events arrive through Redis, not locally
+
+
+@pytest.mark.asyncio
+async def test_stream_resumes_after_last_seen_entry_on_reconnect(monkeypatch):
+    monkeypatch.setattr(sse_fanout, "SSE_FANOUT_RECONNECT_SECONDS", 0)
+    delivered, deliver = _collector()
+    client = MagicMock()
+    client.xadd = AsyncMock()
+    client.xrevrange = AsyncMock(return_value=[("7-0", {"data": "old"})])
+    reads = []
+
+    async def xread(streams, count, block):
+        reads.append(dict(streams))
+        if len(reads) == 1:
+            return [["deals", [("8-0", {"data": "a"}), ("9-0", {"data": "b"})]]]
+        if len(reads) == 2:
+            raise redis.exceptions.ConnectionError("connection reset")
+        if len(reads) == 3:
+            return [["deals", [("10-0", {"data": "c"})]]]
+        await asyncio.Event().wait()
+    client.xread = xread
+    fanout = RedisStreamFanout(deliver, client=client, channel="deals", maxlen=500)
+
+    await fanout.publish("a")
+    await fanout.start()
+    await _wait_for(lambda: len(reads) == 4)
+    await fanout.stop()
+
+    client.xadd.assert_awaited_once_with("deals", {"data": "a"}, maxlen=500, approximate=True)
+    assert delivered == ["a", "b", "c"]
+    assert reads == [{"deals": "7-0"}, {"deals": "9-0"}, {"deals": "9-0"}, {"deals": "10-0"}]
+    client.xrevrange.assert_awaited_once() # Tail looked up once, not again on reconnect
+
+
+@pytest.mark.asyncio
+async def test_delivery_errors_do_not_drop_the_subscription():
+    delivered = []
+
+    async def deliver(data):
+        if data == "bad":
+            raise RuntimeError("client gone")
+        delivered.append(data)
+    client = MagicMock()
+    client.xrevrange = AsyncMock(return_value=[])
+    responses = [[["deals", [("1-0", {"data": "bad"}), ("2-0", {"data": "good"})]]]]
+
+    async def xread(streams, count, block):
+        if responses:
+            return responses.pop()
+        await asyncio.Event().wait()
+    client.xread = xread
+    fanout = RedisStreamFanout(deliver, client=client, channel="deals")
+
+    await fanout.start()
+    await _wait_for(lambda: delivered == ["good"])
+    assert not fanout._task.done()
+    await fanout.stop()
@@ -0,0 +1,89 @@
+import asyncio
+import uuid
+from unittest.mock import AsyncMock, MagicMock
+
+from sqlalchemy.dialects import postgresql
+
+from services.offers.transitions import transition_offer, transition_offer_async, transition_offers, transition_offers_with_values
+
+
+def _session_returning(ids):
+    session = MagicMock()
+    session.execute.return_value.scalars.return_value.all.return_value = ids
+    return session
+
+
+def _compiled(session):
+    return session.execute.call_args[0][0].compile(dialect=postgresql.dialect())
+
+
+def test_transition_offers_single_statement_with_any_and_returning():
+    ids = [uuid.uuid4(), uuid.uuid4()]
+    session = _session_returning(ids)
+
+    updated = transition_offers(session, ids, "PAID_OUT", expected_status="OFFER_READY", pdf_url="s3://x")
+
+    assert updated == ids
+    session.execute.assert_called_once()
+    compiled = _compiled(session)
+    sql = str(compiled)
+    assert "WHERE offer.id = ANY (%(ids)s::UUID[])" in sql
+    assert "offer.status = %(status_1)s" in sql
+    assert sql.endswith("RETURNING offer.id")
+    assert compiled.params["ids"] == ids
+    assert compiled.params["status"] == "PAID_OUT"
+    assert compiled.params["status_1"] == "OFFER_READY"
+    assert compiled.params["pdf_url"] == "s3://x"
+    session.commit.assert_not_called() # The caller owns the transaction
+
+
+def test_transition_offers_accepts_several_expected_statuses():
+    session = _session_returning([])
+    transition_offers(session, [uuid.uuid4()], "VALUATION_FAILED_MODEL_MISSING", expected_status=["pending", "PENDING_VALUATION"])
+    compiled = _compiled(session)
+    assert "offer.status = ANY (%(expected_statuses)s::VARCHAR[])" in str(compiled)
+    assert compiled.params["expected_statuses"] == ["pending", "PENDING_VALUATION"]
+
+
+def test_transition_offer_reports_status_conflict():
+    assert transition_offer(_session_returning([]), uuid.uuid4(), "TERMSHEET_GENERATED", expected_status="OFFER_READY") is False
+    offer_id = uuid.uuid4()
+    assert transition_offer(_session_returning([offer_id]), offer_id, "TERMSHEET_GENERATED", expected_status="OFFER_READY") is True
+
+
+def test_transition_offers_with_per_row_values():
+    rows = [
+        {"id": uuid.uuid4(), "expected_status": "pending", "price_median_eur": 100},
+        {"id": uuid.uuid4(), "expected_status": "OFFER_READY", "price_median_eur": 200},
+    ]
+    session = _session_returning([rows[0]["id"]])
+
+    updated = transition_offers_with_values(session, rows, "OFFER_READY")
+
+    assert updated == [rows[0]["id"]]
+    sql = str(_compiled(session))
+    assert "price_median_eur=v.price_median_eur" in sql
+    assert "AS v (id, expected_status, price_median_eur)" in sql
+    assert "WHERE offer.id = v.id AND offer.status = v.expected_status RETURNING offer.id" in sql
+
+
+def test_empty_transitions_skip_the_database():
+    session = MagicMock()
+    assert transition_offers(session, [], "OFFER_READY") == []
+    assert transition_offers_with_values(session, [], "OFFER_READY") == []
+    session.execute.assert_not_called()
+
+
+def test_transition_offer_async_uses_the_guarded_statement():
+    offer_id = uuid.uuid4()
+    session = AsyncMock()
+    session.execute.return_value = MagicMock()
+    session.execute.return_value.scalars.return_value.all.return_value = []
+
+    assert asyncio.run(transition_offer_async(session, offer_id, "OFFER_READY", expected_status="PENDING_VALUATION", price_median_eur=150)) is False
+
+    compiled = _compiled(session)
+    assert "offer.status = %(status_1)s" in str(compiled)
+    assert str(compiled).endswith("RETURNING offer.id")
+    assert compiled.params["status_1"] == "PENDING_VALUATION"
+    session.commit.assert_not_called()
@@ -45,8 +45,8 @@ def mock_offers_session(monkeypatch, mock_offer_for_payout):
         return mock_result_empty
         
     mock_session_instance.exec = MagicMock(side_effect=mock_exec_side_effect)
-    mock_session_instance.get = MagicMock(return_value=mock_offer_for_payout) # For offer status update
-    mock_session_instance.add = MagicMock()
+    # The status update is one UPDATE ... RETURNING id that reports the offer as transitioned
+    mock_session_instance.execute.return_value.scalars.return_value.all.return_value = [mock_offer_for_payout.id]
     mock_session_instance.commit = MagicMock()
 
     mock_session_manager = MagicMock()
@@ -126,10 +126,10 @@ def test_execute_payout_stripe_success(
     assert added_ledger_entry.reference_id == "stripe_tx_123"
     assert added_ledger_entry.transaction_type == "stripe_payout"
 
-    # Assert offer status update (via mock_offers_session.add)
-    assert mock_offers_session.add.call_count == 1 # Called once for status update
-    updated_offer = mock_offers_session.add.call_args[0][0]
-    assert updated_offer.status == "PAID_OUT"
+    # Assert offer status update (via a single guarded UPDATE on mock_offers_session)
+    assert mock_offers_session.execute.call_count == 1 # Called once for status update
+    update_params = mock_offers_session.execute.call_args[0][0].compile().params
+    assert update_params["status"] == "PAID_OUT"
 
     # mock_kafka.produce.assert_called_once() # If Kafka is mocked
 
@@ -162,9 +162,9 @@ def test_execute_payout_stripe_api_error_wise_success(
     assert added_ledger_entry.reference_id == "wise_tx_456"
     assert added_ledger_entry.transaction_type == "wise_payout"
 
-    assert mock_offers_session.add.call_count == 1
-    updated_offer = mock_offers_session.add.call_args[0][0]
-    assert updated_offer.status == "PAID_OUT"
+    assert mock_offers_session.execute.call_count == 1
+    update_params = mock_offers_session.execute.call_args[0][0].compile().params
+    assert update_params["status"] == "PAID_OUT"
 
 @patch("services.payouts.worker._call_stripe_payout", side_effect=pybreaker.CircuitBreakerError("Stripe CB Open"))
 @patch("services.payouts.worker._call_wise_transfer")
@@ -229,8 +229,8 @@ def test_execute_payout_offer_not_found(
     mock_payouts_ledger_session.add.assert_not_called()
     
     # Verify offer status was not attempted to be updated (since it wasn't found)
-    # The mock_offers_session.add is used for status updates in successful paths
-    mock_offers_session.add.assert_not_called() 
+    # The mock_offers_session.execute is used for status updates in successful paths
+    mock_offers_session.execute.assert_not_called() 
 
     # Verify metrics
     mock_app_errors_total.labels.assert_called_once_with(component="execute_payout", error_type="offer_not_found")
@@ -275,7 +275,7 @@ def test_execute_payout_no_median_price(
     mock_stripe_create.assert_not_called()
     mock_wise_call.assert_not_called()
     mock_payouts_ledger_session.add.assert_not_called()
-    mock_offers_session.add.assert_not_called() # No status update should occur
+    mock_offers_session.execute.assert_not_called() # No status update should occur
 
     # Verify metrics
     mock_app_errors_total.labels.assert_called_once_with(component="execute_payout", error_type="no_median_price")
@@ -336,7 +336,7 @@ def test_execute_payout_stripe_and_wise_fail(
         mock_wise_call_fails.assert_called_once_with(mock_offer_for_payout, 50000, "EUR")
         
         mock_payouts_ledger_session.add.assert_not_called()
-        mock_offers_session.add.assert_not_called() # No status update should occur
+        mock_offers_session.execute.assert_not_called() # No status update should occur
 
         # Verify APP_ERRORS_TOTAL metrics (called for Stripe error, then for Wise error)
         # This gets a bit tricky with multiple calls to .labels().inc()
@@ -0,0 +1,72 @@
+"""
+Encode/decode throughput benchmark for libs.py_common.avro_codec.
+
+Compares confluent-kafka's AvroSerializer/AvroDeserializer with the precompiled
+FastAvroSerializer/FastAvroDeserializer for every schema in schema/, against the
+file-backed registry stand-in so no registry or broker is needed.
+
+    python -m tests.perf.bench_avro_codec [n_events]
+"""
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+from confluent_kafka.schema_registry.avro import AvroDeserializer, AvroSerializer
+from confluent_kafka.serialization import MessageField, SerializationContext
+
+from libs.py_common.avro_codec import FastAvroDeserializer, FastAvroSerializer
+from libs.py_common.schema_registry import SCHEMA_DIR, FileSchemaRegistryClient, subject_for_schema_file
+
+def _value(avro_type, i: int):
+    if isinstance(avro_type, list):
+        return _value(avro_type[-1], i) # Non-null branch of ["null", T]
+    if isinstance(avro_type, dict):
+        if avro_type.get("logicalType") == "uuid":
+            return uuid.UUID(int=i)
+        if avro_type.get("logicalType") == "timestamp-micros":
+            return datetime.fromtimestamp(1_700_000_000 + i, tz=timezone.utc)
+        if avro_type["type"] == "enum":
+            return avro_type["symbols"][i % len(avro_type["symbols"])]
+        return _value(avro_type["type"], i)
+    return {"string": f"value-{i}", "int": i, "long": i * 1000, "double": i / 7}[avro_type]
+
+def _events(schema_str: str, n_events: int) -> list[dict]:
+    fields = json.loads(schema_str)["fields"]
+    return [{f["name"]: _value(f["type"], i) for f in fields} for i in range(n_events)]
+
+def _best_of(codec, ctx: SerializationContext, items, repeats: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for item in items:
+            codec(item, ctx)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main(n_events: int = 20_000) -> dict[str, tuple[float, float]]:
+    registry = FileSchemaRegistryClient()
+    speedups = {}
+    for schema_path in sorted(SCHEMA_DIR.glob("*.avsc")):
+        schema_str = schema_path.read_text()
+        topic = subject_for_schema_file(schema_path)[:-len("-value")]
+        ctx = SerializationContext(topic, MessageField.VALUE)
+        events = _events(schema_str, n_events)
+
+        confluent_ser, fast_ser = AvroSerializer(registry, schema_str), FastAvroSerializer(registry, schema_str)
+        confluent_de, fast_de = AvroDeserializer(registry, schema_str), FastAvroDeserializer(registry, schema_str)
+        payloads = [confluent_ser(e, ctx) for e in events]
+        assert payloads[:100] == [fast_ser(e, ctx) for e in events[:100]] # Wire-compatible
+
+        encode = (_best_of(confluent_ser, ctx, events), _best_of(fast_ser, ctx, events))
+        decode = (_best_of(confluent_de, ctx, payloads), _best_of(fast_de, ctx, payloads))
+        speedups[topic] = (encode[0] / encode[1], decode[0] / decode[1])
+        print(
+            f"{topic:<26} encode confluent={n_events / encode[0]:>9,.0f}/s fast={n_events / encode[1]:>9,.0f}/s ({speedups[topic][0]:.1f}x)"
+            f"  decode confluent={n_events / decode[0]:>9,.0f}/s fast={n_events / decode[1]:>9,.0f}/s ({speedups[topic][1]:.1f}x)"
+        )
+    return speedups
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
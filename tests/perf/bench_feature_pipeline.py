@@ -0,0 +1,58 @@
+"""
+Throughput benchmark for libs.analytics.feature_pipeline.
+
+Compares the per-row path the valuation worker used to take (one dict in, one dict out,
+one single-row DataFrame per offer) with the columnar build_feature_matrix path.
+
+    python -m tests.perf.bench_feature_pipeline [n_rows]
+"""
+import random
+import sys
+import time
+
+import pandas as pd
+
+from libs.analytics.feature_pipeline import build_feature_matrix, process_data_for_features, features_to_frame
+
+def _payloads(n_rows: int) -> list[dict]:
+    rng = random.Random(42)
+    return [
+        {
+            "id": f"artist_{i}",
+            "followers": {"total": rng.randint(0, 5_000_000)},
+            "available_markets": ["SE"] * rng.randint(0, 180),
+        }
+        for i in range(n_rows)
+    ]
+
+def _per_row(payloads: list[dict]) -> list[pd.DataFrame]:
+    frames = []
+    for p in payloads:
+        raw = {
+            "streams_last_month": p.get("followers", {}).get("total", 0),
+            "country_listeners": len(p.get("available_markets", [])),
+        }
+        frames.append(pd.DataFrame([process_data_for_features(raw)]))
+    return frames
+
+def _columnar(payloads: list[dict]) -> pd.DataFrame:
+    return features_to_frame(build_feature_matrix(payloads))
+
+def _best_of(fn, payloads, repeats: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(payloads)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main(n_rows: int = 10_000) -> float:
+    payloads = _payloads(n_rows)
+    per_row_s = _best_of(_per_row, payloads, repeats=1)
+    columnar_s = _best_of(_columnar, payloads)
+    speedup = per_row_s / columnar_s
+    print(f"rows={n_rows} per_row={n_rows / per_row_s:,.0f} rows/s columnar={n_rows / columnar_s:,.0f} rows/s speedup={speedup:.1f}x")
+    return speedup
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,88 @@
+"""
+SSE broadcast benchmark for services.offers.sse.
+
+Holds n_clients open streams on one event loop and compares the previous approach
+(json.dumps + f-string framing per client over unbounded asyncio.Queues, each client
+waiting with its own 15s timeout) with SseBroadcaster (frame encoded once, bounded
+buffers, one heartbeat timer). Reports the time to broadcast a burst of events and
+for every client to have drained it.
+
+    python -m tests.perf.bench_sse_broadcast [n_clients]
+"""
+import asyncio
+import json
+import sys
+import time
+
+from services.offers.sse import SseBroadcaster
+
+N_EVENTS = 20
+EVENT = {"type": "OFFER_VALUATED", "payload": {"offer_id": "5f0c6a4e-8a39-4c36-9df0-2a4bd7b7c001", "price_low_eur": 1200.0,
+                                                "price_median_eur": 1500.0, "price_high_eur": 1900.0, "status": "OFFER_READY"}}
+
+async def _queues(n_clients: int) -> tuple[float, float]:
+    queues = [asyncio.Queue() for _ in range(n_clients)]
+    remaining = n_clients
+    done = asyncio.Event()
+
+    async def client(queue):
+        nonlocal remaining
+        received = 0
+        while received < N_EVENTS:
+            data = await asyncio.wait_for(queue.get(), timeout=15)
+            _ = f"data: {data}\n\n".encode()
+            received += 1
+        remaining -= 1
+        if not remaining:
+            done.set()
+
+    tasks = [asyncio.create_task(client(q)) for q in queues]
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    for _ in range(N_EVENTS):
+        data = json.dumps(EVENT)
+        for queue in queues:
+            await queue.put(data)
+    broadcast = time.perf_counter() - start
+    await done.wait()
+    drained = time.perf_counter() - start
+    await asyncio.gather(*tasks)
+    return broadcast, drained
+
+async def _broadcaster(n_clients: int) -> tuple[float, float]:
+    broadcaster = SseBroadcaster(buffer_size=256, heartbeat_seconds=15)
+    remaining = n_clients
+    done = asyncio.Event()
+    expected = N_EVENTS * len(f"data: {json.dumps(EVENT)}\n\n")
+
+    async def client():
+        nonlocal remaining
+        received = 0
+        async for chunk in broadcaster.stream():
+            received += len(chunk)
+            if received >= expected:
+                break
+        remaining -= 1
+        if not remaining:
+            done.set()
+
+    tasks = [asyncio.create_task(client()) for _ in range(n_clients)]
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    for _ in range(N_EVENTS):
+        broadcaster.broadcast(json.dumps(EVENT))
+    broadcast = time.perf_counter() - start
+    await done.wait()
+    drained = time.perf_counter() - start
+    await asyncio.gather(*tasks)
+    await broadcaster.close()
+    return broadcast, drained
+
+def main(n_clients: int = 10_000) -> dict[str, tuple[float, float]]:
+    results = {"queues": asyncio.run(_queues(n_clients)), "broadcaster": asyncio.run(_broadcaster(n_clients))}
+    for name, (broadcast, drained) in results.items():
+        print(f"{name:<12} {n_clients:,} clients x {N_EVENTS} events: broadcast={broadcast * 1000:>8.1f}ms  all drained={drained * 1000:>8.1f}ms")
+    return results
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
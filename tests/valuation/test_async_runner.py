@@ -0,0 +1,147 @@
+import asyncio
+import json
+import uuid
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock, MagicMock
+
+import httpx
+import pytest
+
+from services.valuation.async_runner import AsyncSpotifyClient, AsyncValuationRunner, run_valuation_async_batch
+from services.valuation.worker import spotify_artist_local_cache, celery_app
+
+
+@pytest.fixture(autouse=True)
+def clear_artist_cache():
+    spotify_artist_local_cache.clear()
+    yield
+    spotify_artist_local_cache.clear()
+
+
+def test_spotify_client_fetches_token_once_and_retries_429():
+    calls = {"token": 0, "artist": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/api/token":
+            calls["token"] += 1
+            return httpx.Response(200, json={"access_token": "tok", "expires_in": 3600})
+        calls["artist"] += 1
+        assert request.headers["Authorization"] == "Bearer tok"
+        if calls["artist"] == 1:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"id": "artist_1", "followers": {"total": 10}})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http:
+            client = AsyncSpotifyClient("id", "secret", http)
+            return await asyncio.gather(client.artist("artist_1"), client.artist("artist_1"))
+
+    results = asyncio.run(scenario())
+    assert [r["id"] for r in results] == ["artist_1", "artist_1"]
+    assert calls["token"] == 1
+    assert calls["artist"] == 3
+
+
+def test_concurrent_lookups_of_one_artist_are_coalesced():
+    async def scenario():
+        runner = AsyncValuationRunner(concurrency=10)
+        runner._redis = AsyncMock()
+        runner._redis.get.return_value = None
+        runner._spotify = AsyncMock()
+
+        async def slow_artist(artist_id):
+            await asyncio.sleep(0.01)
+            return {"id": artist_id}
+        runner._spotify.artist.side_effect = slow_artist
+
+        results = await asyncio.gather(*(runner.get_spotify_artist_data("artist_1") for _ in range(20)))
+        await runner._http.aclose()
+        return runner, results
+
+    runner, results = asyncio.run(scenario())
+    assert all(r == {"id": "artist_1"} for r in results)
+    runner._spotify.artist.assert_awaited_once_with("artist_1")
+    runner._redis.setex.assert_awaited_once()
+    assert json.loads(runner._redis.setex.call_args[0][2]) == {"id": "artist_1"}
+    assert spotify_artist_local_cache.get("artist_1")[0] == {"id": "artist_1"}
+
+
+def test_run_bounds_concurrency_and_collects_errors():
+    peak = {"current": 0, "max": 0}
+
+    async def fake_valuate(offer_id):
+        peak["current"] += 1
+        peak["max"] = max(peak["max"], peak["current"])
+        await asyncio.sleep(0.005)
+        peak["current"] -= 1
+        if str(offer_id).endswith("0"):
+            raise RuntimeError("boom")
+        return {"status": "success"}
+
+    offer_ids = [f"00000000-0000-0000-0000-0000000000{i:02d}" for i in range(40)]
+
+    async def scenario():
+        runner = AsyncValuationRunner(concurrency=5)
+        with patch.object(runner, "_valuate", side_effect=fake_valuate):
+            results = await runner.run(offer_ids)
+        await runner._http.aclose()
+        return results
+
+    results = asyncio.run(scenario())
+    assert peak["max"] == 5
+    assert len(results) == 40
+    assert results[offer_ids[10]] == {"status": "error", "message": "boom"}
+    assert results[offer_ids[11]] == {"status": "success"}
+
+
+@pytest.fixture
+def valuation_runner():
+    offer = SimpleNamespace(id=uuid.uuid4(), status="PENDING_VALUATION", creator=None, creator_id=1)
+    session = AsyncMock()
+    session.execute.return_value = MagicMock()
+    session.execute.return_value.scalars.return_value.first.return_value = offer
+    session_cm = MagicMock()
+    session_cm.__aenter__ = AsyncMock(return_value=session)
+    session_cm.__aexit__ = AsyncMock(return_value=False)
+    producer = MagicMock()
+    with patch("services.valuation.async_runner.model_registry") as registry, \
+         patch("services.valuation.async_runner.predict_with_cache", return_value=[[100, 150, 200, 0.8]]), \
+         patch("services.valuation.async_runner.rules_engine") as rules, \
+         patch("services.valuation.async_runner.get_offer_valuated_producer", return_value=producer), \
+         patch("services.valuation.async_runner._produce_offer_valuated_event") as produce, \
+         patch("services.valuation.async_runner.transition_offer_async") as transition:
+        registry.get_with_version.return_value = (MagicMock(), "v1")
+        rules.apply.side_effect = lambda predictions, signals: predictions
+        runner = AsyncValuationRunner(concurrency=1)
+        runner._session_factory = MagicMock(return_value=session_cm)
+        yield runner, offer, transition, produce
+        asyncio.run(runner._http.aclose())
+
+
+def test_valuation_transition_is_guarded_by_read_status(valuation_runner):
+    runner, offer, transition, produce = valuation_runner
+    transition.return_value = True
+
+    result = asyncio.run(runner.valuate(str(offer.id)))
+
+    assert result["offer_id"] == str(offer.id) and result["status"] == "OFFER_READY"
+    transition.assert_awaited_once()
+    args, kwargs = transition.call_args
+    assert args[1:] == (offer.id, "OFFER_READY")
+    assert kwargs["expected_status"] == "PENDING_VALUATION"
+    assert kwargs["price_median_eur"] == 150
+    produce.assert_called_once()
+
+
+def test_status_conflict_discards_valuation_without_event(valuation_runner):
+    runner, offer, transition, produce = valuation_runner
+    transition.return_value = False # Another writer moved the offer on
+
+    result = asyncio.run(runner.valuate(str(offer.id)))
+
+    assert result == {"status": "skipped", "message": "Offer status changed during valuation"}
+    produce.assert_not_called()
+
+
+def test_async_batch_task_registered():
+    assert run_valuation_async_batch.name in celery_app.tasks
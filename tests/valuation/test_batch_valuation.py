@@ -0,0 +1,125 @@
+import uuid
+from datetime import datetime
+from unittest.mock import patch, MagicMock
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from services.valuation.worker import run_valuation_batch, ValuationBatchDispatcher, celery_app
+from services.offers.models import Offer, Creator
+
+
+def _make_offer(creator: Creator) -> Offer:
+    return Offer(
+        id=uuid.uuid4(),
+        creator_id=creator.id,
+        creator=creator,
+        title="Batch Offer",
+        status="PENDING_VALUATION",
+        amount_cents=10000,
+        currency_code="EUR",
+        created_at=datetime.utcnow(),
+        updated_at=datetime.utcnow()
+    )
+
+
+@pytest.fixture
+def creator():
+    return Creator(id=7, platform_id="artist_1", platform_name="spotify", username="batch_artist",
+                   created_at=datetime.utcnow(), updated_at=datetime.utcnow())
+
+
+@pytest.fixture
+def mock_batch_session():
+    session = MagicMock()
+    session_ctx = MagicMock()
+    session_ctx.__enter__.return_value = session
+    session_ctx.__exit__.return_value = None
+    with patch("services.valuation.worker.Session", return_value=session_ctx):
+        yield session
+
+
+@patch("services.valuation.worker.get_offer_valuated_producer")
+@patch("services.valuation.worker.get_spotify_artist_data")
+@patch("services.valuation.worker.model_registry")
+def test_run_valuation_batch_predicts_once_and_bulk_updates(mock_registry, mock_get_spotify, mock_get_producer, mock_batch_session, creator):
+    mock_model = MagicMock()
+    mock_registry.get_with_version.return_value = (mock_model, "test-batch-predicts-once")
+    offers = [_make_offer(creator) for _ in range(3)]
+    mock_batch_session.exec.return_value.all.return_value = offers
+    mock_batch_session.execute.return_value.scalars.return_value.all.return_value = [o.id for o in offers]
+    mock_get_spotify.return_value = {"followers": {"total": 1000}, "available_markets": ["SE", "NO"]}
+    mock_model.predict.return_value = [[100, 200, 300, 0.9]]
+    producer = MagicMock()
+    mock_get_producer.return_value = producer
+
+    with patch("services.valuation.worker.prefetch_spotify_artists") as mock_prefetch, \
+         patch("services.valuation.worker.sp", new=MagicMock()):
+        result = run_valuation_batch([str(o.id) for o in offers])
+
+    assert result["status"] == "success"
+    assert result["valued_count"] == 3
+    # The batch's creators are prefetched in bulk, then shared within the batch
+    mock_prefetch.assert_called_once_with(["artist_1"] * 3)
+    mock_get_spotify.assert_called_once_with("artist_1")
+    # The three offers share one creator, hence one feature row and one model input row
+    mock_model.predict.assert_called_once()
+    assert len(mock_model.predict.call_args[0][0]) == 1
+
+    # One SELECT ... IN and one UPDATE ... FROM (VALUES ...) RETURNING carrying every row
+    mock_batch_session.exec.assert_called_once()
+    mock_batch_session.execute.assert_called_once()
+    update_stmt = mock_batch_session.execute.call_args[0][0]
+    compiled = update_stmt.compile(dialect=postgresql.dialect())
+    assert "FROM (VALUES" in str(compiled) and "RETURNING offer.id" in str(compiled)
+    assert [v for v in compiled.params.values() if isinstance(v, uuid.UUID)] == [o.id for o in offers]
+    mock_batch_session.commit.assert_called_once()
+    assert all(r["valuation"]["price_median_eur"] == 200 and r["valuation"]["status"] == "OFFER_READY" for r in result["results"].values())
+
+    # Per-offer events are kept
+    assert producer.produce.call_count == 3
+    produced_keys = [c.kwargs["key"] for c in producer.produce.call_args_list]
+    assert produced_keys == [str(o.id) for o in offers]
+    producer.poll.assert_called_once_with(0)
+
+
+@patch("services.valuation.worker.get_offer_valuated_producer")
+@patch("services.valuation.worker.model_registry")
+def test_run_valuation_batch_reports_missing_offers(mock_registry, mock_get_producer, mock_batch_session, creator):
+    mock_model = MagicMock()
+    mock_registry.get_with_version.return_value = (mock_model, "test-batch-missing-offers")
+    offer = _make_offer(creator)
+    missing_id = uuid.uuid4()
+    mock_batch_session.exec.return_value.all.return_value = [offer]
+    mock_batch_session.execute.return_value.scalars.return_value.all.return_value = [offer.id]
+    mock_model.predict.return_value = [[1, 2, 3, 0.5]]
+    mock_get_producer.return_value = None
+
+    with patch("services.valuation.worker.sp", new=None):
+        result = run_valuation_batch([str(offer.id), str(missing_id)])
+
+    assert result["status"] == "partial_success"
+    assert result["results"][str(missing_id)]["status"] == "error"
+    assert result["results"][str(offer.id)]["status"] == "success"
+
+
+def test_dispatcher_flushes_on_batch_size():
+    with patch("services.valuation.worker.run_valuation_batch") as mock_task:
+        dispatcher = ValuationBatchDispatcher(batch_size=2, linger_seconds=60)
+        dispatcher.submit("a")
+        mock_task.delay.assert_not_called()
+        dispatcher.submit("b")
+        mock_task.delay.assert_called_once_with(["a", "b"])
+
+
+def test_dispatcher_flushes_partial_batch():
+    with patch("services.valuation.worker.run_valuation_batch") as mock_task:
+        dispatcher = ValuationBatchDispatcher(batch_size=10, linger_seconds=60)
+        dispatcher.submit("a")
+        dispatcher.flush()
+        mock_task.delay.assert_called_once_with(["a"])
+        assert dispatcher._timer is None
+
+
+def test_batch_task_registered():
+    assert "services.valuation.worker.run_valuation_batch" in celery_app.tasks
@@ -0,0 +1,78 @@
+import json
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.valuation import worker
+from services.valuation.worker import predict_with_cache, prediction_local_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_prediction_cache():
+    prediction_local_cache.clear()
+    yield
+    prediction_local_cache.clear()
+
+
+@pytest.fixture
+def mock_redis():
+    mock_redis = MagicMock()
+    mock_redis.mget.side_effect = lambda keys: [None] * len(keys)
+    with patch("services.valuation.worker.redis_client", new=mock_redis):
+        yield mock_redis
+
+
+def _features(*rows):
+    return pd.DataFrame(list(rows), columns=["streams_last_month", "country_listeners"])
+
+
+def test_identical_rows_predicted_once_and_cached_locally(mock_redis):
+    model = MagicMock()
+    model.predict.return_value = [[1, 2, 3, 0.5], [4, 5, 6, 0.7]]
+
+    result = predict_with_cache(model, "v1", _features([10, 2], [20, 3], [10, 2]))
+
+    np.testing.assert_allclose(result, [[1, 2, 3, 0.5], [4, 5, 6, 0.7], [1, 2, 3, 0.5]])
+    assert len(model.predict.call_args[0][0]) == 2
+    assert mock_redis.pipeline.return_value.setex.call_count == 2
+
+    model.predict.reset_mock()
+    mock_redis.mget.reset_mock()
+    result = predict_with_cache(model, "v1", _features([20, 3]))
+    np.testing.assert_allclose(result, [[4, 5, 6, 0.7]])
+    model.predict.assert_not_called()
+    mock_redis.mget.assert_not_called()
+
+
+def test_redis_hit_skips_inference(mock_redis):
+    mock_redis.mget.side_effect = lambda keys: [json.dumps([7, 8, 9, 0.9])] * len(keys)
+    model = MagicMock()
+
+    result = predict_with_cache(model, "v1", _features([10, 2]))
+
+    np.testing.assert_allclose(result, [[7, 8, 9, 0.9]])
+    model.predict.assert_not_called()
+    key = mock_redis.mget.call_args[0][0][0]
+    assert key.startswith("valuation:prediction:v1:")
+
+
+def test_model_version_is_part_of_the_key(mock_redis):
+    model = MagicMock()
+    model.predict.return_value = [[1, 2, 3, 0.5]]
+    predict_with_cache(model, "v1", _features([10, 2]))
+    predict_with_cache(model, "v2", _features([10, 2]))
+    assert model.predict.call_count == 2
+
+
+def test_model_reload_clears_local_tier(mock_redis):
+    model = MagicMock()
+    model.predict.return_value = [[1, 2, 3, 0.5]]
+    predict_with_cache(model, "v1", _features([10, 2]))
+    assert len(prediction_local_cache) == 1
+
+    worker._invalidate_prediction_cache("v1", "v2")
+
+    assert len(prediction_local_cache) == 0
+    assert worker._invalidate_prediction_cache in worker.model_registry._reload_listeners
@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.valuation.rules_engine import RulesEngine, signals_from_spotify
+
+RULES_YAML = """
+STREAM_DECLINE:
+  threshold_percentage: 0.3
+  min_streams_for_eval: 1000
+  valuation_multiplier: 0.8
+  enabled_flag_name: "fallback_rule_stream_decline"
+GEO_CONCENTRATION:
+  max_single_country_percentage: 0.7
+  min_total_listeners_for_eval: 500
+  confidence_reduction_factor: 0.5
+  enabled_flag_name: "fallback_rule_geo_concentration"
+"""
+
+
+@pytest.fixture
+def rules_file(tmp_path):
+    path = tmp_path / "rules.yaml"
+    path.write_text(RULES_YAML)
+    return path
+
+
+def _signals():
+    return pd.DataFrame({
+        "streams_last_month": [5000, 500, 5000],
+        "stream_decline_rate": [0.5, 0.5, np.nan],
+        "total_listeners": [1000, 1000, 100],
+        "top_country_share": [0.9, 0.2, 0.9],
+    })
+
+
+def test_rules_apply_vectorized_and_resolve_flags_once(rules_file):
+    flag_calls = []
+    engine = RulesEngine(rules_file, flag_resolver=lambda name: flag_calls.append(name) or True)
+    predictions = [[100, 200, 300, 0.8]] * 3
+
+    adjusted = engine.apply(predictions, _signals())
+
+    # Only row 0 declines with enough streams; only row 0 is concentrated with enough listeners
+    np.testing.assert_allclose(adjusted[0], [80, 160, 240, 0.4])
+    np.testing.assert_allclose(adjusted[1], [100, 200, 300, 0.8])
+    np.testing.assert_allclose(adjusted[2], [100, 200, 300, 0.8])
+    assert sorted(flag_calls) == ["fallback_rule_geo_concentration", "fallback_rule_stream_decline"]
+
+
+def test_disabled_flag_skips_rule(rules_file):
+    engine = RulesEngine(rules_file, flag_resolver=lambda name: name == "fallback_rule_geo_concentration")
+    adjusted = engine.apply([[100, 200, 300, 0.8]], _signals().iloc[:1])
+    np.testing.assert_allclose(adjusted[0], [100, 200, 300, 0.4])
+
+
+def test_flags_not_resolved_when_no_offer_matches(rules_file):
+    engine = RulesEngine(rules_file, flag_resolver=lambda name: pytest.fail("flag resolved without a match"))
+    signals = signals_from_spotify([{"followers": {"total": 10}}, None])
+    adjusted = engine.apply([[1, 2, 3, 0.5], [4, 5, 6, 0.5]], signals)
+    np.testing.assert_allclose(adjusted, [[1, 2, 3, 0.5], [4, 5, 6, 0.5]])
+
+
+def test_rules_recompiled_when_file_changes(rules_file):
+    engine = RulesEngine(rules_file, flag_resolver=lambda name: True, check_interval_seconds=0)
+    assert [r.name for r in engine.rules] == ["STREAM_DECLINE", "GEO_CONCENTRATION"]
+
+    rules_file.write_text("STREAM_DECLINE:\n  threshold_percentage: 0.1\n  valuation_multiplier: 0.5\n")
+    stat = os.stat(rules_file)
+    os.utime(rules_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert [r.name for r in engine.rules] == ["STREAM_DECLINE"]
+    adjusted = engine.apply([[100, 200, 300, 0.8]], pd.DataFrame({"streams_last_month": [1], "stream_decline_rate": [0.2]}))
+    np.testing.assert_allclose(adjusted[0], [50, 100, 150, 0.8])
+
+
+def test_bad_edit_keeps_previous_rules(rules_file):
+    engine = RulesEngine(rules_file, flag_resolver=lambda name: True, check_interval_seconds=0)
+    assert len(engine.rules) == 2
+
+    rules_file.write_text("STREAM_DECLINE: [unclosed")
+    stat = os.stat(rules_file)
+    os.utime(rules_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert len(engine.rules) == 2
@@ -0,0 +1,122 @@
+import json
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from libs.py_common.cache import TTLCache
+from services.valuation import worker
+
+
+@pytest.fixture(autouse=True)
+def clear_local_cache():
+    worker.spotify_artist_local_cache.clear()
+    yield
+    worker.spotify_artist_local_cache.clear()
+
+
+@pytest.fixture
+def mock_redis():
+    mock_client = MagicMock()
+    pipe = MagicMock()
+    mock_client.pipeline.return_value = pipe
+    with patch("services.valuation.worker.redis_client", new=mock_client):
+        yield mock_client, pipe
+
+
+@pytest.fixture
+def mock_sp():
+    mock_client = MagicMock()
+    mock_client.artist.return_value = {"id": "artist_1", "followers": {"total": 10}}
+    with patch("services.valuation.worker.sp", new=mock_client):
+        yield mock_client
+
+
+def test_miss_on_both_tiers_fetches_once_and_fills_caches(mock_redis, mock_sp):
+    redis_client, pipe = mock_redis
+    pipe.execute.return_value = [None, -2]
+    redis_client.set.return_value = True # Fetch lock acquired
+
+    first = worker.get_spotify_artist_data("artist_1")
+    second = worker.get_spotify_artist_data("artist_1")
+
+    assert first == second == {"id": "artist_1", "followers": {"total": 10}}
+    mock_sp.artist.assert_called_once_with("artist_1")
+    redis_client.setex.assert_called_once()
+    redis_client.delete.assert_called_once_with("spotify:artist:artist_1:lock")
+    pipe.execute.assert_called_once() # Second call served by the local tier
+
+
+def test_redis_hit_populates_local_tier(mock_redis, mock_sp):
+    _, pipe = mock_redis
+    pipe.execute.return_value = [json.dumps({"id": "artist_1"}), 600]
+
+    assert worker.get_spotify_artist_data("artist_1") == {"id": "artist_1"}
+    assert worker.spotify_artist_local_cache.get("artist_1")[0] == {"id": "artist_1"}
+    mock_sp.artist.assert_not_called()
+
+
+def test_waits_for_concurrent_fetch_when_lock_is_held(mock_redis, mock_sp):
+    redis_client, pipe = mock_redis
+    # First read misses; the poll after the lock is refused sees the other process's result
+    pipe.execute.side_effect = [[None, -2], [json.dumps({"id": "artist_1", "from": "other"}), 900]]
+    redis_client.set.return_value = False
+
+    assert worker.get_spotify_artist_data("artist_1") == {"id": "artist_1", "from": "other"}
+    mock_sp.artist.assert_not_called()
+
+
+@pytest.fixture
+def stale_local_entry():
+    now = [0.0]
+    cache = TTLCache(ttl_seconds=60, stale_seconds=300, clock=lambda: now[0])
+    cache.set("artist_1", {"id": "artist_1", "followers": {"total": 1}})
+    now[0] = 90.0 # Past the local TTL, within the stale window
+    # Run the background revalidation inline
+    with patch.object(worker, "spotify_artist_local_cache", cache), \
+         patch.object(worker._spotify_artist_fetches, "do_in_background", side_effect=lambda key, fn: fn()):
+        yield cache
+
+
+def test_stale_local_entry_revalidates_from_warm_redis(mock_redis, mock_sp, stale_local_entry):
+    redis_client, pipe = mock_redis
+    pipe.execute.return_value = [json.dumps({"id": "artist_1", "followers": {"total": 2}}), 600]
+
+    assert worker.get_spotify_artist_data("artist_1") == {"id": "artist_1", "followers": {"total": 1}} # Stale served
+    assert stale_local_entry.get("artist_1") == ({"id": "artist_1", "followers": {"total": 2}}, "fresh")
+    assert mock_sp.artist.call_count == 0
+    redis_client.set.assert_not_called() # No fetch lock taken
+
+
+def test_stale_local_entry_fetches_when_redis_entry_is_expiring(mock_redis, mock_sp, stale_local_entry):
+    redis_client, pipe = mock_redis
+    pipe.execute.return_value = [json.dumps({"id": "artist_1"}), worker.SPOTIFY_REDIS_REFRESH_AHEAD_SECONDS - 1]
+    redis_client.set.return_value = True
+
+    worker.get_spotify_artist_data("artist_1")
+
+    mock_sp.artist.assert_called_once_with("artist_1")
+    redis_client.setex.assert_called_once()
+
+
+def test_prefetch_uses_bulk_endpoint_in_chunks_of_50(mock_redis, mock_sp):
+    _, pipe = mock_redis
+    artist_ids = [f"artist_{i}" for i in range(120)]
+    pipe.execute.side_effect = [[0] * 120, None, None, None] # EXISTS lookup, then one SETEX flush per chunk
+    mock_sp.artists.side_effect = lambda ids: {"artists": [{"id": a} for a in ids]}
+
+    fetched = worker.prefetch_spotify_artists(artist_ids + artist_ids[:10]) # Duplicates are collapsed
+
+    assert fetched == 120
+    assert [len(c.args[0]) for c in mock_sp.artists.call_args_list] == [50, 50, 20]
+    assert pipe.setex.call_count == 120
+    mock_sp.artist.assert_not_called()
+    assert worker.get_spotify_artist_data("artist_42") == {"id": "artist_42"}
+
+
+def test_prefetch_skips_artists_already_in_redis(mock_redis, mock_sp):
+    _, pipe = mock_redis
+    pipe.execute.side_effect = [[1, 0], None]
+    mock_sp.artists.return_value = {"artists": [{"id": "b"}]}
+
+    assert worker.prefetch_spotify_artists(["a", "b"]) == 1
+    mock_sp.artists.assert_called_once_with(["b"])
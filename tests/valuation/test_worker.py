@@ -9,15 +9,15 @@ from datetime import datetime
 from services.valuation.worker import run_valuation, celery_app #, get_spotify_artist_data
 from services.offers.models import Offer, Creator # Assuming Offer.id is UUID as per recent changes
 
-# Mock joblib.load for the valuation model
-@pytest.fixture(scope="module") # Scope to module as model loading is global in worker
+# Mock the model registry for the valuation model
+@pytest.fixture(scope="module") # Scope to module as the registry is global in worker
 def mock_valuation_model():
     mock_model = MagicMock()
     # Define what model.predict should return: [[low, median, high, confidence]]
     mock_model.predict.return_value = [[10000, 15000, 20000, 0.85]] # e.g., 100€, 150€, 200€
-    with patch('services.valuation.worker.joblib.load', return_value=mock_model) as mock_load:
-        with patch('services.valuation.worker.model', new=mock_model): # Also patch the global 'model' var
-            yield mock_load, mock_model
+    with patch('services.valuation.worker.model_registry') as mock_registry:
+        mock_registry.get_with_version.return_value = (mock_model, "test-worker")
+        yield mock_registry, mock_model
 
 @pytest.fixture
 def mock_spotify_client():